@@ -1,3 +1,6 @@
-from .lib.ztest import ztest
-from .lib.zscore import zscore
+from .lib.ztest import ztest, ztest_many
+from .lib.zscore import zscore, zscore_many
 from .lib.hypergeom import hypergeom
+from .lib.pipeline import pipeline, ztest_zscore
+from .lib.merge import merge_shards
+from .lib.interactions import InteractionIndex
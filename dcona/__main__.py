@@ -1,100 +1,270 @@
+# Config fields that runs of several contrasts do not support,
+# "cache_dir" keeps only the copies of csv tables for them
+CONTRASTS_UNSUPPORTED = [
+    "memory_budget", "cache_size", "checkpoint_dir", "shard"
+]
+
+# Config fields that the pipeline tool does not support,
+# hypergeom needs the z-tests of all pairs
+PIPELINE_UNSUPPORTED = [
+    "memory_budget", "fdr_threshold", "top_k", "checkpoint_dir", "shard"
+]
+
+# Config fields of z-tests that hypergeom does not support: it needs
+# the z-tests of all pairs with the adjusted p-values
+HYPERGEOM_UNSUPPORTED = ["fdr_threshold", "top_k", "memory_budget"]
+
+
 def ztest_cli(config_path):
     import pandas as pd 
     from . import lib
 
-    data_path, description_path, \
-    reference_group, experimental_group, \
-    correlation, alternative, score, \
-    interaction_path, \
-    repeats_number, \
-    output_dir_path, \
-    process_number = \
-    lib.utils.read_config(config_path)
+    config = lib.utils.read_config(config_path)
+    if config.contrasts:
+        lib.utils.check_unsupported(
+            config, CONTRASTS_UNSUPPORTED, "with contrasts"
+        )
     
-    lib.dump.check_directory_existence(output_dir_path)
+    lib.dump.check_directory_existence(config.output_dir_path)
     
-    data_df = pd.read_csv(data_path, sep=",", index_col=0)
-    description_df = pd.read_csv(description_path, sep=",")
-    if interaction_path:
-        interaction_df = pd.read_csv(interaction_path, sep=",")
+    data_df = lib.load.read_data(config.data_path, config.cache_dir)
+    description_df = pd.read_csv(config.description_path, sep=",")
+    if config.interaction_path:
+        interaction_df = lib.interactions.read_interaction(config.interaction_path)
     else:
         interaction_df = None
     
+    if config.contrasts:
+        result = lib.ztest_many(
+            data_df, description_df,
+            config.contrasts,
+            config.correlation, config.alternative,
+            interaction=interaction_df,
+            repeats_number=config.repeats_number,
+            output_dir=config.output_dir_path,
+            process_number=config.process_number,
+            output_format=config.output_format,
+            fdr_threshold=config.fdr_threshold,
+            top_k=config.top_k
+        )
+        return
+
+    cache = lib.load.correlation_cache(config.cache_dir, config.cache_size)
     result = lib.ztest(
         data_df, description_df,
-        reference_group, experimental_group,
-        correlation, alternative,
+        config.reference_group, config.experimental_group,
+        config.correlation, config.alternative,
         interaction=interaction_df,
-        repeats_number=repeats_number,
-        output_dir=output_dir_path,
-        process_number=process_number
+        repeats_number=config.repeats_number,
+        output_dir=config.output_dir_path,
+        process_number=config.process_number,
+        memory_budget=config.memory_budget,
+        output_format=config.output_format,
+        fdr_threshold=config.fdr_threshold,
+        top_k=config.top_k,
+        cache=cache,
+        checkpoint=lib.load.checkpoint_path(
+            config.checkpoint_dir,
+            lib.utils.shard_name(
+                f"{config.correlation}_{config.alternative}_ztest",
+                config.shard
+            )
+        ),
+        shard=config.shard
     )
 
 def zscore_cli(config_path):   
     import pandas as pd
     from . import lib
 
-    data_path, description_path, \
-    reference_group, experimental_group, \
-    correlation, alternative, score, \
-    interaction_path, \
-    repeats_number, \
-    output_dir_path, \
-    process_number = \
-    lib.utils.read_config(config_path)
+    config = lib.utils.read_config(config_path)
+    if config.contrasts:
+        lib.utils.check_unsupported(
+            config, CONTRASTS_UNSUPPORTED, "with contrasts"
+        )
     
-    lib.dump.check_directory_existence(output_dir_path)
+    lib.dump.check_directory_existence(config.output_dir_path)
     
-    data_df = pd.read_csv(data_path, sep=",", index_col=0)
-    description_df = pd.read_csv(description_path, sep=",")
-    if interaction_path:
-        interaction_df = pd.read_csv(interaction_path, sep=",")
+    data_df = lib.load.read_data(config.data_path, config.cache_dir)
+    description_df = pd.read_csv(config.description_path, sep=",")
+    if config.interaction_path:
+        interaction_df = lib.interactions.read_interaction(config.interaction_path)
     else:
         interaction_df = None
     
+    if config.contrasts:
+        result = lib.zscore_many(
+            data_df, description_df,
+            config.contrasts,
+            correlation=config.correlation,
+            score=config.score,
+            alternative=config.alternative,
+            interaction=interaction_df,
+            repeats_number=config.repeats_number,
+            output_dir=config.output_dir_path,
+            process_number=config.process_number,
+            output_format=config.output_format,
+            fdr_threshold=config.fdr_threshold,
+            top_k=config.top_k
+        )
+        return
+
+    cache = lib.load.correlation_cache(config.cache_dir, config.cache_size)
     result = lib.zscore(
         data_df, description_df,
-        reference_group, experimental_group,
-        correlation=correlation,
-        score=score,
-        alternative=alternative,
+        config.reference_group, config.experimental_group,
+        correlation=config.correlation,
+        score=config.score,
+        alternative=config.alternative,
         interaction=interaction_df,
-        repeats_number=repeats_number,
-        output_dir=output_dir_path,
-        process_number=process_number
+        repeats_number=config.repeats_number,
+        output_dir=config.output_dir_path,
+        process_number=config.process_number,
+        output_format=config.output_format,
+        fdr_threshold=config.fdr_threshold,
+        top_k=config.top_k,
+        cache=cache,
+        checkpoint=lib.load.checkpoint_path(
+            config.checkpoint_dir,
+            lib.utils.shard_name(
+                f"{config.correlation}_{lib.utils.score_name(config.score)}_"
+                f"{config.alternative}_zscore",
+                config.shard
+            )
+        ),
+        shard=config.shard,
+        memory_budget=config.memory_budget
     )
                             
 def hypergeom_cli(config_path):   
+    import os
     import pandas as pd
     from . import lib
 
-    data_path, description_path, \
-    reference_group, experimental_group, \
-    correlation, alternative, score, \
-    interaction_path, \
-    repeats_number, \
-    output_dir_path, \
-    process_number = \
-    lib.utils.read_config(config_path)
+    config = lib.utils.read_config(config_path)
+    lib.utils.check_unsupported(
+        config, HYPERGEOM_UNSUPPORTED, "with hypergeom"
+    )
     
-    lib.dump.check_directory_existence(output_dir_path)
+    lib.dump.check_directory_existence(config.output_dir_path)
 
-    path_to_file = output_dir_path.rstrip("/") + \
-        f"/{correlation}_{alternative}_ztest.csv"
-    ztest_df = pd.read_csv(path_to_file, sep=",")
-    
-    if interaction_path:
+    # Z-test tables of contrasts are in their subdirectories
+    output_dirs = [config.output_dir_path]
+    if config.contrasts:
+        output_dirs = [
+            os.path.join(config.output_dir_path, lib.utils.contrast_name(*contrast))
+            for contrast in config.contrasts
+        ]
+
+    if config.interaction_path:
         oriented = True
+        if config.interaction_path.endswith(".npz"):
+            oriented = lib.interactions.read_interaction(
+                config.interaction_path
+            ).oriented
     else:
         oriented = False
 
-    result = lib.hypergeom(
-        ztest_df,
-        alternative=alternative,
-        oriented=oriented,
-        output_dir=output_dir_path
+    for output_dir in output_dirs:
+        path_to_file = lib.dump.output_path(
+            output_dir,
+            f"{config.correlation}_{config.alternative}_ztest",
+            config.output_format
+        )
+
+        result = lib.hypergeom(
+            path_to_file,
+            alternative=config.alternative,
+            oriented=oriented,
+            output_dir=output_dir,
+            output_format=config.output_format
+        )
+                            
+def pipeline_cli(config_path):   
+    import os
+    import pandas as pd
+    from . import lib
+
+    config = lib.utils.read_config(config_path)
+    lib.utils.check_unsupported(
+        config, PIPELINE_UNSUPPORTED, "with the pipeline tool"
+    )
+    
+    lib.dump.check_directory_existence(config.output_dir_path)
+    
+    data_df = lib.load.read_data(config.data_path, config.cache_dir)
+    cache = lib.load.correlation_cache(config.cache_dir, config.cache_size)
+    description_df = pd.read_csv(config.description_path, sep=",")
+    if config.interaction_path:
+        interaction_df = lib.interactions.read_interaction(config.interaction_path)
+    else:
+        interaction_df = None
+    
+    # Contrasts are run one by one over the loaded data,
+    # their results are saved into their subdirectories
+    if config.contrasts:
+        if interaction_df is not None:
+            interaction_df = lib.interactions.interaction_index(interaction_df)
+        
+        for reference_group, experimental_group in config.contrasts:
+            contrast_dir = os.path.join(
+                config.output_dir_path,
+                lib.utils.contrast_name(reference_group, experimental_group)
+            )
+            os.makedirs(contrast_dir, exist_ok=True)
+
+            result = lib.pipeline(
+                data_df, description_df,
+                reference_group, experimental_group,
+                config.correlation, config.alternative,
+                interaction=interaction_df,
+                repeats_number=config.repeats_number,
+                output_dir=contrast_dir,
+                process_number=config.process_number,
+                output_format=config.output_format,
+                score=config.score,
+                ztest_table=config.ztest_table,
+                cache=cache
+            )
+        return
+
+    result = lib.pipeline(
+        data_df, description_df,
+        config.reference_group, config.experimental_group,
+        config.correlation, config.alternative,
+        interaction=interaction_df,
+        repeats_number=config.repeats_number,
+        output_dir=config.output_dir_path,
+        process_number=config.process_number,
+        output_format=config.output_format,
+        score=config.score,
+        ztest_table=config.ztest_table,
+        cache=cache
     )
                             
+def merge_cli(config_path):
+    from . import lib
+
+    config = lib.utils.read_config(config_path)
+    
+    lib.dump.check_directory_existence(config.output_dir_path)
+    
+    # Shards of every table in the output directory
+    # are combined into the table
+    shards = lib.shards.find_shards(config.output_dir_path)
+    if not shards:
+        raise ValueError(f"No shards found in {config.output_dir_path}")
+
+    for name, paths in shards.items():
+        result = lib.merge_shards(
+            paths,
+            output_dir=config.output_dir_path,
+            output_format=config.output_format,
+            fdr_threshold=config.fdr_threshold,
+            top_k=config.top_k,
+            process_number=config.process_number
+        )
+                            
 def main():
     import argparse
 
@@ -104,7 +274,7 @@ def main():
         epilog='https://github.com/zhiyanov/DCoNA'
     )
     parser.add_argument(
-        "tool", choices=['ztest', 'zscore', 'hypergeom'],
+        "tool", choices=['ztest', 'zscore', 'hypergeom', 'pipeline', 'merge'],
         help="One of DCoNA tools"
     )
     parser.add_argument(
@@ -117,6 +287,10 @@ def main():
         ztest_cli(args.config_path)
     elif args.tool=="zscore":
         zscore_cli(args.config_path)
+    elif args.tool=="pipeline":
+        pipeline_cli(args.config_path)
+    elif args.tool=="merge":
+        merge_cli(args.config_path)
     else:
         hypergeom_cli(args.config_path)
 
@@ -1,10 +1,14 @@
 from .putils import \
     unary_index, \
     paired_index, \
+    unary_index_batch, \
+    paired_index_batch, \
     unary_array, \
     unary_matrix, \
     quadrate, \
-    reorder
+    reorder, \
+    as_matrix, \
+    rank_rows
 
 from .pcorrelations import \
     spearmanr, \
@@ -12,12 +16,29 @@ from .pcorrelations import \
     pearsonr
  
 from .ptests import \
-    ztest
+    ztest, \
+    fdr_histogram, \
+    fdr_plan, \
+    fdr_collect, \
+    fdr_adjust, \
+    fdr_select
 
 from .pscores import \
     score_indexed, \
     score_exhaustive 
 
+from .pcache import \
+    CACHE_SIZE, \
+    CorrelationCache
+
+from .pcheckpoint import \
+    CHECKPOINT_INTERVAL, \
+    read_checkpoint
+
 from .ppipelines import \
     ztest_pipeline, \
-    score_pipeline
+    score_pipeline, \
+    ztest_pipeline_contrasts, \
+    score_pipeline_contrasts, \
+    ztest_score_pipeline, \
+    pipeline_statistics
@@ -0,0 +1,137 @@
+import os
+import uuid
+import hashlib
+import numpy as np
+
+# Default size limit of a cache directory (bytes)
+CACHE_SIZE = 2**32
+
+CACHE_SUFFIX = ".npy"
+
+HASH_BLOCK_SIZE = 2**24
+
+
+class CorrelationCache:
+    # Content-addressed store of observed correlations, ranks
+    # and permutation results. An entry is a .npy file named
+    # by a hash of its key: the data matrix, the sample sets,
+    # the correlation, the pairs and the other parameters the
+    # array depends on. Entries are read as memory maps, the
+    # least recently used ones are removed once the total
+    # size of the directory exceeds "size_limit"
+
+    def __init__(self, directory, size_limit=CACHE_SIZE):
+        self.directory = directory
+        self.size_limit = size_limit
+
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, *parts):
+        return make_key(*parts)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            array = np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # Reading an entry makes it the most recently used one
+        os.utime(path)
+        return array
+
+    def get_many(self, *keys):
+        # Arrays of all the keys or None if any is missing
+        arrays = []
+        for key in keys:
+            array = self.get(key)
+            if array is None:
+                return None
+            arrays.append(array)
+
+        return arrays
+
+    def put(self, key, array):
+        # The entry is written to a temporary file and renamed,
+        # so concurrent readers never see a partial file
+        path = self.path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as temp_file:
+            np.save(temp_file, np.ascontiguousarray(array))
+        os.replace(temp_path, path)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(CACHE_SUFFIX):
+                continue
+
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.size_limit:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+def make_key(*parts):
+    # A hash of arrays and reprs of the other parts
+    hasher = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            update_array(hasher, part)
+        else:
+            hasher.update(repr(part).encode())
+        hasher.update(b"\0")
+
+    return hasher.hexdigest()
+
+def update_array(hasher, array):
+    hasher.update(repr((array.dtype.str, array.shape)).encode())
+
+    array = np.ascontiguousarray(array)
+    flat = array.reshape(-1).view("uint8")
+    for start in range(0, len(flat), HASH_BLOCK_SIZE):
+        hasher.update(flat[start : start + HASH_BLOCK_SIZE])
+
+def cached(cache, compute, *parts, copy=True):
+    # The array computed by "compute" is stored in the cache by
+    # the key parts. A hit is a copy of the entry or (if not
+    # "copy") its read-only memory map
+    cache = get_cache(cache)
+    if cache is None:
+        return compute()
+
+    key = cache.key(*parts)
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.put(key, result)
+        return result
+
+    if copy:
+        return np.array(result)
+
+    return result
+
+def get_cache(cache):
+    # A cache of a directory path, an existing cache or None
+    if (cache is None) or isinstance(cache, CorrelationCache):
+        return cache
+
+    return CorrelationCache(cache)
@@ -0,0 +1,60 @@
+import os
+import uuid
+import numpy as np
+
+from .pcache import make_key
+
+# Default interval between checkpoints of a pipeline (seconds)
+CHECKPOINT_INTERVAL = 600
+
+
+def read_checkpoint(path, key):
+    # The permutation state saved in "path" (None if there is
+    # no file). The state must belong to a run with the same key
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path, allow_pickle=False) as archive:
+        if str(archive["key"]) != key:
+            raise ValueError(
+                f"Checkpoint {path} belongs to a run with other parameters"
+            )
+
+        state = {
+            "permutation": int(archive["permutation"]),
+            "generator": str(archive["generator"]),
+            "samples": archive["samples"],
+            "counts": archive["counts"],
+            "permutations": archive["permutations"],
+            "statistic": archive["statistic"]
+        }
+        if "active" in archive:
+            state["active"] = archive["active"]
+
+    return state
+
+def checkpoint_writer(path, key):
+    # A callback of the native pipelines that saves their state,
+    # the file is replaced atomically (see CorrelationCache.put)
+    def write(state):
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as temp_file:
+            np.savez(temp_file, key=key, **state)
+        os.replace(temp_path, path)
+
+    return write
+
+def checkpoint_arguments(checkpoint, *parts, interval=None):
+    # Checkpoint arguments of a native pipeline: the callback, the
+    # state to resume from and the interval. The key parts are the
+    # pipeline parameters except the number of permutations, so
+    # a finished run can be extended with more permutations
+    if checkpoint is None:
+        return None, None, 0
+
+    if interval is None:
+        interval = CHECKPOINT_INTERVAL
+
+    key = make_key(*parts)
+    return checkpoint_writer(checkpoint, key), \
+        read_checkpoint(checkpoint, key), interval
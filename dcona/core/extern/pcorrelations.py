@@ -1,5 +1,4 @@
 import numpy as np
-from scipy.stats import rankdata
 from scipy.stats import t
 from scipy.stats import norm
 
@@ -8,6 +7,13 @@ from .correlations import \
     _correlation_indexed, \
     _correlation_exhaustive
 
+from .putils import \
+    as_matrix, \
+    rank_rows
+
+from .pcache import \
+    cached
+
 TWO_SIDED = "two-sided"
 LESS = "less"
 GREATER = "greater"
@@ -61,9 +67,10 @@ def spearmanr(
     target_indexes=None,
     alternative=None,
     process_num=1,
-    numerical_index=False
+    numerical_index=False,
+    cache=None
 ): 
-    data = df.to_numpy(copy=True).astype("float32")
+    data = as_matrix(df)
 
     if np.all(source_indexes != None) and np.all(target_indexes != None):
         if not numerical_index:
@@ -84,18 +91,26 @@ def spearmanr(
             target_num_indexes
         ).astype("int32")
 
-        corrs = _correlation_indexed(
-            data,
-            source_num_indexes,
-            target_num_indexes,
-            "spearman",
-            process_num
+        corrs = cached(
+            cache,
+            lambda: _correlation_indexed(
+                data,
+                source_num_indexes,
+                target_num_indexes,
+                "spearman",
+                process_num
+            ),
+            "spearmanr", data, source_num_indexes, target_num_indexes
         ) 
     else:
-        corrs = _correlation_exhaustive(
-            data,
-            "spearman",
-            process_num
+        corrs = cached(
+            cache,
+            lambda: _correlation_exhaustive(
+                data,
+                "spearman",
+                process_num
+            ),
+            "spearmanr", data
         )
 
     corrs[corrs == UNDEFINED_CORR_VALUE] = None
@@ -118,9 +133,10 @@ def pearsonr(
     target_indexes=None,
     alternative=None,
     process_num=1,
-    numerical_index=False
+    numerical_index=False,
+    cache=None
 ):    
-    data = df.to_numpy(copy=True).astype("float32")
+    data = as_matrix(df)
     
     if np.all(source_indexes != None) and np.all(target_indexes != None):
         if not numerical_index:
@@ -141,18 +157,26 @@ def pearsonr(
             target_num_indexes
         ).astype("int32")
     
-        corrs = _correlation_indexed(
-            data,
-            source_num_indexes,
-            target_num_indexes,
-            "pearson",
-            process_num
+        corrs = cached(
+            cache,
+            lambda: _correlation_indexed(
+                data,
+                source_num_indexes,
+                target_num_indexes,
+                "pearson",
+                process_num
+            ),
+            "pearsonr", data, source_num_indexes, target_num_indexes
         )
     else:
-        corrs = _correlation_exhaustive(
-            data,
-            "pearson",
-            process_num
+        corrs = cached(
+            cache,
+            lambda: _correlation_exhaustive(
+                data,
+                "pearson",
+                process_num
+            ),
+            "pearsonr", data
         )
 
     corrs[corrs == UNDEFINED_CORR_VALUE] = None
@@ -175,9 +199,10 @@ def spearmanr_test(
     target_indexes=None,
     alternative=None,
     process_num=1,
-    numerical_index=False
+    numerical_index=False,
+    cache=None
 ): 
-    data = df.to_numpy(copy=True).astype("float32")
+    data = as_matrix(df)
 
     if np.all(source_indexes != None) and np.all(target_indexes != None):
         if not numerical_index:
@@ -198,35 +223,51 @@ def spearmanr_test(
             target_num_indexes
         ).astype("int32")
 
-        indexes = set(source_num_indexes)
-        indexes.update(target_num_indexes)
-        indexes = list(indexes)
-        
-        data[indexes] = rankdata(
-            data[indexes],
-            axis=1,
-            method="ordinal"
-        ).astype("float32")
+        # Only the rows of the pairs are ranked,
+        # pairs are renumbered by their positions
+        rows, inverse = np.unique(
+            np.concatenate([source_num_indexes, target_num_indexes]),
+            return_inverse=True
+        )
+
+        # Ranks are cached separately from the correlations
+        def compute():
+            ranks = cached(
+                cache,
+                lambda: rank_rows(data, rows, process_num),
+                "ranks", data, rows,
+                copy=False
+            )
+
+            return _correlation_indexed(
+                ranks,
+                inverse[:len(source_num_indexes)].astype("int32"),
+                inverse[len(source_num_indexes):].astype("int32"),
+                "pearson",
+                process_num
+            )
         
-        corrs = _correlation_indexed(
-            data,
-            source_num_indexes,
-            target_num_indexes,
-            "pearson",
-            process_num
-        ) 
-    else:
-        data = rankdata(
-            data,
-            axis=1,
-            method="ordinal"
-        ).astype("float32")
-
-        corrs = _correlation_exhaustive(
-            data,
-            "pearson",
-            process_num
+        corrs = cached(
+            cache,
+            compute,
+            "spearmanr_test", data, source_num_indexes, target_num_indexes
         )
+    else:
+        def compute():
+            ranks = cached(
+                cache,
+                lambda: rank_rows(data, process_num=process_num),
+                "ranks", data,
+                copy=False
+            )
+
+            return _correlation_exhaustive(
+                ranks,
+                "pearson",
+                process_num
+            )
+
+        corrs = cached(cache, compute, "spearmanr_test", data)
 
     corrs[corrs == UNDEFINED_CORR_VALUE] = None
 
@@ -4,13 +4,38 @@ from .pipelines import \
     _ztest_pipeline_indexed, \
     _score_pipeline_indexed, \
     _ztest_pipeline_exhaustive, \
-    _score_pipeline_exhaustive
+    _score_pipeline_exhaustive, \
+    _ztest_pipeline_contrasts_indexed, \
+    _ztest_pipeline_contrasts_exhaustive, \
+    _score_pipeline_contrasts_indexed, \
+    _score_pipeline_contrasts_exhaustive, \
+    _ztest_score_pipeline_indexed, \
+    _pipeline_statistics
 
 from .pcorrelations import \
     correlation_test \
 
+from .ptests import \
+    ztest
+
 from .putils import \
-    reorder
+    reorder, \
+    as_matrix
+
+from .pcache import \
+    get_cache
+
+from .pcheckpoint import \
+    checkpoint_arguments
+
+
+# Limits of the permutation schedule (see "pipeline_schedule")
+PERMUTATION_WORK = 2**17
+PERMUTATION_MEMORY = 2**30
+
+# Exhaustive scores are streamed if the correlations and
+# statistics of all pairs (three float32 arrays) exceed it
+SCORE_MEMORY = 2**30
 
 
 def get_num_ind(indexes, *args):
@@ -26,6 +51,62 @@ def get_num_ind(indexes, *args):
 
     return result 
 
+def pipeline_statistics():
+    # Thread pool utilization of the last pipeline call
+    # per stage: "pipeline", "rank", "correlation", etc.
+    statistics = []
+    for stage, calls, wall_time, busy_time, utilization in \
+            _pipeline_statistics():
+        statistics.append({
+            "stage": stage,
+            "calls": calls,
+            "wall_time": wall_time,
+            "busy_time": busy_time,
+            "utilization": utilization
+        })
+
+    return statistics
+
+def pipeline_schedule(
+    schedule,
+    data,
+    source_indexes,
+    target_indexes,
+    correlation,
+    process_num
+):
+    # Schedule of the indexed pipelines: "pairs" splits the pairs
+    # of a permutation between the threads, "permutations" computes
+    # whole permutations in every thread. The results are the same.
+    # "auto" chooses permutations if a thread would get less than
+    # PERMUTATION_WORK ((pairs + ranked rows) x samples) of a
+    # permutation and the buffers of the threads (every thread
+    # ranks the rows of its permutation) fit into PERMUTATION_MEMORY
+    if schedule != "auto":
+        return schedule
+
+    if process_num <= 1:
+        return "pairs"
+
+    sample_size = data.shape[1]
+    pairs_number = len(source_indexes)
+
+    rows_number = 0
+    if correlation == "spearman":
+        rows_number = len(np.union1d(source_indexes, target_indexes))
+
+    work = (pairs_number + rows_number) * sample_size / process_num
+    if work >= PERMUTATION_WORK:
+        return "pairs"
+
+    memory = 4 * process_num * (
+        rows_number * sample_size + 3 * pairs_number + 2 * sample_size
+    )
+    if memory > PERMUTATION_MEMORY:
+        return "pairs"
+
+    return "permutations"
+
 def ztest_pipeline( 
     df,
     reference_indexes,
@@ -37,9 +118,38 @@ def ztest_pipeline(
     alternative="two-sided",
     repeats_num=1000,
     process_num=1,
-    numerical_index=False
+    numerical_index=False,
+    stop_exceedances=None,
+    start_row=0,
+    end_row=None,
+    cache=None,
+    checkpoint=None,
+    shard=None,
+    schedule="auto"
 ):
-    data = df.to_numpy(copy=True).astype("float32")
+    # The matrix is not copied if it is float32 and C-contiguous,
+    # pairs address its rows, so a subset is not materialized
+    data = as_matrix(df)
+    
+    # Besag-Clifford sequential stopping: permutations of
+    # an item stop after stop_exceedances exceedances
+    stop_number = 0
+    if stop_exceedances:
+        stop_number = stop_exceedances
+
+    # A shard (start, end) computes the permutations from start + 1
+    # to end of a run of "end" or more permutations with independent
+    # random streams, exceedance counts are returned instead of
+    # permutation p-values (see lib.merge.merge_shards)
+    first_permutation = -1
+    if shard is not None:
+        if stop_number:
+            raise ValueError(
+                "Sequential stopping is not supported by shards"
+            )
+
+        first_permutation = int(shard[0])
+        repeats_num = int(shard[1]) - first_permutation
 
     if np.all(source_indexes != None) and np.all(target_indexes != None):
         if not numerical_index:
@@ -76,9 +186,10 @@ def ztest_pipeline(
             exp_num_indexes
         ).astype("int32")
 
-        ref_corrs, exp_corrs, \
-        stat, pvalue, bootstrap_pvalue = \
-            _ztest_pipeline_indexed(
+        pairs = (source_num_indexes, target_num_indexes)
+        
+        def compute():
+            return _ztest_pipeline_indexed(
                 data,
                 source_num_indexes,
                 target_num_indexes,
@@ -87,7 +198,19 @@ def ztest_pipeline(
                 correlation,
                 alternative,
                 repeats_num,
-                process_num
+                process_num,
+                stop_number,
+                *checkpoint_arguments(
+                    checkpoint, "ztest", *pairs,
+                    ref_num_indexes, exp_num_indexes,
+                    correlation, alternative, stop_number,
+                    first_permutation
+                ),
+                first_permutation,
+                pipeline_schedule(
+                    schedule, data, source_num_indexes,
+                    target_num_indexes, correlation, process_num
+                )
             ) 
     else:
         if not numerical_index:
@@ -108,17 +231,47 @@ def ztest_pipeline(
             exp_num_indexes
         ).astype("int32")
 
-        ref_corrs, exp_corrs, \
-        stat, pvalue, bootstrap_pvalue = \
-            _ztest_pipeline_exhaustive(
+        if end_row is None:
+            end_row = -1
+        pairs = ("exhaustive", start_row, end_row)
+        
+        def compute():
+            return _ztest_pipeline_exhaustive(
                 data,
                 ref_num_indexes,
                 exp_num_indexes,
                 correlation,
                 alternative,
                 repeats_num,
-                process_num
+                process_num,
+                stop_number,
+                start_row,
+                end_row,
+                *checkpoint_arguments(
+                    checkpoint, "ztest", *pairs,
+                    ref_num_indexes, exp_num_indexes,
+                    correlation, alternative, stop_number,
+                    first_permutation
+                ),
+                first_permutation
             ) 
+
+    ref_corrs, exp_corrs, \
+    stat, pvalue, bootstrap_pvalue, permutations = \
+        _cached_ztest_pipeline(
+            compute,
+            get_cache(cache),
+            data,
+            pairs,
+            ref_num_indexes,
+            exp_num_indexes,
+            correlation,
+            alternative,
+            repeats_num,
+            process_num,
+            stop_number,
+            first_permutation
+        )
     
     if correlation_alternative:
         ref_pvalues = correlation_test(
@@ -135,12 +288,98 @@ def ztest_pipeline(
             alternative=correlation_alternative
         )
 
+        if stop_exceedances:
+            return ref_corrs, ref_pvalues, exp_corrs, \
+                exp_pvalues, stat, pvalue, bootstrap_pvalue, \
+                permutations
+        
         return ref_corrs, ref_pvalues, exp_corrs, \
                 exp_pvalues, stat, pvalue, bootstrap_pvalue
 
+    if stop_exceedances:
+        return ref_corrs, exp_corrs, \
+            stat, pvalue, bootstrap_pvalue, permutations
+
     return ref_corrs, exp_corrs, \
             stat, pvalue, bootstrap_pvalue
 
+def _cached_ztest_pipeline(
+    compute,
+    cache,
+    data,
+    pairs,
+    ref_num_indexes,
+    exp_num_indexes,
+    correlation,
+    alternative,
+    repeats_num,
+    process_num,
+    stop_number,
+    first_permutation=-1
+):
+    # Observed correlations are cached by the data, the samples,
+    # the correlation and the pairs, permutation results also by
+    # the alternative and the permutation parameters. The z-test
+    # of cached correlations is computed by the same native code.
+    # Counts of a shard are cached by its first permutation too
+    if cache is None:
+        return compute()
+
+    data_key = cache.key(data)
+    corrs_keys = [
+        cache.key("pipeline_corrs", data_key, correlation, samples, *pairs)
+        for samples in [ref_num_indexes, exp_num_indexes]
+    ]
+    permutation_keys = [
+        cache.key(
+            name, data_key, correlation, alternative,
+            ref_num_indexes, exp_num_indexes,
+            repeats_num, stop_number, *pairs,
+            *([first_permutation] if first_permutation >= 0 else [])
+        )
+        for name in ["bootstrap_pvalue", "permutations"]
+    ]
+
+    corrs = cache.get_many(*corrs_keys)
+    permutation_results = None
+    if repeats_num > 0:
+        permutation_results = cache.get_many(*permutation_keys)
+
+    if (corrs is None) or \
+            ((repeats_num > 0) and (permutation_results is None)):
+        ref_corrs, exp_corrs, \
+        stat, pvalue, bootstrap_pvalue, permutations = compute()
+        
+        cache.put(corrs_keys[0], ref_corrs)
+        cache.put(corrs_keys[1], exp_corrs)
+        if repeats_num > 0:
+            cache.put(permutation_keys[0], bootstrap_pvalue)
+            cache.put(permutation_keys[1], permutations)
+
+        return ref_corrs, exp_corrs, \
+            stat, pvalue, bootstrap_pvalue, permutations
+
+    # Cached arrays are copied, the results are modified in place
+    ref_corrs, exp_corrs = [np.array(corr) for corr in corrs]
+    stat, pvalue = ztest(
+        ref_corrs, len(ref_num_indexes),
+        exp_corrs, len(exp_num_indexes),
+        correlation=correlation,
+        alternative=alternative,
+        process_num=process_num
+    )
+
+    if repeats_num > 0:
+        bootstrap_pvalue, permutations = [
+            np.array(result) for result in permutation_results
+        ]
+    else:
+        bootstrap_pvalue = np.zeros(len(ref_corrs), dtype="float32")
+        permutations = np.zeros(len(ref_corrs), dtype="int32")
+
+    return ref_corrs, exp_corrs, \
+        stat, pvalue, bootstrap_pvalue, permutations
+
 def score_pipeline( 
     df,
     reference_indexes,
@@ -153,8 +392,39 @@ def score_pipeline(
     repeats_num=1000,
     process_num=1,
     numerical_index=False,
+    stop_exceedances=None,
+    cache=None,
+    checkpoint=None,
+    shard=None,
+    schedule="auto",
+    memory_budget=None
 ):
-    data = df.to_numpy(copy=True).astype("float32")
+    # The matrix is not copied if it is float32 and C-contiguous,
+    # pairs address its rows, so a subset is not materialized
+    data = as_matrix(df)
+    
+    # Besag-Clifford sequential stopping: permutations of
+    # an item stop after stop_exceedances exceedances
+    stop_number = 0
+    if stop_exceedances:
+        stop_number = stop_exceedances
+
+    # A list of scores is computed over the same permutations,
+    # its results are (score, source) matrices
+    several = not isinstance(score, str)
+    if several:
+        score = ",".join(score)
+
+    # Shards (see "ztest_pipeline")
+    first_permutation = -1
+    if shard is not None:
+        if stop_number:
+            raise ValueError(
+                "Sequential stopping is not supported by shards"
+            )
+
+        first_permutation = int(shard[0])
+        repeats_num = int(shard[1]) - first_permutation
 
     if np.all(source_indexes != None) and np.all(target_indexes != None):
         if not numerical_index:
@@ -191,10 +461,14 @@ def score_pipeline(
             exp_num_indexes
         ).astype("int32")
         
-        reorder(source_num_indexes, target_num_indexes)
+        # Pairs of an InteractionIndex are already sorted by source
+        if np.any(source_num_indexes[1:] < source_num_indexes[:-1]):
+            reorder(source_num_indexes, target_num_indexes)
         
-        indexes, scores, pvalues = \
-            _score_pipeline_indexed(
+        pairs = (source_num_indexes, target_num_indexes)
+        
+        def compute():
+            return _score_pipeline_indexed(
                 data,
                 source_num_indexes,
                 target_num_indexes,
@@ -204,7 +478,19 @@ def score_pipeline(
                 score,
                 alternative,
                 repeats_num,
-                process_num
+                process_num,
+                stop_number,
+                *checkpoint_arguments(
+                    checkpoint, "score", *pairs,
+                    ref_num_indexes, exp_num_indexes,
+                    correlation, score, alternative, stop_number,
+                    first_permutation
+                ),
+                first_permutation,
+                pipeline_schedule(
+                    schedule, data, source_num_indexes,
+                    target_num_indexes, correlation, process_num
+                )
             )
     else:
         if not numerical_index:
@@ -225,18 +511,318 @@ def score_pipeline(
             exp_num_indexes
         ).astype("int32")
         
-        scores, pvalues = \
-            _score_pipeline_exhaustive(
+        pairs = ("exhaustive",)
+
+        # Pairs are not stored if they do not fit into the
+        # budget, the results are the same
+        if memory_budget is None:
+            memory_budget = SCORE_MEMORY
+        pairs_number = data.shape[0] * (data.shape[0] - 1) // 2
+        streaming = 12 * pairs_number > memory_budget
+        
+        def compute():
+            scores, pvalues, permutations = \
+                _score_pipeline_exhaustive(
+                    data,
+                    ref_num_indexes,
+                    exp_num_indexes,
+                    correlation,
+                    score,
+                    alternative,
+                    repeats_num,
+                    process_num,
+                    stop_number,
+                    *checkpoint_arguments(
+                        checkpoint, "score", *pairs,
+                        ref_num_indexes, exp_num_indexes,
+                        correlation, score, alternative, stop_number,
+                        first_permutation
+                    ),
+                    first_permutation,
+                    streaming
+                )
+
+            indexes = np.arange(data.shape[0], dtype="int32")
+            return indexes, scores, pvalues, permutations
+
+    # Scores are cached with all the parameters
+    # they depend on (see "_cached_ztest_pipeline")
+    cache = get_cache(cache)
+    if cache is None:
+        indexes, scores, pvalues, permutations = compute()
+    else:
+        data_key = cache.key(data)
+        keys = [
+            cache.key(
+                name, data_key, correlation, score, alternative,
+                ref_num_indexes, exp_num_indexes,
+                repeats_num, stop_number, *pairs,
+                *([first_permutation] if first_permutation >= 0 else [])
+            )
+            for name in ["indexes", "scores", "pvalues", "permutations"]
+        ]
+
+        results = cache.get_many(*keys)
+        if results is None:
+            results = compute()
+            for key, result in zip(keys, results):
+                cache.put(key, result)
+
+        indexes, scores, pvalues, permutations = [
+            np.array(result) for result in results
+        ]
+
+    if several:
+        scores, pvalues, permutations = [
+            result.reshape(-1, len(indexes))
+            for result in (scores, pvalues, permutations)
+        ]
+    
+    if stop_exceedances:
+        return indexes, scores, pvalues, permutations
+
+    return indexes, scores, pvalues
+
+def ztest_score_pipeline(
+    df,
+    reference_indexes,
+    experimental_indexes,
+    source_indexes,
+    target_indexes,
+    edge_sources,
+    edge_pairs,
+    correlation="spearman",
+    score="mean",
+    correlation_alternative=False,
+    alternative="two-sided",
+    repeats_num=1000,
+    process_num=1,
+    stop_exceedances=None
+):
+    # Z-tests of the pairs and scores of the sources over the same
+    # permutations, indexes are numerical. Edges of the scores are
+    # the pairs "edge_pairs" taken from the sources "edge_sources"
+    # (sorted), e.g. InteractionIndex.score_edges(). Returns the
+    # results of "ztest_pipeline" and "score_pipeline" (with
+    # permutation numbers)
+    data = as_matrix(df)
+
+    stop_number = 0
+    if stop_exceedances:
+        stop_number = stop_exceedances
+
+    source_num_indexes = np.array(source_indexes).astype("int32")
+    target_num_indexes = np.array(target_indexes).astype("int32")
+    ref_num_indexes = np.array(reference_indexes).astype("int32")
+    exp_num_indexes = np.array(experimental_indexes).astype("int32")
+
+    ref_corrs, exp_corrs, \
+    stat, pvalue, bootstrap_pvalue, permutations, \
+    indexes, scores, pvalues, score_permutations = \
+        _ztest_score_pipeline_indexed(
+            data,
+            source_num_indexes,
+            target_num_indexes,
+            np.ascontiguousarray(edge_sources, dtype="int32"),
+            np.ascontiguousarray(edge_pairs, dtype="int32"),
+            ref_num_indexes,
+            exp_num_indexes,
+            correlation,
+            score,
+            alternative,
+            repeats_num,
+            process_num,
+            stop_number
+        )
+
+    ref_pvalues, exp_pvalues = None, None
+    if correlation_alternative:
+        ref_pvalues = correlation_test(
+            ref_corrs,
+            len(ref_num_indexes),
+            correlation=correlation,
+            alternative=correlation_alternative
+        )
+
+        exp_pvalues = correlation_test(
+            exp_corrs,
+            len(exp_num_indexes),
+            correlation=correlation,
+            alternative=correlation_alternative
+        )
+
+    return (
+        ref_corrs, ref_pvalues, exp_corrs, exp_pvalues,
+        stat, pvalue, bootstrap_pvalue, permutations
+    ), (
+        indexes, scores, pvalues, score_permutations
+    )
+
+def contrast_groups(group_indexes, contrasts):
+    # Sample indexes of the groups and group numbers
+    # of the (reference, experimental) contrasts
+    groups = [
+        np.array(indexes).astype("int32")
+        for indexes in group_indexes
+    ]
+
+    contrasts = np.array(contrasts, dtype="int32").reshape(-1, 2)
+    reference_groups = np.ascontiguousarray(contrasts[:, 0])
+    experimental_groups = np.ascontiguousarray(contrasts[:, 1])
+
+    return groups, reference_groups, experimental_groups
+
+def ztest_pipeline_contrasts(
+    df,
+    group_indexes,
+    contrasts,
+    source_indexes=None,
+    target_indexes=None,
+    correlation="spearman",
+    correlation_alternative=False,
+    alternative="two-sided",
+    repeats_num=1000,
+    process_num=1,
+    stop_exceedances=None
+):
+    # Z-tests of several contrasts, "group_indexes" are numerical
+    # sample indexes of the groups, "contrasts" are pairs of group
+    # numbers. Correlations (and their p-values) are computed once
+    # per group, contrasts of equal group sizes share permutations.
+    # Correlations are (group, pair) arrays, the rest of the
+    # results are (contrast, pair) ones
+    data = as_matrix(df)
+
+    stop_number = 0
+    if stop_exceedances:
+        stop_number = stop_exceedances
+    
+    groups, reference_groups, experimental_groups = \
+        contrast_groups(group_indexes, contrasts)
+
+    if np.all(source_indexes != None) and np.all(target_indexes != None):
+        source_num_indexes = np.array(
+            source_indexes
+        ).astype("int32")
+        target_num_indexes = np.array(
+            target_indexes
+        ).astype("int32")
+
+        corrs, stat, pvalue, bootstrap_pvalue, permutations = \
+            _ztest_pipeline_contrasts_indexed(
                 data,
-                ref_num_indexes,
-                exp_num_indexes,
+                source_num_indexes,
+                target_num_indexes,
+                groups,
+                reference_groups,
+                experimental_groups,
+                correlation,
+                alternative,
+                repeats_num,
+                process_num,
+                stop_number
+            )
+    else:
+        corrs, stat, pvalue, bootstrap_pvalue, permutations = \
+            _ztest_pipeline_contrasts_exhaustive(
+                data,
+                groups,
+                reference_groups,
+                experimental_groups,
                 correlation,
-                score,
                 alternative,
                 repeats_num,
-                process_num
+                process_num,
+                stop_number
             )
 
-        indexes = np.arange(data.shape[0], dtype="int32")
+    shape = (len(reference_groups), -1)
+    stat = stat.reshape(shape)
+    pvalue = pvalue.reshape(shape)
+    bootstrap_pvalue = bootstrap_pvalue.reshape(shape)
+    permutations = permutations.reshape(shape)
+    corrs = corrs.reshape(len(groups), -1)
+
+    corr_pvalues = None
+    if correlation_alternative:
+        corr_pvalues = np.stack([
+            correlation_test(
+                group_corrs,
+                len(indexes),
+                correlation=correlation,
+                alternative=correlation_alternative
+            )
+            for group_corrs, indexes in zip(corrs, groups)
+        ])
     
-    return indexes, scores, pvalues
+    return corrs, corr_pvalues, \
+        stat, pvalue, bootstrap_pvalue, permutations
+
+def score_pipeline_contrasts(
+    df,
+    group_indexes,
+    contrasts,
+    source_indexes=None,
+    target_indexes=None,
+    correlation="spearman",
+    score="mean",
+    alternative="two-sided",
+    repeats_num=1000,
+    process_num=1,
+    stop_exceedances=None
+):
+    # Scores of several contrasts (see "ztest_pipeline_contrasts"),
+    # the results are (contrast, source) arrays
+    data = as_matrix(df)
+
+    stop_number = 0
+    if stop_exceedances:
+        stop_number = stop_exceedances
+    
+    groups, reference_groups, experimental_groups = \
+        contrast_groups(group_indexes, contrasts)
+
+    if np.all(source_indexes != None) and np.all(target_indexes != None):
+        source_num_indexes = np.array(
+            source_indexes
+        ).astype("int32")
+        target_num_indexes = np.array(
+            target_indexes
+        ).astype("int32")
+        
+        if np.any(source_num_indexes[1:] < source_num_indexes[:-1]):
+            reorder(source_num_indexes, target_num_indexes)
+
+        indexes, scores, pvalues, permutations = \
+            _score_pipeline_contrasts_indexed(
+                data,
+                source_num_indexes,
+                target_num_indexes,
+                groups,
+                reference_groups,
+                experimental_groups,
+                correlation,
+                score,
+                alternative,
+                repeats_num,
+                process_num,
+                stop_number
+            )
+    else:
+        indexes, scores, pvalues, permutations = \
+            _score_pipeline_contrasts_exhaustive(
+                data,
+                groups,
+                reference_groups,
+                experimental_groups,
+                correlation,
+                score,
+                alternative,
+                repeats_num,
+                process_num,
+                stop_number
+            )
+
+    shape = (len(reference_groups), -1)
+    return indexes, scores.reshape(shape), \
+        pvalues.reshape(shape), permutations.reshape(shape)
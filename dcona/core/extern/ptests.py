@@ -2,7 +2,11 @@ import numpy as np
 
 from .tests import \
     _ztest_sized, \
-    _ztest_unsized
+    _ztest_unsized, \
+    _fdr_histogram, \
+    _fdr_plan, \
+    _fdr_collect, \
+    _fdr_adjust
 
 
 def ztest(
@@ -43,3 +47,94 @@ def ztest(
         )
     
     return stat, pvalue
+
+def fdr_histogram(
+    pvalues,
+    histogram=None,
+    process_num=1
+):
+    # Histogram of a chunk of p-values merged
+    # with the histogram of the previous chunks
+    counts, mins, maxs = _fdr_histogram(
+        np.asarray(pvalues, dtype="float32").ravel(),
+        process_num
+    )
+
+    if histogram is not None:
+        counts += histogram[0]
+        mins = np.minimum(mins, histogram[1])
+        maxs = np.maximum(maxs, histogram[2])
+
+    return counts, mins, maxs
+
+def fdr_plan(
+    histogram,
+    threshold=None,
+    top_k=None
+):
+    counts, mins, maxs = histogram
+    return _fdr_plan(
+        counts, mins, maxs,
+        -1 if threshold is None else threshold,
+        -1 if top_k is None else top_k
+    )
+
+def fdr_collect(
+    pvalues,
+    plan,
+    offset=0
+):
+    collect, tail = plan
+    return _fdr_collect(
+        np.asarray(pvalues, dtype="float32").ravel(),
+        collect,
+        offset
+    )
+
+def fdr_adjust(
+    pvalues,
+    indexes,
+    histogram,
+    plan,
+    threshold=None,
+    top_k=None,
+    process_num=1
+):
+    collect, tail = plan
+    if indexes is None:
+        indexes = np.empty(0, dtype="int64")
+
+    return _fdr_adjust(
+        np.asarray(pvalues, dtype="float32").ravel(),
+        np.asarray(indexes, dtype="int64"),
+        histogram[0],
+        collect,
+        tail,
+        -1 if threshold is None else threshold,
+        -1 if top_k is None else top_k,
+        process_num
+    )
+
+def fdr_select(
+    pvalues,
+    threshold=None,
+    top_k=None,
+    process_num=1
+):
+    # Benjamini-Hochberg adjusted p-values in ascending
+    # order without a global sort: p-values are bucketed by
+    # a histogram and only the buckets of the selected ranks
+    # are sorted. Returns indexes and adjusted p-values of
+    # all p-values, of the "top_k" ones or of the ones with
+    # adjusted p-value less than "threshold"
+    pvalues = np.asarray(pvalues, dtype="float32").ravel()
+
+    histogram = fdr_histogram(pvalues, process_num=process_num)
+    plan = fdr_plan(histogram, threshold, top_k)
+    
+    return fdr_adjust(
+        pvalues, None,
+        histogram, plan,
+        threshold, top_k,
+        process_num
+    )
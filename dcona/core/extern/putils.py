@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 
 from .utils import UNDEFINED_INDEX
 from .utils import \
@@ -6,28 +7,65 @@ from .utils import \
     _paired_index, \
     _unary_vector, \
     _unary_matrix, \
+    _paired_index_batch, \
+    _unary_index_batch, \
     _quadrate, \
     _reorder, \
-    _reorder_data
+    _reorder_data, \
+    _rank_rows
 
 
+def as_matrix(data):
+    # Float32 C-contiguous matrix of a DataFrame or an array.
+    # Compatible buffers (float32 arrays, memory maps and
+    # DataFrames over them) are passed without a copy
+    if isinstance(data, pd.DataFrame):
+        data = data.to_numpy(copy=False)
+
+    return np.ascontiguousarray(data, dtype="float32")
+
+def rank_rows(data, rows=None, process_num=1):
+    # Ordinal ranks of the listed rows (of all
+    # rows if "rows" is None) of the matrix
+    if rows is None:
+        rows = np.zeros(0, dtype="int32")
+    rows = np.ascontiguousarray(rows, dtype="int32")
+
+    return _rank_rows(as_matrix(data), rows, process_num)
+
 def paired_index(index, base):
-    return _paired_index(index, base)
+    # Pair indexes are 64-bit: exhaustive runs
+    # may have more than 2^31 pairs
+    return _paired_index(int(index), int(base))
 
 def unary_index(first, second, base):
-    result = _unary_index(first, second, base)
+    result = _unary_index(int(first), int(second), int(base))
     
     if result == UNDEFINED_INDEX:
         return None
     
     return result
 
+def paired_index_batch(indexes, base, process_num=1):
+    indexes = np.ascontiguousarray(indexes, dtype="int64")
+    return _paired_index_batch(indexes, int(base), process_num)
+
+def unary_index_batch(source_indexes, target_indexes, base, process_num=1):
+    source_indexes = np.ascontiguousarray(source_indexes, dtype="int32")
+    target_indexes = np.ascontiguousarray(target_indexes, dtype="int32")
+    return _unary_index_batch(
+        source_indexes,
+        target_indexes,
+        int(base),
+        process_num
+    )
+
 def unary_array(index, base):
     index = np.array(index, dtype="int32")
     return _unary_vector(index, base)
 
 def unary_matrix(index, base):
-    index = index.astyp("int32")
+    index = np.array(index, dtype="int32")
     return _unary_matrix(index, base)
 
 def quadrate(flatten_array, index, base):
@@ -1,3 +1,6 @@
-from .ztest import ztest
-from .zscore import zscore
+from .ztest import ztest, ztest_many
+from .zscore import zscore, zscore_many
 from .hypergeom import hypergeom
+from .pipeline import pipeline, ztest_zscore
+from .merge import merge_shards
+from .interactions import InteractionIndex
@@ -1,12 +1,35 @@
 import tqdm
 import sys
 import os
+import json
 import numpy as np
+import pandas as pd
 
 from ..core import extern as cextern
 
 CHUNK_LENGTH = 10**5
 
+# Output formats: a csv file, a parquet or feather (arrow IPC)
+# file or a directory of .npy columns with a name dictionary
+OUTPUT_FORMATS = ["csv", "parquet", "feather", "npy"]
+EXTENSIONS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "npy": ""
+}
+
+# Columns with molecule names, they are stored as
+# integer codes of the name dictionary in binary formats
+CODED_COLUMNS = ["Source", "Target", "Molecule"]
+
+NAMES_FILE = "names.npy"
+TABLE_FILE = "table.json"
+
+# Size of the .npy header reserved for the columns
+# of unknown length, it fits any int64 shape
+NPY_HEADER_SIZE = 128
+
 
 def check_directory_existence(
     directory_path,
@@ -20,15 +43,361 @@ def check_directory_existence(
         print(message_access)
         sys.exit()
 
+def check_output_format(output_format):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unknown output format: {output_format}, "
+            f"use one of {', '.join(OUTPUT_FORMATS)}"
+        )
+
+    if output_format in ["parquet", "feather"]:
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(
+                f"{output_format} output requires pyarrow: "
+                "pip install pyarrow"
+            )
+
+def output_path(output_dir, file_name, output_format="csv"):
+    check_output_format(output_format)
+    return output_dir.rstrip("/") + f"/{file_name}" + \
+        EXTENSIONS[output_format]
+
+def get_format(path):
+    if os.path.isdir(path):
+        return "npy"
+
+    for output_format in ["parquet", "feather"]:
+        if path.endswith(EXTENSIONS[output_format]):
+            return output_format
+
+    return "csv"
+
+def encode_names(*name_arrays):
+    # Builds the name dictionary of several name
+    # arrays and returns their integer codes
+    codes, names = pd.factorize(
+        np.concatenate([np.asarray(arr) for arr in name_arrays])
+    )
+    codes = codes.astype("int32")
+
+    result = []
+    start = 0
+    for arr in name_arrays:
+        result.append(codes[start : start + len(arr)])
+        start += len(arr)
+
+    return np.asarray(names), result
+
+def _npy_header(dtype, length):
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % \
+        (np.lib.format.dtype_to_descr(dtype), length)
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+
+    return np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + \
+        len(header).to_bytes(2, "little") + header.encode("latin1")
+
+class TableWriter:
+    # Appends DataFrame chunks to a table in one of the
+    # OUTPUT_FORMATS. The CODED_COLUMNS of the chunks contain
+    # integer codes of "names", they are written as names
+    # to csv, as dictionary columns to parquet and feather
+    # and as int32 columns with the names.npy dictionary
+    # to the npy directory. Columns of an npy directory are
+    # appended as raw data, the headers are written on close
+
+    def __init__(self, path, names, output_format="csv"):
+        check_output_format(output_format)
+
+        self.path = path
+        self.names = np.asarray(names)
+        self.output_format = output_format
+        self.length = 0
+        self.written = False
+        self.writer = None
+        self.files = None
+        self.dtypes = None
+
+        if self.names.dtype == object:
+            self.names = self.names.astype(str)
+
+        if output_format == "npy":
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, NAMES_FILE), self.names)
+
+    def write(self, df):
+        coded_columns = [
+            column for column in df.columns
+            if column in CODED_COLUMNS
+        ]
+
+        if self.output_format == "csv":
+            df = df.copy()
+            for column in coded_columns:
+                df[column] = self.names[np.asarray(df[column])]
+
+            df.to_csv(
+                self.path,
+                sep=",",
+                index=None,
+                mode='w' if self.length == 0 else 'a',
+                header=(self.length == 0)
+            )
+        elif self.output_format in ["parquet", "feather"]:
+            import pyarrow
+
+            df = df.copy()
+            for column in coded_columns:
+                df[column] = pd.Categorical.from_codes(
+                    np.asarray(df[column]),
+                    categories=self.names
+                )
+
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            if self.writer is None:
+                if self.output_format == "parquet":
+                    import pyarrow.parquet
+                    self.writer = pyarrow.parquet.ParquetWriter(
+                        self.path, table.schema
+                    )
+                else:
+                    import pyarrow.ipc
+                    self.writer = pyarrow.ipc.new_file(
+                        self.path, table.schema
+                    )
+
+            self.writer.write_table(table)
+        else:
+            if self.files is None:
+                self.dtypes = {}
+                self.files = {}
+                for column in df.columns:
+                    dtype = np.asarray(df[column]).dtype
+                    if column in coded_columns:
+                        dtype = np.dtype("int32")
+                    elif dtype == object:
+                        raise ValueError(
+                            f"Column {column} can not be saved as npy"
+                        )
+
+                    self.dtypes[column] = dtype
+                    self.files[column] = open(
+                        os.path.join(self.path, f"{column}.npy"), "wb"
+                    )
+                    self.files[column].write(bytes(NPY_HEADER_SIZE))
+
+            for column in df.columns:
+                self.files[column].write(
+                    np.ascontiguousarray(
+                        df[column], dtype=self.dtypes[column]
+                    ).tobytes()
+                )
+
+        self.length += len(df)
+        self.written = True
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+        if (self.files is None) and (self.output_format == "npy"):
+            self.dtypes = {}
+            self.files = {}
+
+        if self.files is not None:
+            for column in self.files:
+                self.files[column].seek(0)
+                self.files[column].write(
+                    _npy_header(self.dtypes[column], self.length)
+                )
+                self.files[column].close()
+
+            with open(os.path.join(self.path, TABLE_FILE), "w") as table_file:
+                json.dump({
+                    "columns": list(self.files),
+                    "length": self.length
+                }, table_file)
+
+            self.files = None
+
+        # A file is created even without chunks, empty
+        # chunks leave the header in it
+        if (not self.written) and (self.output_format == "csv"):
+            open(self.path, "w").close()
+
+def save_table(df, path_to_file, output_format="csv"):
+    # Saves a whole DataFrame, names of CODED_COLUMNS
+    # are encoded with a common dictionary
+    coded_columns = [
+        column for column in df.columns
+        if column in CODED_COLUMNS
+    ]
+    names, codes = [], []
+    if coded_columns:
+        names, codes = encode_names(
+            *[df[column] for column in coded_columns]
+        )
+
+    df = df.copy()
+    for column, column_codes in zip(coded_columns, codes):
+        df[column] = column_codes
+
+    writer = TableWriter(path_to_file, names, output_format)
+    writer.write(df)
+    writer.close()
+
+def read_column(path, column, mmap=True):
+    # Reads a single column of a table, columns of npy
+    # directories and feather files are memory-mapped
+    output_format = get_format(path)
+
+    if output_format == "npy":
+        values = np.load(
+            os.path.join(path, f"{column}.npy"),
+            mmap_mode='r' if mmap else None
+        )
+        if column in CODED_COLUMNS:
+            names = np.load(os.path.join(path, NAMES_FILE))
+            values = pd.Categorical.from_codes(values, categories=names)
+
+        return values
+
+    return read_table(path, columns=[column], mmap=mmap)[column]
+
+def check_columns(path, columns, table_columns):
+    # Requested columns must be in the table, e.g. AdjPvalue
+    # is not written by a streamed z-test without a selection
+    if columns is None:
+        return
+
+    missing = [column for column in columns if column not in table_columns]
+    if missing:
+        raise ValueError(
+            f"Columns are not in the table {path}: {', '.join(missing)}"
+        )
+
+def read_table(path, columns=None, mmap=True):
+    # Reads a table saved in any of OUTPUT_FORMATS, names are
+    # returned as categorical columns for binary formats
+    output_format = get_format(path)
+
+    if output_format == "csv":
+        return pd.read_csv(path, sep=",", usecols=columns)
+
+    if output_format == "parquet":
+        return pd.read_parquet(path, columns=columns)
+
+    if output_format == "feather":
+        import pyarrow.feather
+        return pyarrow.feather.read_table(
+            path, columns=columns, memory_map=mmap
+        ).to_pandas()
+
+    with open(os.path.join(path, TABLE_FILE), "r") as table_file:
+        table = json.load(table_file)
+
+    check_columns(path, columns, table["columns"])
+    if columns is None:
+        columns = table["columns"]
+
+    return pd.DataFrame({
+        column: read_column(path, column, mmap=mmap)
+        for column in columns
+    })
+
+def read_chunks(path, columns=None, chunk_length=CHUNK_LENGTH):
+    # Iterates over a table saved in any of OUTPUT_FORMATS by
+    # chunks of rows. Names are categorical columns in the chunks
+    # of binary formats, npy columns are sliced from memory maps
+    output_format = get_format(path)
+
+    if output_format == "csv":
+        header = pd.read_csv(path, sep=",", nrows=0).columns
+        check_columns(path, columns, header)
+        for chunk in pd.read_csv(
+            path, sep=",", usecols=columns, chunksize=chunk_length
+        ):
+            yield chunk
+        return
+
+    if output_format == "parquet":
+        import pyarrow.parquet
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        check_columns(path, columns, parquet_file.schema_arrow.names)
+        for batch in parquet_file.iter_batches(
+            batch_size=chunk_length, columns=columns
+        ):
+            yield batch.to_pandas()
+        return
+
+    if output_format == "feather":
+        import pyarrow.ipc
+        with pyarrow.memory_map(path, "r") as source:
+            reader = pyarrow.ipc.open_file(source)
+            check_columns(path, columns, reader.schema.names)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+
+                for start in range(0, batch.num_rows, chunk_length):
+                    yield batch.slice(start, chunk_length).to_pandas()
+        return
+
+    with open(os.path.join(path, TABLE_FILE), "r") as table_file:
+        table = json.load(table_file)
+
+    check_columns(path, columns, table["columns"])
+    if columns is None:
+        columns = table["columns"]
+
+    values = {}
+    for column in columns:
+        values[column] = np.load(
+            os.path.join(path, f"{column}.npy"), mmap_mode='r'
+        )
+
+    dtype = None
+    if any(column in CODED_COLUMNS for column in columns):
+        dtype = pd.CategoricalDtype(
+            np.load(os.path.join(path, NAMES_FILE))
+        )
+
+    for start in range(0, table["length"], chunk_length):
+        chunk = {}
+        for column in columns:
+            chunk_values = np.asarray(
+                values[column][start : start + chunk_length]
+            )
+            if column in CODED_COLUMNS:
+                chunk_values = pd.Categorical.from_codes(
+                    chunk_values, dtype=dtype
+                )
+            chunk[column] = chunk_values
+
+        yield pd.DataFrame(chunk)
+
 def save_by_chunks(
     indexes, df_indexes,
-    df_template, df_columns, 
+    df_template, df_columns,
     path_to_file,
     index_transform=None,
-    chunk_length=CHUNK_LENGTH
+    chunk_length=CHUNK_LENGTH,
+    output_format="csv"
 ):
-    MODE, HEADER = 'w', True
-    
+    # Pair indexes of exhaustive runs exceed int32
+    indexes = np.asarray(indexes, dtype="int64")
+
+    # Molecule names are written as integer codes
+    if (isinstance(df_indexes, tuple)) and (len(df_indexes) == 2):
+        names, (source_codes, target_codes) = encode_names(*df_indexes)
+    else:
+        names = np.asarray(df_indexes)
+
+    writer = TableWriter(path_to_file, names, output_format)
+
     # Splitting rows into chunks
     chunk_number = (len(indexes) + chunk_length - 1) // chunk_length
 
@@ -37,38 +406,28 @@ def save_by_chunks(
         end = (i + 1) * chunk_length
         if i >= chunk_number - 1:
             end = len(indexes)
-        
+
         dump_indexes = indexes[start : end]
-        
+
         if (isinstance(df_indexes, tuple)) and (len(df_indexes) == 2):
-            source_indexes, target_indexes = df_indexes
-            source_indexes = np.array(source_indexes)[dump_indexes]
-            target_indexes = np.array(target_indexes)[dump_indexes]
+            source_indexes = source_codes[dump_indexes]
+            target_indexes = target_codes[dump_indexes]
         else:
-            source_indexes = []
-            target_indexes = []
-            for ind in dump_indexes:
-                if not (index_transform is None):
-                    ind = index_transform[ind]
-
-                s, t = cextern.paired_index(ind, len(df_indexes))
-                source_indexes.append(df_indexes[s])
-                target_indexes.append(df_indexes[t])
-        
+            pair_indexes = dump_indexes
+            if not (index_transform is None):
+                pair_indexes = np.asarray(index_transform)[dump_indexes]
+
+            source_indexes, target_indexes = cextern.paired_index_batch(
+                pair_indexes, len(df_indexes)
+            )
+
         output_df = df_template.copy()
         output_df["Source"] = source_indexes
         output_df["Target"] = target_indexes
-        
-        for i in range(len(df_columns)):
-            output_df.iloc[:, i + 2] = df_columns[i][dump_indexes]
-
-        output_df.to_csv(
-            path_to_file,
-            sep=",",
-            index=None,
-            mode=MODE,
-            header=HEADER
-        )
-        
-        MODE, HEADER = 'a', False
 
+        for column, values in zip(df_template.columns[2:], df_columns):
+            output_df[column] = values[dump_indexes]
+
+        writer.write(output_df)
+
+    writer.close()
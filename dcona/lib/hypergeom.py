@@ -2,54 +2,46 @@ import numpy as np
 import pandas as pd
 import scipy.stats
 
+from ..core import extern
 from . import dump
 
 FDR_THRESHOLD = 0.05
 
+# Columns of the z-test output used by hypergeom
+ZTEST_COLUMNS = ["Source", "Target", "Statistic", "AdjPvalue"]
+
+UNDEFINED_POSITION = np.iinfo("int64").max
+
 
 def hypergeom(
     ztest_df,
     alternative="two-sided",
     oriented=True,
-    output_dir=None
+    output_dir=None,
+    output_format="csv",
+    chunk_length=dump.CHUNK_LENGTH
 ):
-    if alternative == "less":
-        report_df = ztest_df[
-            (ztest_df["AdjPvalue"] < FDR_THRESHOLD) &
-            (ztest_df["Statistic"] < 0)
-        ]
-    elif alternative == "greater":
-        report_df = ztest_df[
-            (ztest_df["AdjPvalue"] < FDR_THRESHOLD) &
-            (ztest_df["Statistic"] > 0)
-        ]
-    else:
-        report_df = ztest_df[ztest_df["AdjPvalue"] < FDR_THRESHOLD]
-    
-    if oriented:
-        report_occurrence = get_occurrence(list(report_df["Source"]))
-        initial_occurrence = get_occurrence(list(ztest_df["Source"]))
+    # ztest_df is a DataFrame or a path to a z-test output
+    # in any of dump.OUTPUT_FORMATS, both are read by chunks
+    if isinstance(ztest_df, str):
+        chunks = dump.read_chunks(ztest_df, ZTEST_COLUMNS, chunk_length)
     else:
-        ll = list(report_df["Source"])
-        ll.extend(list(report_df["Target"]))
-        report_occurrence = get_occurrence(ll)
-
-        ll = list(ztest_df["Source"])
-        ll.extend(list(ztest_df["Target"]))
-        initial_occurrence = get_occurrence(ll)
+        chunks = (
+            ztest_df.iloc[start : start + chunk_length]
+            for start in range(0, len(ztest_df), chunk_length)
+        )
 
-    report_interaction_number = 0
-    for index in report_occurrence:
-        report_interaction_number += report_occurrence[index]
+    names, molecules, \
+    report_occurrence, initial_occurrence = \
+    _count_occurrence(chunks, alternative, oriented)
 
-    initial_interaction_number = 0
-    for index in initial_occurrence:
-        initial_interaction_number += initial_occurrence[index]
+    report_interaction_number = report_occurrence.sum()
+    initial_interaction_number = initial_occurrence.sum()
 
     output_df = pd.DataFrame()
-    output_df["Molecule"] = [index for index in report_occurrence]
-    output_df["Diff"] = [report_occurrence[molecule] for molecule in output_df["Molecule"]]
-    output_df["Total"] = [initial_occurrence[molecule] for molecule in output_df["Molecule"]]
+    output_df["Molecule"] = names[molecules]
+    output_df["Diff"] = report_occurrence[molecules]
+    output_df["Total"] = initial_occurrence[molecules]
     output_df["Proportion"] = output_df["Diff"] / output_df["Total"]
     output_df["Pvalue"] = 1 - scipy.stats.hypergeom.cdf(
         output_df["Diff"] - 1,
@@ -58,33 +50,112 @@ def hypergeom(
         output_df["Total"]
     )
 
-    adjusted_pvalue = np.array(output_df["Pvalue"] * len(output_df["Pvalue"]) / \
-        scipy.stats.rankdata(output_df["Pvalue"]))
-    adjusted_pvalue[adjusted_pvalue > 1] = 1
-    adjusted_pvalue = adjusted_pvalue.flatten()
+    # Step-up Benjamini-Hochberg adjustment as in ztest and zscore
+    sorted_indexes, sorted_adjusted_pvalue = extern.fdr_select(
+        output_df["Pvalue"].to_numpy()
+    )
+    adjusted_pvalue = np.empty(len(output_df), dtype="float32")
+    adjusted_pvalue[sorted_indexes] = sorted_adjusted_pvalue
     output_df["AdjPvalue"] = adjusted_pvalue
-    
+
     if output_dir:
         dump.check_directory_existence(output_dir)
-        path_to_file = output_dir.rstrip("/") + \
-            f"/{alternative}_hypergeom.csv"
-        output_df.to_csv(
-            path_to_file,
-            sep=",",
-            index=None
+        path_to_file = dump.output_path(
+            output_dir,
+            f"{alternative}_hypergeom",
+            output_format
         )
+        dump.save_table(output_df, path_to_file, output_format)
 
         print(f"File saved at: {path_to_file}")
         return None
 
     return output_df
 
-def get_occurrence(array):
-    occurrence = {}
-    for elem in array:
-        if elem in occurrence:
-            occurrence[elem] += 1
-        else:
-            occurrence[elem] = 1
-    
-    return occurrence
+def _count_occurrence(chunks, alternative, oriented):
+    # Counts molecules in all and in the reported pairs. Names
+    # are coded by a common dictionary, so the state is a few
+    # arrays of the dictionary size. Reported molecules are
+    # returned in the order of their first occurrence in the
+    # reported sources (and then targets, if not oriented)
+    columns = ["Source"] if oriented else ["Source", "Target"]
+
+    name_index = pd.Index([])
+    report_occurrence = np.zeros(0, dtype="int64")
+    initial_occurrence = np.zeros(0, dtype="int64")
+    first_positions = {
+        column: np.zeros(0, dtype="int64")
+        for column in columns
+    }
+
+    offset = 0
+    for chunk in chunks:
+        report = np.asarray(chunk["AdjPvalue"]) < FDR_THRESHOLD
+        if alternative == "less":
+            report &= np.asarray(chunk["Statistic"]) < 0
+        elif alternative == "greater":
+            report &= np.asarray(chunk["Statistic"]) > 0
+
+        positions = offset + np.flatnonzero(report)
+        offset += len(chunk)
+
+        for column in columns:
+            codes, name_index = _encode(chunk[column], name_index)
+
+            size = len(name_index)
+            if size > len(initial_occurrence):
+                extension = size - len(initial_occurrence)
+                report_occurrence = np.append(
+                    report_occurrence, np.zeros(extension, dtype="int64")
+                )
+                initial_occurrence = np.append(
+                    initial_occurrence, np.zeros(extension, dtype="int64")
+                )
+                for key in first_positions:
+                    first_positions[key] = np.append(
+                        first_positions[key],
+                        np.full(extension, UNDEFINED_POSITION, dtype="int64")
+                    )
+
+            report_codes = codes[report]
+            initial_occurrence += np.bincount(codes, minlength=size)
+            report_occurrence += np.bincount(report_codes, minlength=size)
+
+            unique_codes, unique_indexes = np.unique(
+                report_codes, return_index=True
+            )
+            first_positions[column][unique_codes] = np.minimum(
+                first_positions[column][unique_codes],
+                positions[unique_indexes]
+            )
+
+    order = first_positions["Source"]
+    if not oriented:
+        # Molecules met only as targets follow the sources
+        order = np.where(
+            order != UNDEFINED_POSITION,
+            order,
+            offset + first_positions["Target"]
+        )
+
+    molecules = np.flatnonzero(report_occurrence > 0)
+    molecules = molecules[np.argsort(order[molecules], kind="stable")]
+
+    return name_index.to_numpy(), molecules, \
+        report_occurrence, initial_occurrence
+
+def _encode(values, name_index):
+    # Codes of the names by the common dictionary,
+    # new names are appended to the dictionary
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = np.asarray(values.cat.codes)
+        names = values.cat.categories
+    else:
+        codes, names = pd.factorize(np.asarray(values))
+
+    mapping = name_index.get_indexer(names)
+    if (mapping < 0).any():
+        name_index = name_index.append(pd.Index(names[mapping < 0]))
+        mapping = name_index.get_indexer(names)
+
+    return mapping[codes], name_index
@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+
+from . import utils
+from . import dump
+
+
+class InteractionIndex:
+    # Pairs of an interaction network as int32 codes of the
+    # molecule "names". An unoriented index keeps every pair
+    # as (smaller code, larger code). The index is resolved
+    # against rows of an expression table once ("resolve"),
+    # pairs of the molecules missing in the table are dropped.
+    # Score pipelines use pairs sorted by source with the CSR
+    # offsets of the sources, they are computed once and saved
+    # with the index (unoriented pairs are taken in both
+    # directions)
+
+    def __init__(self, names, sources, targets, oriented=True):
+        self.names = np.asarray(names)
+        self.sources = np.ascontiguousarray(sources, dtype="int32")
+        self.targets = np.ascontiguousarray(targets, dtype="int32")
+        self.oriented = bool(oriented)
+
+        self.offsets = None
+        self.score_targets = None
+
+    def __len__(self):
+        return len(self.sources)
+
+    @classmethod
+    def from_frame(
+        cls,
+        interaction_df,
+        names=None,
+        oriented=True,
+        deduplicate=True
+    ):
+        # Builds the index of "Source" and "Target" columns, codes
+        # are rows of "names" (e.g. the index of an expression
+        # table) or of the dictionary of the columns
+        if not isinstance(interaction_df, pd.DataFrame):
+            interaction_df = utils.generate_pairs(interaction_df)
+
+        if names is None:
+            names, (sources, targets) = dump.encode_names(
+                interaction_df["Source"], interaction_df["Target"]
+            )
+        else:
+            names = np.asarray(names)
+            sources = utils.positions(names, interaction_df["Source"])
+            targets = utils.positions(names, interaction_df["Target"])
+
+            known = (sources != utils.UNDEFINED_POSITION) & \
+                (targets != utils.UNDEFINED_POSITION)
+            sources, targets = sources[known], targets[known]
+
+        index = cls(names, sources, targets, oriented)
+        if not oriented:
+            index._canonicalize()
+        if deduplicate:
+            index._deduplicate()
+
+        return index
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as archive:
+            index = cls(
+                archive["names"],
+                archive["sources"],
+                archive["targets"],
+                bool(archive["oriented"])
+            )
+
+            if "offsets" in archive:
+                index.offsets = archive["offsets"]
+                index.score_targets = archive["score_targets"]
+
+        return index
+
+    def save(self, path):
+        offsets, score_targets = self.score_pairs()
+        np.savez(
+            path,
+            names=self.names.astype(str),
+            sources=self.sources,
+            targets=self.targets,
+            oriented=self.oriented,
+            offsets=offsets,
+            score_targets=score_targets
+        )
+
+    def resolve(self, names):
+        # The index over "names" (rows of an expression table),
+        # it is returned as is if the names are the same
+        names = np.asarray(names)
+        if (len(names) == len(self.names)) and \
+                np.array_equal(names, self.names):
+            return self
+
+        rows = utils.positions(names, self.names)
+        sources = rows[self.sources]
+        targets = rows[self.targets]
+
+        known = (sources != utils.UNDEFINED_POSITION) & \
+            (targets != utils.UNDEFINED_POSITION)
+
+        index = InteractionIndex(
+            names, sources[known], targets[known], self.oriented
+        )
+        if not self.oriented:
+            index._canonicalize()
+
+        return index
+
+    def score_pairs(self):
+        # CSR offsets of the sources and the targets
+        # of the pairs sorted by source (stable)
+        if self.offsets is None:
+            sources, targets = self.sources, self.targets
+            if not self.oriented:
+                loops = sources == targets
+                sources = np.concatenate([sources, targets[~loops]])
+                targets = np.concatenate([targets, self.sources[~loops]])
+
+            order = np.argsort(sources, kind="stable")
+            self.score_targets = np.ascontiguousarray(
+                targets[order], dtype="int32"
+            )
+            self.offsets = np.zeros(len(self.names) + 1, dtype="int64")
+            np.cumsum(
+                np.bincount(sources, minlength=len(self.names)),
+                out=self.offsets[1:]
+            )
+
+        return self.offsets, self.score_targets
+
+    def score_sources(self):
+        # Sources of the pairs sorted by source
+        offsets, _ = self.score_pairs()
+        return np.repeat(
+            np.arange(len(self.names), dtype="int32"),
+            np.diff(offsets)
+        )
+
+    def score_edges(self):
+        # Sources of the pairs sorted by source (see "score_pairs")
+        # and positions of the pairs in the index
+        positions = np.arange(len(self.sources), dtype="int32")
+        sources = self.sources
+        if not self.oriented:
+            loops = self.sources == self.targets
+            sources = np.concatenate([sources, self.targets[~loops]])
+            positions = np.concatenate([positions, positions[~loops]])
+
+        order = np.argsort(sources, kind="stable")
+        return sources[order], positions[order]
+
+    def pair_names(self):
+        return self.names[self.sources], self.names[self.targets]
+
+    def to_frame(self):
+        sources, targets = self.pair_names()
+        return pd.DataFrame({"Source": sources, "Target": targets})
+
+    def _canonicalize(self):
+        sources = np.minimum(self.sources, self.targets)
+        targets = np.maximum(self.sources, self.targets)
+        self.sources, self.targets = sources, targets
+        self.offsets, self.score_targets = None, None
+
+    def _deduplicate(self):
+        # The first occurrence of every pair is kept
+        keys = self.sources.astype("int64") * len(self.names) + self.targets
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+
+        self.sources = self.sources[first]
+        self.targets = self.targets[first]
+        self.offsets, self.score_targets = None, None
+
+def interaction_index(interaction):
+    # Interactions of ztest and zscore: an InteractionIndex, a path
+    # to a saved one, a DataFrame or a list of molecules (all their
+    # pairs). Pairs of a DataFrame are kept as they are
+    if isinstance(interaction, InteractionIndex):
+        return interaction
+
+    if isinstance(interaction, str) and \
+            interaction.endswith((".npz", ".csv")):
+        interaction = read_interaction(interaction)
+
+    if isinstance(interaction, InteractionIndex):
+        return interaction
+
+    return InteractionIndex.from_frame(interaction, deduplicate=False)
+
+def read_interaction(path):
+    # A saved InteractionIndex (.npz) or a csv
+    # table with "Source" and "Target" columns
+    if path.endswith(".npz"):
+        return InteractionIndex.load(path)
+
+    return pd.read_csv(path, sep=",")
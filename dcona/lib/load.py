@@ -0,0 +1,179 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+from ..core import extern
+
+# Input formats of expression tables: a csv file, a .npy
+# matrix with a .names.npz sidecar (memory-mapped if float32),
+# a .npz archive and parquet or feather tables
+DATA_FORMATS = ["csv", "npy", "npz", "parquet", "feather"]
+
+NAMES_SUFFIX = ".names.npz"
+CACHE_SUFFIX = ".json"
+
+# Version of cached tables, the ones of other versions are converted again
+CACHE_VERSION = 2
+
+# Subdirectory of "cache_dir" with cached correlations
+CORRELATION_CACHE = "correlations"
+
+CHECKPOINT_SUFFIX = ".npz"
+
+HASH_BLOCK_SIZE = 2**24
+
+
+def get_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in DATA_FORMATS:
+        return extension
+
+    return "csv"
+
+def names_path(path):
+    return os.path.splitext(path)[0] + NAMES_SUFFIX
+
+def read_data(path, cache_dir=None):
+    # Reads an expression table (molecules are rows, samples are
+    # columns) from any of DATA_FORMATS. A csv table is converted
+    # to the .npy format once if "cache_dir" is set
+    data_format = get_format(path)
+
+    if data_format == "csv":
+        if cache_dir is not None:
+            return _read_cached(path, cache_dir)
+
+        return pd.read_csv(path, sep=",", index_col=0)
+
+    if data_format == "npy":
+        data = np.load(path, mmap_mode="r")
+        if data.dtype != np.float32:
+            data = data.astype("float32")
+
+        index, columns = None, None
+        if os.path.exists(names_path(path)):
+            with np.load(names_path(path)) as names:
+                index, columns = names["index"], names["columns"]
+
+        return pd.DataFrame(data, index=index, columns=columns, copy=False)
+
+    if data_format == "npz":
+        with np.load(path) as archive:
+            data = archive["data"]
+            index = archive["index"] if "index" in archive else None
+            columns = archive["columns"] if "columns" in archive else None
+
+        if data.dtype != np.float32:
+            data = data.astype("float32")
+
+        return pd.DataFrame(data, index=index, columns=columns, copy=False)
+
+    if data_format == "parquet":
+        data_df = pd.read_parquet(path)
+    else:
+        data_df = pd.read_feather(path)
+
+    # Molecule names are the first column or the stored index
+    if not pd.api.types.is_numeric_dtype(data_df.iloc[:, 0]):
+        data_df = data_df.set_index(data_df.columns[0])
+
+    return data_df
+
+def _names_array(names):
+    # Numeric names keep their dtype, other ones are stored
+    # as strings (object arrays can not be loaded without pickle)
+    if pd.api.types.is_numeric_dtype(names):
+        return names.to_numpy()
+
+    return names.to_numpy().astype(str)
+
+def save_data(data_df, path):
+    # Saves an expression table as a float32 .npy matrix
+    # with the names in the .names.npz sidecar
+    if not pd.api.types.is_numeric_dtype(data_df.iloc[:, 0]):
+        data_df = data_df.set_index(data_df.columns[0])
+
+    np.save(path, np.ascontiguousarray(data_df.to_numpy(), dtype="float32"))
+    np.savez(
+        names_path(path),
+        index=_names_array(data_df.index),
+        columns=_names_array(data_df.columns)
+    )
+
+def file_hash(path):
+    hasher = hashlib.sha1()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b""):
+            hasher.update(block)
+
+    return hasher.hexdigest()
+
+def _read_cached(path, cache_dir):
+    # The cached .npy table is reused while the modification
+    # time of the csv file is unchanged. Otherwise, the file
+    # is hashed, and the table is converted again only
+    # if the hash has changed
+    os.makedirs(cache_dir, exist_ok=True)
+
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{key}.npy")
+    meta_path = os.path.join(cache_dir, f"{key}{CACHE_SUFFIX}")
+
+    stat = os.stat(path)
+    meta = {
+        "source": os.path.abspath(path),
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "hash": None,
+        "version": CACHE_VERSION
+    }
+
+    cached_meta = None
+    if os.path.exists(meta_path) and os.path.exists(cache_path):
+        with open(meta_path, "r") as meta_file:
+            cached_meta = json.load(meta_file)
+
+    if (cached_meta is not None) and \
+            (cached_meta.get("version") == CACHE_VERSION):
+        if (cached_meta["mtime"] == meta["mtime"]) and \
+                (cached_meta["size"] == meta["size"]):
+            return read_data(cache_path)
+
+        meta["hash"] = file_hash(path)
+        if cached_meta["hash"] == meta["hash"]:
+            with open(meta_path, "w") as meta_file:
+                json.dump(meta, meta_file)
+            return read_data(cache_path)
+
+    if meta["hash"] is None:
+        meta["hash"] = file_hash(path)
+
+    save_data(pd.read_csv(path, sep=",", index_col=0), cache_path)
+    with open(meta_path, "w") as meta_file:
+        json.dump(meta, meta_file)
+
+    return read_data(cache_path)
+
+def correlation_cache(cache_dir, cache_size=None):
+    # The cache of observed correlations, ranks and permutation
+    # results in "cache_dir" (None if "cache_dir" is not set)
+    if cache_dir is None:
+        return None
+
+    if cache_size is None:
+        cache_size = extern.CACHE_SIZE
+
+    return extern.CorrelationCache(
+        os.path.join(cache_dir, CORRELATION_CACHE), cache_size
+    )
+
+def checkpoint_path(checkpoint_dir, name):
+    # The checkpoint file of a pipeline run in "checkpoint_dir"
+    # (None if "checkpoint_dir" is not set)
+    if checkpoint_dir is None:
+        return None
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    return os.path.join(checkpoint_dir, name + CHECKPOINT_SUFFIX)
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+from multiprocessing import cpu_count
+
+from ..core import extern
+from . import dump
+from . import shards as shard_files
+from .ztest import _ztest_columns, _ztest_frame
+from .zscore import _zscore_frame
+
+
+def merge_shards(
+    shards,
+    output_dir=None,
+    output_format="csv",
+    fdr_threshold=None,
+    top_k=None,
+    process_number=None
+):
+    # Combines shards of one ztest or zscore run (paths to the
+    # shard files or the dictionaries returned by ztest and zscore
+    # with "shard") into its table. Exceedance counts of the shards
+    # are summed, so the table does not depend on the split
+    if process_number is None:
+        process_number = cpu_count()
+
+    shard, counts = shard_files.combine_shards(shards)
+    parameters = shard_files.shard_parameters(shard)
+    observed = shard_files.shard_observed(shard)
+
+    repeats_number = shard["repeats_number"]
+    pvalues = counts.astype("float32")
+    if repeats_number > 0:
+        pvalues /= np.float32(repeats_number)
+    del counts
+
+    names = parameters["names"]
+    if shard["kind"] == "ztest":
+        return _merge_ztest(
+            shard["name"], names, parameters, observed, pvalues,
+            repeats_number, output_dir, output_format,
+            fdr_threshold, top_k, process_number
+        )
+
+    return _merge_zscore(
+        shard["name"], names, observed, pvalues,
+        output_dir, output_format,
+        fdr_threshold, top_k, process_number
+    )
+
+def _merge_ztest(
+    name, names, parameters, observed, boot_pvalue,
+    repeats_number, output_dir, output_format,
+    fdr_threshold, top_k, process_number
+):
+    if parameters["interaction"]:
+        df_indexes = (
+            names[parameters["sources"]],
+            names[parameters["targets"]]
+        )
+    else:
+        df_indexes = names
+
+    pvalue = observed["pvalue"]
+    print("Adjusted p-value computation")
+    sorted_indexes, sorted_adjusted_pvalue = extern.fdr_select(
+        pvalue,
+        threshold=fdr_threshold,
+        top_k=top_k,
+        process_num=process_number
+    )
+
+    adjusted_pvalue = np.full(len(pvalue), np.nan, dtype="float32")
+    adjusted_pvalue[sorted_indexes] = sorted_adjusted_pvalue
+    del sorted_adjusted_pvalue
+
+    columns = _ztest_columns(
+        repeats_number,
+        observed["ref_corrs"], observed["ref_pvalues"],
+        observed["exp_corrs"], observed["exp_pvalues"],
+        observed["stat"], pvalue, adjusted_pvalue,
+        boot_pvalue, None
+    )
+
+    if output_dir:
+        dump.check_directory_existence(output_dir)
+
+        path_to_file = dump.output_path(output_dir, name, output_format)
+        dump.save_by_chunks(
+            sorted_indexes,
+            df_indexes,
+            pd.DataFrame(columns=["Source", "Target", *columns]),
+            list(columns.values()),
+            path_to_file,
+            output_format=output_format
+        )
+
+        print(f"File saved at: {path_to_file}")
+        return None
+
+    return _ztest_frame(sorted_indexes, df_indexes, columns)
+
+def _merge_zscore(
+    name, names, observed, pvalues,
+    output_dir, output_format,
+    fdr_threshold, top_k, process_number
+):
+    print("Adjusted p-value computation")
+    sorted_indexes, adjusted_pvalue = extern.fdr_select(
+        pvalues,
+        threshold=fdr_threshold,
+        top_k=top_k,
+        process_num=process_number
+    )
+
+    output_df = _zscore_frame(
+        names, observed["sources"], observed["scores"],
+        pvalues, sorted_indexes, adjusted_pvalue, None
+    )
+
+    if output_dir:
+        dump.check_directory_existence(output_dir)
+        path_to_file = dump.output_path(output_dir, name, output_format)
+        dump.save_table(output_df, path_to_file, output_format)
+
+        print(f"File saved at: {path_to_file}")
+        return None
+
+    return output_df
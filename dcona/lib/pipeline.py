@@ -0,0 +1,397 @@
+import numpy as np
+import pandas as pd
+from multiprocessing import cpu_count
+
+from ..core import extern
+from . import dump
+from . import load
+from . import utils
+from . import interactions
+from .ztest import ztest, _ztest, _ztest_columns, _ztest_frame
+from .zscore import zscore, _zscore_frame
+from .hypergeom import hypergeom
+
+
+def pipeline(
+    data_df, description_df,
+    reference_group, experimental_group,
+    correlation="spearman", alternative="two-sided",
+    interaction=None,
+    repeats_number=None,
+    output_dir=None,
+    process_number=None,
+    stop_exceedances=None,
+    output_format="csv",
+    score=None,
+    oriented=None,
+    ztest_table=False,
+    cache=None
+):
+    # Runs ztest and hypergeom (and zscore, if "score" is set)
+    # in one process: z-test arrays are passed to hypergeom
+    # with integer-coded names instead of a saved table. The
+    # z-test table is saved (or returned) only if "ztest_table"
+    if process_number is None:
+        process_number = cpu_count()
+
+    # Expression table can be a path to any of load.DATA_FORMATS
+    if isinstance(data_df, str):
+        data_df = load.read_data(data_df)
+
+    # If gene names are in dataframe column, relocate them to df.index
+    if not pd.api.types.is_number(data_df.iloc[0, 0]):
+        data_df = data_df.copy()
+        data_df.set_index(data_df.columns[0], inplace=True)
+
+    if interaction is not None:
+        interaction_index = interactions.interaction_index(interaction)
+    else:
+        interaction_index = None
+
+    if oriented is None:
+        oriented = (interaction_index is not None) and \
+            interaction_index.oriented
+
+    ztest_repeats_number = repeats_number
+    if ztest_repeats_number is None:
+        ztest_repeats_number = 0
+        if interaction_index is not None:
+            ztest_repeats_number = int(len(interaction_index) / 0.05)
+
+    # Scores of a network are computed over the z-test
+    # permutations (cached results are reused separately),
+    # several scores are computed by "zscore"
+    fused = bool(score) and utils.single_score(score) and \
+        (interaction_index is not None) and (cache is None)
+    if fused:
+        ztest_results, zscore_results = _ztest_zscore(
+            data_df, description_df, interaction_index,
+            reference_group, experimental_group,
+            correlation, score, alternative,
+            ztest_repeats_number, process_number,
+            stop_exceedances
+        )
+    else:
+        ztest_results = _ztest(
+            data_df, description_df, interaction_index, \
+            reference_group, experimental_group, \
+            correlation, alternative, \
+            ztest_repeats_number, process_number, \
+            stop_exceedances, cache=cache
+        )
+
+    sorted_indexes, df_indexes, \
+    ref_corrs, ref_pvalues, exp_corrs, exp_pvalues, \
+    stat, pvalue, adjusted_pvalue, \
+    boot_pvalue, permutations = ztest_results
+    del ztest_results
+
+    if output_dir:
+        dump.check_directory_existence(output_dir)
+
+    ztest_df = None
+    if ztest_table:
+        columns = _ztest_columns(
+            ztest_repeats_number,
+            ref_corrs, ref_pvalues, exp_corrs, exp_pvalues,
+            stat, pvalue, adjusted_pvalue,
+            boot_pvalue, permutations
+        )
+
+        if output_dir:
+            path_to_file = dump.output_path(
+                output_dir,
+                f"{correlation}_{alternative}_ztest",
+                output_format
+            )
+            dump.save_by_chunks(
+                sorted_indexes,
+                df_indexes,
+                pd.DataFrame(columns=["Source", "Target", *columns]),
+                list(columns.values()),
+                path_to_file,
+                output_format=output_format
+            )
+            print(f"File saved at: {path_to_file}")
+        else:
+            ztest_df = _ztest_frame(sorted_indexes, df_indexes, columns)
+
+        del columns
+
+    del ref_corrs, ref_pvalues, exp_corrs, exp_pvalues
+    del pvalue, boot_pvalue, permutations
+
+    # Pairs in the order of the z-test table, names are
+    # categorical columns over the molecule dictionary
+    if (isinstance(df_indexes, tuple)) and (len(df_indexes) == 2):
+        names, (source_codes, target_codes) = dump.encode_names(*df_indexes)
+        sources = source_codes[sorted_indexes]
+        targets = target_codes[sorted_indexes]
+    else:
+        names = np.asarray(df_indexes)
+        sources, targets = extern.paired_index_batch(
+            sorted_indexes, len(df_indexes), process_number
+        )
+
+    dtype = pd.CategoricalDtype(names)
+    edges_df = pd.DataFrame(data={
+        "Source": pd.Categorical.from_codes(sources, dtype=dtype),
+        "Target": pd.Categorical.from_codes(targets, dtype=dtype),
+        "Statistic": stat[sorted_indexes],
+        "AdjPvalue": adjusted_pvalue[sorted_indexes]
+    })
+    del sources, targets, stat, adjusted_pvalue, sorted_indexes
+
+    print("Hypergeometric test computation")
+    hypergeom_df = hypergeom(
+        edges_df,
+        alternative=alternative,
+        oriented=oriented,
+        output_dir=output_dir,
+        output_format=output_format
+    )
+    del edges_df
+
+    zscore_df = None
+    if fused:
+        zscore_df = _zscore_frame(*zscore_results)
+        if output_dir:
+            _save_zscore(
+                zscore_df, output_dir,
+                correlation, score, alternative, output_format
+            )
+            zscore_df = None
+    elif score:
+        zscore_df = zscore(
+            data_df, description_df,
+            reference_group, experimental_group,
+            correlation=correlation,
+            score=score,
+            alternative=alternative,
+            interaction=interaction_index,
+            repeats_number=repeats_number,
+            output_dir=output_dir,
+            process_number=process_number,
+            stop_exceedances=stop_exceedances,
+            output_format=output_format,
+            cache=cache
+        )
+
+    if output_dir:
+        return None
+
+    return ztest_df, hypergeom_df, zscore_df
+
+def ztest_zscore(
+    data_df, description_df,
+    reference_group, experimental_group,
+    correlation="spearman", score="mean", alternative="two-sided",
+    interaction=None,
+    repeats_number=None,
+    output_dir=None,
+    process_number=None,
+    stop_exceedances=None,
+    output_format="csv",
+    fdr_threshold=None,
+    top_k=None
+):
+    # Runs ztest and zscore over the same permutations: the
+    # statistic of a pair is computed once per permutation for
+    # its z-test and for the scores of its sources. The tables
+    # are the same as of separate ztest and zscore calls. Without
+    # "interaction" (or with several scores) the two tests
+    # are run one after another
+    if process_number is None:
+        process_number = cpu_count()
+
+    # Expression table can be a path to any of load.DATA_FORMATS
+    if isinstance(data_df, str):
+        data_df = load.read_data(data_df)
+
+    # If gene names are in dataframe column, relocate them to df.index
+    if not pd.api.types.is_number(data_df.iloc[0, 0]):
+        data_df = data_df.copy()
+        data_df.set_index(data_df.columns[0], inplace=True)
+
+    # Several scores are computed by "zscore" over their
+    # own permutations (see "zscore")
+    if (interaction is None) or (not utils.single_score(score)):
+        kwargs = dict(
+            correlation=correlation,
+            alternative=alternative,
+            repeats_number=repeats_number,
+            output_dir=output_dir,
+            process_number=process_number,
+            stop_exceedances=stop_exceedances,
+            output_format=output_format,
+            fdr_threshold=fdr_threshold,
+            top_k=top_k
+        )
+        ztest_df = ztest(
+            data_df, description_df,
+            reference_group, experimental_group,
+            **kwargs
+        )
+        zscore_df = zscore(
+            data_df, description_df,
+            reference_group, experimental_group,
+            score=score,
+            **kwargs
+        )
+
+        if output_dir:
+            return None
+
+        return ztest_df, zscore_df
+
+    interaction_index = interactions.interaction_index(interaction)
+    if repeats_number is None:
+        repeats_number = int(len(interaction_index) / 0.05)
+
+    (
+        sorted_indexes, df_indexes,
+        ref_corrs, ref_pvalues, exp_corrs, exp_pvalues,
+        stat, pvalue, adjusted_pvalue,
+        boot_pvalue, permutations
+    ), zscore_results = _ztest_zscore(
+        data_df, description_df, interaction_index,
+        reference_group, experimental_group,
+        correlation, score, alternative,
+        repeats_number, process_number,
+        stop_exceedances,
+        fdr_threshold, top_k
+    )
+
+    columns = _ztest_columns(
+        repeats_number,
+        ref_corrs, ref_pvalues, exp_corrs, exp_pvalues,
+        stat, pvalue, adjusted_pvalue,
+        boot_pvalue, permutations
+    )
+    zscore_df = _zscore_frame(*zscore_results)
+
+    if output_dir:
+        dump.check_directory_existence(output_dir)
+
+        path_to_file = dump.output_path(
+            output_dir,
+            f"{correlation}_{alternative}_ztest",
+            output_format
+        )
+        dump.save_by_chunks(
+            sorted_indexes,
+            df_indexes,
+            pd.DataFrame(columns=["Source", "Target", *columns]),
+            list(columns.values()),
+            path_to_file,
+            output_format=output_format
+        )
+        print(f"File saved at: {path_to_file}")
+
+        _save_zscore(
+            zscore_df, output_dir,
+            correlation, score, alternative, output_format
+        )
+        return None
+
+    return _ztest_frame(sorted_indexes, df_indexes, columns), zscore_df
+
+def _ztest_zscore(
+    data_df, description_df, interaction_index,
+    reference_group, experimental_group,
+    correlation, score, alternative,
+    repeats_number, process_number,
+    stop_exceedances=None,
+    fdr_threshold=None,
+    top_k=None
+):
+    # Results of "_ztest" and "_zscore" of one native pass
+    if (correlation != "spearman"):
+        correlation = "pearson"
+
+    interaction_index = interaction_index.resolve(data_df.index)
+    edge_sources, edge_pairs = interaction_index.score_edges()
+
+    reference_indexes = utils.sample_positions(
+        data_df,
+        description_df.loc[
+            description_df["Group"] == reference_group,
+            "Sample"
+        ]
+    )
+    experimental_indexes = utils.sample_positions(
+        data_df,
+        description_df.loc[
+            description_df["Group"] == experimental_group,
+            "Sample"
+        ]
+    )
+
+    print("Z-test and z-score computation")
+    (
+        ref_corrs, ref_pvalues, exp_corrs, exp_pvalues,
+        stat, pvalue, boot_pvalue, permutations
+    ), (
+        sources, scores, pvalues, score_permutations
+    ) = extern.ztest_score_pipeline(
+        data_df,
+        reference_indexes,
+        experimental_indexes,
+        interaction_index.sources,
+        interaction_index.targets,
+        edge_sources,
+        edge_pairs,
+        correlation=correlation,
+        score=score,
+        correlation_alternative="two-sided",
+        alternative=alternative,
+        repeats_num=repeats_number,
+        process_num=process_number,
+        stop_exceedances=stop_exceedances
+    )
+
+    if not stop_exceedances:
+        permutations, score_permutations = None, None
+
+    print("Adjusted p-value computation")
+    sorted_indexes, sorted_adjusted_pvalue = extern.fdr_select(
+        pvalue,
+        threshold=fdr_threshold,
+        top_k=top_k,
+        process_num=process_number
+    )
+
+    adjusted_pvalue = np.full(len(pvalue), np.nan, dtype="float32")
+    adjusted_pvalue[sorted_indexes] = sorted_adjusted_pvalue
+    del sorted_adjusted_pvalue
+
+    score_indexes, score_adjusted_pvalue = extern.fdr_select(
+        pvalues,
+        threshold=fdr_threshold,
+        top_k=top_k,
+        process_num=process_number
+    )
+
+    return (
+        sorted_indexes, interaction_index.pair_names(),
+        ref_corrs, ref_pvalues, exp_corrs, exp_pvalues,
+        stat, pvalue, adjusted_pvalue,
+        boot_pvalue, permutations
+    ), (
+        data_df.index.to_numpy(), sources, scores,
+        pvalues, score_indexes, score_adjusted_pvalue, score_permutations
+    )
+
+def _save_zscore(
+    zscore_df, output_dir,
+    correlation, score, alternative, output_format
+):
+    dump.check_directory_existence(output_dir)
+    path_to_file = dump.output_path(
+        output_dir,
+        f"{correlation}_{utils.score_name(score)}_{alternative}_zscore",
+        output_format
+    )
+    dump.save_table(zscore_df, path_to_file, output_format)
+
+    print(f"File saved at: {path_to_file}")
@@ -0,0 +1,159 @@
+import os
+import glob
+import numpy as np
+
+from ..core import extern
+
+# Shard files are "<table name>.shard-<start>-<end>.npz"
+SHARD_SUFFIX = ".npz"
+SHARD_INFIX = ".shard-"
+
+
+def permutation_shards(repeats_number, shards_number):
+    # Splits permutations into "shards_number" ranges (start, end)
+    # of almost equal sizes, permutations of a range are the ones
+    # from start + 1 to end
+    bounds = np.linspace(0, repeats_number, shards_number + 1)
+    bounds = np.round(bounds).astype(int)
+    return [
+        (int(start), int(end))
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+def shard_range(shard, repeats_number):
+    # Permutation range of a shard given as (shard_index, shards_number)
+    shard_index, shards_number = shard
+    if not (0 <= shard_index < shards_number):
+        raise ValueError(
+            f"Shard index {shard_index} is out of range {shards_number}"
+        )
+
+    return permutation_shards(repeats_number, shards_number)[shard_index]
+
+def shard_path(output_dir, name, permutations):
+    start, end = permutations
+    return os.path.join(
+        output_dir, f"{name}{SHARD_INFIX}{start}-{end}{SHARD_SUFFIX}"
+    )
+
+def make_shard(
+    kind, name, repeats_number, permutations,
+    parameters, observed, counts
+):
+    # Partial result of a shard: exceedance counts of its
+    # permutations and the observed arrays (they must be the
+    # same in all the shards of a run). "parameters" are the
+    # run parameters, shards of a run share their key
+    key = extern.pcache.make_key(kind, name, repeats_number, *[
+        parameters[parameter] for parameter in sorted(parameters)
+    ])
+
+    shard = {
+        "kind": kind,
+        "name": name,
+        "key": key,
+        "repeats_number": repeats_number,
+        "start": permutations[0],
+        "end": permutations[1],
+        "counts": counts
+    }
+    for parameter, value in parameters.items():
+        shard[f"parameter_{parameter}"] = value
+    for array_name, array in observed.items():
+        shard[f"observed_{array_name}"] = array
+
+    return shard
+
+def save_shard(shard, output_dir):
+    # The file is replaced atomically (see CorrelationCache.put)
+    path = shard_path(
+        output_dir, shard["name"], (shard["start"], shard["end"])
+    )
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as temp_file:
+        np.savez(temp_file, **shard)
+    os.replace(temp_path, path)
+
+    return path
+
+def read_shard(shard):
+    # A shard of a path or a dictionary
+    if not isinstance(shard, str):
+        return shard
+
+    with np.load(shard, allow_pickle=False) as archive:
+        shard = {}
+        for name in archive.files:
+            value = archive[name]
+            if value.ndim == 0:
+                value = value.item()
+            shard[name] = value
+
+    return shard
+
+def find_shards(output_dir):
+    # Shard files of "output_dir" by their table names
+    shards = {}
+    pattern = os.path.join(output_dir, f"*{SHARD_INFIX}*{SHARD_SUFFIX}")
+    for path in sorted(glob.glob(pattern)):
+        name = os.path.basename(path).split(SHARD_INFIX)[0]
+        shards.setdefault(name, []).append(path)
+
+    return shards
+
+def shard_parameters(shard):
+    return {
+        name[len("parameter_"):]: value
+        for name, value in shard.items()
+        if name.startswith("parameter_")
+    }
+
+def shard_observed(shard):
+    return {
+        name[len("observed_"):]: value
+        for name, value in shard.items()
+        if name.startswith("observed_")
+    }
+
+def combine_shards(shards):
+    # Checks that the shards belong to one run, cover its
+    # permutations exactly once and have the same observed
+    # arrays. Returns the first shard and the summed counts
+    shards = sorted(
+        [read_shard(shard) for shard in shards],
+        key=lambda shard: shard["start"]
+    )
+    if len(shards) == 0:
+        raise ValueError("No shards to merge")
+
+    first = shards[0]
+    observed = shard_observed(first)
+
+    end = 0
+    counts = np.zeros(len(first["counts"]), dtype="float64")
+    for shard in shards:
+        if shard["key"] != first["key"]:
+            raise ValueError("Shards belong to different runs")
+
+        if shard["start"] != end:
+            raise ValueError(
+                f"Permutations {end}-{shard['start']} are "
+                "missing or computed twice"
+            )
+        end = shard["end"]
+
+        for name, array in shard_observed(shard).items():
+            if array.tobytes() != observed[name].tobytes():
+                raise ValueError(
+                    f"Observed {name} of shard {shard['start']}-"
+                    f"{shard['end']} differs from the other shards"
+                )
+
+        counts += shard["counts"]
+
+    if end != first["repeats_number"]:
+        raise ValueError(
+            f"Permutations {end}-{first['repeats_number']} are missing"
+        )
+
+    return first, counts
@@ -1,8 +1,29 @@
 import itertools
+import collections
 import pandas as pd
 import numpy as np
 import json
 
+UNDEFINED_POSITION = -1
+
+# Fields of a config file read by "read_config"
+Config = collections.namedtuple("Config", [
+    "data_path", "description_path",
+    "reference_group", "experimental_group",
+    "correlation", "alternative", "score",
+    "interaction_path",
+    "repeats_number",
+    "output_dir_path",
+    "process_number",
+    "memory_budget",
+    "output_format",
+    "fdr_threshold", "top_k",
+    "ztest_table",
+    "cache_dir", "cache_size",
+    "contrasts",
+    "checkpoint_dir", "shard"
+])
+
 
 def generate_pairs(objects):    
     if isinstance(objects, (list, set, pd.core.series.Series, np.ndarray)):
@@ -23,15 +44,98 @@ def generate_pairs(objects):
     pairs_df = pd.DataFrame(pairs, columns=["Source", "Target"])
     return pairs_df
 
-# Reads config from a json file
+def positions(names, values):
+    # Positions of "values" in "names" (UNDEFINED_POSITION for
+    # the missing ones), the last one of duplicated names is used
+    names = pd.Index(names)
+    if not names.is_unique:
+        last = ~names.duplicated(keep="last")
+        rows = np.flatnonzero(last)
+        result = names[last].get_indexer(values)
+        return np.where(
+            result == UNDEFINED_POSITION, UNDEFINED_POSITION, rows[result]
+        ).astype("int32")
+
+    return names.get_indexer(values).astype("int32")
+
+def sample_positions(data_df, samples):
+    # Positions of the samples in columns of the expression table
+    result = positions(data_df.columns, samples)
+    if (result == UNDEFINED_POSITION).any():
+        missing = np.asarray(samples)[result == UNDEFINED_POSITION]
+        raise KeyError(f"Samples are not in the table: {list(missing[:5])}")
+
+    return result
+
+def contrast_name(reference_group, experimental_group):
+    # Name of the output subdirectory of a contrast
+    return f"{reference_group}_vs_{experimental_group}"
+
+def score_list(score):
+    # Scores of one run: a list or a comma-separated string of
+    # names with optional parameters (e.g. "quantile:0.9")
+    if isinstance(score, str):
+        return score.split(",")
+    return list(score)
+
+def single_score(score):
+    return isinstance(score, str) and (len(score_list(score)) == 1)
+
+def score_name(score):
+    # Name of the scores in output file names ("quantile:0.9"
+    # is "quantile_0.9", several scores are joined by "+")
+    return "+".join(score_list(score)).replace(":", "_")
+
+def shard_name(name, shard):
+    # Name of a checkpoint of a shard (shard_index, shards_number)
+    if shard is None:
+        return name
+
+    shard_index, shards_number = shard
+    return f"{name}_shard_{shard_index}_of_{shards_number}"
+
+def contrast_groups(data_df, description_df, contrasts):
+    # Sample positions of every group of the (reference_group,
+    # experimental_group) contrasts and the contrasts as pairs
+    # of group numbers
+    groups = []
+    for contrast in contrasts:
+        for group in contrast:
+            if group not in groups:
+                groups.append(group)
+
+    group_indexes = [
+        sample_positions(
+            data_df,
+            description_df.loc[description_df["Group"] == group, "Sample"]
+        )
+        for group in groups
+    ]
+    group_contrasts = [
+        (groups.index(reference_group), groups.index(experimental_group))
+        for reference_group, experimental_group in contrasts
+    ]
+
+    return group_indexes, group_contrasts
+
+# Reads config from a json file into a Config
 def read_config(
     path_to_config
 ):
     config = json.load(open(path_to_config, "r"))
     data_path = config["data_path"]
     description_path = config["description_path"]
-    reference_group = config["reference_group"]
-    experimental_group = config["experimental_group"]
+    
+    # A list of [reference_group, experimental_group] contrasts
+    # can be given instead of a single pair of groups
+    if ("contrasts" in config) and (config["contrasts"] != ""):
+        contrasts = [tuple(contrast) for contrast in config["contrasts"]]
+        reference_group = config.get("reference_group")
+        experimental_group = config.get("experimental_group")
+    else:
+        contrasts = None
+        reference_group = config["reference_group"]
+        experimental_group = config["experimental_group"]
     
     correlation = config["correlation"]
     alternative = config["alternative"]
@@ -50,11 +154,86 @@ def read_config(
         score = config["score"]
     else:
         score = None
+    
+    if ("memory_budget" in config) and (config["memory_budget"] != ""):
+        memory_budget = config["memory_budget"]
+    else:
+        memory_budget = None
+    
+    if ("output_format" in config) and (config["output_format"] != ""):
+        output_format = config["output_format"]
+    else:
+        output_format = "csv"
+    
+    if ("fdr_threshold" in config) and (config["fdr_threshold"] != ""):
+        fdr_threshold = config["fdr_threshold"]
+    else:
+        fdr_threshold = None
+    
+    if ("top_k" in config) and (config["top_k"] != ""):
+        top_k = config["top_k"]
+    else:
+        top_k = None
+    
+    if ("ztest_table" in config) and (config["ztest_table"] != ""):
+        ztest_table = config["ztest_table"]
+    else:
+        ztest_table = False
+    
+    if ("cache_dir" in config) and (config["cache_dir"] != ""):
+        cache_dir = config["cache_dir"]
+    else:
+        cache_dir = None
+    
+    if ("cache_size" in config) and (config["cache_size"] != ""):
+        cache_size = config["cache_size"]
+    else:
+        cache_size = None
+    
+    if ("checkpoint_dir" in config) and (config["checkpoint_dir"] != ""):
+        checkpoint_dir = config["checkpoint_dir"]
+    else:
+        checkpoint_dir = None
+    
+    # [shard_index, shards_number] of the permutations of a
+    # sharded run, the shards are combined by "dcona merge"
+    if ("shard" in config) and (config["shard"] != ""):
+        shard = tuple(config["shard"])
+    else:
+        shard = None
    
-    return data_path, description_path, \
-        reference_group, experimental_group, \
-        correlation, alternative, score, \
-        interaction_path, \
-        repeats_number, \
-        output_dir_path, \
-        process_number
+    return Config(
+        data_path=data_path,
+        description_path=description_path,
+        reference_group=reference_group,
+        experimental_group=experimental_group,
+        correlation=correlation,
+        alternative=alternative,
+        score=score,
+        interaction_path=interaction_path,
+        repeats_number=repeats_number,
+        output_dir_path=output_dir_path,
+        process_number=process_number,
+        memory_budget=memory_budget,
+        output_format=output_format,
+        fdr_threshold=fdr_threshold,
+        top_k=top_k,
+        ztest_table=ztest_table,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        contrasts=contrasts,
+        checkpoint_dir=checkpoint_dir,
+        shard=shard
+    )
+
+def check_unsupported(config, fields, usage):
+    # Raises if any of the config "fields" is set
+    # although "usage" does not support it
+    unsupported = [
+        field for field in fields
+        if getattr(config, field) is not None
+    ]
+    if unsupported:
+        raise ValueError(
+            f"{', '.join(unsupported)} can not be used {usage}"
+        )
@@ -1,11 +1,14 @@
+import os
 import numpy as np
 import pandas as pd
-import scipy.stats
 from multiprocessing import cpu_count
 
 from ..core import extern
 from . import utils
 from . import dump
+from . import load
+from . import interactions
+from . import shards
 
 
 def zscore(
@@ -15,99 +18,277 @@ def zscore(
     interaction=None,
     repeats_number=None,
     output_dir=None,
-    process_number=None 
+    process_number=None,
+    stop_exceedances=None,
+    output_format="csv",
+    fdr_threshold=None,
+    top_k=None,
+    cache=None,
+    checkpoint=None,
+    shard=None,
+    memory_budget=None
 ):
     if process_number is None:
         process_number = cpu_count()
 
+    # Expression table can be a path to any of load.DATA_FORMATS
+    if isinstance(data_df, str):
+        data_df = load.read_data(data_df)
+
     # If gene names are in dataframe column, relocate them to df.index
     if not pd.api.types.is_number(data_df.iloc[0, 0]):
         data_df = data_df.copy()
         data_df.set_index(data_df.columns[0], inplace=True)
         
     if interaction is not None:
-        if isinstance(interaction, pd.core.frame.DataFrame):
-            interaction_df = interaction
-        else:
-            interaction_df = utils.generate_pairs(interaction)
+        interaction_index = interactions.interaction_index(interaction)
         
         if repeats_number is None:
-            repeats_number = int(len(interaction_df) / 0.05)
+            repeats_number = int(len(interaction_index) / 0.05)
     else:
-        interaction_df = None
+        interaction_index = None
         
         if repeats_number is None:
             repeats_number = int(len(data_df) / 0.05)
 
+    # Several scores are computed over the same permutations,
+    # the tables are returned as a dictionary by score
+    if not utils.single_score(score):
+        score = utils.score_list(score)
+
+    # A shard of the permutations (see "ztest")
+    if shard is not None:
+        if not isinstance(score, str):
+            raise ValueError("Several scores are not supported by shards")
+
+        return _zscore_shard(
+            data_df, description_df, interaction_index,
+            reference_group, experimental_group,
+            correlation, score, alternative,
+            repeats_number, process_number,
+            shard, output_dir, cache, checkpoint, memory_budget
+        )
+
     data_df, sources, scores, \
-    pvalues, adjusted_pvalue = \
+    pvalues, sorted_indexes, adjusted_pvalue, permutations = \
     _zscore(
-        data_df, description_df, interaction_df, \
+        data_df, description_df, interaction_index, \
         reference_group, experimental_group, \
         correlation, score, alternative, \
-        repeats_number, process_number
+        repeats_number, process_number, \
+        stop_exceedances, \
+        fdr_threshold, top_k, cache, checkpoint,
+        memory_budget=memory_budget
     )
 
+    several = not isinstance(score, str)
+    if not several:
+        score, scores, pvalues = [score], [scores], [pvalues]
+        sorted_indexes, adjusted_pvalue = [sorted_indexes], [adjusted_pvalue]
+        if permutations is not None:
+            permutations = [permutations]
+
+    if output_dir:
+        dump.check_directory_existence(output_dir)
+
+    result = {}
+    for s, score_name in enumerate(score):
+        output_df = _zscore_frame(
+            data_df.index.to_numpy(), sources, scores[s],
+            pvalues[s], sorted_indexes[s], adjusted_pvalue[s],
+            None if permutations is None else permutations[s]
+        )
+
+        if output_dir:
+            path_to_file = dump.output_path(
+                output_dir,
+                f"{correlation}_{utils.score_name(score_name)}_{alternative}_zscore",
+                output_format
+            )
+            dump.save_table(output_df, path_to_file, output_format)
+
+            print(f"File saved at: {path_to_file}")
+        else:
+            result[score_name] = output_df
+
+    if output_dir:
+        return None
+
+    if not several:
+        return output_df
+
+    return result
+
+def _zscore_frame(
+    names, sources, scores,
+    pvalues, sorted_indexes, adjusted_pvalue, permutations
+):
     output_df = pd.DataFrame(data={
-        "Source": data_df.index.to_numpy()[sources],
-        "Score": scores,
-        "Pvalue": pvalues, 
+        "Source": names[sources[sorted_indexes]],
+        "Score": scores[sorted_indexes],
+        "Pvalue": pvalues[sorted_indexes], 
         "AdjPvalue": adjusted_pvalue, 
     })
-    output_df = output_df.sort_values(["AdjPvalue", "Pvalue"])
-                            
+    if permutations is not None:
+        output_df["Permutations"] = permutations[sorted_indexes]
+
+    return output_df
+
+def zscore_many(
+    data_df, description_df,
+    contrasts,
+    correlation="spearman", score="mean", alternative="two-sided",
+    interaction=None,
+    repeats_number=None,
+    output_dir=None,
+    process_number=None,
+    stop_exceedances=None,
+    output_format="csv",
+    fdr_threshold=None,
+    top_k=None
+):
+    # Runs zscore for every (reference_group, experimental_group)
+    # pair of "contrasts" in one pass (see "ztest_many")
+    if process_number is None:
+        process_number = cpu_count()
+
+    if isinstance(data_df, str):
+        data_df = load.read_data(data_df)
+
+    if not pd.api.types.is_number(data_df.iloc[0, 0]):
+        data_df = data_df.copy()
+        data_df.set_index(data_df.columns[0], inplace=True)
+
+    if (correlation != "spearman"):
+        correlation = "pearson"
+
+    if interaction is not None:
+        interaction_index = interactions.interaction_index(interaction)
+        interaction_index = interaction_index.resolve(data_df.index)
+        source_indexes = interaction_index.score_sources()
+        target_indexes = interaction_index.score_pairs()[1]
+
+        if repeats_number is None:
+            repeats_number = int(len(interaction_index) / 0.05)
+    else:
+        source_indexes = None
+        target_indexes = None
+
+        if repeats_number is None:
+            repeats_number = int(len(data_df) / 0.05)
+
+    if not utils.single_score(score):
+        raise ValueError("Several scores are not supported by zscore_many")
+
+    contrasts = [tuple(contrast) for contrast in contrasts]
+    group_indexes, group_contrasts = utils.contrast_groups(
+        data_df, description_df, contrasts
+    )
+
+    print(f"Z-score computation: {len(contrasts)} contrasts")
+    sources, scores, pvalues, permutations = \
+    extern.score_pipeline_contrasts(
+        data_df,
+        group_indexes,
+        group_contrasts,
+        source_indexes,
+        target_indexes,
+        correlation=correlation,
+        score=score,
+        alternative=alternative,
+        repeats_num=repeats_number,
+        process_num=process_number,
+        stop_exceedances=stop_exceedances
+    )
+    
     if output_dir:
         dump.check_directory_existence(output_dir)
-        path_to_file = output_dir.rstrip("/") + \
-            f"/{correlation}_{score}_{alternative}_zscore.csv"
-        output_df.to_csv(
-            path_to_file,
-            sep=",",
-            index=None
+
+    result = {}
+    names = data_df.index.to_numpy()
+    for c, (reference_group, experimental_group) in enumerate(contrasts):
+        print(f"Adjusted p-value computation: {reference_group} vs {experimental_group}")
+        sorted_indexes, adjusted_pvalue = extern.fdr_select(
+            pvalues[c],
+            threshold=fdr_threshold,
+            top_k=top_k,
+            process_num=process_number
         )
 
-        print(f"File saved at: {path_to_file}")
+        output_df = pd.DataFrame(data={
+            "Source": names[sources[sorted_indexes]],
+            "Score": scores[c][sorted_indexes],
+            "Pvalue": pvalues[c][sorted_indexes],
+            "AdjPvalue": adjusted_pvalue,
+        })
+        if stop_exceedances:
+            output_df["Permutations"] = permutations[c][sorted_indexes]
+
+        if output_dir:
+            contrast_dir = os.path.join(
+                output_dir,
+                utils.contrast_name(reference_group, experimental_group)
+            )
+            os.makedirs(contrast_dir, exist_ok=True)
+
+            path_to_file = dump.output_path(
+                contrast_dir,
+                f"{correlation}_{utils.score_name(score)}_{alternative}_zscore",
+                output_format
+            )
+            dump.save_table(output_df, path_to_file, output_format)
+            print(f"File saved at: {path_to_file}")
+        else:
+            result[(reference_group, experimental_group)] = output_df
+
+    if output_dir:
         return None
-    
-    return output_df
+
+    return result
 
 def _zscore(
-    data_df, description_df, interaction_df,
+    data_df, description_df, interaction_index,
     reference_group, experimental_group,
     correlation, score, alternative,
-    repeats_number, process_number
+    repeats_number, process_number,
+    stop_exceedances=None,
+    fdr_threshold=None,
+    top_k=None,
+    cache=None,
+    checkpoint=None,
+    shard=None,
+    memory_budget=None
 ):
     if (correlation != "spearman"):
         correlation = "pearson"
 
-    if interaction_df is not None:
-        data_molecules = set(data_df.index.to_list())
-        interaction_df = interaction_df[interaction_df["Source"].isin(data_molecules)]
-        interaction_df = interaction_df[interaction_df["Target"].isin(data_molecules)]
-
-        source_indexes = interaction_df["Source"]
-        target_indexes = interaction_df["Target"]
-
-        data_molecules = data_molecules.intersection(
-            set(source_indexes) | set(target_indexes)
-        )
-        data_df = data_df.loc[data_df.index.isin(data_molecules)]
+    # Pairs sorted by source (unoriented pairs are taken
+    # in both directions) address rows of the whole table
+    if interaction_index is not None:
+        interaction_index = interaction_index.resolve(data_df.index)
+        source_indexes = interaction_index.score_sources()
+        target_indexes = interaction_index.score_pairs()[1]
     else:
-        interaction_df = None
         source_indexes = None
         target_indexes = None 
 
-    reference_indexes = description_df.loc[
-        description_df["Group"] == reference_group,
-        "Sample"
-    ].to_list()
-    experimental_indexes = description_df.loc[
-        description_df["Group"] == experimental_group,
-        "Sample"
-    ].to_list()
+    reference_indexes = utils.sample_positions(
+        data_df,
+        description_df.loc[
+            description_df["Group"] == reference_group,
+            "Sample"
+        ]
+    )
+    experimental_indexes = utils.sample_positions(
+        data_df,
+        description_df.loc[
+            description_df["Group"] == experimental_group,
+            "Sample"
+        ]
+    )
 
     print("Z-score computation")
-    sources, scores, pvalues = \
+    sources, scores, pvalues, *permutations = \
     extern.score_pipeline(
         data_df,
         reference_indexes,
@@ -118,15 +299,100 @@ def _zscore(
         score=score,
         alternative=alternative,
         repeats_num=repeats_number,
-        process_num=process_number
+        process_num=process_number,
+        numerical_index=True,
+        stop_exceedances=stop_exceedances,
+        cache=cache,
+        checkpoint=checkpoint,
+        shard=shard,
+        memory_budget=memory_budget
     )
+    permutations = permutations[0] if permutations else None
+
+    # P-values of a shard are adjusted after the merge
+    if shard is not None:
+        return data_df, sources, scores, \
+            pvalues, None, None, permutations
 
     print("Adjusted p-value computation")
-    adjusted_pvalue = pvalues * len(pvalues) / \
-        scipy.stats.rankdata(pvalues)
-    adjusted_pvalue[adjusted_pvalue > 1] = 1
-    adjusted_pvalue = adjusted_pvalue.flatten()
+    if isinstance(score, str):
+        sorted_indexes, adjusted_pvalue = extern.fdr_select(
+            pvalues,
+            threshold=fdr_threshold,
+            top_k=top_k,
+            process_num=process_number
+        )
+    else:
+        # P-values of every score are adjusted separately
+        sorted_indexes, adjusted_pvalue = zip(*[
+            extern.fdr_select(
+                score_pvalues,
+                threshold=fdr_threshold,
+                top_k=top_k,
+                process_num=process_number
+            )
+            for score_pvalues in pvalues
+        ])
     
     return data_df, sources, scores, \
-        pvalues, adjusted_pvalue
+        pvalues, sorted_indexes, adjusted_pvalue, permutations
+
+
+def _zscore_shard(
+    data_df, description_df, interaction_index,
+    reference_group, experimental_group,
+    correlation, score, alternative,
+    repeats_number, process_number,
+    shard, output_dir, cache=None, checkpoint=None, memory_budget=None
+):
+    permutations = shards.shard_range(shard, repeats_number)
+
+    data_df, sources, scores, counts, _, _, _ = _zscore(
+        data_df, description_df, interaction_index,
+        reference_group, experimental_group,
+        correlation, score, alternative,
+        repeats_number, process_number,
+        cache=cache,
+        checkpoint=checkpoint,
+        shard=permutations,
+        memory_budget=memory_budget
+    )
+
+    if interaction_index is not None:
+        interaction_index = interaction_index.resolve(data_df.index)
+        offsets, targets = interaction_index.score_pairs()
+    else:
+        offsets = np.zeros(0, dtype="int64")
+        targets = np.zeros(0, dtype="int32")
+
+    shard = shards.make_shard(
+        "zscore",
+        f"{correlation}_{utils.score_name(score)}_{alternative}_zscore",
+        repeats_number,
+        permutations,
+        {
+            "reference_group": str(reference_group),
+            "experimental_group": str(experimental_group),
+            "correlation": correlation,
+            "score": score,
+            "alternative": alternative,
+            "interaction": interaction_index is not None,
+            "names": data_df.index.to_numpy().astype(str),
+            "offsets": offsets,
+            "targets": targets
+        },
+        {
+            "sources": sources,
+            "scores": scores
+        },
+        counts
+    )
+
+    if output_dir:
+        dump.check_directory_existence(output_dir)
+        path_to_file = shards.save_shard(shard, output_dir)
+
+        print(f"File saved at: {path_to_file}")
+        return None
 
+    return shard
@@ -1,11 +1,18 @@
+import os
 import numpy as np
 import pandas as pd
-import scipy.stats
 from multiprocessing import cpu_count
 
 from ..core import extern
 from . import utils
 from . import dump
+from . import load
+from . import interactions
+from . import shards
+
+# Approximate peak memory (bytes) per pair of a stripe
+# in the streaming regime: native buffers and the output chunk
+STRIPE_PAIR_BYTES = 320
 
 
 def ztest(
@@ -15,79 +22,277 @@ def ztest(
     interaction=None,
     repeats_number=None,
     output_dir=None,
-    process_number=None
+    process_number=None,
+    stop_exceedances=None,
+    memory_budget=None,
+    tile_filter=None,
+    output_format="csv",
+    fdr_threshold=None,
+    top_k=None,
+    cache=None,
+    checkpoint=None,
+    shard=None
 ):
     if process_number is None:
         process_number = cpu_count()
 
+    # Expression table can be a path to any of load.DATA_FORMATS
+    if isinstance(data_df, str):
+        data_df = load.read_data(data_df)
+
     # If gene names are in dataframe column, relocate them to df.index
     if not pd.api.types.is_number(data_df.iloc[0, 0]):
         data_df = data_df.copy()
         data_df.set_index(data_df.columns[0], inplace=True)
+    
+    # Streaming exhaustive regime: stripes of pairs are
+    # computed one by one within the memory budget
+    if (memory_budget is not None) and (interaction is not None):
+        raise ValueError(
+            "Memory budget is supported in the exhaustive regime only"
+        )
+
+    if memory_budget is not None:
+        if checkpoint is not None:
+            raise ValueError(
+                "Checkpoints are not supported in the streaming regime"
+            )
+        if shard is not None:
+            raise ValueError(
+                "Shards are not supported in the streaming regime"
+            )
+
+        if repeats_number is None:
+            repeats_number = 0
+
+        return _ztest_streamed(
+            data_df, description_df,
+            reference_group, experimental_group,
+            correlation, alternative,
+            repeats_number, process_number,
+            stop_exceedances, memory_budget,
+            tile_filter, output_dir, output_format,
+            fdr_threshold, top_k, cache
+        )
         
     if interaction is not None:
-        if isinstance(interaction, pd.core.frame.DataFrame):
-            interaction_df = interaction
-        else:
-            interaction_df = utils.generate_pairs(interaction)
+        interaction_index = interactions.interaction_index(interaction)
 
         if repeats_number is None:
-            repeats_number = int(len(interaction_df) / 0.05)
+            repeats_number = int(len(interaction_index) / 0.05)
     else:
-        interaction_df = None
+        interaction_index = None
 
         if repeats_number is None:
             repeats_number = 0
 
+    # A shard (shard_index, shards_number) of the permutations
+    # saves (or returns) its exceedance counts, see merge_shards
+    if shard is not None:
+        return _ztest_shard(
+            data_df, description_df, interaction_index,
+            reference_group, experimental_group,
+            correlation, alternative,
+            repeats_number, process_number,
+            shard, output_dir, cache, checkpoint
+        )
+
     sorted_indexes, df_indexes, \
     ref_corrs, ref_pvalues, exp_corrs, exp_pvalues, \
     stat, pvalue, adjusted_pvalue, \
-    boot_pvalue = _ztest(
-        data_df, description_df, interaction_df, \
+    boot_pvalue, permutations = _ztest(
+        data_df, description_df, interaction_index, \
         reference_group, experimental_group, \
         correlation, alternative, \
-        repeats_number, process_number
+        repeats_number, process_number, \
+        stop_exceedances, \
+        fdr_threshold, top_k, cache, checkpoint
+    )
+    
+    columns = _ztest_columns(
+        repeats_number,
+        ref_corrs, ref_pvalues, exp_corrs, exp_pvalues,
+        stat, pvalue, adjusted_pvalue,
+        boot_pvalue, permutations
     )
     
     if output_dir:
         dump.check_directory_existence(output_dir)
         
-        if repeats_number > 0: 
-            df_template = pd.DataFrame(columns=[
-                "Source", "Target", "RefCorr", "RefPvalue", 
-                "ExpCorr", "ExpPvalue", "Statistic",
-                "Pvalue", "AdjPvalue", "PermutePvalue"
-            ])
-
-            df_columns = [
-                ref_corrs, ref_pvalues,
-                exp_corrs, exp_pvalues, stat,
-                pvalue, adjusted_pvalue, boot_pvalue
-            ]
-
-        else:
-            df_template = pd.DataFrame(columns=[
-                "Source", "Target", "RefCorr", "RefPvalue", 
-                "ExpCorr", "ExpPvalue", "Statistic",
-                "Pvalue", "AdjPvalue"
-            ])
-
-            df_columns = [
-                ref_corrs, ref_pvalues,
-                exp_corrs, exp_pvalues, stat,
-                pvalue, adjusted_pvalue
-            ]
-
-        path_to_file = output_dir.rstrip("/") + f"/{correlation}_{alternative}_ztest.csv"
+        path_to_file = dump.output_path(
+            output_dir,
+            f"{correlation}_{alternative}_ztest",
+            output_format
+        )
         dump.save_by_chunks(
             sorted_indexes,
-            df_indexes, df_template, df_columns,
-            path_to_file
+            df_indexes,
+            pd.DataFrame(columns=["Source", "Target", *columns]),
+            list(columns.values()),
+            path_to_file,
+            output_format=output_format
         )
         
         print(f"File saved at: {path_to_file}")
         return None
     
+    return _ztest_frame(sorted_indexes, df_indexes, columns)
+
+def ztest_many(
+    data_df, description_df,
+    contrasts,
+    correlation="spearman", alternative="two-sided",
+    interaction=None,
+    repeats_number=None,
+    output_dir=None,
+    process_number=None,
+    stop_exceedances=None,
+    output_format="csv",
+    fdr_threshold=None,
+    top_k=None
+):
+    # Runs ztest for every (reference_group, experimental_group)
+    # pair of "contrasts" in one pass: correlations of a group are
+    # computed once for all its contrasts, contrasts of equal group
+    # sizes share permutations. Results are the same as of separate
+    # ztest calls. Returns a dictionary of the contrast tables, or
+    # saves them into the contrast subdirectories of "output_dir"
+    if process_number is None:
+        process_number = cpu_count()
+
+    if isinstance(data_df, str):
+        data_df = load.read_data(data_df)
+
+    if not pd.api.types.is_number(data_df.iloc[0, 0]):
+        data_df = data_df.copy()
+        data_df.set_index(data_df.columns[0], inplace=True)
+
+    if (correlation != "spearman"):
+        correlation = "pearson"
+
+    if interaction is not None:
+        interaction_index = interactions.interaction_index(interaction)
+        interaction_index = interaction_index.resolve(data_df.index)
+        source_indexes = interaction_index.sources
+        target_indexes = interaction_index.targets
+        df_indexes = interaction_index.pair_names()
+
+        if repeats_number is None:
+            repeats_number = int(len(interaction_index) / 0.05)
+    else:
+        source_indexes = None
+        target_indexes = None
+        df_indexes = data_df.index.to_numpy()
+
+        if repeats_number is None:
+            repeats_number = 0
+
+    contrasts = [tuple(contrast) for contrast in contrasts]
+    group_indexes, group_contrasts = utils.contrast_groups(
+        data_df, description_df, contrasts
+    )
+
+    print(f"Z-test computation: {len(contrasts)} contrasts")
+    corrs, corr_pvalues, \
+    stat, pvalue, boot_pvalue, permutations = \
+    extern.ztest_pipeline_contrasts(
+        data_df,
+        group_indexes,
+        group_contrasts,
+        source_indexes,
+        target_indexes,
+        correlation=correlation,
+        correlation_alternative="two-sided",
+        alternative=alternative,
+        repeats_num=repeats_number,
+        process_num=process_number,
+        stop_exceedances=stop_exceedances
+    )
+
+    if output_dir:
+        dump.check_directory_existence(output_dir)
+
+    result = {}
+    for c, (reference_group, experimental_group) in enumerate(contrasts):
+        print(f"Adjusted p-value computation: {reference_group} vs {experimental_group}")
+        sorted_indexes, sorted_adjusted_pvalue = extern.fdr_select(
+            pvalue[c],
+            threshold=fdr_threshold,
+            top_k=top_k,
+            process_num=process_number
+        )
+
+        adjusted_pvalue = np.full(pvalue.shape[1], np.nan, dtype="float32")
+        adjusted_pvalue[sorted_indexes] = sorted_adjusted_pvalue
+        del sorted_adjusted_pvalue
+
+        ref, exp = group_contrasts[c]
+        columns = _ztest_columns(
+            repeats_number,
+            corrs[ref], corr_pvalues[ref], corrs[exp], corr_pvalues[exp],
+            stat[c], pvalue[c], adjusted_pvalue,
+            boot_pvalue[c],
+            permutations[c] if stop_exceedances else None
+        )
+
+        if output_dir:
+            contrast_dir = os.path.join(
+                output_dir,
+                utils.contrast_name(reference_group, experimental_group)
+            )
+            os.makedirs(contrast_dir, exist_ok=True)
+
+            path_to_file = dump.output_path(
+                contrast_dir,
+                f"{correlation}_{alternative}_ztest",
+                output_format
+            )
+            dump.save_by_chunks(
+                sorted_indexes,
+                df_indexes,
+                pd.DataFrame(columns=["Source", "Target", *columns]),
+                list(columns.values()),
+                path_to_file,
+                output_format=output_format
+            )
+            print(f"File saved at: {path_to_file}")
+        else:
+            result[(reference_group, experimental_group)] = \
+                _ztest_frame(sorted_indexes, df_indexes, columns)
+
+        del columns, adjusted_pvalue, sorted_indexes
+
+    if output_dir:
+        return None
+
+    return result
+
+def _ztest_columns(
+    repeats_number,
+    ref_corrs, ref_pvalues, exp_corrs, exp_pvalues,
+    stat, pvalue, adjusted_pvalue,
+    boot_pvalue, permutations
+):
+    # Columns of the z-test table in the pair order
+    columns = {
+        "RefCorr": ref_corrs,
+        "RefPvalue": ref_pvalues,
+        "ExpCorr": exp_corrs,
+        "ExpPvalue": exp_pvalues,
+        "Statistic": stat,
+        "Pvalue": pvalue,
+        "AdjPvalue": adjusted_pvalue
+    }
+
+    if repeats_number > 0:
+        columns["PermutePvalue"] = boot_pvalue
+
+        if permutations is not None:
+            columns["Permutations"] = permutations
+
+    return columns
+
+def _ztest_frame(sorted_indexes, df_indexes, columns):
     if (isinstance(df_indexes, tuple)) and (len(df_indexes) == 2):
         # This "if" is true when user passed interaction_df
         source_indexes, target_indexes = df_indexes
@@ -95,80 +300,67 @@ def ztest(
         target_indexes = np.array(target_indexes)[sorted_indexes]
     else:
         # This "else" is true when user passed no interaction_df
-        source_indexes = []
-        target_indexes = []
-        for ind in sorted_indexes:
-            s, t = extern.paired_index(ind, len(df_indexes))
-            source_indexes.append(df_indexes[s])
-            target_indexes.append(df_indexes[t])
+        sources, targets = extern.paired_index_batch(
+            sorted_indexes, len(df_indexes)
+        )
+        source_indexes = df_indexes[sources]
+        target_indexes = df_indexes[targets]
+        del sources, targets
 
-    if repeats_number > 0:
-        output_df = pd.DataFrame(data={
-            "Source": source_indexes,
-            "Target": target_indexes,
-            "RefCorr": ref_corrs[sorted_indexes], 
-            "RefPvalue": ref_pvalues[sorted_indexes], 
-            "ExpCorr": exp_corrs[sorted_indexes], 
-            "ExpPvalue": exp_pvalues[sorted_indexes], 
-            "Statistic": stat[sorted_indexes],
-            "Pvalue": pvalue[sorted_indexes], 
-            "AdjPvalue": adjusted_pvalue[sorted_indexes],
-            "PermutePvalue": boot_pvalue[sorted_indexes] 
-        })
-    else:
-        output_df = pd.DataFrame(data={
-            "Source": source_indexes,
-            "Target": target_indexes,
-            "RefCorr": ref_corrs[sorted_indexes], 
-            "RefPvalue": ref_pvalues[sorted_indexes], 
-            "ExpCorr": exp_corrs[sorted_indexes], 
-            "ExpPvalue": exp_pvalues[sorted_indexes], 
-            "Statistic": stat[sorted_indexes],
-            "Pvalue": pvalue[sorted_indexes], 
-            "AdjPvalue": adjusted_pvalue[sorted_indexes]
-        })
+    output_df = pd.DataFrame(data={
+        "Source": source_indexes,
+        "Target": target_indexes
+    })
+    for column in columns:
+        output_df[column] = columns[column][sorted_indexes]
 
     return output_df
 
 def _ztest(
-    data_df, description_df, interaction_df,
+    data_df, description_df, interaction_index,
     reference_group, experimental_group,
     correlation, alternative,
-    repeats_number, process_number
+    repeats_number, process_number,
+    stop_exceedances=None,
+    fdr_threshold=None,
+    top_k=None,
+    cache=None,
+    checkpoint=None,
+    shard=None
 ):
     if (correlation != "spearman"):
         correlation = "pearson"
 
-    if interaction_df is not None:
-        data_molecules = set(data_df.index.to_list())
-        interaction_df = interaction_df[interaction_df["Source"].isin(data_molecules)]
-        interaction_df = interaction_df[interaction_df["Target"].isin(data_molecules)]
-
-        source_indexes = interaction_df["Source"]
-        target_indexes = interaction_df["Target"]
-
-        data_molecules = data_molecules.intersection(
-            set(source_indexes) | set(target_indexes)
-        )
-        data_df = data_df.loc[data_df.index.isin(data_molecules)]
+    # Pairs of the molecules missing in the table are dropped,
+    # pairs address rows of the whole table
+    if interaction_index is not None:
+        interaction_index = interaction_index.resolve(data_df.index)
+        source_indexes = interaction_index.sources
+        target_indexes = interaction_index.targets
     else:
-        interaction_df = None
         source_indexes = None
         target_indexes = None
 
-    reference_indexes = description_df.loc[
-        description_df["Group"] == reference_group,
-        "Sample"
-    ].to_list()
-    experimental_indexes = description_df.loc[
-        description_df["Group"] == experimental_group,
-        "Sample"
-    ].to_list()
+    reference_indexes = utils.sample_positions(
+        data_df,
+        description_df.loc[
+            description_df["Group"] == reference_group,
+            "Sample"
+        ]
+    )
+    experimental_indexes = utils.sample_positions(
+        data_df,
+        description_df.loc[
+            description_df["Group"] == experimental_group,
+            "Sample"
+        ]
+    )
 
     print("Z-test computation")
     ref_corrs, ref_pvalues, \
     exp_corrs, exp_pvalues, \
-    stat, pvalue, boot_pvalue = \
+    stat, pvalue, boot_pvalue, \
+    *permutations = \
     extern.ztest_pipeline(
         data_df,
         reference_indexes,
@@ -179,29 +371,345 @@ def _ztest(
         alternative=alternative,
         repeats_num=repeats_number,
         process_num=process_number,
-        correlation_alternative="two-sided"
+        correlation_alternative="two-sided",
+        numerical_index=True,
+        stop_exceedances=stop_exceedances,
+        cache=cache,
+        checkpoint=checkpoint,
+        shard=shard
     )
+    permutations = permutations[0] if permutations else None
 
-    print("Adjusted p-value computation")
-    adjusted_pvalue = pvalue * len(pvalue) / \
-        scipy.stats.rankdata(pvalue)
-    adjusted_pvalue[adjusted_pvalue > 1] = 1
-    adjusted_pvalue = adjusted_pvalue.flatten()
-    
-    if interaction_df is None:
+    if interaction_index is None:
         df_indexes = data_df.index.to_numpy()
     else:
-        df_indexes = (source_indexes, target_indexes)
+        df_indexes = interaction_index.pair_names()
 
-    fdr_pvalue = np.core.records.fromarrays(
-        [adjusted_pvalue, pvalue],
-        names='fdr, pvalue'
+    # P-values of a shard are adjusted after the merge
+    if shard is not None:
+        return None, df_indexes, \
+            ref_corrs, ref_pvalues, exp_corrs, exp_pvalues, \
+            stat, pvalue, None, \
+            boot_pvalue, permutations
+
+    print("Adjusted p-value computation")
+    sorted_indexes, sorted_adjusted_pvalue = extern.fdr_select(
+        pvalue,
+        threshold=fdr_threshold,
+        top_k=top_k,
+        process_num=process_number
     )
 
-    sorted_indexes = np.argsort(fdr_pvalue, order=('fdr', 'pvalue'))
-    del fdr_pvalue
+    # Only the selected pairs are read by sorted_indexes
+    adjusted_pvalue = np.full(len(pvalue), np.nan, dtype="float32")
+    adjusted_pvalue[sorted_indexes] = sorted_adjusted_pvalue
+    del sorted_adjusted_pvalue
 
     return sorted_indexes, df_indexes, \
         ref_corrs, ref_pvalues, exp_corrs, exp_pvalues, \
         stat, pvalue, adjusted_pvalue, \
-        boot_pvalue
+        boot_pvalue, permutations
+
+def _ztest_shard(
+    data_df, description_df, interaction_index,
+    reference_group, experimental_group,
+    correlation, alternative,
+    repeats_number, process_number,
+    shard, output_dir, cache=None, checkpoint=None
+):
+    permutations = shards.shard_range(shard, repeats_number)
+
+    _, _, \
+    ref_corrs, ref_pvalues, exp_corrs, exp_pvalues, \
+    stat, pvalue, _, \
+    counts, _ = _ztest(
+        data_df, description_df, interaction_index,
+        reference_group, experimental_group,
+        correlation, alternative,
+        repeats_number, process_number,
+        cache=cache,
+        checkpoint=checkpoint,
+        shard=permutations
+    )
+
+    # Pairs are kept as codes of the molecule names
+    if interaction_index is not None:
+        interaction_index = interaction_index.resolve(data_df.index)
+        sources = interaction_index.sources
+        targets = interaction_index.targets
+    else:
+        sources = np.zeros(0, dtype="int32")
+        targets = np.zeros(0, dtype="int32")
+
+    shard = shards.make_shard(
+        "ztest",
+        f"{correlation}_{alternative}_ztest",
+        repeats_number,
+        permutations,
+        {
+            "reference_group": str(reference_group),
+            "experimental_group": str(experimental_group),
+            "correlation": correlation,
+            "alternative": alternative,
+            "interaction": interaction_index is not None,
+            "names": data_df.index.to_numpy().astype(str),
+            "sources": sources,
+            "targets": targets
+        },
+        {
+            "ref_corrs": ref_corrs,
+            "ref_pvalues": ref_pvalues,
+            "exp_corrs": exp_corrs,
+            "exp_pvalues": exp_pvalues,
+            "stat": stat,
+            "pvalue": pvalue
+        },
+        counts
+    )
+
+    if output_dir:
+        dump.check_directory_existence(output_dir)
+        path_to_file = shards.save_shard(shard, output_dir)
+
+        print(f"File saved at: {path_to_file}")
+        return None
+
+    return shard
+
+def stripe_rows(index_size, memory_budget):
+    # Splits rows into stripes: pairs of a stripe rows with
+    # all the following rows fit into the memory budget
+    pairs_budget = max(memory_budget // STRIPE_PAIR_BYTES, 1)
+    
+    start_row = 0
+    while start_row < index_size - 1:
+        end_row, pairs_num = start_row, 0
+        while end_row < index_size - 1:
+            row_pairs_num = index_size - end_row - 1
+            if (pairs_num > 0) and \
+                    (pairs_num + row_pairs_num > pairs_budget):
+                break
+            
+            pairs_num += row_pairs_num
+            end_row += 1
+
+        yield start_row, end_row
+        start_row = end_row
+
+def _ztest_streamed(
+    data_df, description_df,
+    reference_group, experimental_group,
+    correlation, alternative,
+    repeats_number, process_number,
+    stop_exceedances, memory_budget,
+    tile_filter, output_dir, output_format="csv",
+    fdr_threshold=None, top_k=None, cache=None
+):
+    if (correlation != "spearman"):
+        correlation = "pearson"
+
+    reference_indexes = description_df.loc[
+        description_df["Group"] == reference_group,
+        "Sample"
+    ].to_list()
+    experimental_indexes = description_df.loc[
+        description_df["Group"] == experimental_group,
+        "Sample"
+    ].to_list()
+    
+    df_indexes = data_df.index.to_numpy()
+    index_size = len(df_indexes)
+    
+    if output_dir:
+        dump.check_directory_existence(output_dir)
+        path_to_file = dump.output_path(
+            output_dir,
+            f"{correlation}_{alternative}_ztest",
+            output_format
+        )
+        writer = dump.TableWriter(path_to_file, df_indexes, output_format)
+        name_index = pd.Index(df_indexes)
+
+    # Selection of the adjusted p-values takes two passes:
+    # a histogram of all p-values (permutations are not needed
+    # for it) and the pairs of the selected histogram buckets
+    selection = (fdr_threshold is not None) or (top_k is not None)
+    if selection:
+        histogram = None
+        for start_row, end_row in stripe_rows(index_size, memory_budget):
+            print(f"P-value histogram: rows {start_row}-{end_row} of {index_size}")
+            pvalue = extern.ztest_pipeline(
+                data_df,
+                reference_indexes,
+                experimental_indexes,
+                correlation=correlation,
+                alternative=alternative,
+                repeats_num=0,
+                process_num=process_number,
+                correlation_alternative="two-sided",
+                start_row=start_row,
+                end_row=end_row,
+                cache=cache
+            )[5]
+            histogram = extern.fdr_histogram(
+                pvalue, histogram, process_number
+            )
+        plan = extern.fdr_plan(histogram, fdr_threshold, top_k)
+    
+    chunks = []
+    offset = 0
+    for start_row, end_row in stripe_rows(index_size, memory_budget):
+        print(f"Z-test computation: rows {start_row}-{end_row} of {index_size}")
+        ref_corrs, ref_pvalues, \
+        exp_corrs, exp_pvalues, \
+        stat, pvalue, boot_pvalue, \
+        *permutations = \
+        extern.ztest_pipeline(
+            data_df,
+            reference_indexes,
+            experimental_indexes,
+            correlation=correlation,
+            alternative=alternative,
+            repeats_num=repeats_number,
+            process_num=process_number,
+            correlation_alternative="two-sided",
+            stop_exceedances=stop_exceedances,
+            start_row=start_row,
+            end_row=end_row,
+            cache=cache
+        )
+        
+        # Pairs of the stripe are ordered by source and then by target
+        pairs_numbers = index_size - np.arange(start_row, end_row) - 1
+        sources = np.repeat(np.arange(start_row, end_row), pairs_numbers)
+        targets = np.arange(len(sources)) - \
+            np.repeat(np.cumsum(pairs_numbers) - pairs_numbers, pairs_numbers) + \
+            sources + 1
+
+        # Pairs keep integer codes of the rows, names are
+        # restored for a filter or the returned table only
+        output_df = pd.DataFrame(data={
+            "Source": sources,
+            "Target": targets,
+            "RefCorr": ref_corrs, 
+            "RefPvalue": ref_pvalues, 
+            "ExpCorr": exp_corrs, 
+            "ExpPvalue": exp_pvalues, 
+            "Statistic": stat,
+            "Pvalue": pvalue
+        })
+        del sources, targets
+
+        if repeats_number > 0:
+            output_df["PermutePvalue"] = boot_pvalue
+            if permutations:
+                output_df["Permutations"] = permutations[0]
+        
+        if selection:
+            # Only the pairs of the selected buckets are kept,
+            # they are indexed by their position in all pairs
+            indexes, _ = extern.fdr_collect(pvalue, plan, offset)
+            output_df = output_df.iloc[indexes - offset]
+            output_df.index = indexes
+            offset += len(pvalue)
+            
+            chunks.append(output_df)
+            continue
+        
+        if tile_filter is not None:
+            output_df = tile_filter(_named_pairs(output_df, df_indexes))
+            if output_df is None:
+                continue
+
+            if output_dir:
+                output_df = _coded_pairs(output_df, name_index)
+        elif not output_dir:
+            output_df = _named_pairs(output_df, df_indexes)
+
+        if output_dir:
+            writer.write(output_df)
+        else:
+            chunks.append(output_df)
+    
+    if selection:
+        output_df = _select_streamed(
+            chunks, histogram, plan,
+            fdr_threshold, top_k,
+            process_number
+        )
+        del chunks
+        
+        output_df = _named_pairs(output_df, df_indexes)
+        if tile_filter is not None:
+            filtered_df = tile_filter(output_df)
+            
+            # A file keeps the header if no pairs pass the filter
+            if (filtered_df is None) and output_dir:
+                filtered_df = output_df.iloc[:0]
+            output_df = filtered_df
+
+        if output_dir:
+            writer.write(_coded_pairs(output_df, name_index))
+            writer.close()
+            print(f"File saved at: {path_to_file}")
+            return None
+
+        return output_df
+
+    if output_dir:
+        writer.close()
+        print(f"File saved at: {path_to_file}")
+        return None
+    
+    if not chunks:
+        return pd.DataFrame(columns=[
+            "Source", "Target", "RefCorr", "RefPvalue",
+            "ExpCorr", "ExpPvalue", "Statistic", "Pvalue"
+        ])
+
+    output_df = pd.concat(chunks, ignore_index=True)
+    output_df = output_df.sort_values("Pvalue", ignore_index=True)
+    return output_df
+
+def _named_pairs(output_df, df_indexes):
+    # Names of the rows in place of their integer codes
+    return output_df.assign(
+        Source=df_indexes[output_df["Source"].to_numpy()],
+        Target=df_indexes[output_df["Target"].to_numpy()]
+    )
+
+def _coded_pairs(output_df, name_index):
+    # Integer codes of the rows in place of their names
+    return output_df.assign(
+        Source=name_index.get_indexer(output_df["Source"]),
+        Target=name_index.get_indexer(output_df["Target"])
+    )
+
+def _select_streamed(
+    chunks, histogram, plan,
+    fdr_threshold, top_k,
+    process_number
+):
+    # Adjusts the p-values of the collected pairs and
+    # returns the selected ones in ascending order
+    output_df = pd.concat(chunks)
+    
+    sorted_indexes, adjusted_pvalue = extern.fdr_adjust(
+        output_df["Pvalue"].to_numpy(),
+        output_df.index.to_numpy(),
+        histogram, plan,
+        fdr_threshold, top_k,
+        process_number
+    )
+    
+    # Collected pairs are in ascending order of their indexes
+    output_df = output_df.iloc[
+        np.searchsorted(output_df.index.to_numpy(), sorted_indexes)
+    ]
+    output_df.insert(
+        output_df.columns.get_loc("Pvalue") + 1,
+        "AdjPvalue",
+        adjusted_pvalue
+    )
+
+    return output_df.reset_index(drop=True)
@@ -2,6 +2,7 @@
 #include <string>
 #include <utility>
 #include <queue>
+#include <vector>
 #include <algorithm>
 
 #include "correlations.h"
@@ -21,8 +22,8 @@ int spearmanr(
     int *source_ind_ptr,
     int *target_ind_ptr,
     float *corrs_ptr,
-    int start_ind,
-    int end_ind,
+    int64_t start_ind,
+    int64_t end_ind,
     int index_size,
     int *sample_ind_ptr,
     int sample_ind_size
@@ -35,7 +36,7 @@ int spearmanr(
     int *target_ranks = new int[sample_ind_size];    
     int *reverse = new int[sample_ind_size];
     
-    for (int i = start_ind; i < end_ind; ++i) {
+    for (int64_t i = start_ind; i < end_ind; ++i) {
         int source_index, target_index;
         if (!source_ind_ptr || !target_ind_ptr) {
             std::pair<int, int> paired_ind =
@@ -63,14 +64,12 @@ int spearmanr(
                 sample_size,
                 sample_ind_ptr
             ](int i1, int i2) {
-                if (!sample_ind_ptr) {
-                    i1 = sample_size * source_index + i1;
-                    i2 = sample_size * source_index + i2;
-                } else {
-                    i1 = sample_size * source_index + sample_ind_ptr[i1];
-                    i2 = sample_size * source_index + sample_ind_ptr[i2];
+                float *row_ptr = data_ptr + (int64_t) sample_size * source_index;
+                if (sample_ind_ptr) {
+                    i1 = sample_ind_ptr[i1];
+                    i2 = sample_ind_ptr[i2];
                 }
-                return data_ptr[i1] < data_ptr[i2];
+                return row_ptr[i1] < row_ptr[i2];
             }
         );
         inverse(source_ranks, reverse, sample_ind_size);
@@ -85,14 +84,12 @@ int spearmanr(
                 sample_size,
                 sample_ind_ptr
             ](int i1, int i2) {
-                if (!sample_ind_ptr) {
-                    i1 = sample_size * target_index + i1;
-                    i2 = sample_size * target_index + i2;
-                } else {
-                    i1 = sample_size * target_index + sample_ind_ptr[i1];
-                    i2 = sample_size * target_index + sample_ind_ptr[i2];
+                float *row_ptr = data_ptr + (int64_t) sample_size * target_index;
+                if (sample_ind_ptr) {
+                    i1 = sample_ind_ptr[i1];
+                    i2 = sample_ind_ptr[i2];
                 }
-                return data_ptr[i1] < data_ptr[i2];
+                return row_ptr[i1] < row_ptr[i2];
             }
         );
         inverse(target_ranks, reverse, sample_ind_size);
@@ -135,71 +132,786 @@ int spearmanr(
     return 0;
 }
 
+std::pair<int, int> pair_rows(
+    int64_t index,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int index_size
+) {
+    if (!source_ind_ptr || !target_ind_ptr) {
+        return paired_index(index, index_size);
+    }
+
+    return std::make_pair(source_ind_ptr[index], target_ind_ptr[index]);
+}
+
+float pearson_value(
+    float correlation,
+    float source_mean,
+    float source_var,
+    float target_mean,
+    float target_var,
+    int sample_ind_size
+) {
+    // Pearson correlation from the sums of the samples,
+    // their squares and products
+    source_mean /= sample_ind_size;
+    target_mean /= sample_ind_size;
+
+    correlation = correlation / sample_ind_size - 
+        source_mean * target_mean;
+
+    source_var = source_var / sample_ind_size -
+        source_mean * source_mean; 
+    target_var = target_var / sample_ind_size -
+        target_mean * target_mean; 
+    
+    if (source_var == 0 || target_var == 0) { 
+        return UNDEFINED_CORR_VALUE;
+    }
+
+    return correlation / std::sqrt(source_var * target_var);
+}
+
 int pearsonr(
     float *data_ptr,
     int sample_size,
     int *source_ind_ptr,
     int *target_ind_ptr,
     float *corrs_ptr,
-    int start_ind,
-    int end_ind,
+    int64_t start_ind,
+    int64_t end_ind,
     int index_size,
     int *sample_ind_ptr,
     int sample_ind_size
 ) {
-    if (!sample_ind_ptr) {
+    /* Correlations of the pairs from "start_ind" to "end_ind"
+     * over the "sample_ind_ptr" columns of the rows. Without
+     * "sample_ind_ptr" the first "sample_ind_size" columns (all
+     * of them if it is negative) are used, e.g. the grouped
+     * columns of "group_columns" */
+
+    if (!sample_ind_ptr && sample_ind_size < 0) {
         sample_ind_size = sample_size;
     }
 
-    for (int i = start_ind; i < end_ind; ++i) {
-        int source_index, target_index;
-        if (!source_ind_ptr || !target_ind_ptr) {
-            std::pair<int, int> paired_ind =
-                paired_index(i, index_size);
-            source_index = paired_ind.first; 
-            target_index = paired_ind.second;    
-        } else {
-            source_index = source_ind_ptr[i]; 
-            target_index = target_ind_ptr[i];
+    int64_t i = start_ind;
+    
+    // Unit-stride columns: two pairs are computed at once,
+    // sums of every pair are accumulated in the same order
+    // as below, they are only interleaved
+    for (; !sample_ind_ptr && (i + 1 < end_ind); i += 2) {
+        std::pair<int, int> first =
+            pair_rows(i, source_ind_ptr, target_ind_ptr, index_size);
+        std::pair<int, int> second =
+            pair_rows(i + 1, source_ind_ptr, target_ind_ptr, index_size);
+
+        float *source_ptr = data_ptr + (int64_t) first.first * sample_size;
+        float *target_ptr = data_ptr + (int64_t) first.second * sample_size;
+        float *next_source_ptr = data_ptr + (int64_t) second.first * sample_size;
+        float *next_target_ptr = data_ptr + (int64_t) second.second * sample_size;
+
+        float correlation = 0, next_correlation = 0;
+        float source_mean = 0, target_mean = 0;
+        float source_var  = 0, target_var  = 0;
+        float next_source_mean = 0, next_target_mean = 0;
+        float next_source_var  = 0, next_target_var  = 0;
+        for (int j = 0; j < sample_ind_size; ++j) {
+            float source = source_ptr[j];
+            float target = target_ptr[j];
+            float next_source = next_source_ptr[j];
+            float next_target = next_target_ptr[j];
+
+            correlation += source * target;
+            next_correlation += next_source * next_target;
+            
+            source_mean += source;
+            source_var  += source * source;
+            next_source_mean += next_source;
+            next_source_var  += next_source * next_source;
+        
+            target_mean += target;
+            target_var  += target * target;
+            next_target_mean += next_target;
+            next_target_var  += next_target * next_target;
         }
 
+        corrs_ptr[i] = pearson_value(
+            correlation,
+            source_mean, source_var,
+            target_mean, target_var,
+            sample_ind_size
+        );
+        corrs_ptr[i + 1] = pearson_value(
+            next_correlation,
+            next_source_mean, next_source_var,
+            next_target_mean, next_target_var,
+            sample_ind_size
+        );
+    }
+
+    for (; i < end_ind; ++i) {
+        std::pair<int, int> paired_ind =
+            pair_rows(i, source_ind_ptr, target_ind_ptr, index_size);
+
         float correlation = 0;
         float source_mean = 0, target_mean = 0;
         float source_var  = 0, target_var  = 0;
 
+        float *source_ptr = data_ptr + (int64_t) paired_ind.first * sample_size;
+        float *target_ptr = data_ptr + (int64_t) paired_ind.second * sample_size;
         for (int j = 0; j < sample_ind_size; ++j) {
             int jj = (sample_ind_ptr == nullptr) ? j : sample_ind_ptr[j];
-            correlation += data_ptr[source_index * sample_size + jj] *
-                data_ptr[target_index * sample_size + jj];
+            correlation += source_ptr[jj] * target_ptr[jj];
             
-            source_mean += data_ptr[source_index * sample_size + jj];
-            source_var  += data_ptr[source_index * sample_size + jj] *
-                           data_ptr[source_index * sample_size + jj];
+            source_mean += source_ptr[jj];
+            source_var  += source_ptr[jj] * source_ptr[jj];
         
-            target_mean += data_ptr[target_index * sample_size + jj];
-            target_var  += data_ptr[target_index * sample_size + jj] *
-                           data_ptr[target_index * sample_size + jj]; 
+            target_mean += target_ptr[jj];
+            target_var  += target_ptr[jj] * target_ptr[jj]; 
         }
 
+        corrs_ptr[i] = pearson_value(
+            correlation,
+            source_mean, source_var,
+            target_mean, target_var,
+            sample_ind_size
+        );
+    }
+
+    return 0;
+}
+
+int pooled_products(
+    float *data_ptr,
+    int sample_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    double *products_ptr,
+    int64_t start_ind,
+    int64_t end_ind,
+    int sample_ind_size
+) {
+    /* Sums of the products of the pairs from "start_ind"
+     * to "end_ind" over the first "sample_ind_size" columns,
+     * centered by the means of the rows over these columns.
+     * They are in double so the sums of a group can be
+     * subtracted from them (see "pearsonr_complement") */
+
+    for (int64_t i = start_ind; i < end_ind; ++i) {
+        float *source_ptr = data_ptr + (int64_t) source_ind_ptr[i] * sample_size;
+        float *target_ptr = data_ptr + (int64_t) target_ind_ptr[i] * sample_size;
+
+        double source_mean = 0, target_mean = 0;
+        for (int j = 0; j < sample_ind_size; ++j) {
+            source_mean += source_ptr[j];
+            target_mean += target_ptr[j];
+        }
         source_mean /= sample_ind_size;
         target_mean /= sample_ind_size;
 
-        correlation = correlation / sample_ind_size - 
-            source_mean * target_mean;
+        double product = 0;
+        for (int j = 0; j < sample_ind_size; ++j) {
+            product += (source_ptr[j] - source_mean) *
+                (target_ptr[j] - target_mean);
+        }
 
-        source_var = source_var / sample_ind_size -
-            source_mean * source_mean; 
-        target_var = target_var / sample_ind_size -
-            target_mean * target_mean; 
-        
-        if (source_var == 0 || target_var == 0) { 
-            correlation = UNDEFINED_CORR_VALUE;
+        products_ptr[i] = product;
+    }
+
+    return 0;
+}
+
+bool centered_rows(
+    float *data_ptr,
+    int sample_size,
+    int *row_ind_ptr,
+    int row_size
+) {
+    /* Whether the absolute mean of every "row_ind_ptr" row
+     * is at most CENTERED_RATIO of its standard deviation
+     * (constant rows are skipped). Correlations of
+     * "pearsonr_complement" equal the ones of "pearsonr" on
+     * such rows only, uncentered sums of "pearson_value"
+     * are rounded differently otherwise */
+
+    for (int k = 0; k < row_size; ++k) {
+        float *row_ptr = data_ptr + (int64_t) row_ind_ptr[k] * sample_size;
+
+        double mean = 0;
+        for (int j = 0; j < sample_size; ++j) {
+            mean += row_ptr[j];
+        }
+        mean /= sample_size;
+
+        double var = 0;
+        for (int j = 0; j < sample_size; ++j) {
+            var += (row_ptr[j] - mean) * (row_ptr[j] - mean);
+        }
+        var /= sample_size;
+
+        if ((var > 0) &&
+                (mean * mean > CENTERED_RATIO * CENTERED_RATIO * var)) {
+            return false;
+        }
+    }
+
+    return true;
+}
+
+int pearsonr_complement(
+    float *data_ptr,
+    int sample_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    float *ref_corrs_ptr,
+    float *exp_corrs_ptr,
+    int64_t start_ind,
+    int64_t end_ind,
+    int ref_ind_size,
+    int exp_ind_size,
+    float *moments_ptr,
+    double *products_ptr
+) {
+    /* Reference and experimental correlations of the pairs
+     * from "start_ind" to "end_ind" over grouped columns (see
+     * "group_columns") when the groups split all the samples.
+     * Sums of the rows are taken from "moments_ptr", products
+     * are summed over the smaller group only. The centered
+     * sums of the other group are the pooled ones "products_ptr"
+     * of the pairs (see "pooled_products") minus the centered
+     * sums of the smaller group, both are centered by the pooled
+     * means so uncentered data do not cancel. Correlations of
+     * the smaller group equal the ones of "pearsonr", the ones
+     * of the other group too if the rows are centered (see
+     * "centered_rows") */
+
+    bool ref_smaller = (ref_ind_size <= exp_ind_size);
+    int offset = ref_smaller ? 0 : ref_ind_size;
+    int size = ref_smaller ? ref_ind_size : exp_ind_size;
+    int other_size = ref_smaller ? exp_ind_size : ref_ind_size;
+    int pooled_size = ref_ind_size + exp_ind_size;
+
+    // Moments of the other group in the rows
+    int other_moment = ref_smaller ? 2 : 0;
+
+    float products[PAIR_BLOCK];
+    double centered[PAIR_BLOCK];
+    double source_means[PAIR_BLOCK];
+    double target_means[PAIR_BLOCK];
+    float *source_ptrs[PAIR_BLOCK];
+    float *target_ptrs[PAIR_BLOCK];
+    float *source_moments[PAIR_BLOCK];
+    float *target_moments[PAIR_BLOCK];
+
+    for (int64_t i = start_ind; i < end_ind; i += PAIR_BLOCK) {
+        int block_size = std::min((int64_t) PAIR_BLOCK, end_ind - i);
+        for (int p = 0; p < block_size; ++p) {
+            source_ptrs[p] = data_ptr + offset +
+                (int64_t) source_ind_ptr[i + p] * sample_size;
+            target_ptrs[p] = data_ptr + offset +
+                (int64_t) target_ind_ptr[i + p] * sample_size;
+            source_moments[p] = moments_ptr +
+                (int64_t) source_ind_ptr[i + p] * MOMENTS_NUMBER;
+            target_moments[p] = moments_ptr +
+                (int64_t) target_ind_ptr[i + p] * MOMENTS_NUMBER;
+
+            source_means[p] = ((double) source_moments[p][0] +
+                source_moments[p][2]) / pooled_size;
+            target_means[p] = ((double) target_moments[p][0] +
+                target_moments[p][2]) / pooled_size;
+            products[p] = 0;
+            centered[p] = 0;
+        }
+
+        // Products of every pair are summed in the order
+        // of "pearsonr", pairs of a block are interleaved
+        if (block_size == PAIR_BLOCK) {
+            for (int j = 0; j < size; ++j) {
+                for (int p = 0; p < PAIR_BLOCK; ++p) {
+                    float source = source_ptrs[p][j];
+                    float target = target_ptrs[p][j];
+                    products[p] += source * target;
+                    centered[p] += (source - source_means[p]) *
+                        (target - target_means[p]);
+                }
+            }
         } else {
-            correlation /= std::sqrt(source_var * target_var);
+            for (int p = 0; p < block_size; ++p) {
+                for (int j = 0; j < size; ++j) {
+                    float source = source_ptrs[p][j];
+                    float target = target_ptrs[p][j];
+                    products[p] += source * target;
+                    centered[p] += (source - source_means[p]) *
+                        (target - target_means[p]);
+                }
+            }
         }
 
-        corrs_ptr[i] = correlation;
+        for (int p = 0; p < block_size; ++p) {
+            // The uncentered sum of the other group for
+            // "pearson_value", from its centered one
+            double source_sum = source_moments[p][other_moment];
+            double target_sum = target_moments[p][other_moment];
+            float product = products[p];
+            float complement = (float) (
+                products_ptr[i + p] - centered[p] +
+                source_means[p] * target_sum +
+                target_means[p] * source_sum -
+                other_size * source_means[p] * target_means[p]
+            );
+
+            ref_corrs_ptr[i + p] = pearson_value(
+                ref_smaller ? product : complement,
+                source_moments[p][0], source_moments[p][1],
+                target_moments[p][0], target_moments[p][1],
+                ref_ind_size
+            );
+            exp_corrs_ptr[i + p] = pearson_value(
+                ref_smaller ? complement : product,
+                source_moments[p][2], source_moments[p][3],
+                target_moments[p][2], target_moments[p][3],
+                exp_ind_size
+            );
+        }
+    }
+
+    return 0;
+}
+
+int _group_columns(
+    float *data_ptr,
+    int sample_size,
+    float *grouped_ptr,
+    int start_ind,
+    int end_ind,
+    int *ref_ind_ptr,
+    int ref_ind_size,
+    int *exp_ind_ptr,
+    int exp_ind_size,
+    int *row_ind_ptr,
+    int *data_row_ptr,
+    float *moments_ptr
+) {
+    for (int ind = start_ind; ind < end_ind; ++ind) {
+        int i = (row_ind_ptr == nullptr) ? ind : row_ind_ptr[ind];
+        int data_row = (data_row_ptr == nullptr) ? i : data_row_ptr[i];
+        float *row_ptr = data_ptr + (int64_t) data_row * sample_size;
+        float *grouped_row_ptr = grouped_ptr + (int64_t) i * sample_size;
+
+        for (int j = 0; j < ref_ind_size; ++j) {
+            grouped_row_ptr[j] = row_ptr[ref_ind_ptr[j]];
+        }
+
+        grouped_row_ptr += ref_ind_size;
+        for (int j = 0; j < exp_ind_size; ++j) {
+            grouped_row_ptr[j] = row_ptr[exp_ind_ptr[j]];
+        }
+
+        if (!moments_ptr) {
+            continue;
+        }
+
+        // Sums of the groups in the order of "pearsonr"
+        float *row_moments_ptr = moments_ptr + (int64_t) i * MOMENTS_NUMBER;
+        float *ref_row_ptr = grouped_row_ptr - ref_ind_size;
+        float mean = 0, var = 0;
+        for (int j = 0; j < ref_ind_size; ++j) {
+            float value = ref_row_ptr[j];
+            mean += value;
+            var  += value * value;
+        }
+        row_moments_ptr[0] = mean;
+        row_moments_ptr[1] = var;
+
+        mean = 0;
+        var  = 0;
+        for (int j = 0; j < exp_ind_size; ++j) {
+            float value = grouped_row_ptr[j];
+            mean += value;
+            var  += value * value;
+        }
+        row_moments_ptr[2] = mean;
+        row_moments_ptr[3] = var;
     }
 
     return 0;
 }
+
+int group_columns(
+    float *data_ptr,
+    int sample_size,
+    float *grouped_ptr,
+    int index_size,
+    ThreadPool &pool,
+    int *ref_ind_ptr,
+    int ref_ind_size,
+    int *exp_ind_ptr,
+    int exp_ind_size,
+    int *row_ind_ptr,
+    int *data_row_ptr,
+    float *moments_ptr
+) {
+    /* Gathers the reference and then the experimental
+     * columns of every row into the first columns of the
+     * same row of "grouped_ptr", so correlations within a
+     * group run over unit-stride memory (see "pearsonr").
+     * If "row_ind_ptr" is given only "index_size" rows listed
+     * there are gathered, if "data_row_ptr" is given row "i"
+     * is gathered from row "data_row_ptr[i]" of "data_ptr".
+     * If "moments_ptr" is given the sums of the groups of row
+     * "i" are written at i * MOMENTS_NUMBER */
+
+    pool.run(
+        "group",
+        index_size,
+        [=](int64_t left_border, int64_t right_border) {
+            _group_columns(
+                data_ptr,
+                sample_size,
+                grouped_ptr,
+                left_border,
+                right_border,
+                ref_ind_ptr,
+                ref_ind_size,
+                exp_ind_ptr,
+                exp_ind_size,
+                row_ind_ptr,
+                data_row_ptr,
+                moments_ptr
+            );
+        }
+    );
+
+    return 0;
+}
+
+int standardize(
+    float *data_ptr,
+    int sample_size,
+    float *std_ptr,
+    bool *defined_ptr,
+    int start_ind,
+    int end_ind,
+    int *sample_ind_ptr,
+    int sample_ind_size
+) {
+    /* Gathers the "sample_ind_ptr" columns of the rows
+     * from "start_ind" to "end_ind" into a contiguous buffer
+     * and scales every row to zero mean and unit norm, so
+     * the pearson correlation of two rows is their dot product */
+
+    if (!sample_ind_ptr) {
+        sample_ind_size = sample_size;
+    }
+
+    for (int i = start_ind; i < end_ind; ++i) {
+        float *row_ptr = std_ptr + (int64_t) i * sample_ind_size;
+        
+        double mean = 0;
+        for (int j = 0; j < sample_ind_size; ++j) {
+            int jj = (sample_ind_ptr == nullptr) ? j : sample_ind_ptr[j];
+            row_ptr[j] = data_ptr[(int64_t) i * sample_size + jj];
+            mean += row_ptr[j];
+        }
+        mean /= sample_ind_size;
+
+        double var = 0;
+        for (int j = 0; j < sample_ind_size; ++j) {
+            double diff = row_ptr[j] - mean;
+            var += diff * diff;
+        }
+
+        if (var == 0) {
+            defined_ptr[i] = false;
+            for (int j = 0; j < sample_ind_size; ++j) {
+                row_ptr[j] = 0;
+            }
+            continue;
+        }
+
+        defined_ptr[i] = true;
+        double scale = 1 / std::sqrt(var);
+        for (int j = 0; j < sample_ind_size; ++j) {
+            row_ptr[j] = (row_ptr[j] - mean) * scale;
+        }
+    }
+
+    return 0;
+}
+
+int tiles_number(int index_size, int source_size) {
+    /* Number of (i-block x j-block) tiles with
+     * i-block <= j-block that cover all unique pairs
+     * whose first row is less than "source_size" */
+    
+    if (source_size < 0) {
+        source_size = index_size;
+    }
+    
+    int blocks_num = (index_size + TILE_SIZE - 1) / TILE_SIZE;
+    int source_blocks_num = (source_size + TILE_SIZE - 1) / TILE_SIZE;
+    return source_blocks_num * blocks_num -
+        source_blocks_num * (source_blocks_num - 1) / 2;
+}
+
+int correlation_tiled(
+    float *std_ptr,
+    bool *defined_ptr,
+    int sample_ind_size,
+    int index_size,
+    float *corrs_ptr,
+    int start_tile,
+    int end_tile,
+    int source_size
+) {
+    /* Computes correlations of all pairs covered by
+     * the tiles from "start_tile" to "end_tile" of the
+     * standardized rows "std_ptr". Tiles are enumerated
+     * in the same alphabetical order as pairs, results
+     * are written straight into the "unary_index" layout.
+     * Pairs whose first row is not less than "source_size"
+     * are skipped, the rest of the layout is the same */
+
+    if (source_size < 0) {
+        source_size = index_size;
+    }
+
+    int blocks_num = (index_size + TILE_SIZE - 1) / TILE_SIZE;
+    
+    // The panel is a transposed (DEPTH_SIZE x TILE_SIZE)
+    // piece of the j-block, so the innermost loop runs
+    // over unit-stride memory without any reduction
+    std::vector<float> panel(DEPTH_SIZE * TILE_SIZE);
+    std::vector<float> tile(TILE_SIZE * TILE_SIZE);
+    
+    // Find the first tile of the batch
+    int block_i = 0, block_j = 0;
+    for (int t = start_tile; t > 0;) {
+        int row_tiles = blocks_num - block_i;
+        if (t < row_tiles) {
+            block_j = block_i + t;
+            break;
+        }
+        t -= row_tiles;
+        ++block_i;
+        block_j = block_i;
+    }
+
+    for (int t = start_tile; t < end_tile; ++t) {
+        int i_start = block_i * TILE_SIZE;
+        int i_end = std::min(i_start + TILE_SIZE, source_size);
+        int j_start = block_j * TILE_SIZE;
+        int j_end = std::min(j_start + TILE_SIZE, index_size);
+        int j_width = j_end - j_start;
+
+        std::fill(tile.begin(), tile.end(), 0);
+        std::fill(panel.begin(), panel.end(), 0);
+
+        for (int k_start = 0; k_start < sample_ind_size; k_start += DEPTH_SIZE) {
+            int k_end = std::min(k_start + DEPTH_SIZE, sample_ind_size);
+
+            for (int jj = 0; jj < j_width; ++jj) {
+                float *row_ptr = std_ptr + (int64_t) (j_start + jj) * sample_ind_size;
+                for (int k = k_start; k < k_end; ++k) {
+                    panel[(k - k_start) * TILE_SIZE + jj] = row_ptr[k];
+                }
+            }
+
+            for (int i = i_start; i < i_end; ++i) {
+                float *row_ptr = std_ptr + (int64_t) i * sample_ind_size;
+                float *tile_ptr = tile.data() + (i - i_start) * TILE_SIZE;
+                
+                for (int k = k_start; k < k_end; ++k) {
+                    float value = row_ptr[k];
+                    float *panel_ptr = panel.data() + (k - k_start) * TILE_SIZE;
+                    for (int jj = 0; jj < TILE_SIZE; ++jj) {
+                        tile_ptr[jj] += value * panel_ptr[jj];
+                    }
+                }
+            }
+        }
+
+        for (int i = i_start; i < i_end; ++i) {
+            int j_first = std::max(j_start, i + 1);
+            if (j_first >= j_end) {
+                continue;
+            }
+            
+            int64_t offset = unary_index(i, j_first, index_size) - j_first;
+            float *tile_ptr = tile.data() + (i - i_start) * TILE_SIZE;
+            for (int j = j_first; j < j_end; ++j) {
+                if (!defined_ptr[i] || !defined_ptr[j]) {
+                    corrs_ptr[offset + j] = UNDEFINED_CORR_VALUE;
+                } else {
+                    corrs_ptr[offset + j] = tile_ptr[j - j_start];
+                }
+            }
+        }
+
+        ++block_j;
+        if (block_j >= blocks_num) {
+            ++block_i;
+            block_j = block_i;
+        }
+    }
+
+    return 0;
+}
+
+int correlation_rows(
+    float *std_ptr,
+    bool *defined_ptr,
+    int sample_ind_size,
+    int index_size,
+    int64_t *rows_ptr,
+    int rows_size,
+    float *corrs_ptr
+) {
+    /* Correlations of the standardized rows "rows_ptr" (at most
+     * TILE_SIZE of them) with all rows: the correlation of the
+     * r-th of them with a row "j" is written at r * index_size + j.
+     * Products are accumulated in the same order as by
+     * "correlation_tiled", so the values are bit-identical
+     * to the ones of the pair layout */
+
+    static thread_local std::vector<float> panel;
+    static thread_local std::vector<float> tile;
+    panel.assign(DEPTH_SIZE * TILE_SIZE, 0);
+    tile.resize(TILE_SIZE * TILE_SIZE);
+
+    for (int j_start = 0; j_start < index_size; j_start += TILE_SIZE) {
+        int j_end = std::min(j_start + TILE_SIZE, index_size);
+        int j_width = j_end - j_start;
+
+        std::fill(tile.begin(), tile.end(), 0);
+
+        for (int k_start = 0; k_start < sample_ind_size; k_start += DEPTH_SIZE) {
+            int k_end = std::min(k_start + DEPTH_SIZE, sample_ind_size);
+
+            for (int jj = 0; jj < j_width; ++jj) {
+                float *row_ptr = std_ptr + (int64_t) (j_start + jj) * sample_ind_size;
+                for (int k = k_start; k < k_end; ++k) {
+                    panel[(k - k_start) * TILE_SIZE + jj] = row_ptr[k];
+                }
+            }
+
+            for (int r = 0; r < rows_size; ++r) {
+                float *row_ptr = std_ptr + rows_ptr[r] * sample_ind_size;
+                float *tile_ptr = tile.data() + r * TILE_SIZE;
+
+                for (int k = k_start; k < k_end; ++k) {
+                    float value = row_ptr[k];
+                    float *panel_ptr = panel.data() + (k - k_start) * TILE_SIZE;
+                    for (int jj = 0; jj < TILE_SIZE; ++jj) {
+                        tile_ptr[jj] += value * panel_ptr[jj];
+                    }
+                }
+            }
+        }
+
+        for (int r = 0; r < rows_size; ++r) {
+            int64_t i = rows_ptr[r];
+            float *tile_ptr = tile.data() + r * TILE_SIZE;
+            float *row_corrs_ptr = corrs_ptr + (int64_t) r * index_size;
+            for (int j = j_start; j < j_end; ++j) {
+                if (!defined_ptr[i] || !defined_ptr[j]) {
+                    row_corrs_ptr[j] = UNDEFINED_CORR_VALUE;
+                } else {
+                    row_corrs_ptr[j] = tile_ptr[j - j_start];
+                }
+            }
+        }
+    }
+
+    return 0;
+}
+
+int correlation_blocked(
+    float *data_ptr,
+    int sample_size,
+    int index_size,
+    float *corrs_ptr,
+    ThreadPool &pool,
+    int *sample_ind_ptr,
+    int sample_ind_size,
+    int source_size
+) {
+    /* Computes pearson correlations of all unique pairs
+     * of rows over "sample_ind_ptr" columns. Rows are
+     * standardized once, then the pairs are computed
+     * tile by tile. Pass ranked data to get spearman.
+     * With "source_size" only the pairs of the first
+     * "source_size" rows are computed, they form the
+     * beginning of the "unary_index" layout */
+
+    if (!sample_ind_ptr) {
+        sample_ind_size = sample_size;
+    }
+
+    std::vector<float> std_data((int64_t) index_size * sample_ind_size);
+    float *std_ptr = std_data.data();
+    bool *defined_ptr = new bool[index_size];
+    
+    pool.run(
+        "standardize",
+        index_size,
+        [=](int64_t left_border, int64_t right_border) {
+            standardize(
+                data_ptr,
+                sample_size,
+                std_ptr,
+                defined_ptr,
+                left_border,
+                right_border,
+                sample_ind_ptr,
+                sample_ind_size
+            );
+        }
+    );
+
+    pool.run(
+        "correlation",
+        tiles_number(index_size, source_size),
+        [=](int64_t left_border, int64_t right_border) {
+            correlation_tiled(
+                std_ptr,
+                defined_ptr,
+                sample_ind_size,
+                index_size,
+                corrs_ptr,
+                left_border,
+                right_border,
+                source_size
+            );
+        },
+        1
+    );
+
+    delete[] defined_ptr;
+
+    return 0;
+}
+
+int correlation_blocked(
+    float *data_ptr,
+    int sample_size,
+    int index_size,
+    float *corrs_ptr,
+    int *sample_ind_ptr,
+    int sample_ind_size,
+    int process_num,
+    int source_size
+) {
+    ThreadPool pool(process_num);
+    return correlation_blocked(
+        data_ptr,
+        sample_size,
+        index_size,
+        corrs_ptr,
+        pool,
+        sample_ind_ptr,
+        sample_ind_size,
+        source_size
+    );
+}
@@ -1,23 +1,43 @@
 #ifndef CORRS_H
 #define CORRS_H
 
+#include <cstdint>
 #include <utility>
 #include <vector>
 #include <string>
 
+#include "../pool/pool.h"
+
 const float UNDEFINED_CORR_VALUE = -2;
 
 const std::string SPEARMAN = "spearman";
 const std::string PEARSON = "pearson";
 
+// Tile geometry of the blocked correlation engine:
+// TILE_SIZE rows per block and DEPTH_SIZE samples
+// per panel of the (i-block x j-block) product
+const int TILE_SIZE = 64;
+const int DEPTH_SIZE = 256;
+
+// Sums of a row per group kept by "group_columns": reference
+// sum and sum of squares, then the experimental ones
+const int MOMENTS_NUMBER = 4;
+
+// Pairs accumulated at once by "pearsonr_complement"
+const int PAIR_BLOCK = 4;
+
+// The largest absolute mean of a row in its standard
+// deviations for "pearsonr_complement" (see "centered_rows")
+const double CENTERED_RATIO = 1;
+
 int spearmanr(
     float *data_ptr,
     int sample_size,
     int *source_ind_ptr,
     int *target_ind_ptr,
     float *corrs_ptr,
-    int start_ind,
-    int end_ind,
+    int64_t start_ind,
+    int64_t end_ind,
     int index_size=-1,
     int *sample_ind_ptr=nullptr,
     int sample_ind_size=-1
@@ -29,12 +49,131 @@ int pearsonr(
     int *source_ind_ptr,
     int *target_ind_ptr,
     float *corrs_ptr,
+    int64_t start_ind,
+    int64_t end_ind,
+    int index_size=-1,
+    int *sample_ind_ptr=nullptr,
+    int sample_ind_size=-1
+);
+
+int pooled_products(
+    float *data_ptr,
+    int sample_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    double *products_ptr,
+    int64_t start_ind,
+    int64_t end_ind,
+    int sample_ind_size
+);
+
+bool centered_rows(
+    float *data_ptr,
+    int sample_size,
+    int *row_ind_ptr,
+    int row_size
+);
+
+int pearsonr_complement(
+    float *data_ptr,
+    int sample_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    float *ref_corrs_ptr,
+    float *exp_corrs_ptr,
+    int64_t start_ind,
+    int64_t end_ind,
+    int ref_ind_size,
+    int exp_ind_size,
+    float *moments_ptr,
+    double *products_ptr
+);
+
+int _group_columns(
+    float *data_ptr,
+    int sample_size,
+    float *grouped_ptr,
+    int start_ind,
+    int end_ind,
+    int *ref_ind_ptr,
+    int ref_ind_size,
+    int *exp_ind_ptr,
+    int exp_ind_size,
+    int *row_ind_ptr,
+    int *data_row_ptr,
+    float *moments_ptr=nullptr
+);
+
+int group_columns(
+    float *data_ptr,
+    int sample_size,
+    float *grouped_ptr,
+    int index_size,
+    ThreadPool &pool,
+    int *ref_ind_ptr,
+    int ref_ind_size,
+    int *exp_ind_ptr,
+    int exp_ind_size,
+    int *row_ind_ptr=nullptr,
+    int *data_row_ptr=nullptr,
+    float *moments_ptr=nullptr
+);
+
+int standardize(
+    float *data_ptr,
+    int sample_size,
+    float *std_ptr,
+    bool *defined_ptr,
     int start_ind,
     int end_ind,
-    int index_size=-1,
     int *sample_ind_ptr=nullptr,
     int sample_ind_size=-1
 );
 
+int tiles_number(int index_size, int source_size=-1);
+
+int correlation_tiled(
+    float *std_ptr,
+    bool *defined_ptr,
+    int sample_ind_size,
+    int index_size,
+    float *corrs_ptr,
+    int start_tile,
+    int end_tile,
+    int source_size=-1
+);
+
+int correlation_rows(
+    float *std_ptr,
+    bool *defined_ptr,
+    int sample_ind_size,
+    int index_size,
+    int64_t *rows_ptr,
+    int rows_size,
+    float *corrs_ptr
+);
+
+int correlation_blocked(
+    float *data_ptr,
+    int sample_size,
+    int index_size,
+    float *corrs_ptr,
+    int *sample_ind_ptr=nullptr,
+    int sample_ind_size=-1,
+    int process_num=1,
+    int source_size=-1
+);
+
+int correlation_blocked(
+    float *data_ptr,
+    int sample_size,
+    int index_size,
+    float *corrs_ptr,
+    ThreadPool &pool,
+    int *sample_ind_ptr=nullptr,
+    int sample_ind_size=-1,
+    int source_size=-1
+);
+
 #endif
 
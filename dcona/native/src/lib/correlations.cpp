@@ -110,7 +110,7 @@ NumPyFloatArray correlation_exhaustive(
     
     int sample_size = data_buf.shape[1]; 
     int index_size = data_buf.shape[0];
-    int pairs_num = index_size * (index_size - 1) / 2;
+    int64_t pairs_num = (int64_t) index_size * (index_size - 1) / 2;
 
     if (process_num > index_size) {
         process_num = index_size;
@@ -123,53 +123,30 @@ NumPyFloatArray correlation_exhaustive(
     NumPyFloatArray corrs = NumPyFloatArray(pairs_num);
     float *corrs_ptr = (float *) corrs.request().ptr;
     
-    std::queue<std::thread> threads;
-    int batch_size = pairs_num / process_num;
-    for (int i = 0; i < process_num; ++i) {
-        int left_border = i * batch_size;
-        int right_border = (i + 1) * batch_size;
-        if (i == process_num - 1) {
-            right_border = pairs_num;
-        }
-        
-        if (correlation == SPEARMAN) {
-            std::thread thr(spearmanr,
-                (float *) data_buf.ptr,
-                sample_size,
-                (int *) nullptr,
-                (int *) nullptr,
-                corrs_ptr,
-                left_border,
-                right_border,
-                index_size,
-                (int *) nullptr,
-                -1
-            );
-            
-            threads.push(move(thr));
-        } else {
-            std::thread thr(pearsonr,
-                (float *) data_buf.ptr,
-                sample_size,
-                (int *) nullptr,
-                (int *) nullptr,
-                corrs_ptr,
-                left_border,
-                right_border,
-                index_size,
-                (int *) nullptr,
-                -1
-            );
-            
-            threads.push(move(thr));
-
-        }
+    ThreadPool pool(process_num);
+    
+    float *data_ptr = (float *) data_buf.ptr;
+    std::vector<float> ranks;
+    if (correlation == SPEARMAN) {
+        ranks.resize((int64_t) index_size * sample_size);
+        rank_data(
+            data_ptr,
+            ranks.data(),
+            sample_size,
+            index_size,
+            pool
+        );
+
+        data_ptr = ranks.data();
     }
 
-    while (!threads.empty()) {
-        threads.front().join();
-        threads.pop();
-    }
+    correlation_blocked(
+        data_ptr,
+        sample_size,
+        index_size,
+        corrs_ptr,
+        pool
+    );
 
     return corrs;
 }
@@ -3,11 +3,12 @@
 #include <pybind11/stl.h>
 
 #include <iostream>
+#include <sstream>
+#include <chrono>
+#include <cstring>
 #include <cmath>
-#include <thread>
 #include <string>
 #include <utility>
-#include <queue>
 #include <tuple>
 #include <algorithm>
 #include <random>
@@ -26,12 +27,404 @@ using NumPyIntArray = py::array_t<int32_t, py::array::c_style>;
 
 const int SEED = 733;
 
+// Thread pool statistics of the last pipeline call
+std::vector<StageStatistics> last_statistics;
+
+std::vector<
+    std::tuple<std::string, long, double, double, double>
+> pipeline_statistics() {
+    /* Returns (stage, calls, wall time, busy time, utilization)
+     * for every stage of the last pipeline call. Utilization
+     * is a share of the stage time the workers were busy */
+
+    std::vector<
+        std::tuple<std::string, long, double, double, double>
+    > result;
+    
+    for (auto &stats : last_statistics) {
+        double utilization = 0;
+        if (stats.wall_time > 0) {
+            utilization = stats.busy_time /
+                (stats.wall_time * stats.thread_num);
+        }
+
+        result.push_back(std::make_tuple(
+            stats.stage,
+            stats.calls,
+            stats.wall_time,
+            stats.busy_time,
+            utilization
+        ));
+    }
+
+    return result;
+}
+
+void permute_samples(
+    std::vector<int> &indexes,
+    std::mt19937 &random_gen,
+    int permutation,
+    int first_permutation
+) {
+    /* Permuted sample order of a permutation. A run shuffles the
+     * order in place with one generator. Permutations of a shard
+     * (first_permutation >= 0) are independent: the initial order
+     * is shuffled by a generator seeded with the global number of
+     * the permutation, so shards of any split give the same
+     * permutations */
+
+    if (first_permutation < 0) {
+        std::shuffle(indexes.begin(), indexes.end(), random_gen);
+        return;
+    }
+
+    for (int i = 0; i < (int) indexes.size(); ++i) {
+        indexes[i] = i;
+    }
+
+    std::seed_seq seed{SEED, first_permutation + permutation};
+    std::mt19937 permutation_gen(seed);
+    std::shuffle(indexes.begin(), indexes.end(), permutation_gen);
+}
+
+float *permuted_data(
+    float *data_ptr,
+    int *order_ptr,
+    float *buffer_ptr,
+    int sample_size,
+    std::vector<int> &rows,
+    int *data_row_ptr,
+    int *ref_ind_ptr,
+    int ref_ind_size,
+    int *exp_ind_ptr,
+    int exp_ind_size,
+    std::vector<int> &groups,
+    std::vector<int> &positions,
+    ThreadPool &pool,
+    const std::string &correlation,
+    bool grouped=true,
+    float *moments_ptr=nullptr
+) {
+    /* Data of the "rows" in a permutation (ranks within the
+     * groups in the spearman case) written to "buffer_ptr".
+     * If "grouped" the group columns are gathered once per
+     * permutation (see "group_columns"), row "i" of the data
+     * is then row "data_row_ptr[i]" of "data_ptr", sums of
+     * the groups of the rows are written to "moments_ptr" */
+
+    int *position_ptr = grouped ? positions.data() : nullptr;
+    if (correlation == SPEARMAN) {
+        label_samples(
+            groups.data(),
+            sample_size,
+            ref_ind_ptr,
+            ref_ind_size,
+            exp_ind_ptr,
+            exp_ind_size,
+            position_ptr
+        );
+
+        rank_presorted(
+            order_ptr,
+            buffer_ptr,
+            sample_size,
+            rows.size(),
+            pool,
+            groups.data(),
+            2,
+            rows.data(),
+            position_ptr
+        );
+
+        return buffer_ptr;
+    }
+
+    if (!grouped) {
+        return data_ptr;
+    }
+
+    group_columns(
+        data_ptr,
+        sample_size,
+        buffer_ptr,
+        rows.size(),
+        pool,
+        ref_ind_ptr,
+        ref_ind_size,
+        exp_ind_ptr,
+        exp_ind_size,
+        rows.data(),
+        data_row_ptr,
+        moments_ptr
+    );
+
+    return buffer_ptr;
+}
+
+class PermutationSlots {
+    /* Scratch buffers of the permutation schedule: a block of
+     * up to "size" permutations, every permutation of the block
+     * is computed by one worker in its own slot. Sample orders
+     * of the block are drawn in turn ("draw") as in the pair
+     * schedule, so both schedules give the same permutations.
+     * A slot keeps grouped columns of the rows (see
+     * "group_columns"), ranks in the spearman case, and
+     * sums of the groups of the rows if "moment_size" > 0 */
+
+public:
+    PermutationSlots() : size_(0) {}
+
+    PermutationSlots(
+        int size,
+        int sample_size,
+        int64_t column_size,
+        int64_t stat_size,
+        int64_t score_size=0,
+        int64_t moment_size=0
+    ) : size_(size),
+        sample_size_(sample_size),
+        column_size_(column_size),
+        stat_size_(stat_size),
+        score_size_(score_size),
+        moment_size_(moment_size),
+        samples_((int64_t) size * sample_size),
+        groups_((int64_t) size * sample_size),
+        positions_((int64_t) size * sample_size),
+        columns_(size * column_size),
+        ref_corrs_(size * stat_size),
+        exp_corrs_(size * stat_size),
+        stat_(size * stat_size),
+        scores_(size * score_size),
+        moments_(size * moment_size) {}
+
+    int draw(
+        std::vector<int> &indexes,
+        std::mt19937 &random_gen,
+        int permutation,
+        int first_permutation,
+        int repeats_left
+    ) {
+        /* Draws the sample orders of the permutations from
+         * "permutation" on, returns the size of the block */
+
+        int block_size = std::min(size_, repeats_left);
+        for (int j = 0; j < block_size; ++j) {
+            permute_samples(
+                indexes,
+                random_gen,
+                permutation + j,
+                first_permutation
+            );
+            std::copy(indexes.begin(), indexes.end(), samples(j));
+        }
+
+        return block_size;
+    }
+
+    int *samples(int j) {
+        return samples_.data() + (int64_t) j * sample_size_;
+    }
+
+    int *groups(int j) {
+        return groups_.data() + (int64_t) j * sample_size_;
+    }
+
+    int *positions(int j) {
+        return positions_.data() + (int64_t) j * sample_size_;
+    }
+
+    float *columns(int j) {
+        return columns_.data() + j * column_size_;
+    }
+
+    float *ref_corrs(int j) {
+        return ref_corrs_.data() + j * stat_size_;
+    }
+
+    float *exp_corrs(int j) {
+        return exp_corrs_.data() + j * stat_size_;
+    }
+
+    float *stat(int j) {
+        return stat_.data() + j * stat_size_;
+    }
+
+    float *scores(int j) {
+        return scores_.data() + j * score_size_;
+    }
+
+    float *moments(int j) {
+        if (moment_size_ == 0) {
+            return nullptr;
+        }
+
+        return moments_.data() + j * moment_size_;
+    }
+
+private:
+    int size_;
+    int sample_size_;
+    int64_t column_size_;
+    int64_t stat_size_;
+    int64_t score_size_;
+    int64_t moment_size_;
+
+    std::vector<int> samples_;
+    std::vector<int> groups_;
+    std::vector<int> positions_;
+    std::vector<float> columns_;
+    std::vector<float> ref_corrs_;
+    std::vector<float> exp_corrs_;
+    std::vector<float> stat_;
+    std::vector<float> scores_;
+    std::vector<float> moments_;
+};
+
+namespace {
+
+class Checkpoint {
+    /* Passes the permutation state of a pipeline to the Python
+     * "callback" (if it is not None) at most once per "interval"
+     * seconds: exceedance counts, permutation numbers of the
+     * decided items, the active items (if items are stopped),
+     * observed statistics, the state of the generator and the
+     * sample order it shuffles (permutations are shuffled in
+     * place). The state is a dict, "restore_state" reads it */
+
+public:
+    Checkpoint(const py::object &callback, double interval)
+        : callback_(callback),
+          interval_(interval),
+          last_(std::chrono::steady_clock::now()) {}
+
+    bool due() const {
+        if (callback_.is_none()) {
+            return false;
+        }
+
+        std::chrono::duration<double> elapsed =
+            std::chrono::steady_clock::now() - last_;
+        return elapsed.count() >= interval_;
+    }
+
+    void save(
+        int permutation,
+        const std::mt19937 &random_gen,
+        const std::vector<int> &indexes,
+        float *counts_ptr,
+        int *permutations_ptr,
+        int64_t index_size,
+        int64_t *active_ptr,
+        int64_t active_size,
+        float *stat_ptr,
+        int64_t stat_size
+    ) {
+        if (callback_.is_none()) {
+            return;
+        }
+
+        std::ostringstream generator;
+        generator << random_gen;
+
+        py::dict state;
+        state["permutation"] = permutation;
+        state["generator"] = generator.str();
+        state["samples"] = NumPyIntArray(indexes.size(), indexes.data());
+        state["counts"] = NumPyFloatArray(index_size, counts_ptr);
+        state["permutations"] = NumPyIntArray(index_size, permutations_ptr);
+        state["statistic"] = NumPyFloatArray(stat_size, stat_ptr);
+        if (active_ptr) {
+            state["active"] = py::array_t<int64_t>(active_size, active_ptr);
+        }
+
+        callback_(state);
+        last_ = std::chrono::steady_clock::now();
+    }
+
+private:
+    py::object callback_;
+    double interval_;
+    std::chrono::steady_clock::time_point last_;
+};
+
+int restore_state(
+    const py::object &state,
+    std::mt19937 &random_gen,
+    std::vector<int> &indexes,
+    float *counts_ptr,
+    int *permutations_ptr,
+    int64_t index_size,
+    std::vector<int64_t> &active,
+    int64_t &active_size,
+    float *stat_ptr,
+    int64_t stat_size,
+    int repeats_number
+) {
+    /* Restores the state saved by "Checkpoint" after the observed
+     * statistics are computed, they must be the same as the saved
+     * ones. Returns the number of the permutations done */
+
+    py::dict values = state.cast<py::dict>();
+
+    int permutation = values["permutation"].cast<int>();
+    if (permutation > repeats_number) {
+        throw std::runtime_error(
+            "Checkpoint has more permutations than repeats_number"
+        );
+    }
+
+    NumPyFloatArray counts = values["counts"].cast<NumPyFloatArray>();
+    NumPyIntArray permutations = values["permutations"].cast<NumPyIntArray>();
+    NumPyFloatArray stat = values["statistic"].cast<NumPyFloatArray>();
+    NumPyIntArray samples = values["samples"].cast<NumPyIntArray>();
+    if ((counts.size() != index_size) ||
+            (samples.size() != (int64_t) indexes.size()) ||
+            (permutations.size() != index_size) ||
+            (stat.size() != stat_size)) {
+        throw std::runtime_error("Checkpoint sizes error");
+    }
+
+    if (std::memcmp(stat.data(), stat_ptr, stat_size * sizeof(float)) != 0) {
+        throw std::runtime_error(
+            "Checkpoint statistics do not match the data"
+        );
+    }
+
+    std::copy(counts.data(), counts.data() + index_size, counts_ptr);
+    std::copy(
+        permutations.data(),
+        permutations.data() + index_size,
+        permutations_ptr
+    );
+
+    if (values.contains("active")) {
+        py::array_t<int64_t, py::array::c_style> saved =
+            values["active"].cast<py::array_t<int64_t, py::array::c_style>>();
+        if ((int64_t) active.size() < saved.size()) {
+            throw std::runtime_error("Checkpoint sizes error");
+        }
+
+        std::copy(saved.data(), saved.data() + saved.size(), active.begin());
+        active_size = saved.size();
+    }
+
+    std::copy(samples.data(), samples.data() + samples.size(), indexes.begin());
+
+    std::istringstream generator(values["generator"].cast<std::string>());
+    generator >> random_gen;
+
+    return permutation;
+}
+
+} // namespace
+
 std::tuple<
     NumPyFloatArray,
     NumPyFloatArray,
     NumPyFloatArray,
     NumPyFloatArray,
-    NumPyFloatArray
+    NumPyFloatArray,
+    NumPyIntArray
 > ztest_pipeline_indexed(
     const NumPyFloatArray &data,
     const NumPyIntArray &source_indexes,
@@ -41,7 +434,13 @@ std::tuple<
     const std::string correlation=SPEARMAN,
     const std::string alternative=TWO_SIDED,
     int repeats_number=REPEATS_NUMBER,
-    int process_num=1    
+    int process_num=1,
+    int stop_exceedances=0,
+    const py::object &checkpoint=py::none(),
+    const py::object &state=py::none(),
+    double checkpoint_interval=0,
+    int first_permutation=-1,
+    const std::string schedule=PAIR_SCHEDULE
 ) {
     py::buffer_info data_buf = data.request();
     float *data_ptr = (float *) data_buf.ptr;
@@ -80,13 +479,53 @@ std::tuple<
     NumPyFloatArray boot_pvalue = NumPyFloatArray(index_size);
     float *boot_pvalue_ptr = (float *) boot_pvalue.request().ptr;
     
-    // Rank data    
-    float *rank_ptr;
+    NumPyIntArray permutations = NumPyIntArray(index_size);
+    int *permutations_ptr = (int *) permutations.request().ptr;
+    
+    // Grouped columns (ranks in the spearman case) of the
+    // used rows only, the pairs are renumbered by positions
+    // of their rows in "data_rows"
+    float *grouped_ptr = nullptr;
+    int *order_ptr = nullptr;
+    std::vector<int> groups(sample_size);
+    std::vector<int> positions(sample_size);
+    std::vector<int> data_rows;
+    std::vector<int> compact_sources;
+    std::vector<int> compact_targets;
+    data_len = compact_rows(
+        source_ind_ptr,
+        target_ind_ptr,
+        index_size,
+        data_len,
+        data_rows,
+        compact_sources,
+        compact_targets
+    );
+    source_ind_ptr = compact_sources.data();
+    target_ind_ptr = compact_targets.data();
+
+    grouped_ptr = new float[
+        (int64_t) data_len * sample_size
+    ];
     if (correlation == SPEARMAN) {
-        rank_ptr = new float[
-            data_len * sample_size
+        order_ptr = new int[
+            (int64_t) data_len * sample_size
         ];
     }
+
+    // If the groups split all the samples, pearson correlations
+    // of a permutation are computed from the sums of the rows
+    // and the pooled sums of the pairs (see "pearsonr_complement"),
+    // the pooled sums are the same in all the permutations. Rows
+    // far from zero are computed directly (see "centered_rows")
+    bool complement = (correlation == PEARSON) &&
+        (ref_ind_size + exp_ind_size == sample_size) &&
+        centered_rows(data_ptr, sample_size, data_rows.data(), data_len);
+    int64_t moment_size = complement ?
+        (int64_t) data_len * MOMENTS_NUMBER : 0;
+    std::vector<float> moments(moment_size);
+    std::vector<double> products(complement ? index_size : 0);
+    std::vector<double> active_products;
     
     // Bootstrapped data
     float *boot_ref_corrs_ptr =  new float[index_size];
@@ -96,6 +535,28 @@ std::tuple<
     int *boot_ref_ind_ptr = new int[ref_ind_size];
     int *boot_exp_ind_ptr = new int[exp_ind_size];
 
+    // Active (undecided) pairs, their indexes
+    // and observed statistics in compacted form
+    std::vector<int64_t> active(index_size);
+    std::vector<int> active_sources(
+        source_ind_ptr, source_ind_ptr + index_size
+    );
+    std::vector<int> active_targets(
+        target_ind_ptr, target_ind_ptr + index_size
+    );
+    std::vector<float> active_stat(index_size);
+    std::vector<int> rows;
+    
+    range(active.data(), index_size);
+    int64_t active_size = index_size;
+    used_rows(
+        source_ind_ptr,
+        target_ind_ptr,
+        index_size,
+        data_len,
+        rows
+    );
+
     // Bootstrap indexes initialization
     std::vector<int> indexes(sample_size);
     for (int i = 0; i < sample_size; ++i) {
@@ -107,14 +568,235 @@ std::tuple<
     std::mt19937 random_gen(SEED);
 
     // Bootstrap pvalue computations    
-    float *dpr, *rcp, *ecp, *sp, *pp;
-    int *rip, *eip;
+    float *dpr, *rcp, *ecp, *sp, *pp, *mp;
+    int *rip, *eip, *sip, *tip;
+    double *prp;
+    
+    ThreadPool pool(process_num);
+
+    PermutationSlots slots;
+    if (schedule == PERMUTATION_SCHEDULE) {
+        slots = PermutationSlots(
+            pool.size(),
+            sample_size,
+            (int64_t) data_len * sample_size,
+            index_size,
+            0,
+            moment_size
+        );
+    }
+
+    // The state of the finished permutations is checkpointed
+    // periodically, on interruption and at the end
+    Checkpoint saver(checkpoint, checkpoint_interval);
+    int done = 0;
+    auto save_state = [&](int permutation) {
+        saver.save(
+            permutation,
+            random_gen,
+            indexes,
+            boot_pvalue_ptr,
+            permutations_ptr,
+            index_size,
+            (stop_exceedances > 0) ? active.data() : nullptr,
+            active_size,
+            stat_ptr,
+            index_size
+        );
+    };
+    
+    if (correlation == SPEARMAN) {
+        argsort_data(
+            data_ptr,
+            order_ptr,
+            sample_size,
+            data_len,
+            pool,
+            data_rows.data()
+        );
+    }
     
+    for (int i = 0; i < index_size; ++i) {
+        boot_pvalue_ptr[i] = 0;
+        permutations_ptr[i] = 0;
+    }
+
     std::cout << "Permutation progress: ";
     progressbar bar(repeats_number + 1);
     for (int r = 0; r < repeats_number + 1; ++r) {
         if (PyErr_CheckSignals() != 0) {
-            throw py::error_already_set();
+            py::error_already_set error;
+            if (done > 0) {
+                save_state(done);
+            }
+            throw error;
+        }
+
+        if (r > 0 && active_size == 0) {
+            break;
+        }
+
+        // Permutation schedule: every worker computes whole
+        // permutations of a block, exceedances are counted
+        // in the order of the permutations
+        if ((r > 0) && (schedule == PERMUTATION_SCHEDULE)) {
+            int block_size = slots.draw(
+                indexes,
+                random_gen,
+                r,
+                first_permutation,
+                repeats_number + 1 - r
+            );
+
+            pool.run(
+                "permutations",
+                block_size,
+                [&](int64_t left_border, int64_t right_border) {
+                    for (int64_t j = left_border; j < right_border; ++j) {
+                        int *slot_rip = slots.samples(j);
+                        int *slot_eip = slot_rip + ref_ind_size;
+                        
+                        float *slot_dpr = slots.columns(j);
+                        if (correlation == SPEARMAN) {
+                            label_samples(
+                                slots.groups(j),
+                                sample_size,
+                                slot_rip,
+                                ref_ind_size,
+                                slot_eip,
+                                exp_ind_size,
+                                slots.positions(j)
+                            );
+
+                            _rank_presorted(
+                                order_ptr,
+                                slot_dpr,
+                                sample_size,
+                                0,
+                                rows.size(),
+                                slots.groups(j),
+                                2,
+                                rows.data(),
+                                slots.positions(j)
+                            );
+                        } else {
+                            _group_columns(
+                                data_ptr,
+                                sample_size,
+                                slot_dpr,
+                                0,
+                                rows.size(),
+                                slot_rip,
+                                ref_ind_size,
+                                slot_eip,
+                                exp_ind_size,
+                                rows.data(),
+                                data_rows.data(),
+                                slots.moments(j)
+                            );
+                        }
+
+                        ztest_pipeline(
+                            slot_dpr,
+                            sample_size,
+                            active_sources.data(),
+                            active_targets.data(),
+                            0,
+                            active_size,
+                            active_size,
+                            nullptr,
+                            nullptr,
+                            ref_ind_size,
+                            exp_ind_size,
+                            slots.ref_corrs(j),
+                            slots.exp_corrs(j),
+                            slots.stat(j),
+                            nullptr,
+                            correlation,
+                            alternative,
+                            slots.moments(j),
+                            complement ? active_products.data() : nullptr
+                        );
+                    }
+                },
+                1
+            );
+
+            float *asp = active_stat.data();
+            int64_t *ap = active.data();
+            pool.run(
+                "count",
+                active_size,
+                [&](int64_t left_border, int64_t right_border) {
+                    for (int64_t k = left_border; k < right_border; ++k) {
+                        int64_t i = ap[k];
+                        for (int j = 0; j < block_size; ++j) {
+                            float boot_stat = slots.stat(j)[k];
+                            if (((alternative == TWO_SIDED) &&
+                                    (std::abs(asp[k]) <= std::abs(boot_stat))) ||
+                                    ((alternative == LESS) &&
+                                    (asp[k] <= boot_stat)) ||
+                                    ((alternative == GREATER) &&
+                                    (asp[k] >= boot_stat))) {
+                                boot_pvalue_ptr[i] += 1;
+                            }
+
+                            // Later permutations of the block
+                            // are not counted for a decided pair
+                            if ((stop_exceedances > 0) &&
+                                    (boot_pvalue_ptr[i] >= stop_exceedances)) {
+                                permutations_ptr[i] = r + j;
+                                break;
+                            }
+                        }
+                    }
+                }
+            );
+
+            for (int j = 0; j < block_size; ++j) {
+                bar.update();
+            }
+            r += block_size - 1;
+
+            int decided_size = retire_items(
+                active.data(),
+                active_sources.data(),
+                active_targets.data(),
+                active_stat.data(),
+                active_size,
+                boot_pvalue_ptr,
+                permutations_ptr,
+                stop_exceedances,
+                r
+            );
+            
+            if (decided_size < active_size) {
+                active_size = decided_size;
+                used_rows(
+                    active_sources.data(),
+                    active_targets.data(),
+                    active_size,
+                    data_len,
+                    rows
+                );
+
+                if (complement) {
+                    compact_products(
+                        active.data(),
+                        active_size,
+                        nullptr,
+                        nullptr,
+                        products.data(),
+                        active_products
+                    );
+                }
+            }
+
+            done = r;
+            if (saver.due()) {
+                save_state(done);
+            }
+            continue;
         }
 
         if (r == 0) {
@@ -125,8 +807,12 @@ std::tuple<
 
             rip = ref_ind_ptr;
             eip = exp_ind_ptr;
+
+            // Observed correlations are computed directly
+            mp  = nullptr;
+            prp = nullptr;
         } else {
-            std::shuffle(indexes.begin(), indexes.end(), random_gen);
+            permute_samples(indexes, random_gen, r, first_permutation);
             for (int i = 0; i < ref_ind_size; ++i) {
                 boot_ref_ind_ptr[i] = indexes[i];
             }
@@ -141,106 +827,213 @@ std::tuple<
             
             rip = boot_ref_ind_ptr;
             eip = boot_exp_ind_ptr;
-        }
-
-        if (correlation == SPEARMAN) {
-            rank_data(
-                data_ptr,
-                rank_ptr,
-                sample_size,
-                data_len,
-                rip,
-                ref_ind_size,
-                process_num
-            );
-
-            rank_data(
-                data_ptr,
-                rank_ptr,
-                sample_size,
-                data_len,
-                eip,
-                exp_ind_size,
-                process_num
-            );
 
-            dpr = rank_ptr;
-        } else {
-            dpr = data_ptr;
+            mp  = complement ? moments.data() : nullptr;
+            prp = complement ? active_products.data() : nullptr;
         }
         
-        std::queue<std::thread> threads;
-        int batch_size = index_size / process_num;
-        for (int i = 0; i < process_num; ++i) {
-            int left_border = i * batch_size;
-            int right_border = (i + 1) * batch_size;
-            if (i == process_num - 1) {
-                right_border = index_size;
+        sip = active_sources.data();
+        tip = active_targets.data();
+
+        dpr = permuted_data(
+            data_ptr,
+            order_ptr,
+            grouped_ptr,
+            sample_size,
+            rows,
+            data_rows.data(),
+            rip,
+            ref_ind_size,
+            eip,
+            exp_ind_size,
+            groups,
+            positions,
+            pool,
+            correlation,
+            true,
+            mp
+        );
+        
+        pool.run(
+            "pipeline",
+            active_size,
+            [&](int64_t left_border, int64_t right_border) {
+                ztest_pipeline(
+                    dpr,
+                    sample_size,
+                    sip,
+                    tip,
+                    left_border,
+                    right_border,
+                    active_size,
+                    nullptr,
+                    nullptr,
+                    ref_ind_size,
+                    exp_ind_size,
+                    rcp,
+                    ecp,
+                    sp,
+                    pp,
+                    correlation,
+                    alternative,
+                    mp,
+                    prp
+                );
             }
+        );
+
+        if (r > 0) {
+            float *asp = active_stat.data();
+            int64_t *ap = active.data();
+            pool.run(
+                "count",
+                active_size,
+                [&](int64_t left_border, int64_t right_border) {
+                    for (int64_t k = left_border; k < right_border; ++k) {
+                        int64_t i = ap[k];
+                        if ((alternative == TWO_SIDED) &&
+                                (std::abs(asp[k]) <= std::abs(boot_stat_ptr[k]))) {
+                            boot_pvalue_ptr[i] += 1;
+                        }
+
+                        if ((alternative == LESS) &&
+                                (asp[k] <= boot_stat_ptr[k])) {
+                            boot_pvalue_ptr[i] += 1;
+                        }
+                        
+                        if ((alternative == GREATER) &&
+                                (asp[k] >= boot_stat_ptr[k])) {
+                            boot_pvalue_ptr[i] += 1;
+                        }
+                    }
+                }
+            );
             
-            std::thread thr(ztest_pipeline,
-                dpr,
-                sample_size,
-                source_ind_ptr,
-                target_ind_ptr,
-                left_border,
-                right_border,
-                index_size,
-                rip,
-                eip,
-                ref_ind_size,
-                exp_ind_size,
-                rcp,
-                ecp,
-                sp,
-                pp,
-                correlation,
-                alternative
+            int decided_size = retire_items(
+                active.data(),
+                active_sources.data(),
+                active_targets.data(),
+                active_stat.data(),
+                active_size,
+                boot_pvalue_ptr,
+                permutations_ptr,
+                stop_exceedances,
+                r
             );
             
-            threads.push(move(thr));
-        }
+            if (decided_size < active_size) {
+                active_size = decided_size;
+                used_rows(
+                    active_sources.data(),
+                    active_targets.data(),
+                    active_size,
+                    data_len,
+                    rows
+                );
 
-        while (!threads.empty()) {
-            threads.front().join();
-            threads.pop();
-        }
+                if (complement) {
+                    compact_products(
+                        active.data(),
+                        active_size,
+                        nullptr,
+                        nullptr,
+                        products.data(),
+                        active_products
+                    );
+                }
+            }
 
-        if (r > 0) {
+            done = r;
+            if (saver.due()) {
+                save_state(done);
+            }
+        } else {
             for (int i = 0; i < index_size; ++i) {
-                if ((alternative == TWO_SIDED) &&
-                        (std::abs(stat_ptr[i]) <= std::abs(boot_stat_ptr[i]))) {
-                    boot_pvalue_ptr[i] += 1;
-                }
+                active_stat[i] = stat_ptr[i];
+            }
+
+            if (!state.is_none()) {
+                r = restore_state(
+                    state,
+                    random_gen,
+                    indexes,
+                    boot_pvalue_ptr,
+                    permutations_ptr,
+                    index_size,
+                    active,
+                    active_size,
+                    stat_ptr,
+                    index_size,
+                    repeats_number
+                );
+                done = r;
 
-                if ((alternative == LESS) &&
-                        (stat_ptr[i] <= boot_stat_ptr[i])) {
-                    boot_pvalue_ptr[i] += 1;
+                for (int64_t k = 0; k < active_size; ++k) {
+                    int64_t i = active[k];
+                    active_sources[k] = source_ind_ptr[i];
+                    active_targets[k] = target_ind_ptr[i];
+                    active_stat[k] = stat_ptr[i];
                 }
-                
-                if ((alternative == GREATER) &&
-                        (stat_ptr[i] >= boot_stat_ptr[i])) {
-                    boot_pvalue_ptr[i] += 1;
+                used_rows(
+                    active_sources.data(),
+                    active_targets.data(),
+                    active_size,
+                    data_len,
+                    rows
+                );
+
+                for (int k = 0; k < r; ++k) {
+                    bar.update();
                 }
             }
-        } else {
-            for (int i = 0; i < index_size; ++i) {
-                boot_pvalue_ptr[i] = 0;
+
+            if (complement) {
+                pool.run(
+                    "pooled",
+                    index_size,
+                    [&](int64_t left_border, int64_t right_border) {
+                        pooled_products(
+                            dpr,
+                            sample_size,
+                            source_ind_ptr,
+                            target_ind_ptr,
+                            products.data(),
+                            left_border,
+                            right_border,
+                            sample_size
+                        );
+                    }
+                );
+                compact_products(
+                    active.data(),
+                    active_size,
+                    nullptr,
+                    nullptr,
+                    products.data(),
+                    active_products
+                );
             }
         }
 
         bar.update();
     }
     std::cout << "\n";
+    last_statistics = pool.statistics();
+    save_state(done);
     
-    if (repeats_number > 0) {
-        for (int i = 0; i < index_size; ++i) {
-            boot_pvalue_ptr[i] /= repeats_number;
-        }
+    // Shards return exceedance counts (see "permute_samples")
+    if (first_permutation < 0) {
+        finalize_counts(
+            boot_pvalue_ptr,
+            permutations_ptr,
+            index_size,
+            repeats_number
+        );
     }
     
+    delete[] grouped_ptr;
     if (correlation == SPEARMAN) {
-        delete[] rank_ptr;
+        delete[] order_ptr;
     }
 
     delete[] boot_ref_corrs_ptr;
@@ -252,16 +1045,16 @@ std::tuple<
     
     return std::tuple<
         NumPyFloatArray, NumPyFloatArray, NumPyFloatArray,
-        NumPyFloatArray, NumPyFloatArray
+        NumPyFloatArray, NumPyFloatArray, NumPyIntArray
     >(
         ref_corrs, exp_corrs, stat,
-        pvalue, boot_pvalue
+        pvalue, boot_pvalue, permutations
     );
 }
 
 std::tuple<
     NumPyIntArray, NumPyFloatArray,
-    NumPyFloatArray
+    NumPyFloatArray, NumPyIntArray
 > _score_pipeline_indexed(
     const NumPyFloatArray &data,
     const NumPyIntArray &source_indexes,
@@ -272,7 +1065,13 @@ std::tuple<
     const std::string score=MEAN,
     const std::string alternative=TWO_SIDED,
     int repeats_number=REPEATS_NUMBER,
-    int process_num=1    
+    int process_num=1,
+    int stop_exceedances=0,
+    const py::object &checkpoint=py::none(),
+    const py::object &state=py::none(),
+    double checkpoint_interval=0,
+    int first_permutation=-1,
+    const std::string schedule=PAIR_SCHEDULE
 ) {
     py::buffer_info data_buf = data.request();
     float *data_ptr = (float *) data_buf.ptr;
@@ -295,13 +1094,11 @@ std::tuple<
     int exp_ind_size = exp_ind_buf.shape[0];
     int *exp_ind_ptr = (int *) exp_ind_buf.ptr;
 
-    // Rank data    
-    float *rank_ptr;
-    if (correlation == SPEARMAN) {
-        rank_ptr = new float[
-            data_len * sample_size
-        ];
-    }
+    // Grouped columns (ranks in the spearman case)
+    float *grouped_ptr = nullptr;
+    int *order_ptr = nullptr;
+    std::vector<int> groups(sample_size);
+    std::vector<int> positions(sample_size);
     
     // Bootstrapped data
     float *boot_ref_corrs_ptr =  new float[index_size];
@@ -353,21 +1150,106 @@ std::tuple<
     NumPyIntArray sources = NumPyIntArray(sources_size);
     int *sources_ptr = (int *) sources.request().ptr;
 
-    NumPyFloatArray scores = NumPyFloatArray(sources_size);
+    // Several scores of one run are stored one after another
+    std::vector<Score> parsed_scores = parse_scores(score);
+    int score_num = parsed_scores.size();
+    int64_t scores_size = (int64_t) score_num * sources_size;
+
+    NumPyFloatArray scores = NumPyFloatArray(scores_size);
     float *scores_ptr = (float *) scores.request().ptr;
 
-    NumPyFloatArray pvalues = NumPyFloatArray(sources_size);
+    NumPyFloatArray pvalues = NumPyFloatArray(scores_size);
     float *pvalues_ptr = (float *) pvalues.request().ptr;
 
+    NumPyIntArray permutations = NumPyIntArray(scores_size);
+    int *permutations_ptr = (int *) permutations.request().ptr;
+
     for (int j = 0; j < sources_size; ++j) {
         sources_ptr[j] = _sources[j];
+    }
+    for (int64_t j = 0; j < scores_size; ++j) {
         pvalues_ptr[j] = 0;
+        permutations_ptr[j] = 0;
     }
 
+    std::vector<int> score_ids(score_num);
+    for (int s = 0; s < score_num; ++s) {
+        score_ids[s] = s;
+    }
+
+    // Grouped data of the used rows only, the edges are
+    // renumbered by positions of their rows in "data_rows"
+    std::vector<int> data_rows;
+    std::vector<int> compact_sources;
+    std::vector<int> compact_targets;
+    data_len = compact_rows(
+        source_ind_ptr,
+        target_ind_ptr,
+        index_size,
+        data_len,
+        data_rows,
+        compact_sources,
+        compact_targets
+    );
+    source_ind_ptr = compact_sources.data();
+    target_ind_ptr = compact_targets.data();
+
+    grouped_ptr = new float[
+        (int64_t) data_len * sample_size
+    ];
+    if (correlation == SPEARMAN) {
+        order_ptr = new int[
+            (int64_t) data_len * sample_size
+        ];
+    }
+
+    // Pooled sums of the edges (see "ztest_pipeline_indexed")
+    bool complement = (correlation == PEARSON) &&
+        (ref_ind_size + exp_ind_size == sample_size) &&
+        centered_rows(data_ptr, sample_size, data_rows.data(), data_len);
+    int64_t moment_size = complement ?
+        (int64_t) data_len * MOMENTS_NUMBER : 0;
+    std::vector<float> moments(moment_size);
+    std::vector<double> products(complement ? index_size : 0);
+    std::vector<double> active_products;
+
     // Bootstrap scores
-    float *boot_scores_ptr = new float[sources_size];
+    float *boot_scores_ptr = new float[scores_size];
     
-    if (process_num > sources_size) {
+    // Active sources (with an undecided
+    // score) and their edges in compacted form
+    std::vector<int64_t> active(sources_size);
+    std::vector<int> active_sources;
+    std::vector<int> active_targets;
+    std::vector<int> active_starts;
+    std::vector<int> active_ends;
+    std::vector<int> rows;
+    
+    range(active.data(), sources_size);
+    int64_t active_size = sources_size;
+    int edges_size = compact_edges(
+        active.data(),
+        active_size,
+        source_ind_ptr,
+        target_ind_ptr,
+        starts.data(),
+        ends.data(),
+        active_sources,
+        active_targets,
+        active_starts,
+        active_ends
+    );
+    used_rows(
+        active_sources.data(),
+        active_targets.data(),
+        edges_size,
+        data_len,
+        rows
+    );
+    
+    // Workers of the permutation schedule are
+    // not limited by the number of sources
+    if ((schedule == PAIR_SCHEDULE) && (process_num > sources_size)) {
         process_num = sources_size;
     }
 
@@ -376,34 +1258,264 @@ std::tuple<
     }
     
     // Bootstrap pvalue computations    
-    float *dpr, *rcp, *ecp, *sp, *pp;
+    float *dpr, *rcp, *ecp, *sp, *pp, *mp;
     int *rip, *eip;
     float *scp;
+    double *prp;
+    
+    ThreadPool pool(process_num);
+
+    PermutationSlots slots;
+    if (schedule == PERMUTATION_SCHEDULE) {
+        slots = PermutationSlots(
+            pool.size(),
+            sample_size,
+            (int64_t) data_len * sample_size,
+            index_size,
+            scores_size,
+            moment_size
+        );
+    }
+
+    // Checkpoints (see "ztest_pipeline_indexed")
+    Checkpoint saver(checkpoint, checkpoint_interval);
+    int done = 0;
+    auto save_state = [&](int permutation) {
+        saver.save(
+            permutation,
+            random_gen,
+            indexes,
+            pvalues_ptr,
+            permutations_ptr,
+            scores_size,
+            (stop_exceedances > 0) ? active.data() : nullptr,
+            active_size,
+            scores_ptr,
+            scores_size
+        );
+    };
+    
+    if (correlation == SPEARMAN) {
+        argsort_data(
+            data_ptr,
+            order_ptr,
+            sample_size,
+            data_len,
+            pool,
+            data_rows.data()
+        );
+    }
     
     std::cout << "Permutation progress: ";
     progressbar bar(repeats_number + 1);
     for (int r = 0; r < repeats_number + 1; ++r) {
         if (PyErr_CheckSignals() != 0) {
-            throw py::error_already_set();
+            py::error_already_set error;
+            if (done > 0) {
+                save_state(done);
+            }
+            throw error;
         }
 
-        if (r == 0) {
-            rcp = boot_ref_corrs_ptr;
-            ecp = boot_exp_corrs_ptr;
-            sp  = boot_stat_ptr;
-            pp  = nullptr;
+        if (r > 0 && active_size == 0) {
+            break;
+        }
 
-            rip = ref_ind_ptr;
-            eip = exp_ind_ptr;
+        // Permutation schedule (see "ztest_pipeline_indexed")
+        if ((r > 0) && (schedule == PERMUTATION_SCHEDULE)) {
+            int block_size = slots.draw(
+                indexes,
+                random_gen,
+                r,
+                first_permutation,
+                repeats_number + 1 - r
+            );
 
-            scp = scores_ptr;
-        } else {
-            std::shuffle(indexes.begin(), indexes.end(), random_gen);
-            for (int i = 0; i < ref_ind_size; ++i) {
-                boot_ref_ind_ptr[i] = indexes[i];
+            pool.run(
+                "permutations",
+                block_size,
+                [&](int64_t left_border, int64_t right_border) {
+                    for (int64_t j = left_border; j < right_border; ++j) {
+                        int *slot_rip = slots.samples(j);
+                        int *slot_eip = slot_rip + ref_ind_size;
+                        
+                        float *slot_dpr = slots.columns(j);
+                        if (correlation == SPEARMAN) {
+                            label_samples(
+                                slots.groups(j),
+                                sample_size,
+                                slot_rip,
+                                ref_ind_size,
+                                slot_eip,
+                                exp_ind_size,
+                                slots.positions(j)
+                            );
+
+                            _rank_presorted(
+                                order_ptr,
+                                slot_dpr,
+                                sample_size,
+                                0,
+                                rows.size(),
+                                slots.groups(j),
+                                2,
+                                rows.data(),
+                                slots.positions(j)
+                            );
+                        } else {
+                            _group_columns(
+                                data_ptr,
+                                sample_size,
+                                slot_dpr,
+                                0,
+                                rows.size(),
+                                slot_rip,
+                                ref_ind_size,
+                                slot_eip,
+                                exp_ind_size,
+                                rows.data(),
+                                data_rows.data(),
+                                slots.moments(j)
+                            );
+                        }
+
+                        score_pipeline_indexed(
+                            slot_dpr,
+                            sample_size,
+                            active_sources.data(),
+                            active_targets.data(),
+                            edges_size,
+                            nullptr,
+                            nullptr,
+                            ref_ind_size,
+                            exp_ind_size,
+                            slots.ref_corrs(j),
+                            slots.exp_corrs(j),
+                            slots.stat(j),
+                            nullptr,
+                            active_starts.data(),
+                            active_ends.data(),
+                            0,
+                            active_size,
+                            slots.scores(j),
+                            sources_size,
+                            parsed_scores,
+                            correlation,
+                            alternative,
+                            slots.moments(j),
+                            complement ? active_products.data() : nullptr
+                        );
+                    }
+                },
+                1
+            );
+
+            for (int s = 0; s < score_num; ++s) {
+                for (int64_t k = 0; k < active_size; ++k) {
+                    int64_t i = s * (int64_t) sources_size + active[k];
+                    if (permutations_ptr[i] > 0) {
+                        continue;
+                    }
+
+                    for (int j = 0; j < block_size; ++j) {
+                        float boot_score = slots.scores(j)[
+                            s * (int64_t) sources_size + k
+                        ];
+                        if (score_exceedance(
+                                scores_ptr[i], boot_score, alternative)) {
+                            pvalues_ptr[i] += 1;
+                        }
+
+                        if ((stop_exceedances > 0) &&
+                                (pvalues_ptr[i] >= stop_exceedances)) {
+                            permutations_ptr[i] = r + j;
+                            break;
+                        }
+                    }
+                }
             }
-            for (int i = 0; i < exp_ind_size; ++i) {
-                boot_exp_ind_ptr[i] = indexes[ref_ind_size + i];
+
+            for (int j = 0; j < block_size; ++j) {
+                bar.update();
+            }
+            r += block_size - 1;
+
+            int decided_size = retire_contrasts(
+                active.data(),
+                nullptr,
+                nullptr,
+                active_size,
+                sources_size,
+                score_ids.data(),
+                score_num,
+                pvalues_ptr,
+                permutations_ptr,
+                stop_exceedances,
+                r
+            );
+
+            if (decided_size < active_size) {
+                active_size = decided_size;
+                edges_size = compact_edges(
+                    active.data(),
+                    active_size,
+                    source_ind_ptr,
+                    target_ind_ptr,
+                    starts.data(),
+                    ends.data(),
+                    active_sources,
+                    active_targets,
+                    active_starts,
+                    active_ends
+                );
+                used_rows(
+                    active_sources.data(),
+                    active_targets.data(),
+                    edges_size,
+                    data_len,
+                    rows
+                );
+
+                if (complement) {
+                    compact_products(
+                        active.data(),
+                        active_size,
+                        starts.data(),
+                        ends.data(),
+                        products.data(),
+                        active_products
+                    );
+                }
+            }
+
+            done = r;
+            if (saver.due()) {
+                save_state(done);
+            }
+            continue;
+        }
+
+        if (r == 0) {
+            rcp = boot_ref_corrs_ptr;
+            ecp = boot_exp_corrs_ptr;
+            sp  = boot_stat_ptr;
+            pp  = nullptr;
+
+            rip = ref_ind_ptr;
+            eip = exp_ind_ptr;
+
+            scp = scores_ptr;
+
+            // Observed correlations are computed directly
+            mp  = nullptr;
+            prp = nullptr;
+        } else {
+            permute_samples(indexes, random_gen, r, first_permutation);
+            for (int i = 0; i < ref_ind_size; ++i) {
+                boot_ref_ind_ptr[i] = indexes[i];
+            }
+            for (int i = 0; i < exp_ind_size; ++i) {
+                boot_exp_ind_ptr[i] = indexes[ref_ind_size + i];
             }
 
             rcp = boot_ref_corrs_ptr;
@@ -415,111 +1527,213 @@ std::tuple<
             eip = boot_exp_ind_ptr;
 
             scp = boot_scores_ptr;
+
+            mp  = complement ? moments.data() : nullptr;
+            prp = complement ? active_products.data() : nullptr;
         }
         
-        if (correlation == SPEARMAN) {
-            rank_data(
-                data_ptr,
-                rank_ptr,
-                sample_size,
-                data_len,
-                rip,
-                ref_ind_size,
-                process_num
-            );
+        dpr = permuted_data(
+            data_ptr,
+            order_ptr,
+            grouped_ptr,
+            sample_size,
+            rows,
+            data_rows.data(),
+            rip,
+            ref_ind_size,
+            eip,
+            exp_ind_size,
+            groups,
+            positions,
+            pool,
+            correlation,
+            true,
+            mp
+        );
+        
+        score_pipeline_balanced(
+            dpr,
+            sample_size,
+            active_sources.data(),
+            active_targets.data(),
+            edges_size,
+            nullptr,
+            nullptr,
+            ref_ind_size,
+            exp_ind_size,
+            rcp,
+            ecp,
+            sp,
+            pp,
+            active_starts.data(),
+            active_ends.data(),
+            active_size,
+            scp,
+            sources_size,
+            parsed_scores,
+            pool,
+            correlation,
+            alternative,
+            mp,
+            prp
+        );
 
-            rank_data(
-                data_ptr,
-                rank_ptr,
-                sample_size,
-                data_len,
-                eip,
-                exp_ind_size,
-                process_num
+        if (r > 0) {
+            count_score_exceedances(
+                scores_ptr,
+                boot_scores_ptr,
+                active.data(),
+                active_size,
+                sources_size,
+                score_num,
+                pvalues_ptr,
+                permutations_ptr,
+                alternative
             );
 
-            dpr = rank_ptr;
-        } else {
-            dpr = data_ptr;
-        }
-        
-        std::queue<std::thread> threads;
-        int batch_size = sources_size / process_num;
-        for (int i = 0; i < process_num; ++i) {
-            int left_border = i * batch_size;
-            int right_border = (i + 1) * batch_size;
-            if (i == process_num - 1) {
-                right_border = sources_size;
-            }
-            
-            std::thread thr(score_pipeline_indexed,
-                dpr,
-                sample_size,
-                source_ind_ptr,
-                target_ind_ptr,
-                index_size,
-                rip,
-                eip,
-                ref_ind_size,
-                exp_ind_size,
-                rcp,
-                ecp,
-                sp,
-                pp,
-                starts.data(),
-                ends.data(),
-                left_border,
-                right_border,
-                scp,
-                correlation,
-                alternative,
-                score
+            int decided_size = retire_contrasts(
+                active.data(),
+                nullptr,
+                nullptr,
+                active_size,
+                sources_size,
+                score_ids.data(),
+                score_num,
+                pvalues_ptr,
+                permutations_ptr,
+                stop_exceedances,
+                r
             );
-            
-            threads.push(move(thr));
-        }
 
-        while (!threads.empty()) {
-            threads.front().join();
-            threads.pop();
-        }
+            if (decided_size < active_size) {
+                active_size = decided_size;
+                edges_size = compact_edges(
+                    active.data(),
+                    active_size,
+                    source_ind_ptr,
+                    target_ind_ptr,
+                    starts.data(),
+                    ends.data(),
+                    active_sources,
+                    active_targets,
+                    active_starts,
+                    active_ends
+                );
+                used_rows(
+                    active_sources.data(),
+                    active_targets.data(),
+                    edges_size,
+                    data_len,
+                    rows
+                );
 
-        if (r > 0) {
-            for (int i = 0; i < sources_size; ++i) {
-                if (alternative == TWO_SIDED && 
-                        std::abs(scores_ptr[i]) <= std::abs(boot_scores_ptr[i])) {
-                    pvalues_ptr[i] += 1;
+                if (complement) {
+                    compact_products(
+                        active.data(),
+                        active_size,
+                        starts.data(),
+                        ends.data(),
+                        products.data(),
+                        active_products
+                    );
                 }
+            }
 
-                if (alternative == LESS &&
-                        scores_ptr[i] >= boot_scores_ptr[i]) {
-                    pvalues_ptr[i] += 1;
-                }
+            done = r;
+            if (saver.due()) {
+                save_state(done);
+            }
+        } else {
+            if (!state.is_none()) {
+                r = restore_state(
+                    state,
+                    random_gen,
+                    indexes,
+                    pvalues_ptr,
+                    permutations_ptr,
+                    scores_size,
+                    active,
+                    active_size,
+                    scores_ptr,
+                    scores_size,
+                    repeats_number
+                );
+                done = r;
 
+                edges_size = compact_edges(
+                    active.data(),
+                    active_size,
+                    source_ind_ptr,
+                    target_ind_ptr,
+                    starts.data(),
+                    ends.data(),
+                    active_sources,
+                    active_targets,
+                    active_starts,
+                    active_ends
+                );
+                used_rows(
+                    active_sources.data(),
+                    active_targets.data(),
+                    edges_size,
+                    data_len,
+                    rows
+                );
 
-                if (alternative == GREATER &&
-                        scores_ptr[i] <= boot_scores_ptr[i]) { 
-                    pvalues_ptr[i] += 1;
+                for (int k = 0; k < r; ++k) {
+                    bar.update();
                 }
             }
-        } else {
-            for (int i = 0; i < sources_size; ++i) {
-                pvalues_ptr[i] = 0;
+
+            // Edges of the sources only, their rows are grouped
+            if (complement) {
+                pool.run(
+                    "pooled",
+                    sources_size,
+                    [&](int64_t left_border, int64_t right_border) {
+                        for (int64_t j = left_border; j < right_border; ++j) {
+                            pooled_products(
+                                dpr,
+                                sample_size,
+                                source_ind_ptr,
+                                target_ind_ptr,
+                                products.data(),
+                                starts[j],
+                                ends[j],
+                                sample_size
+                            );
+                        }
+                    }
+                );
+                compact_products(
+                    active.data(),
+                    active_size,
+                    starts.data(),
+                    ends.data(),
+                    products.data(),
+                    active_products
+                );
             }
         }
 
         bar.update();
     }
     std::cout << "\n";
+    last_statistics = pool.statistics();
+    save_state(done);
 
-    if (repeats_number > 0) {
-        for (int i = 0; i < sources_size; ++i) {
-            pvalues_ptr[i] /= repeats_number;
-        }
+    if (first_permutation < 0) {
+        finalize_counts(
+            pvalues_ptr,
+            permutations_ptr,
+            scores_size,
+            repeats_number
+        );
     }
 
+    delete[] grouped_ptr;
     if (correlation == SPEARMAN) {
-        delete[] rank_ptr;
+        delete[] order_ptr;
     }
 
     delete[] boot_ref_corrs_ptr;
@@ -534,11 +1748,13 @@ std::tuple<
     return std::tuple<
         NumPyIntArray,
         NumPyFloatArray,
-        NumPyFloatArray
+        NumPyFloatArray,
+        NumPyIntArray
     >(
         sources,
         scores,
-        pvalues
+        pvalues,
+        permutations
     );
 }
 
@@ -547,7 +1763,8 @@ std::tuple<
     NumPyFloatArray,
     NumPyFloatArray,
     NumPyFloatArray,
-    NumPyFloatArray
+    NumPyFloatArray,
+    NumPyIntArray
 > ztest_pipeline_exhaustive(
     const NumPyFloatArray &data,
     const NumPyIntArray &reference_indexes,
@@ -555,13 +1772,36 @@ std::tuple<
     const std::string correlation=SPEARMAN,
     const std::string alternative=TWO_SIDED,
     int repeats_number=REPEATS_NUMBER,
-    int process_num=1    
+    int process_num=1,
+    int stop_exceedances=0,
+    int start_row=0,
+    int end_row=-1,
+    const py::object &checkpoint=py::none(),
+    const py::object &state=py::none(),
+    double checkpoint_interval=0,
+    int first_permutation=-1
 ) {
+    // The pairs of the rows from "start_row" to "end_row"
+    // with all the following rows form a contiguous
+    // stripe of the "unary_index" layout, only the stripe
+    // is computed, so the memory is bounded by its size
     py::buffer_info data_buf = data.request();
-    float *data_ptr = (float *) data_buf.ptr;
-    int index_size = data_buf.shape[0];
+    int data_len    = data_buf.shape[0];
     int sample_size = data_buf.shape[1];
-    int pairs_num = index_size * (index_size - 1) / 2;
+    
+    if (end_row < 0 || end_row > data_len) {
+        end_row = data_len;
+    }
+
+    if (start_row < 0 || start_row > end_row) {
+        throw std::runtime_error("Stripe rows error");
+    }
+
+    float *data_ptr = (float *) data_buf.ptr + (int64_t) start_row * sample_size;
+    int index_size  = data_len - start_row;
+    int source_size = end_row - start_row;
+    int64_t pairs_num = (int64_t) index_size * (index_size - 1) / 2 -
+        (int64_t) (index_size - source_size) * (index_size - source_size - 1) / 2;
 
     py::buffer_info ref_ind_buf = reference_indexes.request();
     int ref_ind_size = ref_ind_buf.shape[0];
@@ -587,10 +1827,23 @@ std::tuple<
     NumPyFloatArray boot_pvalue = NumPyFloatArray(pairs_num);
     float *boot_pvalue_ptr = (float *) boot_pvalue.request().ptr;
 
-    // Rank data    
-    float *rank_ptr;
+    NumPyIntArray permutations = NumPyIntArray(pairs_num);
+    int *permutations_ptr = (int *) permutations.request().ptr;
+
+    // Rank data, the active pairs of the indexed mode
+    // are computed over grouped columns (ranks in the
+    // spearman case)
+    float *grouped_ptr = nullptr;
+    int *order_ptr = nullptr;
+    std::vector<int> groups(sample_size);
+    std::vector<int> positions(sample_size);
+    if ((correlation == SPEARMAN) || (stop_exceedances > 0)) {
+        grouped_ptr = new float[
+            index_size * sample_size
+        ];
+    }
     if (correlation == SPEARMAN) {
-        rank_ptr = new float[
+        order_ptr = new int[
             index_size * sample_size
         ];
     }
@@ -603,6 +1856,23 @@ std::tuple<
     int *boot_ref_ind_ptr = new int[ref_ind_size];
     int *boot_exp_ind_ptr = new int[exp_ind_size];
 
+    // Active (undecided) pairs. All pairs are computed by
+    // the blocked engine while most of them are active,
+    // after that only the active pairs in the indexed mode
+    std::vector<int64_t> active;
+    std::vector<int> active_sources;
+    std::vector<int> active_targets;
+    std::vector<float> active_stat;
+    std::vector<int> rows(index_size);
+    
+    range(rows.data(), index_size);
+    int64_t active_size = pairs_num;
+    bool indexed = false;
+    if (stop_exceedances > 0) {
+        active.resize(pairs_num);
+        range(active.data(), pairs_num);
+    }
+
     // Bootstrap indexes initialization
     std::vector<int> indexes(sample_size);
     for (int i = 0; i < sample_size; ++i) {
@@ -617,11 +1887,84 @@ std::tuple<
     float *dpr, *rcp, *ecp, *sp, *pp;
     int *rip, *eip;
     
+    ThreadPool pool(process_num);
+
+    // Checkpoints (see "ztest_pipeline_indexed")
+    Checkpoint saver(checkpoint, checkpoint_interval);
+    int done = 0;
+    auto save_state = [&](int permutation) {
+        saver.save(
+            permutation,
+            random_gen,
+            indexes,
+            boot_pvalue_ptr,
+            permutations_ptr,
+            pairs_num,
+            (stop_exceedances > 0) ? active.data() : nullptr,
+            active_size,
+            stat_ptr,
+            pairs_num
+        );
+    };
+
+    // Compacted arrays of the active pairs once
+    // they are few enough for the indexed mode
+    auto update_active = [&]() {
+        if (!indexed && active_size < INDEXED_SHARE * pairs_num &&
+                active_size < INT32_MAX) {
+            indexed = true;
+            active_sources.resize(active_size);
+            active_targets.resize(active_size);
+            active_stat.resize(active_size);
+            
+            for (int64_t k = 0; k < active_size; ++k) {
+                std::pair<int, int> paired_ind =
+                    paired_index(active[k], index_size);
+                active_sources[k] = paired_ind.first;
+                active_targets[k] = paired_ind.second;
+                active_stat[k] = stat_ptr[active[k]];
+            }
+        }
+
+        if (indexed) {
+            used_rows(
+                active_sources.data(),
+                active_targets.data(),
+                active_size,
+                index_size,
+                rows
+            );
+        }
+    };
+    
+    if (correlation == SPEARMAN) {
+        argsort_data(
+            data_ptr,
+            order_ptr,
+            sample_size,
+            index_size,
+            pool
+        );
+    }
+    
+    for (int64_t i = 0; i < pairs_num; ++i) {
+        boot_pvalue_ptr[i] = 0;
+        permutations_ptr[i] = 0;
+    }
+
     std::cout << "Permutation progress: ";
     progressbar bar(repeats_number + 1);
     for (int r = 0; r < repeats_number + 1; ++r) {
         if (PyErr_CheckSignals() != 0) {
-            throw py::error_already_set();
+            py::error_already_set error;
+            if (done > 0) {
+                save_state(done);
+            }
+            throw error;
+        }
+
+        if (r > 0 && active_size == 0) {
+            break;
         }
 
         if (r == 0) {
@@ -633,7 +1976,7 @@ std::tuple<
             rip = ref_ind_ptr;
             eip = exp_ind_ptr;
         } else {
-            std::shuffle(indexes.begin(), indexes.end(), random_gen);
+            permute_samples(indexes, random_gen, r, first_permutation);
             for (int i = 0; i < ref_ind_size; ++i) {
                 boot_ref_ind_ptr[i] = indexes[i];
             }
@@ -650,48 +1993,28 @@ std::tuple<
             eip = boot_exp_ind_ptr;
         }
         
-        if (correlation == SPEARMAN) {
-            rank_data(
-                data_ptr,
-                rank_ptr,
-                sample_size,
-                index_size,
-                rip,
-                ref_ind_size,
-                process_num
-            );
-
-            rank_data(
-                data_ptr,
-                rank_ptr,
-                sample_size,
-                index_size,
-                eip,
-                exp_ind_size,
-                process_num
-            );
-
-            dpr = rank_ptr;
-        } else {
-            dpr = data_ptr;
-        }
+        dpr = permuted_data(
+            data_ptr,
+            order_ptr,
+            grouped_ptr,
+            sample_size,
+            rows,
+            nullptr,
+            rip,
+            ref_ind_size,
+            eip,
+            exp_ind_size,
+            groups,
+            positions,
+            pool,
+            correlation,
+            indexed
+        );
 
-        std::queue<std::thread> threads;
-        int batch_size = pairs_num / process_num;
-        for (int i = 0; i < process_num; ++i) {
-            int left_border = i * batch_size;
-            int right_border = (i + 1) * batch_size;
-            if (i == process_num - 1) {
-                right_border = pairs_num;
-            }
-            
-            std::thread thr(ztest_pipeline,
+        if (!indexed) {
+            ztest_pipeline_blocked(
                 dpr,
                 sample_size,
-                (int *) nullptr,
-                (int *) nullptr,
-                left_border,
-                right_border,
                 index_size,
                 rip,
                 eip,
@@ -701,53 +2024,131 @@ std::tuple<
                 ecp,
                 sp,
                 pp,
+                pool,
                 correlation,
-                alternative
+                alternative,
+                source_size
+            );
+        } else {
+            pool.run(
+                "pipeline",
+                active_size,
+                [&](int64_t left_border, int64_t right_border) {
+                    ztest_pipeline(
+                        dpr,
+                        sample_size,
+                        active_sources.data(),
+                        active_targets.data(),
+                        left_border,
+                        right_border,
+                        active_size,
+                        nullptr,
+                        nullptr,
+                        ref_ind_size,
+                        exp_ind_size,
+                        rcp,
+                        ecp,
+                        sp,
+                        pp,
+                        correlation,
+                        alternative
+                    );
+                }
             );
-            
-            threads.push(move(thr));
-        }
-
-        while (!threads.empty()) {
-            threads.front().join();
-            threads.pop();
         }
         
         if (r > 0) {
-            for (int i = 0; i < pairs_num; ++i) {
-                if ((alternative == TWO_SIDED) &&
-                        (std::abs(stat_ptr[i]) <= std::abs(boot_stat_ptr[i]))) {
-                    boot_pvalue_ptr[i] += 1;
-                }
+            pool.run(
+                "count",
+                active_size,
+                [&](int64_t left_border, int64_t right_border) {
+                    for (int64_t k = left_border; k < right_border; ++k) {
+                        int64_t i = (stop_exceedances > 0) ? active[k] : k;
+                        float s = indexed ? active_stat[k] : stat_ptr[i];
+                        float b = indexed ? boot_stat_ptr[k] : boot_stat_ptr[i];
 
-                if ((alternative == LESS) &&
-                        (stat_ptr[i] <= boot_stat_ptr[i])) {
-                    boot_pvalue_ptr[i] += 1;
-                }
-                
-                if ((alternative == GREATER) &&
-                        (stat_ptr[i] >= boot_stat_ptr[i])) {
-                    boot_pvalue_ptr[i] += 1;
+                        if ((alternative == TWO_SIDED) &&
+                                (std::abs(s) <= std::abs(b))) {
+                            boot_pvalue_ptr[i] += 1;
+                        }
+
+                        if ((alternative == LESS) &&
+                                (s <= b)) {
+                            boot_pvalue_ptr[i] += 1;
+                        }
+                        
+                        if ((alternative == GREATER) &&
+                                (s >= b)) {
+                            boot_pvalue_ptr[i] += 1;
+                        }
+                    }
                 }
+            );
+
+            int64_t decided_size = retire_items(
+                active.data(),
+                indexed ? active_sources.data() : nullptr,
+                indexed ? active_targets.data() : nullptr,
+                indexed ? active_stat.data() : nullptr,
+                active_size,
+                boot_pvalue_ptr,
+                permutations_ptr,
+                stop_exceedances,
+                r
+            );
+
+            if (decided_size < active_size) {
+                active_size = decided_size;
+                update_active();
             }
-        } else {
-            for (int i = 0; i < pairs_num; ++i) {
-                boot_pvalue_ptr[i] = 0;
+
+            done = r;
+            if (saver.due()) {
+                save_state(done);
+            }
+        } else if (!state.is_none()) {
+            r = restore_state(
+                state,
+                random_gen,
+                indexes,
+                boot_pvalue_ptr,
+                permutations_ptr,
+                pairs_num,
+                active,
+                active_size,
+                stat_ptr,
+                pairs_num,
+                repeats_number
+            );
+            done = r;
+
+            if (active_size < pairs_num) {
+                update_active();
+            }
+
+            for (int k = 0; k < r; ++k) {
+                bar.update();
             }
         }
 
         bar.update();
     }
     std::cout << "\n";
+    last_statistics = pool.statistics();
+    save_state(done);
     
-    if (repeats_number > 0) {
-        for (int i = 0; i < pairs_num; ++i) {
-            boot_pvalue_ptr[i] /= repeats_number;
-        }
+    if (first_permutation < 0) {
+        finalize_counts(
+            boot_pvalue_ptr,
+            permutations_ptr,
+            pairs_num,
+            repeats_number
+        );
     }
     
+    delete[] grouped_ptr;
     if (correlation == SPEARMAN) {
-        delete [] rank_ptr;
+        delete[] order_ptr;
     }
 
     delete[] boot_ref_corrs_ptr;
@@ -762,18 +2163,21 @@ std::tuple<
         NumPyFloatArray,
         NumPyFloatArray,
         NumPyFloatArray,
-        NumPyFloatArray
+        NumPyFloatArray,
+        NumPyIntArray
     >(
         ref_corrs,
         exp_corrs,
         stat,
         pvalue,
-        boot_pvalue
+        boot_pvalue,
+        permutations
     );
 }
 
 std::tuple<
-    NumPyFloatArray, NumPyFloatArray
+    NumPyFloatArray, NumPyFloatArray,
+    NumPyIntArray
 > _score_pipeline_exhaustive(
     const NumPyFloatArray &data,
     const NumPyIntArray &reference_indexes,
@@ -782,13 +2186,26 @@ std::tuple<
     const std::string score=MEAN,
     const std::string alternative=TWO_SIDED,
     int repeats_number=REPEATS_NUMBER,
-    int process_num=1    
+    int process_num=1,
+    int stop_exceedances=0,
+    const py::object &checkpoint=py::none(),
+    const py::object &state=py::none(),
+    double checkpoint_interval=0,
+    int first_permutation=-1,
+    bool streaming=false
 ) {
+    /* Scores of every row paired with all other rows. In the
+     * "streaming" mode the statistics of the pairs are not
+     * stored: they are computed by blocks of rows and reduced
+     * into the scores right away (see "score_pipeline_streaming"),
+     * so memory is proportional to the number of rows. The
+     * results are the same in both modes */
+
     py::buffer_info data_buf = data.request();
     float *data_ptr = (float *) data_buf.ptr;
     int data_len    = data_buf.shape[0];
     int sample_size = data_buf.shape[1];
-    int pairs_num   = data_len * (data_len - 1) / 2;
+    int64_t pairs_num = (int64_t) data_len * (data_len - 1) / 2;
 
     py::buffer_info ref_ind_buf = reference_indexes.request();
     int ref_ind_size = ref_ind_buf.shape[0];
@@ -798,18 +2215,29 @@ std::tuple<
     int exp_ind_size = exp_ind_buf.shape[0];
     int *exp_ind_ptr = (int *) exp_ind_buf.ptr;
 
-    // Rank data    
-    float *rank_ptr;
+    // Rank data, the active pairs of the indexed mode
+    // are computed over grouped columns (ranks in the
+    // spearman case)
+    float *grouped_ptr = nullptr;
+    int *order_ptr = nullptr;
+    std::vector<int> groups(sample_size);
+    std::vector<int> positions(sample_size);
+    if ((correlation == SPEARMAN) || (stop_exceedances > 0)) {
+        grouped_ptr = new float[
+            data_len * sample_size
+        ];
+    }
     if (correlation == SPEARMAN) {
-        rank_ptr = new float[
+        order_ptr = new int[
             data_len * sample_size
         ];
     }
     
-    // Bootstrapped data
-    float *boot_ref_corrs_ptr =  new float[pairs_num];
-    float *boot_exp_corrs_ptr = new float[pairs_num];
-    float *boot_stat_ptr = new float[pairs_num];
+    // Bootstrapped data (pairs are not stored while streaming)
+    int64_t boot_size = streaming ? 0 : pairs_num;
+    float *boot_ref_corrs_ptr =  new float[boot_size];
+    float *boot_exp_corrs_ptr = new float[boot_size];
+    float *boot_stat_ptr = new float[boot_size];
      
     int *boot_ref_ind_ptr = new int[ref_ind_size];
     int *boot_exp_ind_ptr = new int[exp_ind_size];
@@ -826,14 +2254,45 @@ std::tuple<
 
     // Scores data
     int sources_size = data_len; 
-    NumPyFloatArray scores = NumPyFloatArray(sources_size);
+    
+    // Several scores of one run are stored one after another
+    std::vector<Score> parsed_scores = parse_scores(score);
+    int score_num = parsed_scores.size();
+    int64_t scores_size = (int64_t) score_num * sources_size;
+
+    NumPyFloatArray scores = NumPyFloatArray(scores_size);
     float *scores_ptr = (float *) scores.request().ptr;
     
-    NumPyFloatArray pvalues = NumPyFloatArray(sources_size);
+    NumPyFloatArray pvalues = NumPyFloatArray(scores_size);
     float *pvalues_ptr = (float *) pvalues.request().ptr;
     
+    NumPyIntArray permutations = NumPyIntArray(scores_size);
+    int *permutations_ptr = (int *) permutations.request().ptr;
+
+    std::vector<int> score_ids(score_num);
+    for (int s = 0; s < score_num; ++s) {
+        score_ids[s] = s;
+    }
+    
     // Bootstrap scores
-    float *boot_scores_ptr = new float[sources_size];
+    float *boot_scores_ptr = new float[scores_size];
+    
+    // Active sources (with an undecided score). Scores of all
+    // sources are computed in the exhaustive mode while most of
+    // them are active, after that only edges of the active sources
+    // are computed in the indexed mode
+    std::vector<int64_t> active(sources_size);
+    std::vector<int> active_sources;
+    std::vector<int> active_targets;
+    std::vector<int> active_starts;
+    std::vector<int> active_ends;
+    std::vector<int> rows(data_len);
+    
+    range(active.data(), sources_size);
+    range(rows.data(), data_len);
+    int64_t active_size = sources_size;
+    int edges_size = 0;
+    bool indexed = false;
     
     if (process_num > sources_size) {
         process_num = sources_size;
@@ -848,11 +2307,87 @@ std::tuple<
     int *rip, *eip;
     float *scp;
     
+    ThreadPool pool(process_num);
+
+    // Checkpoints (see "ztest_pipeline_indexed")
+    Checkpoint saver(checkpoint, checkpoint_interval);
+    int done = 0;
+    auto save_state = [&](int permutation) {
+        saver.save(
+            permutation,
+            random_gen,
+            indexes,
+            pvalues_ptr,
+            permutations_ptr,
+            scores_size,
+            (stop_exceedances > 0) ? active.data() : nullptr,
+            active_size,
+            scores_ptr,
+            scores_size
+        );
+    };
+
+    // Edges of the active sources once they are few enough
+    // for the indexed mode (active rows are streamed as they are)
+    auto update_active = [&]() {
+        if (streaming) {
+            return;
+        }
+
+        int64_t edges_num = (int64_t) active_size * (sources_size - 1);
+        if (!indexed && edges_num < INDEXED_SHARE * pairs_num &&
+                edges_num < INT32_MAX) {
+            indexed = true;
+        }
+
+        if (indexed) {
+            edges_size = complete_edges(
+                active.data(),
+                active_size,
+                sources_size,
+                active_sources,
+                active_targets,
+                active_starts,
+                active_ends
+            );
+            used_rows(
+                active_sources.data(),
+                active_targets.data(),
+                edges_size,
+                data_len,
+                rows
+            );
+        }
+    };
+    
+    if (correlation == SPEARMAN) {
+        argsort_data(
+            data_ptr,
+            order_ptr,
+            sample_size,
+            data_len,
+            pool
+        );
+    }
+    
+    for (int64_t i = 0; i < scores_size; ++i) {
+        pvalues_ptr[i] = 0;
+        permutations_ptr[i] = 0;
+    }
+
     std::cout << "Permutation progress: ";
     progressbar bar(repeats_number + 1);
     for (int r = 0; r < repeats_number + 1; ++r) {
         if (PyErr_CheckSignals() != 0) {
-            throw py::error_already_set();
+            py::error_already_set error;
+            if (done > 0) {
+                save_state(done);
+            }
+            throw error;
+        }
+
+        if (r > 0 && active_size == 0) {
+            break;
         }
 
         if (r == 0) {
@@ -866,7 +2401,7 @@ std::tuple<
 
             scp = scores_ptr;
         } else {
-            std::shuffle(indexes.begin(), indexes.end(), random_gen);
+            permute_samples(indexes, random_gen, r, first_permutation);
             for (int i = 0; i < ref_ind_size; ++i) {
                 boot_ref_ind_ptr[i] = indexes[i];
             }
@@ -885,48 +2420,46 @@ std::tuple<
             scp = boot_scores_ptr;
         }
 
-        if (correlation == SPEARMAN) {
-            rank_data(
-                data_ptr,
-                rank_ptr,
+        dpr = permuted_data(
+            data_ptr,
+            order_ptr,
+            grouped_ptr,
+            sample_size,
+            rows,
+            nullptr,
+            rip,
+            ref_ind_size,
+            eip,
+            exp_ind_size,
+            groups,
+            positions,
+            pool,
+            correlation,
+            indexed
+        );
+        
+        if (streaming) {
+            score_pipeline_streaming(
+                dpr,
                 sample_size,
-                data_len,
+                sources_size,
                 rip,
-                ref_ind_size,
-                process_num
-            );
-
-            rank_data(
-                data_ptr,
-                rank_ptr,
-                sample_size,
-                data_len,
                 eip,
+                ref_ind_size,
                 exp_ind_size,
-                process_num
+                active.data(),
+                active_size,
+                scp,
+                sources_size,
+                parsed_scores,
+                pool,
+                correlation,
+                alternative
             );
-
-            dpr = rank_ptr;
-        } else {
-            dpr = data_ptr;
-        }
-        
-        std::queue<std::thread> threads;
-        int batch_size = pairs_num / process_num;
-        for (int i = 0; i < process_num; ++i) {
-            int left_border = i * batch_size;
-            int right_border = (i + 1) * batch_size;
-            if (i == process_num - 1) {
-                right_border = pairs_num;
-            }
-            
-            std::thread thr(ztest_pipeline,
+        } else if (!indexed) {
+            ztest_pipeline_blocked(
                 dpr,
                 sample_size,
-                (int *) nullptr,
-                (int *) nullptr,
-                left_border,
-                right_border,
                 sources_size,
                 rip,
                 eip,
@@ -936,80 +2469,134 @@ std::tuple<
                 ecp,
                 sp,
                 pp,
+                pool,
                 correlation,
                 TWO_SIDED
             );
-            
-            threads.push(move(thr));
-        }
-
-        while (!threads.empty()) {
-            threads.front().join();
-            threads.pop();
-        }
 
-        batch_size = sources_size / process_num;
-        for (int i = 0; i < process_num; ++i) {
-            int left_border = i * batch_size;
-            int right_border = (i + 1) * batch_size;
-            if (i == process_num - 1) {
-                right_border = sources_size;
-            }
-            
-            std::thread thr(score_pipeline_exhaustive,
-                sp,
+            pool.run(
+                "score",
                 sources_size,
-                left_border,
-                right_border,
+                [&](int64_t left_border, int64_t right_border) {
+                    score_pipeline_exhaustive(
+                        sp,
+                        sources_size,
+                        left_border,
+                        right_border,
+                        scp,
+                        sources_size,
+                        parsed_scores,
+                        alternative
+                    );
+                }
+            );
+        } else {
+            score_pipeline_balanced(
+                dpr,
+                sample_size,
+                active_sources.data(),
+                active_targets.data(),
+                edges_size,
+                nullptr,
+                nullptr,
+                ref_ind_size,
+                exp_ind_size,
+                rcp,
+                ecp,
+                sp,
+                pp,
+                active_starts.data(),
+                active_ends.data(),
+                active_size,
                 scp,
-                score,
+                sources_size,
+                parsed_scores,
+                pool,
+                correlation,
                 alternative
             );
-            
-            threads.push(move(thr));
-        }
-
-        while (!threads.empty()) {
-            threads.front().join();
-            threads.pop();
         }
 
         if (r > 0) {
-            for (int i = 0; i < sources_size; ++i) {
-                if (alternative == TWO_SIDED && 
-                        std::abs(scores_ptr[i]) <= std::abs(boot_scores_ptr[i])) {
-                    pvalues_ptr[i] += 1;
-                }
+            count_score_exceedances(
+                scores_ptr,
+                boot_scores_ptr,
+                active.data(),
+                active_size,
+                sources_size,
+                score_num,
+                pvalues_ptr,
+                permutations_ptr,
+                alternative,
+                indexed || streaming
+            );
 
-                if (alternative == LESS &&
-                        scores_ptr[i] >= boot_scores_ptr[i]) {
-                    pvalues_ptr[i] += 1;
-                }
+            int decided_size = retire_contrasts(
+                active.data(),
+                nullptr,
+                nullptr,
+                active_size,
+                sources_size,
+                score_ids.data(),
+                score_num,
+                pvalues_ptr,
+                permutations_ptr,
+                stop_exceedances,
+                r
+            );
 
+            if (decided_size < active_size) {
+                active_size = decided_size;
+                update_active();
+            }
 
-                if (alternative == GREATER &&
-                        scores_ptr[i] <= boot_scores_ptr[i]) { 
-                    pvalues_ptr[i] += 1;
-                }
+            done = r;
+            if (saver.due()) {
+                save_state(done);
             }
-        } else {
-            for (int i = 0; i < sources_size; ++i) {
-                pvalues_ptr[i] = 0;
+        } else if (!state.is_none()) {
+            r = restore_state(
+                state,
+                random_gen,
+                indexes,
+                pvalues_ptr,
+                permutations_ptr,
+                scores_size,
+                active,
+                active_size,
+                scores_ptr,
+                scores_size,
+                repeats_number
+            );
+            done = r;
+
+            if (active_size < sources_size) {
+                update_active();
             }
-        }
+
+            for (int k = 0; k < r; ++k) {
+                bar.update();
+            }
+        }
 
         bar.update();
     }
     std::cout << "\n";
+    last_statistics = pool.statistics();
+    save_state(done);
 
-    if (repeats_number > 0) {
-        for (int i = 0; i < sources_size; ++i) {
-            pvalues_ptr[i] /= repeats_number;
-        }
+    if (first_permutation < 0) {
+        finalize_counts(
+            pvalues_ptr,
+            permutations_ptr,
+            scores_size,
+            repeats_number
+        );
     }
     
+    delete[] grouped_ptr;
     if (correlation == SPEARMAN) {
-        delete[] rank_ptr;
+        delete[] order_ptr;
     }
 
     delete[] boot_ref_corrs_ptr;
@@ -1022,10 +2609,1875 @@ std::tuple<
     delete[] boot_scores_ptr;
 
     return std::tuple<
-        NumPyFloatArray, NumPyFloatArray
+        NumPyFloatArray, NumPyFloatArray,
+        NumPyIntArray
     >(
         scores,
-        pvalues
+        pvalues,
+        permutations
+    );
+}
+
+std::tuple<
+    NumPyFloatArray, NumPyFloatArray, NumPyFloatArray,
+    NumPyFloatArray, NumPyFloatArray, NumPyIntArray,
+    NumPyIntArray, NumPyFloatArray, NumPyFloatArray,
+    NumPyIntArray
+> ztest_score_pipeline_indexed(
+    const NumPyFloatArray &data,
+    const NumPyIntArray &source_indexes,
+    const NumPyIntArray &target_indexes,
+    const NumPyIntArray &edge_sources,
+    const NumPyIntArray &edge_pairs,
+    const NumPyIntArray &reference_indexes,
+    const NumPyIntArray &experimental_indexes,
+    const std::string correlation=SPEARMAN,
+    const std::string score=MEAN,
+    const std::string alternative=TWO_SIDED,
+    int repeats_number=REPEATS_NUMBER,
+    int process_num=1,
+    int stop_exceedances=0
+) {
+    /* Z-tests of the pairs and scores of the sources over the
+     * same permutations. Edges of the scores are pairs taken
+     * in the direction of their source: "edge_sources" are
+     * sorted sources of the edges, "edge_pairs" are positions
+     * of their pairs. A permutation computes the statistic of
+     * every pair still needed once, for the z-test and for
+     * the scores. Results equal the ones of the separate
+     * z-test and score pipelines */
+
+    py::buffer_info data_buf = data.request();
+    float *data_ptr = (float *) data_buf.ptr;
+    int data_len    = data_buf.shape[0];
+    int sample_size = data_buf.shape[1];
+
+    py::buffer_info source_ind_buf = source_indexes.request();
+    int *source_ind_ptr = (int *) source_ind_buf.ptr;
+    
+    py::buffer_info target_ind_buf = target_indexes.request();
+    int *target_ind_ptr = (int *) target_ind_buf.ptr;
+    
+    int index_size = source_ind_buf.shape[0];
+
+    py::buffer_info edge_source_buf = edge_sources.request();
+    int *edge_source_ptr = (int *) edge_source_buf.ptr;
+    
+    py::buffer_info edge_pair_buf = edge_pairs.request();
+    int *edge_pair_ptr = (int *) edge_pair_buf.ptr;
+
+    int edge_size = edge_source_buf.shape[0];
+    
+    py::buffer_info ref_ind_buf = reference_indexes.request();
+    int ref_ind_size = ref_ind_buf.shape[0];
+    int *ref_ind_ptr = (int *) ref_ind_buf.ptr;
+    
+    py::buffer_info exp_ind_buf = experimental_indexes.request();
+    int exp_ind_size = exp_ind_buf.shape[0];
+    int *exp_ind_ptr = (int *) exp_ind_buf.ptr;
+
+    if (edge_pair_buf.shape[0] != edge_size) {
+        throw std::runtime_error("Edge sizes error");
+    }
+
+    // Real data    
+    NumPyFloatArray ref_corrs = NumPyFloatArray(index_size);
+    float *ref_corrs_ptr = (float *) ref_corrs.request().ptr;
+    
+    NumPyFloatArray exp_corrs = NumPyFloatArray(index_size);
+    float *exp_corrs_ptr = (float *) exp_corrs.request().ptr;
+
+    NumPyFloatArray stat = NumPyFloatArray(index_size);
+    float *stat_ptr = (float *) stat.request().ptr;
+    
+    NumPyFloatArray pvalue = NumPyFloatArray(index_size);
+    float *pvalue_ptr = (float *) pvalue.request().ptr;
+    
+    NumPyFloatArray boot_pvalue = NumPyFloatArray(index_size);
+    float *boot_pvalue_ptr = (float *) boot_pvalue.request().ptr;
+    
+    NumPyIntArray permutations = NumPyIntArray(index_size);
+    int *permutations_ptr = (int *) permutations.request().ptr;
+
+    // Scores initialization
+    std::vector<int> _sources;
+    std::vector<int> starts;
+    std::vector<int> ends;
+
+    for (int i = 0; i < edge_size;) {
+        int end = i;
+        while ((end < edge_size) &&
+                (edge_source_ptr[i] == edge_source_ptr[end])) {
+            ++end;
+        }
+
+        _sources.push_back(edge_source_ptr[i]);
+        starts.push_back(i);
+        ends.push_back(end);
+
+        i = end;
+    }
+
+    int sources_size = _sources.size();
+
+    std::vector<Score> parsed_scores = parse_scores(score);
+    if (parsed_scores.size() != 1) {
+        throw std::runtime_error(
+            "Several scores are not supported by this pipeline"
+        );
+    }
+
+    NumPyIntArray sources = NumPyIntArray(sources_size);
+    int *sources_ptr = (int *) sources.request().ptr;
+
+    NumPyFloatArray scores = NumPyFloatArray(sources_size);
+    float *scores_ptr = (float *) scores.request().ptr;
+
+    NumPyFloatArray score_pvalues = NumPyFloatArray(sources_size);
+    float *score_pvalues_ptr = (float *) score_pvalues.request().ptr;
+
+    NumPyIntArray score_permutations = NumPyIntArray(sources_size);
+    int *score_permutations_ptr = (int *) score_permutations.request().ptr;
+
+    for (int j = 0; j < sources_size; ++j) {
+        sources_ptr[j] = _sources[j];
+        score_pvalues_ptr[j] = 0;
+        score_permutations_ptr[j] = 0;
+    }
+
+    for (int i = 0; i < index_size; ++i) {
+        boot_pvalue_ptr[i] = 0;
+        permutations_ptr[i] = 0;
+    }
+    
+    // Grouped data of the used rows only (see "ztest_pipeline_indexed")
+    float *grouped_ptr = nullptr;
+    int *order_ptr = nullptr;
+    std::vector<int> groups(sample_size);
+    std::vector<int> positions(sample_size);
+    std::vector<int> data_rows;
+    std::vector<int> compact_sources;
+    std::vector<int> compact_targets;
+    data_len = compact_rows(
+        source_ind_ptr,
+        target_ind_ptr,
+        index_size,
+        data_len,
+        data_rows,
+        compact_sources,
+        compact_targets
+    );
+    source_ind_ptr = compact_sources.data();
+    target_ind_ptr = compact_targets.data();
+
+    grouped_ptr = new float[
+        (int64_t) data_len * sample_size
+    ];
+    if (correlation == SPEARMAN) {
+        order_ptr = new int[
+            (int64_t) data_len * sample_size
+        ];
+    }
+
+    // Pooled sums of the pairs (see "ztest_pipeline_indexed"),
+    // "pair_products" are the ones of the computed pairs
+    bool complement = (correlation == PEARSON) &&
+        (ref_ind_size + exp_ind_size == sample_size) &&
+        centered_rows(data_ptr, sample_size, data_rows.data(), data_len);
+    std::vector<float> moments(
+        complement ? (int64_t) data_len * MOMENTS_NUMBER : 0
+    );
+    std::vector<double> products(complement ? index_size : 0);
+    std::vector<double> pair_products;
+    
+    // Bootstrapped data: statistics of the computed pairs in
+    // compacted form, of all the pairs and of the edges
+    std::vector<float> boot_ref_corrs(index_size);
+    std::vector<float> boot_exp_corrs(index_size);
+    std::vector<float> boot_stat(index_size);
+    std::vector<float> pair_stat(index_size);
+    std::vector<float> edge_stat(edge_size);
+    std::vector<float> boot_scores(sources_size);
+     
+    std::vector<int> boot_ref_ind(ref_ind_size);
+    std::vector<int> boot_exp_ind(exp_ind_size);
+
+    // Active (undecided) pairs and sources, the pairs
+    // needed by them and the rows of those pairs
+    std::vector<int64_t> active(index_size);
+    std::vector<int64_t> active_sources(sources_size);
+    std::vector<int> active_starts(sources_size);
+    std::vector<int> active_ends(sources_size);
+    std::vector<int> pairs;
+    std::vector<int> pair_sources;
+    std::vector<int> pair_targets;
+    std::vector<int> rows;
+    
+    range(active.data(), index_size);
+    range(active_sources.data(), sources_size);
+    int64_t active_size = index_size;
+    int64_t active_sources_size = sources_size;
+    bool changed = true;
+
+    // Bootstrap indexes initialization
+    std::vector<int> indexes(sample_size);
+    for (int i = 0; i < sample_size; ++i) {
+        indexes[i] = i;
+    }
+
+    // Random generator initialization
+    std::mt19937 random_gen(SEED);
+
+    bool absolute = false;
+    if (alternative == TWO_SIDED) {
+        absolute = true;
+    }
+
+    float *dpr, *rcp, *ecp, *sp, *pp, *mp;
+    int *rip, *eip;
+    double *prp;
+    
+    ThreadPool pool(process_num);
+    
+    if (correlation == SPEARMAN) {
+        argsort_data(
+            data_ptr,
+            order_ptr,
+            sample_size,
+            data_len,
+            pool,
+            data_rows.data()
+        );
+    }
+
+    std::cout << "Permutation progress: ";
+    progressbar bar(repeats_number + 1);
+    for (int r = 0; r < repeats_number + 1; ++r) {
+        if (PyErr_CheckSignals() != 0) {
+            throw py::error_already_set();
+        }
+
+        if (r > 0 && active_size == 0 && active_sources_size == 0) {
+            break;
+        }
+
+        if (changed) {
+            shared_pairs(
+                active.data(),
+                active_size,
+                active_sources.data(),
+                active_sources_size,
+                edge_pair_ptr,
+                starts.data(),
+                ends.data(),
+                source_ind_ptr,
+                target_ind_ptr,
+                index_size,
+                pairs,
+                pair_sources,
+                pair_targets
+            );
+            used_rows(
+                pair_sources.data(),
+                pair_targets.data(),
+                pairs.size(),
+                data_len,
+                rows
+            );
+
+            for (int64_t k = 0; k < active_sources_size; ++k) {
+                active_starts[k] = starts[active_sources[k]];
+                active_ends[k] = ends[active_sources[k]];
+            }
+
+            if (complement) {
+                pair_products.resize(pairs.size());
+                for (size_t k = 0; k < pairs.size(); ++k) {
+                    pair_products[k] = products[pairs[k]];
+                }
+            }
+
+            changed = false;
+        }
+
+        if (r == 0) {
+            rcp = ref_corrs_ptr;
+            ecp = exp_corrs_ptr;
+            sp  = stat_ptr;
+            pp  = pvalue_ptr;
+
+            rip = ref_ind_ptr;
+            eip = exp_ind_ptr;
+
+            // Observed correlations are computed directly
+            mp  = nullptr;
+            prp = nullptr;
+        } else {
+            std::shuffle(indexes.begin(), indexes.end(), random_gen);
+            for (int i = 0; i < ref_ind_size; ++i) {
+                boot_ref_ind[i] = indexes[i];
+            }
+            for (int i = 0; i < exp_ind_size; ++i) {
+                boot_exp_ind[i] = indexes[ref_ind_size + i];
+            }
+
+            rcp = boot_ref_corrs.data();
+            ecp = boot_exp_corrs.data();
+            sp  = boot_stat.data();
+            pp  = nullptr;
+            
+            rip = boot_ref_ind.data();
+            eip = boot_exp_ind.data();
+
+            mp  = complement ? moments.data() : nullptr;
+            prp = complement ? pair_products.data() : nullptr;
+        }
+        
+        dpr = permuted_data(
+            data_ptr,
+            order_ptr,
+            grouped_ptr,
+            sample_size,
+            rows,
+            data_rows.data(),
+            rip,
+            ref_ind_size,
+            eip,
+            exp_ind_size,
+            groups,
+            positions,
+            pool,
+            correlation,
+            true,
+            mp
+        );
+        
+        // Observed statistics are written to the results in
+        // place (all the pairs are computed at first)
+        int pairs_size = pairs.size();
+        float *psp = pair_stat.data();
+        pool.run(
+            "pipeline",
+            pairs_size,
+            [&](int64_t left_border, int64_t right_border) {
+                ztest_pipeline(
+                    dpr,
+                    sample_size,
+                    pair_sources.data(),
+                    pair_targets.data(),
+                    left_border,
+                    right_border,
+                    pairs_size,
+                    nullptr,
+                    nullptr,
+                    ref_ind_size,
+                    exp_ind_size,
+                    rcp,
+                    ecp,
+                    sp,
+                    pp,
+                    correlation,
+                    alternative,
+                    mp,
+                    prp
+                );
+
+                for (int64_t k = left_border; k < right_border; ++k) {
+                    psp[pairs[k]] = sp[k];
+                }
+            }
+        );
+
+        // Scores of the active sources over their edges
+        float *esp = edge_stat.data();
+        float *scp = (r == 0) ? scores_ptr : boot_scores.data();
+        pool.run(
+            "score",
+            active_sources_size,
+            [&](int64_t left_border, int64_t right_border) {
+                for (int64_t k = left_border; k < right_border; ++k) {
+                    for (int e = active_starts[k]; e < active_ends[k]; ++e) {
+                        esp[e] = psp[edge_pair_ptr[e]];
+                    }
+                }
+
+                _score(
+                    esp,
+                    active_starts.data(),
+                    active_ends.data(),
+                    left_border,
+                    right_border,
+                    scp,
+                    sources_size,
+                    parsed_scores,
+                    absolute
+                );
+            }
+        );
+
+        if (r == 0) {
+            // All the pairs are computed at first
+            if (complement) {
+                pool.run(
+                    "pooled",
+                    index_size,
+                    [&](int64_t left_border, int64_t right_border) {
+                        pooled_products(
+                            dpr,
+                            sample_size,
+                            source_ind_ptr,
+                            target_ind_ptr,
+                            products.data(),
+                            left_border,
+                            right_border,
+                            sample_size
+                        );
+                    }
+                );
+
+                pair_products.resize(pairs.size());
+                for (size_t k = 0; k < pairs.size(); ++k) {
+                    pair_products[k] = products[pairs[k]];
+                }
+            }
+
+            bar.update();
+            continue;
+        }
+
+        int64_t *ap = active.data();
+        pool.run(
+            "count",
+            active_size,
+            [&](int64_t left_border, int64_t right_border) {
+                for (int64_t k = left_border; k < right_border; ++k) {
+                    int64_t i = ap[k];
+                    float s = stat_ptr[i];
+                    float b = psp[i];
+
+                    if ((alternative == TWO_SIDED) &&
+                            (std::abs(s) <= std::abs(b))) {
+                        boot_pvalue_ptr[i] += 1;
+                    }
+
+                    if ((alternative == LESS) &&
+                            (s <= b)) {
+                        boot_pvalue_ptr[i] += 1;
+                    }
+                    
+                    if ((alternative == GREATER) &&
+                            (s >= b)) {
+                        boot_pvalue_ptr[i] += 1;
+                    }
+                }
+            }
+        );
+
+        for (int64_t k = 0; k < active_sources_size; ++k) {
+            int64_t j = active_sources[k];
+            float s = scores_ptr[j];
+            float b = boot_scores[k];
+
+            if (alternative == TWO_SIDED &&
+                    std::abs(s) <= std::abs(b)) {
+                score_pvalues_ptr[j] += 1;
+            }
+
+            if (alternative == LESS && s >= b) {
+                score_pvalues_ptr[j] += 1;
+            }
+
+            if (alternative == GREATER && s <= b) {
+                score_pvalues_ptr[j] += 1;
+            }
+        }
+
+        int64_t decided_size = retire_items(
+            active.data(),
+            nullptr,
+            nullptr,
+            nullptr,
+            active_size,
+            boot_pvalue_ptr,
+            permutations_ptr,
+            stop_exceedances,
+            r
+        );
+
+        int64_t decided_sources_size = retire_items(
+            active_sources.data(),
+            nullptr,
+            nullptr,
+            nullptr,
+            active_sources_size,
+            score_pvalues_ptr,
+            score_permutations_ptr,
+            stop_exceedances,
+            r
+        );
+
+        if ((decided_size < active_size) ||
+                (decided_sources_size < active_sources_size)) {
+            active_size = decided_size;
+            active_sources_size = decided_sources_size;
+            changed = true;
+        }
+
+        bar.update();
+    }
+    std::cout << "\n";
+    last_statistics = pool.statistics();
+    
+    finalize_counts(
+        boot_pvalue_ptr,
+        permutations_ptr,
+        index_size,
+        repeats_number
+    );
+
+    finalize_counts(
+        score_pvalues_ptr,
+        score_permutations_ptr,
+        sources_size,
+        repeats_number
+    );
+    
+    delete[] grouped_ptr;
+    if (correlation == SPEARMAN) {
+        delete[] order_ptr;
+    }
+
+    return std::tuple<
+        NumPyFloatArray, NumPyFloatArray, NumPyFloatArray,
+        NumPyFloatArray, NumPyFloatArray, NumPyIntArray,
+        NumPyIntArray, NumPyFloatArray, NumPyFloatArray,
+        NumPyIntArray
+    >(
+        ref_corrs, exp_corrs, stat,
+        pvalue, boot_pvalue, permutations,
+        sources, scores, score_pvalues,
+        score_permutations
+    );
+}
+
+int read_contrasts(
+    const std::vector<NumPyIntArray> &group_indexes,
+    const NumPyIntArray &reference_groups,
+    const NumPyIntArray &experimental_groups,
+    int sample_size,
+    std::vector<int *> &group_ptrs,
+    std::vector<int> &group_sizes,
+    std::vector<int> &labels,
+    std::vector<int> &ref_groups,
+    std::vector<int> &exp_groups
+) {
+    /* Reads sample indexes of the groups and the contrasts
+     * (pairs of group numbers). Samples are labeled by their
+     * groups (see "label_samples"), so the groups have to be
+     * disjoint. Returns the number of contrasts */
+
+    int group_num = group_indexes.size();
+    
+    group_ptrs.resize(group_num);
+    group_sizes.resize(group_num);
+    labels.assign(sample_size, -1);
+    for (int g = 0; g < group_num; ++g) {
+        py::buffer_info group_buf = group_indexes[g].request();
+        group_ptrs[g] = (int *) group_buf.ptr;
+        group_sizes[g] = group_buf.shape[0];
+
+        for (int i = 0; i < group_sizes[g]; ++i) {
+            int sample = group_ptrs[g][i];
+            if ((sample < 0) || (sample >= sample_size)) {
+                throw std::runtime_error("Sample index is out of range");
+            }
+            
+            if (labels[sample] != -1) {
+                throw std::runtime_error("Groups must not overlap");
+            }
+
+            labels[sample] = g;
+        }
+    }
+
+    py::buffer_info ref_group_buf = reference_groups.request();
+    py::buffer_info exp_group_buf = experimental_groups.request();
+    if (ref_group_buf.size != exp_group_buf.size) {
+        throw std::runtime_error("Contrast shapes must match");
+    }
+
+    int contrast_num = ref_group_buf.shape[0];
+    int *ref_group_ptr = (int *) ref_group_buf.ptr;
+    int *exp_group_ptr = (int *) exp_group_buf.ptr;
+    
+    ref_groups.assign(ref_group_ptr, ref_group_ptr + contrast_num);
+    exp_groups.assign(exp_group_ptr, exp_group_ptr + contrast_num);
+    for (int c = 0; c < contrast_num; ++c) {
+        if ((ref_groups[c] < 0) || (ref_groups[c] >= group_num) ||
+                (exp_groups[c] < 0) || (exp_groups[c] >= group_num)) {
+            throw std::runtime_error("Contrast group is out of range");
+        }
+    }
+
+    return contrast_num;
+}
+
+int group_positions(
+    std::vector<int *> &group_ptrs,
+    std::vector<int> &group_sizes,
+    int sample_size,
+    std::vector<int> &offsets,
+    std::vector<int> &positions
+) {
+    /* Columns of the samples when all the groups are gathered
+     * one after another (see "group_columns"), group "g" starts
+     * at column "offsets[g]". The groups are disjoint (see
+     * "read_contrasts") */
+
+    int group_num = group_ptrs.size();
+    
+    offsets.assign(group_num, 0);
+    positions.assign(sample_size, -1);
+    int offset = 0;
+    for (int g = 0; g < group_num; ++g) {
+        offsets[g] = offset;
+        for (int i = 0; i < group_sizes[g]; ++i) {
+            positions[group_ptrs[g][i]] = offset + i;
+        }
+        offset += group_sizes[g];
+    }
+
+    return 0;
+}
+
+std::tuple<
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyIntArray
+> ztest_pipeline_contrasts(
+    const NumPyFloatArray &data,
+    const NumPyIntArray &source_indexes,
+    const NumPyIntArray &target_indexes,
+    const std::vector<NumPyIntArray> &group_indexes,
+    const NumPyIntArray &reference_groups,
+    const NumPyIntArray &experimental_groups,
+    bool exhaustive,
+    const std::string correlation,
+    const std::string alternative,
+    int repeats_number,
+    int process_num,
+    int stop_exceedances
+) {
+    /* Z-tests of several contrasts (pairs of sample groups)
+     * in one pass. Correlations of every group are computed
+     * once and shared by its contrasts. Permuted groups depend
+     * on the group sizes only (all samples are shuffled by the
+     * same seeded generator), so contrasts of equal sizes share
+     * permuted statistics and differ only in the observed ones.
+     * Results of a contrast are the same as of the single
+     * pipeline. Correlations are (group, pair) matrices, the
+     * rest are (contrast, pair) ones, all are flattened. In the
+     * exhaustive mode all pairs of rows are tested */
+
+    py::buffer_info data_buf = data.request();
+    float *data_ptr = (float *) data_buf.ptr;
+    int data_len    = data_buf.shape[0];
+    int sample_size = data_buf.shape[1];
+
+    py::buffer_info source_ind_buf = source_indexes.request();
+    int *source_ind_ptr = (int *) source_ind_buf.ptr;
+    
+    py::buffer_info target_ind_buf = target_indexes.request();
+    int *target_ind_ptr = (int *) target_ind_buf.ptr;
+    
+    int64_t pairs_num = source_ind_buf.shape[0];
+    if (exhaustive) {
+        pairs_num = (int64_t) data_len * (data_len - 1) / 2;
+    }
+
+    std::vector<int *> group_ptrs;
+    std::vector<int> group_sizes;
+    std::vector<int> labels;
+    std::vector<int> ref_groups;
+    std::vector<int> exp_groups;
+    int contrast_num = read_contrasts(
+        group_indexes,
+        reference_groups,
+        experimental_groups,
+        sample_size,
+        group_ptrs,
+        group_sizes,
+        labels,
+        ref_groups,
+        exp_groups
+    );
+    int group_num = group_ptrs.size();
+
+    if (process_num <= 0) {    
+        throw std::runtime_error("Process number error");
+    }
+
+    NumPyFloatArray corrs = NumPyFloatArray(group_num * pairs_num);
+    float *corrs_ptr = (float *) corrs.request().ptr;
+
+    NumPyFloatArray stat = NumPyFloatArray(contrast_num * pairs_num);
+    float *stat_ptr = (float *) stat.request().ptr;
+    
+    NumPyFloatArray pvalue = NumPyFloatArray(contrast_num * pairs_num);
+    float *pvalue_ptr = (float *) pvalue.request().ptr;
+    
+    NumPyFloatArray boot_pvalue = NumPyFloatArray(contrast_num * pairs_num);
+    float *boot_pvalue_ptr = (float *) boot_pvalue.request().ptr;
+    
+    NumPyIntArray permutations = NumPyIntArray(contrast_num * pairs_num);
+    int *permutations_ptr = (int *) permutations.request().ptr;
+
+    std::fill(boot_pvalue_ptr, boot_pvalue_ptr + contrast_num * pairs_num, 0);
+    std::fill(permutations_ptr, permutations_ptr + contrast_num * pairs_num, 0);
+
+    // Grouped columns (ranks in the spearman case) of the used
+    // rows only (see "ztest_pipeline_indexed"), they are gathered
+    // unless all pairs are computed by the blocked engine
+    int row_num = data_len;
+    std::vector<float> columns;
+    std::vector<int> order;
+    std::vector<int> data_rows;
+    std::vector<int> compact_sources;
+    std::vector<int> compact_targets;
+    if (!exhaustive) {
+        row_num = compact_rows(
+            source_ind_ptr,
+            target_ind_ptr,
+            pairs_num,
+            data_len,
+            data_rows,
+            compact_sources,
+            compact_targets
+        );
+        source_ind_ptr = compact_sources.data();
+        target_ind_ptr = compact_targets.data();
+    }
+
+    if (!exhaustive || (correlation == SPEARMAN) || (stop_exceedances > 0)) {
+        columns.resize((int64_t) row_num * sample_size);
+    }
+    if (correlation == SPEARMAN) {
+        order.resize((int64_t) row_num * sample_size);
+    }
+
+    std::vector<int> rows(row_num);
+    range(rows.data(), row_num);
+    
+    ThreadPool pool(process_num);
+    
+    if (correlation == SPEARMAN) {
+        argsort_data(
+            data_ptr,
+            order.data(),
+            sample_size,
+            row_num,
+            pool,
+            exhaustive ? nullptr : data_rows.data()
+        );
+    }
+    
+    // Observed correlations, all groups are ranked at once.
+    // Unless "exhaustive" the groups are gathered one after
+    // another, group "g" starts at column "offsets[g]"
+    std::vector<int> offsets;
+    std::vector<int> positions;
+    group_positions(
+        group_ptrs,
+        group_sizes,
+        sample_size,
+        offsets,
+        positions
+    );
+
+    float *dpr = data_ptr;
+    if (correlation == SPEARMAN) {
+        rank_presorted(
+            order.data(),
+            columns.data(),
+            sample_size,
+            rows.size(),
+            pool,
+            labels.data(),
+            group_num,
+            rows.data(),
+            exhaustive ? nullptr : positions.data()
+        );
+
+        dpr = columns.data();
+    } else if (!exhaustive) {
+        for (int g = 0; g < group_num; ++g) {
+            group_columns(
+                data_ptr,
+                sample_size,
+                columns.data() + offsets[g],
+                rows.size(),
+                pool,
+                group_ptrs[g],
+                group_sizes[g],
+                nullptr,
+                0,
+                rows.data(),
+                data_rows.data()
+            );
+        }
+
+        dpr = columns.data();
+    }
+
+    for (int g = 0; g < group_num; ++g) {
+        float *gcp = corrs_ptr + g * pairs_num;
+        
+        if (exhaustive) {
+            correlation_blocked(
+                dpr,
+                sample_size,
+                data_len,
+                gcp,
+                pool,
+                group_ptrs[g],
+                group_sizes[g]
+            );
+            continue;
+        }
+        
+        pool.run(
+            "correlation",
+            pairs_num,
+            [&](int64_t left_border, int64_t right_border) {
+                pearsonr(
+                    dpr + offsets[g],
+                    sample_size,
+                    source_ind_ptr,
+                    target_ind_ptr,
+                    gcp,
+                    left_border,
+                    right_border,
+                    pairs_num,
+                    nullptr,
+                    group_sizes[g]
+                );
+            }
+        );
+    }
+
+    for (int c = 0; c < contrast_num; ++c) {
+        int rg = ref_groups[c];
+        int eg = exp_groups[c];
+
+        pool.run(
+            "ztest",
+            pairs_num,
+            [&](int64_t left_border, int64_t right_border) {
+                ztest_unsized(
+                    corrs_ptr + rg * pairs_num, group_sizes[rg],
+                    corrs_ptr + eg * pairs_num, group_sizes[eg],
+                    stat_ptr + c * pairs_num,
+                    pvalue_ptr + c * pairs_num,
+                    left_border, right_border,
+                    correlation,
+                    alternative
+                );
+            }
+        );
+    }
+
+    // Permutations are done by classes of contrasts
+    std::vector<int> ref_sizes(contrast_num);
+    std::vector<int> exp_sizes(contrast_num);
+    for (int c = 0; c < contrast_num; ++c) {
+        ref_sizes[c] = group_sizes[ref_groups[c]];
+        exp_sizes[c] = group_sizes[exp_groups[c]];
+    }
+
+    std::vector<std::vector<int>> classes;
+    if (repeats_number > 0) {
+        contrast_classes(
+            ref_sizes.data(),
+            exp_sizes.data(),
+            contrast_num,
+            classes
+        );
+    }
+
+    std::vector<float> boot_ref_corrs;
+    std::vector<float> boot_exp_corrs;
+    std::vector<float> boot_stat;
+    if (classes.size() > 0) {
+        boot_ref_corrs.resize(pairs_num);
+        boot_exp_corrs.resize(pairs_num);
+        boot_stat.resize(pairs_num);
+    }
+
+    std::cout << "Permutation progress: ";
+    progressbar bar(classes.size() * repeats_number + 1);
+    bar.update();
+    
+    std::vector<int> groups(sample_size);
+    std::vector<int> indexes(sample_size);
+    for (auto &members : classes) {
+        int ref_ind_size = ref_sizes[members[0]];
+        int exp_ind_size = exp_sizes[members[0]];
+        
+        std::vector<int> boot_ref_ind(ref_ind_size);
+        std::vector<int> boot_exp_ind(exp_ind_size);
+        
+        // Every class starts from the same generator state
+        // as a single pipeline
+        range(indexes.data(), sample_size);
+        std::mt19937 random_gen(SEED);
+
+        // Active pairs are undecided for any of the class
+        // contrasts, they are computed in the indexed mode
+        // (see "ztest_pipeline_exhaustive")
+        std::vector<int64_t> active;
+        std::vector<int> active_sources;
+        std::vector<int> active_targets;
+        
+        int64_t active_size = pairs_num;
+        bool indexed = !exhaustive;
+        if (indexed || (stop_exceedances > 0)) {
+            active.resize(pairs_num);
+            range(active.data(), pairs_num);
+        }
+        if (indexed) {
+            active_sources.assign(source_ind_ptr, source_ind_ptr + pairs_num);
+            active_targets.assign(target_ind_ptr, target_ind_ptr + pairs_num);
+        }
+        
+        rows.resize(row_num);
+        range(rows.data(), row_num);
+
+        for (int r = 1; r < repeats_number + 1; ++r) {
+            if (PyErr_CheckSignals() != 0) {
+                throw py::error_already_set();
+            }
+
+            if (active_size == 0) {
+                break;
+            }
+
+            std::shuffle(indexes.begin(), indexes.end(), random_gen);
+            for (int i = 0; i < ref_ind_size; ++i) {
+                boot_ref_ind[i] = indexes[i];
+            }
+            for (int i = 0; i < exp_ind_size; ++i) {
+                boot_exp_ind[i] = indexes[ref_ind_size + i];
+            }
+
+            dpr = permuted_data(
+                data_ptr,
+                order.data(),
+                columns.data(),
+                sample_size,
+                rows,
+                exhaustive ? nullptr : data_rows.data(),
+                boot_ref_ind.data(),
+                ref_ind_size,
+                boot_exp_ind.data(),
+                exp_ind_size,
+                groups,
+                positions,
+                pool,
+                correlation,
+                indexed
+            );
+
+            if (!indexed) {
+                ztest_pipeline_blocked(
+                    dpr,
+                    sample_size,
+                    data_len,
+                    boot_ref_ind.data(),
+                    boot_exp_ind.data(),
+                    ref_ind_size,
+                    exp_ind_size,
+                    boot_ref_corrs.data(),
+                    boot_exp_corrs.data(),
+                    boot_stat.data(),
+                    nullptr,
+                    pool,
+                    correlation,
+                    alternative
+                );
+            } else {
+                pool.run(
+                    "pipeline",
+                    active_size,
+                    [&](int64_t left_border, int64_t right_border) {
+                        ztest_pipeline(
+                            dpr,
+                            sample_size,
+                            active_sources.data(),
+                            active_targets.data(),
+                            left_border,
+                            right_border,
+                            active_size,
+                            nullptr,
+                            nullptr,
+                            ref_ind_size,
+                            exp_ind_size,
+                            boot_ref_corrs.data(),
+                            boot_exp_corrs.data(),
+                            boot_stat.data(),
+                            nullptr,
+                            correlation,
+                            alternative
+                        );
+                    }
+                );
+            }
+
+            pool.run(
+                "count",
+                active_size,
+                [&](int64_t left_border, int64_t right_border) {
+                    for (int64_t k = left_border; k < right_border; ++k) {
+                        int64_t i = active.empty() ? k : active[k];
+                        float b = indexed ? boot_stat[k] : boot_stat[i];
+
+                        for (int c : members) {
+                            int64_t j = c * pairs_num + i;
+                            if (permutations_ptr[j] > 0) {
+                                continue;
+                            }
+
+                            float s = stat_ptr[j];
+                            if ((alternative == TWO_SIDED) &&
+                                    (std::abs(s) <= std::abs(b))) {
+                                boot_pvalue_ptr[j] += 1;
+                            }
+
+                            if ((alternative == LESS) &&
+                                    (s <= b)) {
+                                boot_pvalue_ptr[j] += 1;
+                            }
+                            
+                            if ((alternative == GREATER) &&
+                                    (s >= b)) {
+                                boot_pvalue_ptr[j] += 1;
+                            }
+                        }
+                    }
+                }
+            );
+
+            int64_t decided_size = retire_contrasts(
+                active.data(),
+                indexed ? active_sources.data() : nullptr,
+                indexed ? active_targets.data() : nullptr,
+                active_size,
+                pairs_num,
+                members.data(),
+                members.size(),
+                boot_pvalue_ptr,
+                permutations_ptr,
+                stop_exceedances,
+                r
+            );
+
+            if (decided_size < active_size) {
+                active_size = decided_size;
+
+                if (!indexed && active_size < INDEXED_SHARE * pairs_num &&
+                        active_size < INT32_MAX) {
+                    indexed = true;
+                    active_sources.resize(active_size);
+                    active_targets.resize(active_size);
+                    
+                    for (int64_t k = 0; k < active_size; ++k) {
+                        std::pair<int, int> paired_ind =
+                            paired_index(active[k], data_len);
+                        active_sources[k] = paired_ind.first;
+                        active_targets[k] = paired_ind.second;
+                    }
+                }
+
+                if (indexed) {
+                    used_rows(
+                        active_sources.data(),
+                        active_targets.data(),
+                        active_size,
+                        row_num,
+                        rows
+                    );
+                }
+            }
+
+            bar.update();
+        }
+    }
+    std::cout << "\n";
+    last_statistics = pool.statistics();
+    
+    for (int c = 0; c < contrast_num; ++c) {
+        finalize_counts(
+            boot_pvalue_ptr + c * pairs_num,
+            permutations_ptr + c * pairs_num,
+            pairs_num,
+            repeats_number
+        );
+    }
+
+    return std::tuple<
+        NumPyFloatArray, NumPyFloatArray, NumPyFloatArray,
+        NumPyFloatArray, NumPyIntArray
+    >(
+        corrs, stat, pvalue,
+        boot_pvalue, permutations
+    );
+}
+
+std::tuple<
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyIntArray
+> ztest_pipeline_contrasts_indexed(
+    const NumPyFloatArray &data,
+    const NumPyIntArray &source_indexes,
+    const NumPyIntArray &target_indexes,
+    const std::vector<NumPyIntArray> &group_indexes,
+    const NumPyIntArray &reference_groups,
+    const NumPyIntArray &experimental_groups,
+    const std::string correlation=SPEARMAN,
+    const std::string alternative=TWO_SIDED,
+    int repeats_number=REPEATS_NUMBER,
+    int process_num=1,
+    int stop_exceedances=0
+) {
+    return ztest_pipeline_contrasts(
+        data,
+        source_indexes,
+        target_indexes,
+        group_indexes,
+        reference_groups,
+        experimental_groups,
+        false,
+        correlation,
+        alternative,
+        repeats_number,
+        process_num,
+        stop_exceedances
+    );
+}
+
+std::tuple<
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyIntArray
+> ztest_pipeline_contrasts_exhaustive(
+    const NumPyFloatArray &data,
+    const std::vector<NumPyIntArray> &group_indexes,
+    const NumPyIntArray &reference_groups,
+    const NumPyIntArray &experimental_groups,
+    const std::string correlation=SPEARMAN,
+    const std::string alternative=TWO_SIDED,
+    int repeats_number=REPEATS_NUMBER,
+    int process_num=1,
+    int stop_exceedances=0
+) {
+    NumPyIntArray no_indexes = NumPyIntArray(0);
+    
+    return ztest_pipeline_contrasts(
+        data,
+        no_indexes,
+        no_indexes,
+        group_indexes,
+        reference_groups,
+        experimental_groups,
+        true,
+        correlation,
+        alternative,
+        repeats_number,
+        process_num,
+        stop_exceedances
+    );
+}
+
+std::tuple<
+    NumPyIntArray,
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyIntArray
+> score_pipeline_contrasts(
+    const NumPyFloatArray &data,
+    const NumPyIntArray &source_indexes,
+    const NumPyIntArray &target_indexes,
+    const std::vector<NumPyIntArray> &group_indexes,
+    const NumPyIntArray &reference_groups,
+    const NumPyIntArray &experimental_groups,
+    bool exhaustive,
+    const std::string correlation,
+    const std::string score,
+    const std::string alternative,
+    int repeats_number,
+    int process_num,
+    int stop_exceedances
+) {
+    /* Score analogue of "ztest_pipeline_contrasts": group
+     * correlations are shared by the contrasts, permuted
+     * scores by the contrasts of equal group sizes. Edges
+     * have to be sorted by source. Scores are (contrast,
+     * source) matrices, they are flattened. In the
+     * exhaustive mode every row is a source paired with
+     * all other rows */
+
+    py::buffer_info data_buf = data.request();
+    float *data_ptr = (float *) data_buf.ptr;
+    int data_len    = data_buf.shape[0];
+    int sample_size = data_buf.shape[1];
+    
+    py::buffer_info source_ind_buf = source_indexes.request();
+    int *source_ind_ptr = (int *) source_ind_buf.ptr;
+    
+    py::buffer_info target_ind_buf = target_indexes.request();
+    int *target_ind_ptr = (int *) target_ind_buf.ptr;
+    
+    int64_t pairs_num = (int64_t) data_len * (data_len - 1) / 2;
+    int64_t edges_num = source_ind_buf.shape[0];
+    if (exhaustive) {
+        edges_num = pairs_num;
+    }
+
+    std::vector<int *> group_ptrs;
+    std::vector<int> group_sizes;
+    std::vector<int> labels;
+    std::vector<int> ref_groups;
+    std::vector<int> exp_groups;
+    int contrast_num = read_contrasts(
+        group_indexes,
+        reference_groups,
+        experimental_groups,
+        sample_size,
+        group_ptrs,
+        group_sizes,
+        labels,
+        ref_groups,
+        exp_groups
+    );
+    int group_num = group_ptrs.size();
+
+    // Edges of the sources (see "_score_pipeline_indexed")
+    std::vector<int> _sources;
+    std::vector<int> starts;
+    std::vector<int> ends;
+    if (exhaustive) {
+        _sources.resize(data_len);
+        range(_sources.data(), data_len);
+    }
+
+    for (int i = 0; i < edges_num && !exhaustive;) {
+        int start = i;
+        int end = i;
+        
+        while ((end < edges_num) &&
+                (source_ind_ptr[start] == source_ind_ptr[end])) {
+            ++end;
+        }
+
+        _sources.push_back(source_ind_ptr[start]);
+        starts.push_back(start);
+        ends.push_back(end);
+        
+        i = end;
+    }
+    
+    int sources_size = _sources.size();
+
+    std::vector<Score> parsed_scores = parse_scores(score);
+    if (parsed_scores.size() != 1) {
+        throw std::runtime_error(
+            "Several scores are not supported by this pipeline"
+        );
+    }
+
+    NumPyIntArray sources = NumPyIntArray(sources_size);
+    int *sources_ptr = (int *) sources.request().ptr;
+    std::copy(_sources.begin(), _sources.end(), sources_ptr);
+
+    NumPyFloatArray scores = NumPyFloatArray(contrast_num * sources_size);
+    float *scores_ptr = (float *) scores.request().ptr;
+    
+    NumPyFloatArray pvalues = NumPyFloatArray(contrast_num * sources_size);
+    float *pvalues_ptr = (float *) pvalues.request().ptr;
+    
+    NumPyIntArray permutations = NumPyIntArray(contrast_num * sources_size);
+    int *permutations_ptr = (int *) permutations.request().ptr;
+
+    std::fill(pvalues_ptr, pvalues_ptr + contrast_num * sources_size, 0);
+    std::fill(permutations_ptr, permutations_ptr + contrast_num * sources_size, 0);
+    
+    if (process_num > sources_size) {
+        process_num = sources_size;
+    }
+
+    if (process_num <= 0) {    
+        throw std::runtime_error("Process number error");
+    }
+
+    // Grouped columns (ranks in the spearman case) of the used
+    // rows only (see "ztest_pipeline_contrasts")
+    int row_num = data_len;
+    std::vector<float> columns;
+    std::vector<int> order;
+    std::vector<int> data_rows;
+    std::vector<int> compact_sources;
+    std::vector<int> compact_targets;
+    if (!exhaustive) {
+        row_num = compact_rows(
+            source_ind_ptr,
+            target_ind_ptr,
+            edges_num,
+            data_len,
+            data_rows,
+            compact_sources,
+            compact_targets
+        );
+        source_ind_ptr = compact_sources.data();
+        target_ind_ptr = compact_targets.data();
+    }
+
+    if (!exhaustive || (correlation == SPEARMAN) || (stop_exceedances > 0)) {
+        columns.resize((int64_t) row_num * sample_size);
+    }
+    if (correlation == SPEARMAN) {
+        order.resize((int64_t) row_num * sample_size);
+    }
+
+    std::vector<int> rows(row_num);
+    range(rows.data(), row_num);
+    
+    ThreadPool pool(process_num);
+    
+    if (correlation == SPEARMAN) {
+        argsort_data(
+            data_ptr,
+            order.data(),
+            sample_size,
+            row_num,
+            pool,
+            exhaustive ? nullptr : data_rows.data()
+        );
+    }
+    
+    bool absolute = false;
+    if (alternative == TWO_SIDED) {
+        absolute = true;
+    }
+
+    // Observed scores, all groups are ranked at once. Unless
+    // "exhaustive" the groups are gathered one after another
+    std::vector<int> offsets;
+    std::vector<int> positions;
+    group_positions(
+        group_ptrs,
+        group_sizes,
+        sample_size,
+        offsets,
+        positions
+    );
+
+    float *dpr = data_ptr;
+    if (correlation == SPEARMAN) {
+        rank_presorted(
+            order.data(),
+            columns.data(),
+            sample_size,
+            rows.size(),
+            pool,
+            labels.data(),
+            group_num,
+            rows.data(),
+            exhaustive ? nullptr : positions.data()
+        );
+
+        dpr = columns.data();
+    } else if (!exhaustive) {
+        for (int g = 0; g < group_num; ++g) {
+            group_columns(
+                data_ptr,
+                sample_size,
+                columns.data() + offsets[g],
+                rows.size(),
+                pool,
+                group_ptrs[g],
+                group_sizes[g],
+                nullptr,
+                0,
+                rows.data(),
+                data_rows.data()
+            );
+        }
+
+        dpr = columns.data();
+    }
+
+    std::vector<float> corrs(group_num * edges_num);
+    for (int g = 0; g < group_num; ++g) {
+        float *gcp = corrs.data() + g * edges_num;
+        
+        if (exhaustive) {
+            correlation_blocked(
+                dpr,
+                sample_size,
+                data_len,
+                gcp,
+                pool,
+                group_ptrs[g],
+                group_sizes[g]
+            );
+            continue;
+        }
+        
+        pool.run(
+            "correlation",
+            edges_num,
+            [&](int64_t left_border, int64_t right_border) {
+                pearsonr(
+                    dpr + offsets[g],
+                    sample_size,
+                    source_ind_ptr,
+                    target_ind_ptr,
+                    gcp,
+                    left_border,
+                    right_border,
+                    edges_num,
+                    nullptr,
+                    group_sizes[g]
+                );
+            }
+        );
+    }
+
+    std::vector<float> stat(edges_num);
+    for (int c = 0; c < contrast_num; ++c) {
+        int rg = ref_groups[c];
+        int eg = exp_groups[c];
+        float *scp = scores_ptr + c * sources_size;
+
+        pool.run(
+            "ztest",
+            edges_num,
+            [&](int64_t left_border, int64_t right_border) {
+                ztest_unsized(
+                    corrs.data() + rg * edges_num, group_sizes[rg],
+                    corrs.data() + eg * edges_num, group_sizes[eg],
+                    stat.data(), nullptr,
+                    left_border, right_border,
+                    correlation,
+                    TWO_SIDED
+                );
+            }
+        );
+
+        pool.run(
+            "score",
+            sources_size,
+            [&](int64_t left_border, int64_t right_border) {
+                if (exhaustive) {
+                    score_pipeline_exhaustive(
+                        stat.data(),
+                        sources_size,
+                        left_border,
+                        right_border,
+                        scp,
+                        sources_size,
+                        parsed_scores,
+                        alternative
+                    );
+                } else {
+                    _score(
+                        stat.data(),
+                        starts.data(),
+                        ends.data(),
+                        left_border,
+                        right_border,
+                        scp,
+                        sources_size,
+                        parsed_scores,
+                        absolute
+                    );
+                }
+            }
+        );
+    }
+    
+    std::vector<float>().swap(corrs);
+    std::vector<float>().swap(stat);
+
+    // Permutations are done by classes of contrasts
+    std::vector<int> ref_sizes(contrast_num);
+    std::vector<int> exp_sizes(contrast_num);
+    for (int c = 0; c < contrast_num; ++c) {
+        ref_sizes[c] = group_sizes[ref_groups[c]];
+        exp_sizes[c] = group_sizes[exp_groups[c]];
+    }
+
+    std::vector<std::vector<int>> classes;
+    if (repeats_number > 0) {
+        contrast_classes(
+            ref_sizes.data(),
+            exp_sizes.data(),
+            contrast_num,
+            classes
+        );
+    }
+
+    std::vector<float> boot_ref_corrs;
+    std::vector<float> boot_exp_corrs;
+    std::vector<float> boot_stat;
+    std::vector<float> boot_scores;
+    if (classes.size() > 0) {
+        boot_ref_corrs.resize(edges_num);
+        boot_exp_corrs.resize(edges_num);
+        boot_stat.resize(edges_num);
+        boot_scores.resize(sources_size);
+    }
+
+    std::cout << "Permutation progress: ";
+    progressbar bar(classes.size() * repeats_number + 1);
+    bar.update();
+    
+    std::vector<int> groups(sample_size);
+    std::vector<int> indexes(sample_size);
+    for (auto &members : classes) {
+        int ref_ind_size = ref_sizes[members[0]];
+        int exp_ind_size = exp_sizes[members[0]];
+        
+        std::vector<int> boot_ref_ind(ref_ind_size);
+        std::vector<int> boot_exp_ind(exp_ind_size);
+        
+        range(indexes.data(), sample_size);
+        std::mt19937 random_gen(SEED);
+
+        // Active sources are undecided for any of the class
+        // contrasts, the edges of the active sources are
+        // computed in the indexed mode (see the single
+        // score pipelines)
+        std::vector<int64_t> active(sources_size);
+        std::vector<int> active_sources;
+        std::vector<int> active_targets;
+        std::vector<int> active_starts;
+        std::vector<int> active_ends;
+        
+        range(active.data(), sources_size);
+        int active_size = sources_size;
+        int edges_size = 0;
+        bool indexed = !exhaustive;
+        
+        rows.resize(row_num);
+        range(rows.data(), row_num);
+        if (indexed) {
+            edges_size = compact_edges(
+                active.data(),
+                active_size,
+                source_ind_ptr,
+                target_ind_ptr,
+                starts.data(),
+                ends.data(),
+                active_sources,
+                active_targets,
+                active_starts,
+                active_ends
+            );
+            used_rows(
+                active_sources.data(),
+                active_targets.data(),
+                edges_size,
+                row_num,
+                rows
+            );
+        }
+
+        for (int r = 1; r < repeats_number + 1; ++r) {
+            if (PyErr_CheckSignals() != 0) {
+                throw py::error_already_set();
+            }
+
+            if (active_size == 0) {
+                break;
+            }
+
+            std::shuffle(indexes.begin(), indexes.end(), random_gen);
+            for (int i = 0; i < ref_ind_size; ++i) {
+                boot_ref_ind[i] = indexes[i];
+            }
+            for (int i = 0; i < exp_ind_size; ++i) {
+                boot_exp_ind[i] = indexes[ref_ind_size + i];
+            }
+
+            dpr = permuted_data(
+                data_ptr,
+                order.data(),
+                columns.data(),
+                sample_size,
+                rows,
+                exhaustive ? nullptr : data_rows.data(),
+                boot_ref_ind.data(),
+                ref_ind_size,
+                boot_exp_ind.data(),
+                exp_ind_size,
+                groups,
+                positions,
+                pool,
+                correlation,
+                indexed
+            );
+
+            if (!indexed) {
+                ztest_pipeline_blocked(
+                    dpr,
+                    sample_size,
+                    sources_size,
+                    boot_ref_ind.data(),
+                    boot_exp_ind.data(),
+                    ref_ind_size,
+                    exp_ind_size,
+                    boot_ref_corrs.data(),
+                    boot_exp_corrs.data(),
+                    boot_stat.data(),
+                    nullptr,
+                    pool,
+                    correlation,
+                    TWO_SIDED
+                );
+
+                pool.run(
+                    "score",
+                    sources_size,
+                    [&](int64_t left_border, int64_t right_border) {
+                        score_pipeline_exhaustive(
+                            boot_stat.data(),
+                            sources_size,
+                            left_border,
+                            right_border,
+                            boot_scores.data(),
+                            sources_size,
+                            parsed_scores,
+                            alternative
+                        );
+                    }
+                );
+            } else {
+                score_pipeline_balanced(
+                    dpr,
+                    sample_size,
+                    active_sources.data(),
+                    active_targets.data(),
+                    edges_size,
+                    nullptr,
+                    nullptr,
+                    ref_ind_size,
+                    exp_ind_size,
+                    boot_ref_corrs.data(),
+                    boot_exp_corrs.data(),
+                    boot_stat.data(),
+                    nullptr,
+                    active_starts.data(),
+                    active_ends.data(),
+                    active_size,
+                    boot_scores.data(),
+                    sources_size,
+                    parsed_scores,
+                    pool,
+                    correlation,
+                    alternative
+                );
+            }
+
+            for (int k = 0; k < active_size; ++k) {
+                int64_t i = active[k];
+                float b = indexed ? boot_scores[k] : boot_scores[i];
+
+                for (int c : members) {
+                    int64_t j = (int64_t) c * sources_size + i;
+                    if (permutations_ptr[j] > 0) {
+                        continue;
+                    }
+                    
+                    float s = scores_ptr[j];
+                    if (alternative == TWO_SIDED && 
+                            std::abs(s) <= std::abs(b)) {
+                        pvalues_ptr[j] += 1;
+                    }
+
+                    if (alternative == LESS &&
+                            s >= b) {
+                        pvalues_ptr[j] += 1;
+                    }
+
+                    if (alternative == GREATER &&
+                            s <= b) { 
+                        pvalues_ptr[j] += 1;
+                    }
+                }
+            }
+
+            int decided_size = retire_contrasts(
+                active.data(),
+                nullptr,
+                nullptr,
+                active_size,
+                sources_size,
+                members.data(),
+                members.size(),
+                pvalues_ptr,
+                permutations_ptr,
+                stop_exceedances,
+                r
+            );
+
+            if (decided_size < active_size) {
+                active_size = decided_size;
+
+                int64_t active_edges = (int64_t) active_size * (sources_size - 1);
+                if (!indexed && active_edges < INDEXED_SHARE * pairs_num &&
+                        active_edges < INT32_MAX) {
+                    indexed = true;
+                }
+
+                if (indexed) {
+                    if (exhaustive) {
+                        edges_size = complete_edges(
+                            active.data(),
+                            active_size,
+                            sources_size,
+                            active_sources,
+                            active_targets,
+                            active_starts,
+                            active_ends
+                        );
+                    } else {
+                        edges_size = compact_edges(
+                            active.data(),
+                            active_size,
+                            source_ind_ptr,
+                            target_ind_ptr,
+                            starts.data(),
+                            ends.data(),
+                            active_sources,
+                            active_targets,
+                            active_starts,
+                            active_ends
+                        );
+                    }
+                    used_rows(
+                        active_sources.data(),
+                        active_targets.data(),
+                        edges_size,
+                        row_num,
+                        rows
+                    );
+                }
+            }
+
+            bar.update();
+        }
+    }
+    std::cout << "\n";
+    last_statistics = pool.statistics();
+
+    for (int c = 0; c < contrast_num; ++c) {
+        finalize_counts(
+            pvalues_ptr + c * sources_size,
+            permutations_ptr + c * sources_size,
+            sources_size,
+            repeats_number
+        );
+    }
+
+    return std::tuple<
+        NumPyIntArray,
+        NumPyFloatArray,
+        NumPyFloatArray,
+        NumPyIntArray
+    >(
+        sources,
+        scores,
+        pvalues,
+        permutations
+    );
+}
+
+std::tuple<
+    NumPyIntArray,
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyIntArray
+> score_pipeline_contrasts_indexed(
+    const NumPyFloatArray &data,
+    const NumPyIntArray &source_indexes,
+    const NumPyIntArray &target_indexes,
+    const std::vector<NumPyIntArray> &group_indexes,
+    const NumPyIntArray &reference_groups,
+    const NumPyIntArray &experimental_groups,
+    const std::string correlation=SPEARMAN,
+    const std::string score=MEAN,
+    const std::string alternative=TWO_SIDED,
+    int repeats_number=REPEATS_NUMBER,
+    int process_num=1,
+    int stop_exceedances=0
+) {
+    return score_pipeline_contrasts(
+        data,
+        source_indexes,
+        target_indexes,
+        group_indexes,
+        reference_groups,
+        experimental_groups,
+        false,
+        correlation,
+        score,
+        alternative,
+        repeats_number,
+        process_num,
+        stop_exceedances
+    );
+}
+
+std::tuple<
+    NumPyIntArray,
+    NumPyFloatArray,
+    NumPyFloatArray,
+    NumPyIntArray
+> score_pipeline_contrasts_exhaustive(
+    const NumPyFloatArray &data,
+    const std::vector<NumPyIntArray> &group_indexes,
+    const NumPyIntArray &reference_groups,
+    const NumPyIntArray &experimental_groups,
+    const std::string correlation=SPEARMAN,
+    const std::string score=MEAN,
+    const std::string alternative=TWO_SIDED,
+    int repeats_number=REPEATS_NUMBER,
+    int process_num=1,
+    int stop_exceedances=0
+) {
+    NumPyIntArray no_indexes = NumPyIntArray(0);
+    
+    return score_pipeline_contrasts(
+        data,
+        no_indexes,
+        no_indexes,
+        group_indexes,
+        reference_groups,
+        experimental_groups,
+        true,
+        correlation,
+        score,
+        alternative,
+        repeats_number,
+        process_num,
+        stop_exceedances
     );
 }
 
@@ -1034,4 +4486,10 @@ PYBIND11_MODULE(pipelines, m) {
     m.def("_score_pipeline_indexed", &_score_pipeline_indexed);
     m.def("_ztest_pipeline_exhaustive", &ztest_pipeline_exhaustive);
     m.def("_score_pipeline_exhaustive", &_score_pipeline_exhaustive);
+    m.def("_ztest_pipeline_contrasts_indexed", &ztest_pipeline_contrasts_indexed);
+    m.def("_ztest_pipeline_contrasts_exhaustive", &ztest_pipeline_contrasts_exhaustive);
+    m.def("_score_pipeline_contrasts_indexed", &score_pipeline_contrasts_indexed);
+    m.def("_score_pipeline_contrasts_exhaustive", &score_pipeline_contrasts_exhaustive);
+    m.def("_ztest_score_pipeline_indexed", &ztest_score_pipeline_indexed);
+    m.def("_pipeline_statistics", &pipeline_statistics);
 }
@@ -5,6 +5,7 @@
 
 #include <cmath>
 #include <thread>
+#include <functional>
 #include <string>
 #include <utility>
 #include <queue>
@@ -80,7 +81,11 @@ std::pair<
         sources_ptr[j] = _sources[j]; 
     }
     
-    NumPyFloatArray scores = NumPyFloatArray(sources_size);
+    // Several scores are stored one after another
+    std::vector<Score> parsed_scores = parse_scores(score);
+    NumPyFloatArray scores = NumPyFloatArray(
+        parsed_scores.size() * sources_size
+    );
     float *scores_ptr = (float *) scores.request().ptr;
     
     if (process_num > sources_size) {
@@ -100,32 +105,19 @@ std::pair<
             right_border = starts.size();
         }
 
-        if (score == MEAN) {
-            std::thread thr(_mean,
-                data_ptr,
-                starts.data(),
-                ends.data(),
-                left_border,
-                right_border,
-                scores_ptr,
-                false
-            );
-            
-            threads.push(move(thr));
-        } else if (score == MEDIAN) {
-            std::thread thr(_quantile,
-                data_ptr,
-                starts.data(),
-                ends.data(),
-                left_border,
-                right_border,
-                scores_ptr,
-                QMEDIAN,
-                false
-            );
-
-            threads.push(move(thr));
-        }    
+        std::thread thr(_score,
+            data_ptr,
+            starts.data(),
+            ends.data(),
+            left_border,
+            right_border,
+            scores_ptr,
+            sources_size,
+            std::cref(parsed_scores),
+            false
+        );
+
+        threads.push(move(thr));
     }
 
     while (!threads.empty()) {
@@ -158,7 +150,11 @@ NumPyFloatArray score_exhaustive(
         throw std::runtime_error("Process number error");
     } 
     
-    NumPyFloatArray scores = NumPyFloatArray(sources_size);
+    // Several scores are stored one after another
+    std::vector<Score> parsed_scores = parse_scores(score);
+    NumPyFloatArray scores = NumPyFloatArray(
+        parsed_scores.size() * sources_size
+    );
     float *scores_ptr = (float *) scores.request().ptr;
     
     if (process_num > sources_size) {
@@ -178,30 +174,18 @@ NumPyFloatArray score_exhaustive(
             right_border = sources_size;
         }
 
-        if (score == MEAN) {
-            std::thread thr(__mean,
-                data_ptr,
-                sources_size,
-                left_border,
-                right_border,
-                scores_ptr,
-                false
-            );
-            
-            threads.push(move(thr));
-        } else if (score == MEDIAN) {
-            std::thread thr(__quantile,
-                data_ptr,
-                sources_size,
-                left_border,
-                right_border,
-                scores_ptr,
-                QMEDIAN,
-                false
-            );
-
-            threads.push(move(thr));
-        }    
+        std::thread thr(__score,
+            data_ptr,
+            sources_size,
+            left_border,
+            right_border,
+            scores_ptr,
+            sources_size,
+            std::cref(parsed_scores),
+            false
+        );
+
+        threads.push(move(thr));
     }
 
     while (!threads.empty()) {
@@ -3,6 +3,7 @@
 #include <pybind11/stl.h>
 
 #include <cmath>
+#include <limits>
 #include <thread>
 #include <string>
 #include <utility>
@@ -13,6 +14,7 @@
 #include <random>
 #include <vector>
 
+#include "../pool/pool.h"
 #include "../tests/tests.h"
 
 namespace py = pybind11;
@@ -20,6 +22,8 @@ namespace py = pybind11;
 using NumPyFloatArray = py::array_t<float, py::array::c_style>;
 using NumPyDoubleArray = py::array_t<double, py::array::c_style>;
 using NumPyIntArray = py::array_t<int32_t, py::array::c_style>;
+using NumPyLongArray = py::array_t<int64_t, py::array::c_style>;
+using NumPyByteArray = py::array_t<uint8_t, py::array::c_style>;
 
 
 std::pair<NumPyFloatArray, NumPyFloatArray> _ztest_sized(
@@ -34,7 +38,7 @@ std::pair<NumPyFloatArray, NumPyFloatArray> _ztest_sized(
     py::buffer_info first_rs_buf = first_rs.request();
     py::buffer_info second_rs_buf = second_rs.request();
     
-    int rs_number = first_rs_buf.shape[0];
+    int64_t rs_number = first_rs_buf.shape[0];
     if (first_rs_buf.size != second_rs_buf.size) {
         throw std::runtime_error("Correlation shapes must match");
     }
@@ -54,10 +58,10 @@ std::pair<NumPyFloatArray, NumPyFloatArray> _ztest_sized(
     float *pvalue_ptr = (float *) pvalue.request().ptr;
     
     std::queue<std::thread> threads;
-    int batch_size = rs_number / process_num;
+    int64_t batch_size = rs_number / process_num;
     for (int i = 0; i < process_num; ++i) {
-        int left_border = i * batch_size;
-        int right_border = (i + 1) * batch_size;
+        int64_t left_border = i * batch_size;
+        int64_t right_border = (i + 1) * batch_size;
         if (i == process_num - 1) {
             right_border = rs_number;
         }
@@ -99,7 +103,7 @@ std::pair<NumPyFloatArray, NumPyFloatArray> _ztest_unsized(
     py::buffer_info first_rs_buf = first_rs.request();
     py::buffer_info second_rs_buf = second_rs.request();
     
-    int rs_number = first_rs_buf.shape[0];
+    int64_t rs_number = first_rs_buf.shape[0];
     if (first_rs_buf.size != second_rs_buf.size) {
         throw std::runtime_error("Correlation shapes must match");
     }
@@ -119,10 +123,10 @@ std::pair<NumPyFloatArray, NumPyFloatArray> _ztest_unsized(
     float *pvalue_ptr = (float *) pvalue.request().ptr;
     
     std::queue<std::thread> threads;
-    int batch_size = rs_number / process_num;
+    int64_t batch_size = rs_number / process_num;
     for (int i = 0; i < process_num; ++i) {
-        int left_border = i * batch_size;
-        int right_border = (i + 1) * batch_size;
+        int64_t left_border = i * batch_size;
+        int64_t right_border = (i + 1) * batch_size;
         if (i == process_num - 1) {
             right_border = rs_number;
         }
@@ -154,7 +158,409 @@ std::pair<NumPyFloatArray, NumPyFloatArray> _ztest_unsized(
     >(stat, pvalue);
 }
 
+std::tuple<
+    NumPyLongArray,
+    NumPyFloatArray,
+    NumPyFloatArray
+> _fdr_histogram(
+    const NumPyFloatArray &pvalues,
+    int process_num=1
+) {
+    /* Histogram of p-values over the FDR buckets:
+     * the number, minimum and maximum of p-values
+     * in every bucket. Blocks of p-values are counted
+     * in parallel and merged */
+
+    py::buffer_info pvalue_buf = pvalues.request();
+    int64_t pvalues_size = pvalue_buf.size;
+    float *pvalue_ptr = (float *) pvalue_buf.ptr;
+    
+    if (process_num <= 0) {    
+        throw std::runtime_error("Process number error");
+    }
+
+    NumPyLongArray counts = NumPyLongArray(FDR_BUCKETS_NUMBER);
+    int64_t *counts_ptr = (int64_t *) counts.request().ptr;
+    
+    NumPyFloatArray mins = NumPyFloatArray(FDR_BUCKETS_NUMBER);
+    float *min_ptr = (float *) mins.request().ptr;
+    
+    NumPyFloatArray maxs = NumPyFloatArray(FDR_BUCKETS_NUMBER);
+    float *max_ptr = (float *) maxs.request().ptr;
+
+    {
+        py::gil_scoped_release release;
+
+        int64_t block_num = std::max<int64_t>(
+            std::min<int64_t>(process_num, pvalues_size), 1
+        );
+        std::vector<int64_t> block_counts(
+            block_num * FDR_BUCKETS_NUMBER, 0
+        );
+        std::vector<float> block_mins(
+            block_num * FDR_BUCKETS_NUMBER,
+            std::numeric_limits<float>::infinity()
+        );
+        std::vector<float> block_maxs(
+            block_num * FDR_BUCKETS_NUMBER,
+            -std::numeric_limits<float>::infinity()
+        );
+
+        ThreadPool pool(process_num);
+        pool.run(
+            "fdr_histogram",
+            block_num,
+            [&](int64_t left_border, int64_t right_border) {
+                for (int64_t k = left_border; k < right_border; ++k) {
+                    fdr_histogram(
+                        pvalue_ptr,
+                        k * pvalues_size / block_num,
+                        (k + 1) * pvalues_size / block_num,
+                        block_counts.data() + k * FDR_BUCKETS_NUMBER,
+                        block_mins.data() + k * FDR_BUCKETS_NUMBER,
+                        block_maxs.data() + k * FDR_BUCKETS_NUMBER
+                    );
+                }
+            },
+            1
+        );
+
+        for (int64_t b = 0; b < FDR_BUCKETS_NUMBER; ++b) {
+            counts_ptr[b] = 0;
+            min_ptr[b] = std::numeric_limits<float>::infinity();
+            max_ptr[b] = -std::numeric_limits<float>::infinity();
+            
+            for (int64_t k = 0; k < block_num; ++k) {
+                int64_t i = k * FDR_BUCKETS_NUMBER + b;
+                counts_ptr[b] += block_counts[i];
+                min_ptr[b] = std::min(min_ptr[b], block_mins[i]);
+                max_ptr[b] = std::max(max_ptr[b], block_maxs[i]);
+            }
+        }
+    }
+
+    return std::tuple<
+        NumPyLongArray,
+        NumPyFloatArray,
+        NumPyFloatArray
+    >(counts, mins, maxs);
+}
+
+std::pair<NumPyByteArray, float> _fdr_plan(
+    const NumPyLongArray &counts,
+    const NumPyFloatArray &mins,
+    const NumPyFloatArray &maxs,
+    float threshold=-1,
+    int64_t top_k=-1
+) {
+    if ((counts.size() != FDR_BUCKETS_NUMBER) ||
+            (mins.size() != FDR_BUCKETS_NUMBER) ||
+            (maxs.size() != FDR_BUCKETS_NUMBER)) {
+        throw std::runtime_error("Histogram shape error");
+    }
+
+    NumPyByteArray collect = NumPyByteArray(FDR_BUCKETS_NUMBER);
+    float tail = fdr_plan(
+        (int64_t *) counts.request().ptr,
+        (float *) mins.request().ptr,
+        (float *) maxs.request().ptr,
+        threshold,
+        top_k,
+        (uint8_t *) collect.request().ptr
+    );
+
+    return std::pair<NumPyByteArray, float>(collect, tail);
+}
+
+std::pair<NumPyLongArray, NumPyFloatArray> _fdr_collect(
+    const NumPyFloatArray &pvalues,
+    const NumPyByteArray &collect,
+    int64_t offset=0
+) {
+    /* Indexes (shifted by "offset") and values
+     * of p-values in the collected buckets */
+
+    py::buffer_info pvalue_buf = pvalues.request();
+    int64_t pvalues_size = pvalue_buf.size;
+    float *pvalue_ptr = (float *) pvalue_buf.ptr;
+    uint8_t *collect_ptr = (uint8_t *) collect.request().ptr;
+
+    int64_t collected_size = 0;
+    for (int64_t i = 0; i < pvalues_size; ++i) {
+        collected_size += collect_ptr[fdr_bucket(pvalue_ptr[i])];
+    }
+    
+    NumPyLongArray indexes = NumPyLongArray(collected_size);
+    int64_t *index_ptr = (int64_t *) indexes.request().ptr;
+    
+    NumPyFloatArray collected = NumPyFloatArray(collected_size);
+    float *collected_ptr = (float *) collected.request().ptr;
+
+    int64_t position = 0;
+    for (int64_t i = 0; i < pvalues_size; ++i) {
+        if (collect_ptr[fdr_bucket(pvalue_ptr[i])]) {
+            index_ptr[position] = offset + i;
+            collected_ptr[position] = pvalue_ptr[i];
+            position += 1;
+        }
+    }
+
+    return std::pair<NumPyLongArray, NumPyFloatArray>(
+        indexes, collected
+    );
+}
+
+std::pair<NumPyLongArray, NumPyFloatArray> _fdr_adjust(
+    const NumPyFloatArray &pvalues,
+    const NumPyLongArray &indexes,
+    const NumPyLongArray &counts,
+    const NumPyByteArray &collect,
+    float tail=1,
+    float threshold=-1,
+    int64_t top_k=-1,
+    int process_num=1
+) {
+    /* Benjamini-Hochberg adjustment of the p-values in
+     * the collected buckets. P-values are scattered into
+     * their buckets (a stable counting sort), every bucket
+     * is sorted on its own and the adjusted p-values are
+     * the suffix minimums of p * n / rank bounded by "tail".
+     * Returns indexes and adjusted p-values of the selected
+     * ranks in ascending order: all p-values, the "top_k"
+     * ones or the ones with adjusted p-value less than
+     * "threshold". Empty "indexes" denote 0, 1, ... */
+
+    py::buffer_info pvalue_buf = pvalues.request();
+    int64_t data_size = pvalue_buf.size;
+    float *pvalue_ptr = (float *) pvalue_buf.ptr;
+    
+    py::buffer_info index_buf = indexes.request();
+    int64_t *data_index_ptr = (int64_t *) index_buf.ptr;
+    if ((index_buf.size > 0) && (index_buf.size != data_size)) {
+        throw std::runtime_error("Index shapes must match");
+    }
+    if (index_buf.size == 0) {
+        data_index_ptr = nullptr;
+    }
+    
+    if ((counts.size() != FDR_BUCKETS_NUMBER) ||
+            (collect.size() != FDR_BUCKETS_NUMBER)) {
+        throw std::runtime_error("Histogram shape error");
+    }
+    int64_t *counts_ptr = (int64_t *) counts.request().ptr;
+    uint8_t *collect_ptr = (uint8_t *) collect.request().ptr;
+    
+    if (process_num <= 0) {    
+        throw std::runtime_error("Process number error");
+    }
+
+    // Ranks and positions of the collected buckets
+    std::vector<int64_t> ranks(FDR_BUCKETS_NUMBER, 0);
+    std::vector<int64_t> offsets(FDR_BUCKETS_NUMBER, 0);
+    std::vector<int64_t> buckets;
+    int64_t pvalues_size = 0;
+    int64_t collected_size = 0;
+    for (int64_t b = 0; b < FDR_BUCKETS_NUMBER; ++b) {
+        ranks[b] = pvalues_size;
+        offsets[b] = collected_size;
+        if (b < FDR_NAN_BUCKET) {
+            pvalues_size += counts_ptr[b];
+        }
+
+        if (collect_ptr[b] && (counts_ptr[b] > 0)) {
+            collected_size += counts_ptr[b];
+            buckets.push_back(b);
+        }
+    }
+    
+    int64_t nan_size = collect_ptr[FDR_NAN_BUCKET] ?
+        counts_ptr[FDR_NAN_BUCKET] : 0;
+    
+    NumPyLongArray sorted_indexes = NumPyLongArray(collected_size);
+    int64_t *sorted_index_ptr = (int64_t *) sorted_indexes.request().ptr;
+
+    NumPyFloatArray adjusted = NumPyFloatArray(collected_size);
+    float *adjusted_ptr = (float *) adjusted.request().ptr;
+    
+    int64_t selected_size = collected_size;
+    {
+        py::gil_scoped_release release;
+        
+        std::vector<float> sorted_pvalues(collected_size);
+        ThreadPool pool(process_num);
+
+        int64_t block_num = std::max<int64_t>(
+            std::min<int64_t>(process_num, data_size), 1
+        );
+        std::vector<int64_t> positions(
+            block_num * FDR_BUCKETS_NUMBER, 0
+        );
+
+        // Scatter: block counts, block positions, block writes
+        pool.run(
+            "fdr_count",
+            block_num,
+            [&](int64_t left_border, int64_t right_border) {
+                for (int64_t k = left_border; k < right_border; ++k) {
+                    int64_t *block_ptr = positions.data() +
+                        k * FDR_BUCKETS_NUMBER;
+                    for (int64_t i = k * data_size / block_num;
+                            i < (k + 1) * data_size / block_num; ++i) {
+                        block_ptr[fdr_bucket(pvalue_ptr[i])] += 1;
+                    }
+                }
+            },
+            1
+        );
+
+        bool matched = true;
+        for (int64_t b = 0; b < FDR_BUCKETS_NUMBER; ++b) {
+            if (!collect_ptr[b]) {
+                continue;
+            }
+
+            int64_t position = offsets[b];
+            for (int64_t k = 0; k < block_num; ++k) {
+                int64_t block_size = positions[k * FDR_BUCKETS_NUMBER + b];
+                positions[k * FDR_BUCKETS_NUMBER + b] = position;
+                position += block_size;
+            }
+
+            matched = matched && (position - offsets[b] == counts_ptr[b]);
+        }
+
+        if (matched) {
+            pool.run(
+                "fdr_scatter",
+                block_num,
+                [&](int64_t left_border, int64_t right_border) {
+                    for (int64_t k = left_border; k < right_border; ++k) {
+                        int64_t *block_ptr = positions.data() +
+                            k * FDR_BUCKETS_NUMBER;
+                        for (int64_t i = k * data_size / block_num;
+                                i < (k + 1) * data_size / block_num; ++i) {
+                            int64_t bucket = fdr_bucket(pvalue_ptr[i]);
+                            if (!collect_ptr[bucket]) {
+                                continue;
+                            }
+
+                            int64_t position = block_ptr[bucket]++;
+                            sorted_index_ptr[position] = data_index_ptr ?
+                                data_index_ptr[i] : i;
+                            sorted_pvalues[position] = pvalue_ptr[i];
+                        }
+                    }
+                },
+                1
+            );
+            
+            pool.run(
+                "fdr_sort",
+                buckets.size(),
+                [&](int64_t left_border, int64_t right_border) {
+                    for (int64_t k = left_border; k < right_border; ++k) {
+                        int64_t b = buckets[k];
+                        fdr_sort_bucket(
+                            sorted_index_ptr + offsets[b],
+                            sorted_pvalues.data() + offsets[b],
+                            adjusted_ptr + offsets[b],
+                            counts_ptr[b],
+                            b == FDR_NAN_BUCKET ? -1 : ranks[b] + 1,
+                            pvalues_size
+                        );
+                    }
+                },
+                1
+            );
+
+            // Suffix minimums: block minimums are
+            // combined first, then blocks are scanned
+            int64_t scan_size = collected_size - nan_size;
+            std::vector<float> carries(block_num + 1, tail);
+            pool.run(
+                "fdr_minimum",
+                block_num,
+                [&](int64_t left_border, int64_t right_border) {
+                    for (int64_t k = left_border; k < right_border; ++k) {
+                        for (int64_t i = k * scan_size / block_num;
+                                i < (k + 1) * scan_size / block_num; ++i) {
+                            carries[k] = std::min(carries[k], adjusted_ptr[i]);
+                        }
+                    }
+                },
+                1
+            );
+
+            for (int64_t k = block_num - 1; k >= 0; --k) {
+                carries[k] = std::min(carries[k], carries[k + 1]);
+            }
+            
+            pool.run(
+                "fdr_scan",
+                block_num,
+                [&](int64_t left_border, int64_t right_border) {
+                    for (int64_t k = left_border; k < right_border; ++k) {
+                        float minimum = carries[k + 1];
+                        for (int64_t i = (k + 1) * scan_size / block_num - 1;
+                                i >= k * scan_size / block_num; --i) {
+                            minimum = std::min(minimum, adjusted_ptr[i]);
+                            adjusted_ptr[i] = minimum;
+                        }
+                    }
+                },
+                1
+            );
+
+            if (top_k >= 0) {
+                selected_size = std::min(top_k, pvalues_size);
+            } else if (threshold >= 0) {
+                selected_size = std::lower_bound(
+                    adjusted_ptr,
+                    adjusted_ptr + scan_size,
+                    threshold
+                ) - adjusted_ptr;
+            }
+        }
+
+        if (!matched) {
+            selected_size = -1;
+        }
+    }
+    
+    if (selected_size < 0) {
+        throw std::runtime_error("P-values do not match the histogram");
+    }
+
+    if (selected_size == collected_size) {
+        return std::pair<NumPyLongArray, NumPyFloatArray>(
+            sorted_indexes, adjusted
+        );
+    }
+
+    NumPyLongArray selected_indexes = NumPyLongArray(selected_size);
+    NumPyFloatArray selected_adjusted = NumPyFloatArray(selected_size);
+    std::copy(
+        sorted_index_ptr,
+        sorted_index_ptr + selected_size,
+        (int64_t *) selected_indexes.request().ptr
+    );
+    std::copy(
+        adjusted_ptr,
+        adjusted_ptr + selected_size,
+        (float *) selected_adjusted.request().ptr
+    );
+
+    return std::pair<NumPyLongArray, NumPyFloatArray>(
+        selected_indexes, selected_adjusted
+    );
+}
+
 PYBIND11_MODULE(tests, m) {
     m.def("_ztest_sized", &_ztest_sized);
     m.def("_ztest_unsized", &_ztest_unsized);
+    m.def("_fdr_histogram", &_fdr_histogram);
+    m.def("_fdr_plan", &_fdr_plan);
+    m.def("_fdr_collect", &_fdr_collect);
+    m.def("_fdr_adjust", &_fdr_adjust);
+    m.attr("FDR_BUCKETS_NUMBER") = py::int_(FDR_BUCKETS_NUMBER);
 }
@@ -17,9 +17,10 @@ namespace py = pybind11;
 using NumPyFloatArray = py::array_t<float, py::array::c_style>;
 using NumPyDoubleArray = py::array_t<double, py::array::c_style>;
 using NumPyIntArray = py::array_t<int32_t, py::array::c_style>;
+using NumPyLongArray = py::array_t<int64_t, py::array::c_style>;
 
 
-NumPyIntArray unary_matrix(
+NumPyLongArray unary_matrix(
     const NumPyIntArray &index,
     int base
 ) {
@@ -30,12 +31,12 @@ NumPyIntArray unary_matrix(
     int index_size = index_buf.shape[0];
     int *index_ptr = (int *) index_buf.ptr;
 
-    NumPyIntArray paired_array = NumPyIntArray(index_size * base);
-    int *pa_ptr = (int *) paired_array.request().ptr;
+    NumPyLongArray paired_array = NumPyLongArray((int64_t) index_size * base);
+    int64_t *pa_ptr = (int64_t *) paired_array.request().ptr;
     
     for (int i = 0; i < index_size; ++i){
         for (int j = 0; j < base; ++j) {
-            pa_ptr[i * base + j] = unary_index(index_ptr[i], j, base);    
+            pa_ptr[(int64_t) i * base + j] = unary_index(index_ptr[i], j, base);    
         }
     }
     
@@ -58,17 +59,17 @@ NumPyFloatArray quadrate(
     
     float *array_ptr = (float *) flatten_array.request().ptr;
 
-    NumPyFloatArray matrix = NumPyFloatArray(index_size * base);
+    NumPyFloatArray matrix = NumPyFloatArray((int64_t) index_size * base);
     float *matrix_ptr = (float *) matrix.request().ptr;
     
     for (int i = 0; i < index_size; ++i){
         for (int j = 0; j < base; ++j) {
             if (index_ptr[i] == j) {
-                matrix_ptr[i * base + j] = 1.;
+                matrix_ptr[(int64_t) i * base + j] = 1.;
                 continue;
             }
                 
-            matrix_ptr[i * base + j] = array_ptr[
+            matrix_ptr[(int64_t) i * base + j] = array_ptr[
                 unary_index(index_ptr[i], j, base)
             ];    
         }
@@ -78,6 +79,158 @@ NumPyFloatArray quadrate(
     return matrix;
 }
 
+std::pair<NumPyIntArray, NumPyIntArray> paired_index_batch(
+    const NumPyLongArray &indexes,
+    int base,
+    int process_num=1
+) {
+    /* This function is a vector analogue of
+     * "paired_index", the GIL is released
+     * while the indexes are decoded */
+
+    py::buffer_info index_buf = indexes.request();
+    int64_t index_size = index_buf.size;
+    int64_t *index_ptr = (int64_t *) index_buf.ptr;
+    
+    NumPyIntArray sources = NumPyIntArray(index_size);
+    int *sources_ptr = (int *) sources.request().ptr;
+    
+    NumPyIntArray targets = NumPyIntArray(index_size);
+    int *targets_ptr = (int *) targets.request().ptr;
+    
+    if (process_num <= 0) {    
+        throw std::runtime_error("Process number error");
+    }
+
+    {
+        py::gil_scoped_release release;
+        
+        ThreadPool pool(process_num);
+        pool.run(
+            "paired_index",
+            index_size,
+            [=](int64_t left_border, int64_t right_border) {
+                for (int64_t i = left_border; i < right_border; ++i) {
+                    std::pair<int, int> paired_ind =
+                        paired_index(index_ptr[i], base);
+                    sources_ptr[i] = paired_ind.first;
+                    targets_ptr[i] = paired_ind.second;
+                }
+            }
+        );
+    }
+
+    return std::pair<NumPyIntArray, NumPyIntArray>(
+        sources, targets
+    );
+}
+
+NumPyLongArray unary_index_batch(
+    const NumPyIntArray &sources,
+    const NumPyIntArray &targets,
+    int base,
+    int process_num=1
+) {
+    /* This function is a vector analogue of
+     * "unary_index", the GIL is released
+     * while the indexes are encoded */
+
+    py::buffer_info sources_buf = sources.request();
+    py::buffer_info targets_buf = targets.request();
+    if (sources_buf.size != targets_buf.size) {
+        throw std::runtime_error("Index shapes must match");
+    }
+
+    int64_t index_size = sources_buf.size;
+    int *sources_ptr = (int *) sources_buf.ptr;
+    int *targets_ptr = (int *) targets_buf.ptr;
+    
+    NumPyLongArray indexes = NumPyLongArray(index_size);
+    int64_t *index_ptr = (int64_t *) indexes.request().ptr;
+    
+    if (process_num <= 0) {    
+        throw std::runtime_error("Process number error");
+    }
+
+    {
+        py::gil_scoped_release release;
+        
+        ThreadPool pool(process_num);
+        pool.run(
+            "unary_index",
+            index_size,
+            [=](int64_t left_border, int64_t right_border) {
+                for (int64_t i = left_border; i < right_border; ++i) {
+                    index_ptr[i] = unary_index(
+                        sources_ptr[i],
+                        targets_ptr[i],
+                        base
+                    );
+                }
+            }
+        );
+    }
+
+    return indexes;
+}
+
+NumPyFloatArray rank_rows(
+    const NumPyFloatArray &data,
+    const NumPyIntArray &rows,
+    int process_num=1
+) {
+    /* Ordinal ranks of the samples of "rows" of
+     * the data (of all rows if "rows" is empty).
+     * Only the ranked rows are allocated */
+
+    py::buffer_info data_buf = data.request();
+    float *data_ptr = (float *) data_buf.ptr;
+    int data_len = data_buf.shape[0];
+    int sample_size = data_buf.shape[1];
+
+    py::buffer_info rows_buf = rows.request();
+    int *rows_ptr = nullptr;
+    int rows_size = data_len;
+    if (rows_buf.size > 0) {
+        rows_ptr = (int *) rows_buf.ptr;
+        rows_size = rows_buf.size;
+    }
+
+    for (int i = 0; rows_ptr && i < rows_size; ++i) {
+        if ((rows_ptr[i] < 0) || (rows_ptr[i] >= data_len)) {
+            throw std::runtime_error("Row index out of range");
+        }
+    }
+
+    if (process_num <= 0) {    
+        throw std::runtime_error("Process number error");
+    }
+
+    NumPyFloatArray ranks = NumPyFloatArray(
+        (int64_t) rows_size * sample_size
+    );
+    float *ranks_ptr = (float *) ranks.request().ptr;
+
+    {
+        py::gil_scoped_release release;
+
+        ThreadPool pool(process_num);
+        rank_data(
+            data_ptr,
+            ranks_ptr,
+            sample_size,
+            rows_size,
+            pool,
+            nullptr,
+            -1,
+            rows_ptr
+        );
+    }
+
+    ranks.resize({rows_size, sample_size});
+    return ranks;
+}
+
 int _reorder(
     NumPyIntArray &source_indexes,
     NumPyIntArray &target_indexes
@@ -129,7 +282,10 @@ PYBIND11_MODULE(utils, m) {
     m.def("_paired_index", &paired_index);
     m.def("_unary_vector", &unary_vector);
     m.def("_unary_matrix", &unary_matrix);
+    m.def("_paired_index_batch", &paired_index_batch);
+    m.def("_unary_index_batch", &unary_index_batch);
     m.def("_quadrate", &quadrate);
+    m.def("_rank_rows", &rank_rows);
     m.def("_reorder", &_reorder);
     m.def("_reorder_data", &__reorder);
     m.attr("UNDEFINED_INDEX") = py::int_(UNDEFINED_INDEX);
@@ -1,6 +1,9 @@
 #include <string>
 #include <utility>
 #include <iostream>
+#include <map>
+#include <vector>
+#include <algorithm>
 
 #include "../correlations/correlations.h"
 #include "../tests/tests.h"
@@ -24,13 +27,39 @@ int ztest_pipeline(
     float *stat_ptr,
     float *pvalue_ptr,
     const std::string correlation,
-    const std::string alternative
+    const std::string alternative,
+    float *moments_ptr,
+    double *products_ptr
 ) {
     // Can be used in exhaustive and
     // interaction modes
 
+    // Without sample indexes the columns are grouped (see
+    // "group_columns"), experimental ones follow reference ones
+    float *exp_data_ptr = data_ptr;
+    if (!exp_ind_ptr) {
+        exp_data_ptr = data_ptr + ref_ind_size;
+    }
+
     // std::cout << "Correlation computations\n";
-    if (correlation == SPEARMAN) {
+    // Pooled sums of the pairs are given when the groups
+    // split all the samples (see "pearsonr_complement")
+    if (products_ptr) {
+        pearsonr_complement(
+            data_ptr,
+            sample_size,
+            source_ind_ptr,
+            target_ind_ptr,
+            ref_corrs_ptr,
+            exp_corrs_ptr,
+            start_ind,
+            end_ind,
+            ref_ind_size,
+            exp_ind_size,
+            moments_ptr,
+            products_ptr
+        );
+    } else if (correlation == SPEARMAN) {
         pearsonr(
             data_ptr,
             sample_size,
@@ -45,7 +74,7 @@ int ztest_pipeline(
         );
         
         pearsonr(
-            data_ptr,
+            exp_data_ptr,
             sample_size,
             source_ind_ptr,
             target_ind_ptr,
@@ -71,7 +100,7 @@ int ztest_pipeline(
         );
 
         pearsonr(
-            data_ptr,
+            exp_data_ptr,
             sample_size,
             source_ind_ptr,
             target_ind_ptr,
@@ -97,11 +126,9 @@ int ztest_pipeline(
     return 0;
 }
 
-int score_pipeline_indexed(
+int ztest_pipeline_blocked(
     float *data_ptr,
     int sample_size,
-    int *source_ind_ptr,
-    int *target_ind_ptr,
     int index_size,
     int *ref_ind_ptr,
     int *exp_ind_ptr,
@@ -111,44 +138,112 @@ int score_pipeline_indexed(
     float *exp_corrs_ptr,
     float *stat_ptr,
     float *pvalue_ptr,
-    int *starts_ind_ptr,
-    int *ends_ind_ptr,
-    int start_ind,
-    int end_ind,
-    float *score_ptr,
+    ThreadPool &pool,
     const std::string correlation,
     const std::string alternative,
-    const std::string score
-) { 
-    int start = starts_ind_ptr[start_ind];
-    int end = ends_ind_ptr[end_ind - 1];
+    int source_size
+) {
+    // Exhaustive mode analogue of "ztest_pipeline":
+    // correlations of all pairs are computed by the
+    // blocked engine, "data_ptr" has to be ranked
+    // in advance in the case of spearman correlation.
+    // With "source_size" only the pairs of the first
+    // "source_size" rows are processed
+
+    if (source_size < 0) {
+        source_size = index_size;
+    }
+
+    correlation_blocked(
+        data_ptr,
+        sample_size,
+        index_size,
+        ref_corrs_ptr,
+        pool,
+        ref_ind_ptr,
+        ref_ind_size,
+        source_size
+    );
+
+    correlation_blocked(
+        data_ptr,
+        sample_size,
+        index_size,
+        exp_corrs_ptr,
+        pool,
+        exp_ind_ptr,
+        exp_ind_size,
+        source_size
+    );
+
+    int64_t pairs_num = (int64_t) index_size * (index_size - 1) / 2 -
+        (int64_t) (index_size - source_size) * (index_size - source_size - 1) / 2;
     
+    pool.run(
+        "ztest",
+        pairs_num,
+        [&](int64_t left_border, int64_t right_border) {
+            ztest_unsized(
+                ref_corrs_ptr, ref_ind_size,
+                exp_corrs_ptr, exp_ind_size,
+                stat_ptr, pvalue_ptr,
+                left_border, right_border,
+                correlation,
+                alternative
+            );
+        }
+    );
+
+    return 0;
+}
+
+int score_pipeline_edges(
+    float *data_ptr,
+    int sample_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int index_size,
+    int *ref_ind_ptr,
+    int *exp_ind_ptr,
+    int ref_ind_size,
+    int exp_ind_size,
+    float *ref_corrs_ptr,
+    float *exp_corrs_ptr,
+    float *stat_ptr,
+    float *pvalue_ptr,
+    int start,
+    int end,
+    const std::string correlation,
+    float *moments_ptr,
+    double *products_ptr
+) {
+    /* Correlations and two-sided z-test statistics of the
+     * edges from "start" to "end", "data_ptr" has to be
+     * ranked in advance in the case of spearman correlation.
+     * Without sample indexes the columns of "data_ptr" are
+     * grouped (see "group_columns"), with "products_ptr" the
+     * correlations are computed by "pearsonr_complement" */
+
+    float *exp_data_ptr = data_ptr;
+    if (!exp_ind_ptr) {
+        exp_data_ptr = data_ptr + ref_ind_size;
+    }
+
     // std::cout << "Correlation computations\n";
-    if (correlation == SPEARMAN) {
-        pearsonr(
+    if (products_ptr) {
+        pearsonr_complement(
             data_ptr,
             sample_size,
             source_ind_ptr,
             target_ind_ptr,
             ref_corrs_ptr,
-            start,
-            end,
-            index_size,
-            ref_ind_ptr,
-            ref_ind_size
-        );
-        
-        pearsonr(
-            data_ptr,
-            sample_size,
-            source_ind_ptr,
-            target_ind_ptr,
             exp_corrs_ptr,
             start,
             end,
-            index_size,
-            exp_ind_ptr,
-            exp_ind_size
+            ref_ind_size,
+            exp_ind_size,
+            moments_ptr,
+            products_ptr
         );
     } else {
         pearsonr(
@@ -163,9 +258,9 @@ int score_pipeline_indexed(
             ref_ind_ptr,
             ref_ind_size
         );
-
+        
         pearsonr(
-            data_ptr,
+            exp_data_ptr,
             sample_size,
             source_ind_ptr,
             target_ind_ptr,
@@ -192,45 +287,205 @@ int score_pipeline_indexed(
         TWO_SIDED    
     );
 
+    return 0;
+}
+
+int score_pipeline_sources(
+    float *stat_ptr,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    int start_ind,
+    int end_ind,
+    float *score_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    const std::string alternative
+) {
+    /* Scores of the sources from "start_ind" to "end_ind"
+     * over the statistics of their edges, score "s" of
+     * a source "i" is written at s * score_stride + i */
+
     bool absolute = false;
     if (alternative == TWO_SIDED) {
         absolute = true;
     }
 
-    // std::cout << "Score computations\n";
-    if (score == MEAN) {
-        _mean(
-            stat_ptr,
-            starts_ind_ptr,
-            ends_ind_ptr,
-            start_ind,
-            end_ind,
-            score_ptr,
-            absolute
-        ); 
-    } else if (score == MEDIAN) {
-        _quantile( 
-            stat_ptr,
-            starts_ind_ptr,
-            ends_ind_ptr,
-            start_ind,
-            end_ind,
-            score_ptr,
-            QMEDIAN,
-            absolute
-        );
-    }
+    _score(
+        stat_ptr,
+        starts_ind_ptr,
+        ends_ind_ptr,
+        start_ind,
+        end_ind,
+        score_ptr,
+        score_stride,
+        scores,
+        absolute
+    );
+
+    return 0;
+}
+
+int score_pipeline_indexed(
+    float *data_ptr,
+    int sample_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int index_size,
+    int *ref_ind_ptr,
+    int *exp_ind_ptr,
+    int ref_ind_size,
+    int exp_ind_size,
+    float *ref_corrs_ptr,
+    float *exp_corrs_ptr,
+    float *stat_ptr,
+    float *pvalue_ptr,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    int start_ind,
+    int end_ind,
+    float *score_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    const std::string correlation,
+    const std::string alternative,
+    float *moments_ptr,
+    double *products_ptr
+) { 
+    int start = starts_ind_ptr[start_ind];
+    int end = ends_ind_ptr[end_ind - 1];
+    
+    score_pipeline_edges(
+        data_ptr,
+        sample_size,
+        source_ind_ptr,
+        target_ind_ptr,
+        index_size,
+        ref_ind_ptr,
+        exp_ind_ptr,
+        ref_ind_size,
+        exp_ind_size,
+        ref_corrs_ptr,
+        exp_corrs_ptr,
+        stat_ptr,
+        pvalue_ptr,
+        start,
+        end,
+        correlation,
+        moments_ptr,
+        products_ptr
+    );
+
+    score_pipeline_sources(
+        stat_ptr,
+        starts_ind_ptr,
+        ends_ind_ptr,
+        start_ind,
+        end_ind,
+        score_ptr,
+        score_stride,
+        scores,
+        alternative
+    );
     
     return 0;
 }
 
+int score_pipeline_balanced(
+    float *data_ptr,
+    int sample_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int index_size,
+    int *ref_ind_ptr,
+    int *exp_ind_ptr,
+    int ref_ind_size,
+    int exp_ind_size,
+    float *ref_corrs_ptr,
+    float *exp_corrs_ptr,
+    float *stat_ptr,
+    float *pvalue_ptr,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    int sources_size,
+    float *score_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    ThreadPool &pool,
+    const std::string correlation,
+    const std::string alternative,
+    float *moments_ptr,
+    double *products_ptr
+) {
+    /* "score_pipeline_indexed" of the sources from 0 to
+     * "sources_size" balanced by edges: workers take chunks
+     * of the edges (edges of a hub source are split between
+     * them), then the scores of the sources are reduced over
+     * the statistics of their edges in a separate stage.
+     * Edges of the sources have to be contiguous */
+
+    if (sources_size <= 0) {
+        return 0;
+    }
+
+    int start = starts_ind_ptr[0];
+    int end = ends_ind_ptr[sources_size - 1];
+
+    pool.run(
+        "pipeline",
+        end - start,
+        [&](int64_t left_border, int64_t right_border) {
+            score_pipeline_edges(
+                data_ptr,
+                sample_size,
+                source_ind_ptr,
+                target_ind_ptr,
+                index_size,
+                ref_ind_ptr,
+                exp_ind_ptr,
+                ref_ind_size,
+                exp_ind_size,
+                ref_corrs_ptr,
+                exp_corrs_ptr,
+                stat_ptr,
+                pvalue_ptr,
+                start + left_border,
+                start + right_border,
+                correlation,
+                moments_ptr,
+                products_ptr
+            );
+        }
+    );
+
+    pool.run(
+        "score",
+        sources_size,
+        [&](int64_t left_border, int64_t right_border) {
+            score_pipeline_sources(
+                stat_ptr,
+                starts_ind_ptr,
+                ends_ind_ptr,
+                left_border,
+                right_border,
+                score_ptr,
+                score_stride,
+                scores,
+                alternative
+            );
+        }
+    );
+
+    return 0;
+}
+
 int score_pipeline_exhaustive(
     float *stat_ptr,
     int index_size,
     int start_ind,
     int end_ind,
     float *score_ptr,
-    const std::string score,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
     const std::string alternative
 ) {
     bool absolute = false;
@@ -238,26 +493,627 @@ int score_pipeline_exhaustive(
         absolute = true;
     }
 
-    if (score == MEAN) {
-        __mean(
-            stat_ptr,
+    __score(
+        stat_ptr,
+        index_size,
+        start_ind,
+        end_ind,
+        score_ptr,
+        score_stride,
+        scores,
+        absolute
+    );
+    
+    return 0;
+}
+
+int score_pipeline_rows(
+    float *ref_std_ptr,
+    bool *ref_defined_ptr,
+    int ref_ind_size,
+    float *exp_std_ptr,
+    bool *exp_defined_ptr,
+    int exp_ind_size,
+    int index_size,
+    int64_t *rows_ptr,
+    int64_t start_ind,
+    int64_t end_ind,
+    float *score_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    const std::string correlation,
+    const std::string alternative
+) {
+    /* Exhaustive scores of the rows "rows_ptr" from "start_ind"
+     * to "end_ind" without the pair layout: statistics of
+     * TILE_SIZE rows with all rows are computed into a block
+     * that is reduced into the scores of the rows right away.
+     * Rows have to be standardized by groups (see
+     * "standardize"). Score "s" of the k-th row is written at
+     * s * score_stride + k, the scores are the same as of
+     * "score_pipeline_exhaustive" */
+
+    bool absolute = false;
+    if (alternative == TWO_SIDED) {
+        absolute = true;
+    }
+
+    // Blocks of the thread are reused by its calls
+    int64_t block_len = (int64_t) TILE_SIZE * index_size;
+    static thread_local std::vector<float> ref_corrs;
+    static thread_local std::vector<float> exp_corrs;
+    static thread_local std::vector<float> stat;
+    ref_corrs.resize(block_len);
+    exp_corrs.resize(block_len);
+    stat.resize(block_len);
+
+    for (int64_t start = start_ind; start < end_ind; start += TILE_SIZE) {
+        int rows_size = std::min((int64_t) TILE_SIZE, end_ind - start);
+
+        correlation_rows(
+            ref_std_ptr,
+            ref_defined_ptr,
+            ref_ind_size,
             index_size,
-            start_ind,
-            end_ind,
-            score_ptr,
-            absolute
-        ); 
-    } else if (score == MEDIAN) {
-        __quantile( 
-            stat_ptr,
+            rows_ptr + start,
+            rows_size,
+            ref_corrs.data()
+        );
+
+        correlation_rows(
+            exp_std_ptr,
+            exp_defined_ptr,
+            exp_ind_size,
             index_size,
-            start_ind,
-            end_ind,
-            score_ptr,
-            QMEDIAN,
+            rows_ptr + start,
+            rows_size,
+            exp_corrs.data()
+        );
+
+        ztest_unsized(
+            ref_corrs.data(), ref_ind_size,
+            exp_corrs.data(), exp_ind_size,
+            stat.data(), nullptr,
+            0, (int64_t) rows_size * index_size,
+            correlation,
+            TWO_SIDED
+        );
+
+        _score_rows(
+            stat.data(),
+            rows_ptr + start,
+            rows_size,
+            index_size,
+            score_ptr + start,
+            score_stride,
+            scores,
             absolute
         );
     }
+
+    return 0;
+}
+
+int score_pipeline_streaming(
+    float *data_ptr,
+    int sample_size,
+    int index_size,
+    int *ref_ind_ptr,
+    int *exp_ind_ptr,
+    int ref_ind_size,
+    int exp_ind_size,
+    int64_t *rows_ptr,
+    int64_t rows_size,
+    float *score_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    ThreadPool &pool,
+    const std::string correlation,
+    const std::string alternative
+) {
+    /* "score_pipeline_rows" of the rows "rows_ptr" with the
+     * thread pool: memory is proportional to the number of
+     * rows (the standardized groups and a block of TILE_SIZE
+     * rows per thread) instead of the number of pairs.
+     * "data_ptr" has to be ranked in advance in the case of
+     * spearman correlation */
+
+    if (rows_size <= 0) {
+        return 0;
+    }
+
+    std::vector<float> ref_std((int64_t) index_size * ref_ind_size);
+    std::vector<float> exp_std((int64_t) index_size * exp_ind_size);
+    bool *ref_defined_ptr = new bool[index_size];
+    bool *exp_defined_ptr = new bool[index_size];
+    
+    pool.run(
+        "standardize",
+        index_size,
+        [&](int64_t left_border, int64_t right_border) {
+            standardize(
+                data_ptr,
+                sample_size,
+                ref_std.data(),
+                ref_defined_ptr,
+                left_border,
+                right_border,
+                ref_ind_ptr,
+                ref_ind_size
+            );
+            standardize(
+                data_ptr,
+                sample_size,
+                exp_std.data(),
+                exp_defined_ptr,
+                left_border,
+                right_border,
+                exp_ind_ptr,
+                exp_ind_size
+            );
+        }
+    );
+
+    int64_t blocks_num = (rows_size + TILE_SIZE - 1) / TILE_SIZE;
+    pool.run(
+        "score",
+        blocks_num,
+        [&](int64_t left_border, int64_t right_border) {
+            score_pipeline_rows(
+                ref_std.data(),
+                ref_defined_ptr,
+                ref_ind_size,
+                exp_std.data(),
+                exp_defined_ptr,
+                exp_ind_size,
+                index_size,
+                rows_ptr,
+                left_border * TILE_SIZE,
+                std::min(right_border * TILE_SIZE, rows_size),
+                score_ptr,
+                score_stride,
+                scores,
+                correlation,
+                alternative
+            );
+        },
+        1
+    );
+
+    delete[] ref_defined_ptr;
+    delete[] exp_defined_ptr;
+
+    return 0;
+}
+
+bool score_exceedance(
+    float score,
+    float boot_score,
+    const std::string &alternative
+) {
+    /* Whether a permuted score is at least as
+     * extreme as the observed one */
+
+    if (alternative == TWO_SIDED) {
+        return std::abs(score) <= std::abs(boot_score);
+    }
+
+    if (alternative == LESS) {
+        return score >= boot_score;
+    }
+
+    return score <= boot_score;
+}
+
+int count_score_exceedances(
+    float *scores_ptr,
+    float *boot_scores_ptr,
+    int64_t *active_ptr,
+    int64_t active_size,
+    int64_t sources_size,
+    int score_num,
+    float *counts_ptr,
+    int *permutations_ptr,
+    const std::string alternative,
+    bool compacted
+) {
+    /* Counts exceedances of the active sources for each of
+     * "score_num" scores stored with stride "sources_size".
+     * Permuted scores of an active source "k" are at
+     * s * sources_size + k if "compacted" (at the index of
+     * the source otherwise), scores that are decided (have
+     * a permutation number) are not counted */
+
+    for (int s = 0; s < score_num; ++s) {
+        int64_t offset = s * sources_size;
+        for (int64_t k = 0; k < active_size; ++k) {
+            int64_t i = offset + active_ptr[k];
+            if (permutations_ptr[i] > 0) {
+                continue;
+            }
+
+            int64_t j = offset + (compacted ? k : active_ptr[k]);
+            if (score_exceedance(scores_ptr[i], boot_scores_ptr[j], alternative)) {
+                counts_ptr[i] += 1;
+            }
+        }
+    }
+
+    return 0;
+}
+
+int64_t retire_items(
+    int64_t *active_ptr,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    float *stat_ptr,
+    int64_t active_size,
+    float *counts_ptr,
+    int *permutations_ptr,
+    int stop_exceedances,
+    int permutation
+) {
+    /* Sequential stopping (Besag & Clifford, 1991): items
+     * that reached "stop_exceedances" null exceedances are
+     * decided. They remember the number of permutations they
+     * used and are removed from the active set, the rest of
+     * the compacted arrays are shifted accordingly. Any of
+     * "source_ind_ptr", "target_ind_ptr", "stat_ptr" can be
+     * omitted. Permutation numbers that are already set (by
+     * a block of permutations) are kept. Returns the new
+     * size of the active set */
+
+    if (stop_exceedances <= 0) {
+        return active_size;
+    }
+
+    int64_t kept = 0;
+    for (int64_t k = 0; k < active_size; ++k) {
+        int64_t i = active_ptr[k];
+        if (counts_ptr[i] >= stop_exceedances) {
+            if (permutations_ptr[i] <= 0) {
+                permutations_ptr[i] = permutation;
+            }
+            continue;
+        }
+
+        active_ptr[kept] = i;
+        if (source_ind_ptr) {
+            source_ind_ptr[kept] = source_ind_ptr[k];
+        }
+        if (target_ind_ptr) {
+            target_ind_ptr[kept] = target_ind_ptr[k];
+        }
+        if (stat_ptr) {
+            stat_ptr[kept] = stat_ptr[k];
+        }
+        ++kept;
+    }
+
+    return kept;
+}
+
+int compact_edges(
+    int64_t *active_ptr,
+    int64_t active_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    std::vector<int> &active_sources,
+    std::vector<int> &active_targets,
+    std::vector<int> &active_starts,
+    std::vector<int> &active_ends
+) {
+    /* Copies edges of the active sources into contiguous
+     * arrays, so the score pipeline can process active
+     * sources as if they were the only ones */
+
+    active_sources.clear();
+    active_targets.clear();
+    active_starts.resize(active_size);
+    active_ends.resize(active_size);
+
+    for (int64_t k = 0; k < active_size; ++k) {
+        int j = active_ptr[k];
+        active_starts[k] = active_sources.size();
+        
+        for (int i = starts_ind_ptr[j]; i < ends_ind_ptr[j]; ++i) {
+            active_sources.push_back(source_ind_ptr[i]);
+            active_targets.push_back(target_ind_ptr[i]);
+        }
+        
+        active_ends[k] = active_sources.size();
+    }
+
+    return active_sources.size();
+}
+
+int compact_products(
+    int64_t *active_ptr,
+    int64_t active_size,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    double *products_ptr,
+    std::vector<double> &active_products
+) {
+    /* Pooled sums of the active items (see "pooled_products")
+     * in compacted form. With "starts_ind_ptr" the items are
+     * sources and the sums of their edges are copied in the
+     * order of "compact_edges" */
+
+    active_products.clear();
+    for (int64_t k = 0; k < active_size; ++k) {
+        int64_t j = active_ptr[k];
+        if (!starts_ind_ptr) {
+            active_products.push_back(products_ptr[j]);
+            continue;
+        }
+
+        active_products.insert(
+            active_products.end(),
+            products_ptr + starts_ind_ptr[j],
+            products_ptr + ends_ind_ptr[j]
+        );
+    }
+
+    return active_products.size();
+}
+
+int complete_edges(
+    int64_t *active_ptr,
+    int64_t active_size,
+    int index_size,
+    std::vector<int> &active_sources,
+    std::vector<int> &active_targets,
+    std::vector<int> &active_starts,
+    std::vector<int> &active_ends
+) {
+    /* Exhaustive mode analogue of "compact_edges":
+     * every active source is paired with all other rows */
+
+    active_sources.clear();
+    active_targets.clear();
+    active_starts.resize(active_size);
+    active_ends.resize(active_size);
+
+    for (int64_t k = 0; k < active_size; ++k) {
+        int j = active_ptr[k];
+        active_starts[k] = active_sources.size();
+        
+        for (int i = 0; i < index_size; ++i) {
+            if (i == j) {
+                continue;
+            }
+            
+            active_sources.push_back(j);
+            active_targets.push_back(i);
+        }
+        
+        active_ends[k] = active_sources.size();
+    }
+
+    return active_sources.size();
+}
+
+int used_rows(
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int64_t index_size,
+    int data_len,
+    std::vector<int> &rows
+) {
+    /* Collects the sorted list of rows that take
+     * part in at least one of the pairs */
+
+    std::vector<bool> used(data_len, false);
+    for (int64_t i = 0; i < index_size; ++i) {
+        used[source_ind_ptr[i]] = true;
+        used[target_ind_ptr[i]] = true;
+    }
+
+    rows.clear();
+    for (int i = 0; i < data_len; ++i) {
+        if (used[i]) {
+            rows.push_back(i);
+        }
+    }
+
+    return rows.size();
+}
+
+int compact_rows(
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int64_t index_size,
+    int data_len,
+    std::vector<int> &rows,
+    std::vector<int> &compact_sources,
+    std::vector<int> &compact_targets
+) {
+    /* Collects the rows of the pairs (see "used_rows") and
+     * renumbers the pairs by positions of their rows in
+     * "rows", so per-row buffers take only the used rows
+     * of the data. The order of rows is preserved */
+
+    used_rows(
+        source_ind_ptr,
+        target_ind_ptr,
+        index_size,
+        data_len,
+        rows
+    );
+
+    std::vector<int> positions(data_len, -1);
+    for (int i = 0; i < (int) rows.size(); ++i) {
+        positions[rows[i]] = i;
+    }
+
+    compact_sources.resize(index_size);
+    compact_targets.resize(index_size);
+    for (int64_t i = 0; i < index_size; ++i) {
+        compact_sources[i] = positions[source_ind_ptr[i]];
+        compact_targets[i] = positions[target_ind_ptr[i]];
+    }
+
+    return rows.size();
+}
+
+int64_t retire_contrasts(
+    int64_t *active_ptr,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int64_t active_size,
+    int64_t item_num,
+    int *contrast_ptr,
+    int contrast_num,
+    float *counts_ptr,
+    int *permutations_ptr,
+    int stop_exceedances,
+    int permutation
+) {
+    /* "retire_items" for contrasts that share permutations:
+     * counts and permutations of a contrast "c" start at
+     * c * item_num. An item is decided for a contrast once
+     * it reached "stop_exceedances", it is removed from the
+     * active set when it is decided for all the contrasts
+     * of "contrast_ptr". Returns the new size of the set */
+
+    if (stop_exceedances <= 0) {
+        return active_size;
+    }
+
+    int64_t kept = 0;
+    for (int64_t k = 0; k < active_size; ++k) {
+        int64_t i = active_ptr[k];
+
+        bool undecided = false;
+        for (int m = 0; m < contrast_num; ++m) {
+            int64_t j = contrast_ptr[m] * item_num + i;
+            if (permutations_ptr[j] > 0) {
+                continue;
+            }
+
+            if (counts_ptr[j] >= stop_exceedances) {
+                permutations_ptr[j] = permutation;
+            } else {
+                undecided = true;
+            }
+        }
+
+        if (!undecided) {
+            continue;
+        }
+
+        active_ptr[kept] = i;
+        if (source_ind_ptr) {
+            source_ind_ptr[kept] = source_ind_ptr[k];
+        }
+        if (target_ind_ptr) {
+            target_ind_ptr[kept] = target_ind_ptr[k];
+        }
+        ++kept;
+    }
+
+    return kept;
+}
+
+int contrast_classes(
+    int *ref_size_ptr,
+    int *exp_size_ptr,
+    int contrast_num,
+    std::vector<std::vector<int>> &classes
+) {
+    /* Groups contrasts by the sizes of their reference and
+     * experimental groups: permuted groups depend on the
+     * sizes only, so contrasts of a class share them.
+     * Classes are ordered by their first contrast */
+
+    std::map<std::pair<int, int>, int> class_ids;
     
+    classes.clear();
+    for (int c = 0; c < contrast_num; ++c) {
+        std::pair<int, int> sizes(ref_size_ptr[c], exp_size_ptr[c]);
+        
+        auto found = class_ids.find(sizes);
+        if (found == class_ids.end()) {
+            class_ids[sizes] = classes.size();
+            classes.push_back(std::vector<int>());
+            found = class_ids.find(sizes);
+        }
+
+        classes[found->second].push_back(c);
+    }
+
+    return classes.size();
+}
+
+int shared_pairs(
+    int64_t *active_ptr,
+    int64_t active_size,
+    int64_t *active_sources_ptr,
+    int64_t active_sources_size,
+    int *edge_pairs_ptr,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int index_size,
+    std::vector<int> &pairs,
+    std::vector<int> &pair_sources,
+    std::vector<int> &pair_targets
+) {
+    /* Collects the pairs a permutation of the fused z-test and
+     * score pipeline has to compute: the active pairs and the
+     * pairs of the edges of the active sources ("edge_pairs_ptr"
+     * maps edges to pairs). Pairs are kept in increasing order
+     * with their rows in "pair_sources" and "pair_targets" */
+
+    std::vector<bool> used(index_size, false);
+    for (int64_t k = 0; k < active_size; ++k) {
+        used[active_ptr[k]] = true;
+    }
+
+    for (int64_t k = 0; k < active_sources_size; ++k) {
+        int j = active_sources_ptr[k];
+        for (int e = starts_ind_ptr[j]; e < ends_ind_ptr[j]; ++e) {
+            used[edge_pairs_ptr[e]] = true;
+        }
+    }
+
+    pairs.clear();
+    pair_sources.clear();
+    pair_targets.clear();
+    for (int i = 0; i < index_size; ++i) {
+        if (used[i]) {
+            pairs.push_back(i);
+            pair_sources.push_back(source_ind_ptr[i]);
+            pair_targets.push_back(target_ind_ptr[i]);
+        }
+    }
+
+    return pairs.size();
+}
+
+int finalize_counts(
+    float *counts_ptr,
+    int *permutations_ptr,
+    int64_t index_size,
+    int repeats_number
+) {
+    /* Turns exceedance counts into permutation p-values.
+     * Items that were not stopped early used all
+     * "repeats_number" permutations */
+
+    for (int64_t i = 0; i < index_size; ++i) {
+        if (permutations_ptr[i] <= 0) {
+            permutations_ptr[i] = repeats_number;
+        }
+
+        if (permutations_ptr[i] > 0) {
+            counts_ptr[i] /= permutations_ptr[i];
+        }
+    }
+
     return 0;
 }
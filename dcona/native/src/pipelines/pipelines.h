@@ -2,6 +2,7 @@
 #define PIPELINES_H
 
 #include <string>
+#include <vector>
 
 #include "../correlations/correlations.h"
 #include "../tests/tests.h"
@@ -9,6 +10,16 @@
 
 const int REPEATS_NUMBER = 1000;
 
+// Exhaustive pipelines switch to the indexed mode
+// once less than this share of items is undecided
+const float INDEXED_SHARE = 0.1;
+
+// Schedules of the indexed pipelines: pairs (sources) of a
+// permutation are split between the workers, or every worker
+// computes whole permutations of a block
+const std::string PAIR_SCHEDULE = "pairs";
+const std::string PERMUTATION_SCHEDULE = "permutations";
+
 
 int ztest_pipeline(
     float *data_ptr,
@@ -27,7 +38,27 @@ int ztest_pipeline(
     float *stat_ptr,
     float *pvalue_ptr,
     const std::string correlation=SPEARMAN,
-    const std::string alternative=TWO_SIDED
+    const std::string alternative=TWO_SIDED,
+    float *moments_ptr=nullptr,
+    double *products_ptr=nullptr
+);
+
+int ztest_pipeline_blocked(
+    float *data_ptr,
+    int sample_size,
+    int index_size,
+    int *ref_ind_ptr,
+    int *exp_ind_ptr,
+    int ref_ind_size,
+    int exp_ind_size,
+    float *ref_corrs_ptr,
+    float *exp_corrs_ptr,
+    float *stat_ptr,
+    float *pvalue_ptr,
+    ThreadPool &pool,
+    const std::string correlation=SPEARMAN,
+    const std::string alternative=TWO_SIDED,
+    int source_size=-1
 );
 
 int score_pipeline_indexed(
@@ -49,9 +80,72 @@ int score_pipeline_indexed(
     int start_ind,
     int end_ind,
     float *score_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
     const std::string correlation=SPEARMAN,
     const std::string alternative=TWO_SIDED,
-    const std::string score=MEAN
+    float *moments_ptr=nullptr,
+    double *products_ptr=nullptr
+);
+
+int score_pipeline_edges(
+    float *data_ptr,
+    int sample_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int index_size,
+    int *ref_ind_ptr,
+    int *exp_ind_ptr,
+    int ref_ind_size,
+    int exp_ind_size,
+    float *ref_corrs_ptr,
+    float *exp_corrs_ptr,
+    float *stat_ptr,
+    float *pvalue_ptr,
+    int start,
+    int end,
+    const std::string correlation=SPEARMAN,
+    float *moments_ptr=nullptr,
+    double *products_ptr=nullptr
+);
+
+int score_pipeline_sources(
+    float *stat_ptr,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    int start_ind,
+    int end_ind,
+    float *score_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    const std::string alternative=TWO_SIDED
+);
+
+int score_pipeline_balanced(
+    float *data_ptr,
+    int sample_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int index_size,
+    int *ref_ind_ptr,
+    int *exp_ind_ptr,
+    int ref_ind_size,
+    int exp_ind_size,
+    float *ref_corrs_ptr,
+    float *exp_corrs_ptr,
+    float *stat_ptr,
+    float *pvalue_ptr,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    int sources_size,
+    float *score_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    ThreadPool &pool,
+    const std::string correlation=SPEARMAN,
+    const std::string alternative=TWO_SIDED,
+    float *moments_ptr=nullptr,
+    double *products_ptr=nullptr
 );
 
 int score_pipeline_exhaustive(
@@ -60,8 +154,170 @@ int score_pipeline_exhaustive(
     int start_ind,
     int end_ind,
     float *score_ptr,
-    const std::string score=MEAN,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    const std::string alternative=TWO_SIDED
+);
+
+int score_pipeline_rows(
+    float *ref_std_ptr,
+    bool *ref_defined_ptr,
+    int ref_ind_size,
+    float *exp_std_ptr,
+    bool *exp_defined_ptr,
+    int exp_ind_size,
+    int index_size,
+    int64_t *rows_ptr,
+    int64_t start_ind,
+    int64_t end_ind,
+    float *score_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    const std::string correlation=SPEARMAN,
     const std::string alternative=TWO_SIDED
 );
 
+int score_pipeline_streaming(
+    float *data_ptr,
+    int sample_size,
+    int index_size,
+    int *ref_ind_ptr,
+    int *exp_ind_ptr,
+    int ref_ind_size,
+    int exp_ind_size,
+    int64_t *rows_ptr,
+    int64_t rows_size,
+    float *score_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    ThreadPool &pool,
+    const std::string correlation=SPEARMAN,
+    const std::string alternative=TWO_SIDED
+);
+
+bool score_exceedance(
+    float score,
+    float boot_score,
+    const std::string &alternative
+);
+
+int count_score_exceedances(
+    float *scores_ptr,
+    float *boot_scores_ptr,
+    int64_t *active_ptr,
+    int64_t active_size,
+    int64_t sources_size,
+    int score_num,
+    float *counts_ptr,
+    int *permutations_ptr,
+    const std::string alternative=TWO_SIDED,
+    bool compacted=true
+);
+
+int64_t retire_items(
+    int64_t *active_ptr,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    float *stat_ptr,
+    int64_t active_size,
+    float *counts_ptr,
+    int *permutations_ptr,
+    int stop_exceedances,
+    int permutation
+);
+
+int compact_edges(
+    int64_t *active_ptr,
+    int64_t active_size,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    std::vector<int> &active_sources,
+    std::vector<int> &active_targets,
+    std::vector<int> &active_starts,
+    std::vector<int> &active_ends
+);
+
+int compact_products(
+    int64_t *active_ptr,
+    int64_t active_size,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    double *products_ptr,
+    std::vector<double> &active_products
+);
+
+int complete_edges(
+    int64_t *active_ptr,
+    int64_t active_size,
+    int index_size,
+    std::vector<int> &active_sources,
+    std::vector<int> &active_targets,
+    std::vector<int> &active_starts,
+    std::vector<int> &active_ends
+);
+
+int used_rows(
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int64_t index_size,
+    int data_len,
+    std::vector<int> &rows
+);
+
+int compact_rows(
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int64_t index_size,
+    int data_len,
+    std::vector<int> &rows,
+    std::vector<int> &compact_sources,
+    std::vector<int> &compact_targets
+);
+
+int64_t retire_contrasts(
+    int64_t *active_ptr,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int64_t active_size,
+    int64_t item_num,
+    int *contrast_ptr,
+    int contrast_num,
+    float *counts_ptr,
+    int *permutations_ptr,
+    int stop_exceedances,
+    int permutation
+);
+
+int contrast_classes(
+    int *ref_size_ptr,
+    int *exp_size_ptr,
+    int contrast_num,
+    std::vector<std::vector<int>> &classes
+);
+
+int shared_pairs(
+    int64_t *active_ptr,
+    int64_t active_size,
+    int64_t *active_sources_ptr,
+    int64_t active_sources_size,
+    int *edge_pairs_ptr,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    int *source_ind_ptr,
+    int *target_ind_ptr,
+    int index_size,
+    std::vector<int> &pairs,
+    std::vector<int> &pair_sources,
+    std::vector<int> &pair_targets
+);
+
+int finalize_counts(
+    float *counts_ptr,
+    int *permutations_ptr,
+    int64_t index_size,
+    int repeats_number
+);
+
 #endif 
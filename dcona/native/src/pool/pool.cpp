@@ -0,0 +1,171 @@
+#include <algorithm>
+#include <chrono>
+
+#include "pool.h"
+
+using Clock = std::chrono::steady_clock;
+
+
+ThreadPool::ThreadPool(int thread_num) :
+    thread_num_(std::max(thread_num, 1)),
+    generation_(0),
+    stop_(false),
+    active_(0),
+    busy_time_(0),
+    task_(nullptr),
+    task_size_(0),
+    chunk_size_(1),
+    next_(0)
+{
+    for (int i = 1; i < thread_num_; ++i) {
+        workers_.emplace_back(&ThreadPool::work, this);
+    }
+}
+
+ThreadPool::~ThreadPool() {
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        stop_ = true;
+    }
+    task_cv_.notify_all();
+
+    for (auto &worker : workers_) {
+        worker.join();
+    }
+}
+
+int ThreadPool::size() const {
+    return thread_num_;
+}
+
+double ThreadPool::process() {
+    /* Grabs chunks of the current stage until
+     * the range is exhausted, returns busy time */
+
+    auto start = Clock::now();
+    while (true) {
+        int64_t left_border = next_.fetch_add(chunk_size_);
+        if (left_border >= task_size_) {
+            break;
+        }
+
+        int64_t right_border = std::min(left_border + chunk_size_, task_size_);
+        try {
+            (*task_)(left_border, right_border);
+        } catch (...) {
+            // No more chunks are handed out
+            // after the first failure
+            std::lock_guard<std::mutex> lock(mutex_);
+            if (!error_) {
+                error_ = std::current_exception();
+            }
+            next_ = task_size_;
+        }
+    }
+
+    return std::chrono::duration<double>(Clock::now() - start).count();
+}
+
+void ThreadPool::work() {
+    long generation = 0;
+    while (true) {
+        {
+            std::unique_lock<std::mutex> lock(mutex_);
+            task_cv_.wait(lock, [this, generation] {
+                return stop_ || generation_ != generation;
+            });
+
+            if (stop_) {
+                return;
+            }
+            generation = generation_;
+        }
+
+        double busy_time = process();
+        
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            busy_time_ += busy_time;
+            --active_;
+            if (active_ == 0) {
+                done_cv_.notify_one();
+            }
+        }
+    }
+}
+
+int ThreadPool::run(
+    const std::string &stage,
+    int64_t task_size,
+    const std::function<void(int64_t, int64_t)> &task,
+    int64_t chunk_size
+) {
+    if (task_size <= 0) {
+        return 0;
+    }
+
+    if (chunk_size <= 0) {
+        chunk_size = std::max(
+            task_size / ((int64_t) thread_num_ * CHUNKS_PER_THREAD),
+            (int64_t) 1
+        );
+    }
+    
+    auto start = Clock::now();
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        task_ = &task;
+        task_size_ = task_size;
+        chunk_size_ = chunk_size;
+        next_ = 0;
+        busy_time_ = 0;
+        error_ = nullptr;
+        active_ = workers_.size();
+        ++generation_;
+    }
+    task_cv_.notify_all();
+
+    double busy_time = process();
+
+    std::exception_ptr error;
+    {
+        std::unique_lock<std::mutex> lock(mutex_);
+        done_cv_.wait(lock, [this] {
+            return active_ == 0;
+        });
+        busy_time += busy_time_;
+        task_ = nullptr;
+        std::swap(error, error_);
+    }
+
+    if (error) {
+        std::rethrow_exception(error);
+    }
+    
+    double wall_time = std::chrono::duration<double>(
+        Clock::now() - start
+    ).count();
+
+    auto stats = std::find_if(
+        statistics_.begin(),
+        statistics_.end(),
+        [&stage](const StageStatistics &s) {
+            return s.stage == stage;
+        }
+    );
+
+    if (stats == statistics_.end()) {
+        statistics_.push_back({stage, 0, 0, 0, thread_num_});
+        stats = statistics_.end() - 1;
+    }
+    
+    stats->calls += 1;
+    stats->wall_time += wall_time;
+    stats->busy_time += busy_time;
+    
+    return 0;
+}
+
+std::vector<StageStatistics> ThreadPool::statistics() const {
+    return statistics_;
+}
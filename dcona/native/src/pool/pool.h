@@ -0,0 +1,79 @@
+#ifndef POOL_H
+#define POOL_H
+
+#include <atomic>
+#include <cstdint>
+#include <condition_variable>
+#include <exception>
+#include <functional>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
+
+// Number of chunks per worker that a stage is
+// split into if no chunk size is given
+const int CHUNKS_PER_THREAD = 8;
+
+
+struct StageStatistics {
+    std::string stage;
+    long calls;
+    double wall_time;
+    double busy_time;
+    int thread_num;
+};
+
+class ThreadPool {
+    /* Fixed set of workers that lives as long as the
+     * pool object. "run" splits a range into chunks that
+     * workers grab dynamically and returns only when the
+     * whole range is processed (a barrier between stages).
+     * The calling thread takes part in every stage. The first
+     * exception thrown by a chunk stops the stage, it is
+     * rethrown by "run" once all the workers are done */
+
+public:
+    explicit ThreadPool(int thread_num=1);
+    ~ThreadPool();
+
+    ThreadPool(const ThreadPool &) = delete;
+    ThreadPool &operator=(const ThreadPool &) = delete;
+
+    int size() const;
+
+    int run(
+        const std::string &stage,
+        int64_t task_size,
+        const std::function<void(int64_t, int64_t)> &task,
+        int64_t chunk_size=0
+    );
+
+    std::vector<StageStatistics> statistics() const;
+
+private:
+    void work();
+    double process();
+
+    int thread_num_;
+    std::vector<std::thread> workers_;
+
+    std::mutex mutex_;
+    std::condition_variable task_cv_;
+    std::condition_variable done_cv_;
+    
+    long generation_;
+    bool stop_;
+    int active_;
+    double busy_time_;
+
+    const std::function<void(int64_t, int64_t)> *task_;
+    int64_t task_size_;
+    int64_t chunk_size_;
+    std::atomic<int64_t> next_;
+    std::exception_ptr error_;
+
+    std::vector<StageStatistics> statistics_;
+};
+
+#endif
@@ -1,5 +1,7 @@
 #include <cmath>
 #include <string>
+#include <sstream>
+#include <stdexcept>
 #include <utility>
 #include <vector>
 #include <algorithm>
@@ -9,17 +11,187 @@
 #include "../utils/utils.h"
 
 
-float mean(
+std::vector<Score> parse_scores(const std::string &score) {
+    /* Parses a list of scores, e.g. "mean,quantile:0.9".
+     * "median" is the quantile of QMEDIAN level */
+
+    std::vector<Score> scores;
+    std::stringstream stream(score);
+    std::string item;
+    while (std::getline(stream, item, SCORE_SEPARATOR)) {
+        std::string name = item;
+        std::string parameter;
+        size_t separator = item.find(PARAMETER_SEPARATOR);
+        if (separator != std::string::npos) {
+            name = item.substr(0, separator);
+            parameter = item.substr(separator + 1);
+        }
+
+        Score result = {name, 0};
+        if (name == MEAN || name == MEDIAN) {
+            if (!parameter.empty()) {
+                throw std::runtime_error("Score " + name + " has no parameter");
+            }
+
+            if (name == MEDIAN) {
+                result = {QUANTILE, QMEDIAN};
+            }
+
+            scores.push_back(result);
+            continue;
+        }
+
+        if (name != QUANTILE && name != TRIMMED_MEAN &&
+                name != TOP_MEAN && name != FRACTION) {
+            throw std::runtime_error("Unknown score: " + item);
+        }
+
+        if (parameter.empty()) {
+            throw std::runtime_error("Score " + name + " needs a parameter");
+        }
+        result.parameter = std::stof(parameter);
+
+        if ((name == QUANTILE) &&
+                (result.parameter < 0 || result.parameter > 1)) {
+            throw std::runtime_error("Quantile level is out of [0, 1]");
+        }
+
+        if ((name == TRIMMED_MEAN) &&
+                (result.parameter < 0 || result.parameter >= 0.5)) {
+            throw std::runtime_error("Trimmed share is out of [0, 0.5)");
+        }
+
+        if ((name == TOP_MEAN) && (result.parameter < 1)) {
+            throw std::runtime_error("Top mean needs at least one value");
+        }
+
+        scores.push_back(result);
+    }
+
+    if (scores.empty()) {
+        throw std::runtime_error("No scores are given");
+    }
+
+    return scores;
+}
+
+bool absolute_score(const Score &score, bool absolute) {
+    /* Mean and top mean are computed over absolute
+     * statistics, the rest of the scores over absolute
+     * ones if "absolute" (two-sided alternative) */
+
+    return (score.name == MEAN) || (score.name == TOP_MEAN) || absolute;
+}
+
+float aggregate(
+    std::vector<float> &values,
+    const Score &score
+) {
+    /* The score of "values", they are reordered by
+     * linear-time selection instead of sorting */
+
+    int size = values.size();
+    if (size == 0) {
+        return 0;
+    }
+
+    if (score.name == MEAN) {
+        float mean = 0;
+        float iter_num = 0;
+        for (float value : values) {
+            mean += value;
+            iter_num += 1;
+        }
+
+        return mean / iter_num;
+    }
+
+    if (score.name == QUANTILE) {
+        int position = std::min((int) (size * score.parameter), size - 1);
+        std::nth_element(
+            values.begin(),
+            values.begin() + position,
+            values.end()
+        );
+
+        return values[position];
+    }
+
+    if (score.name == TRIMMED_MEAN) {
+        // The smallest and the largest "trimmed" values
+        // are moved to the sides of the values
+        int trimmed = (int) (size * score.parameter);
+        if (trimmed > 0) {
+            std::nth_element(
+                values.begin(),
+                values.begin() + trimmed,
+                values.end()
+            );
+            std::nth_element(
+                values.begin() + trimmed,
+                values.begin() + (size - trimmed - 1),
+                values.end()
+            );
+        }
+
+        float mean = 0;
+        for (int i = trimmed; i < size - trimmed; ++i) {
+            mean += values[i];
+        }
+
+        return mean / (size - 2 * trimmed);
+    }
+
+    if (score.name == TOP_MEAN) {
+        int top = std::min((int) score.parameter, size);
+        std::nth_element(
+            values.begin(),
+            values.begin() + (size - top),
+            values.end()
+        );
+
+        float mean = 0;
+        for (int i = size - top; i < size; ++i) {
+            mean += values[i];
+        }
+
+        return mean / top;
+    }
+
+    // FRACTION
+    int above = 0;
+    for (float value : values) {
+        if (value > score.parameter) {
+            above += 1;
+        }
+    }
+
+    return (float) above / size;
+}
+
+bool reordering_score(const Score &score) {
+    // Selection reorders the values and float sums depend
+    // on the order, so these scores get a copy of the values
+    return (score.name != MEAN) && (score.name != FRACTION);
+}
+
+std::vector<float> &scratch_values(int buffer=0) {
+    // Values of a source are gathered into the buffers
+    // of the thread, they are reused by all its sources
+    static thread_local std::vector<float> values[3];
+    values[buffer].clear();
+    return values[buffer];
+}
+
+void gather(
     float *data_ptr,
-    int *index_ptr,
+    int64_t *index_ptr,
     int start_ind,
     int end_ind,
-    bool absolute
+    bool absolute,
+    std::vector<float> &values
 ) {
-    float mean = 0;
-    float iter_num = 0;
-
-    int index = 0;
+    int64_t index = 0;
     for (int i = start_ind; i < end_ind; ++i) {
         if (!index_ptr) {
             index = i;
@@ -31,144 +203,236 @@ float mean(
             continue;
         }
 
-        mean += std::abs(data_ptr[index]);
-        iter_num += 1;
+        if (absolute) {
+            values.push_back(std::abs(data_ptr[index]));
+        } else {
+            values.push_back(data_ptr[index]);
+        }
     }
+}
 
-    if (iter_num > 0) {
-        mean /= iter_num;
-    }
+void gather_row(
+    float *data_ptr,
+    int source,
+    int sources_size,
+    bool absolute,
+    std::vector<float> &values
+) {
+    // Statistics of the pairs of "source" with all other
+    // rows in the exhaustive (condensed) order
+    for (int j = 0; j < sources_size; ++j) {
+        int64_t index = unary_index(source, j, sources_size);
+        if (index < 0) {
+            continue;
+        }
 
-    return mean;
+        if (absolute) {
+            values.push_back(std::abs(data_ptr[index]));
+        } else {
+            values.push_back(data_ptr[index]);
+        }
+    }
 }
 
-int _mean(
-    float *data_ptr,
-    int *starts_ind_ptr,
-    int *ends_ind_ptr,
-    int start_ind,
-    int end_ind,
+void aggregate_scores(
+    std::vector<float> &values,
+    std::vector<float> &absolute_values,
     float *scores_ptr,
+    int64_t score_stride,
+    int64_t index,
+    const std::vector<Score> &scores,
     bool absolute
 ) {
-    for (int i = start_ind; i < end_ind; ++i) {
-        scores_ptr[i] = mean(
-            data_ptr,
-            (int *) nullptr,
-            starts_ind_ptr[i],
-            ends_ind_ptr[i],
-            absolute
-        );  
+    // All the scores of a source from its gathered values,
+    // a score does not depend on the other scores of the list
+    for (size_t s = 0; s < scores.size(); ++s) {
+        std::vector<float> &source_values =
+            absolute_score(scores[s], absolute) ? absolute_values : values;
+
+        if (!reordering_score(scores[s]) || (scores.size() == 1)) {
+            scores_ptr[s * score_stride + index] = aggregate(
+                source_values,
+                scores[s]
+            );
+            continue;
+        }
+
+        std::vector<float> &selected = scratch_values(2);
+        selected.assign(source_values.begin(), source_values.end());
+        scores_ptr[s * score_stride + index] = aggregate(
+            selected,
+            scores[s]
+        );
     }
+}
 
-    return 0;
+void gathered_values(
+    const std::vector<Score> &scores,
+    bool absolute,
+    bool &raw,
+    bool &absolute_raw
+) {
+    // Which of the raw and absolute values the scores need
+    raw = false;
+    absolute_raw = false;
+    for (const Score &score : scores) {
+        if (absolute_score(score, absolute)) {
+            absolute_raw = true;
+        } else {
+            raw = true;
+        }
+    }
 }
 
-int __mean(
+float mean(
     float *data_ptr,
-    int sources_size,
+    int64_t *index_ptr,
     int start_ind,
     int end_ind,
-    float *scores_ptr,
     bool absolute
 ) {
-    for (int i = start_ind; i < end_ind; ++i) {
-        std::vector<int> targets = unary_vector(i, sources_size);
-        scores_ptr[i] = mean(
-            data_ptr,
-            targets.data(),
-            0,
-            sources_size,
-            absolute
-        );  
-    }
-
-    return 0;
+    std::vector<float> &values = scratch_values();
+    gather(data_ptr, index_ptr, start_ind, end_ind, true, values);
+    return aggregate(values, {MEAN, 0});
 }
 
 float quantile(
     float *data_ptr,
-    int *index_ptr,
+    int64_t *index_ptr,
     int start_ind,
     int end_ind,
     float q,
     bool absolute
 ) {
-    std::vector<float> values;
-    int iter_num = 0;
+    std::vector<float> &values = scratch_values();
+    gather(data_ptr, index_ptr, start_ind, end_ind, absolute, values);
+    return aggregate(values, {QUANTILE, q});
+}
 
-    int index = 0;
+int _score(
+    float *data_ptr,
+    int *starts_ind_ptr,
+    int *ends_ind_ptr,
+    int start_ind,
+    int end_ind,
+    float *scores_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    bool absolute
+) {
+    /* Scores of the sources from "start_ind" to "end_ind"
+     * over their edges from "starts_ind_ptr" to "ends_ind_ptr".
+     * Score "s" of a source "i" is written at
+     * s * score_stride + i */
 
-    for (int i = start_ind; i < end_ind; ++i) {
-        if (!index_ptr) {
-            index = i;
-        } else {
-            index = index_ptr[i];
-        }
+    bool raw, absolute_raw;
+    gathered_values(scores, absolute, raw, absolute_raw);
 
-        if (index < 0) {
-            continue;
+    for (int i = start_ind; i < end_ind; ++i) {
+        std::vector<float> &values = scratch_values(0);
+        std::vector<float> &absolute_values = scratch_values(1);
+        if (raw) {
+            gather(
+                data_ptr, (int64_t *) nullptr,
+                starts_ind_ptr[i], ends_ind_ptr[i],
+                false, values
+            );
         }
-        
-        iter_num += 1;
-        if (absolute) {
-            values.push_back(std::abs(data_ptr[index]));
-        } else {
-            values.push_back(data_ptr[index]);
+        if (absolute_raw) {
+            gather(
+                data_ptr, (int64_t *) nullptr,
+                starts_ind_ptr[i], ends_ind_ptr[i],
+                true, absolute_values
+            );
         }
-    }
- 
-    if (iter_num > 0) {
-        std::sort(values.begin(), values.end());
-        return values[(int) iter_num * q];
+
+        aggregate_scores(
+            values, absolute_values,
+            scores_ptr, score_stride, i,
+            scores, absolute
+        );
     }
 
     return 0;
 }
 
-int _quantile(
+int __score(
     float *data_ptr,
-    int *starts_ind_ptr,
-    int *ends_ind_ptr,
+    int sources_size,
     int start_ind,
     int end_ind,
     float *scores_ptr,
-    float q,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
     bool absolute
 ) {
+    /* Exhaustive analogue of "_score": every row
+     * is a source paired with all other rows */
+
+    bool raw, absolute_raw;
+    gathered_values(scores, absolute, raw, absolute_raw);
+
     for (int i = start_ind; i < end_ind; ++i) {
-        scores_ptr[i] = quantile(
-            data_ptr,
-            (int *) nullptr,
-            starts_ind_ptr[i],
-            ends_ind_ptr[i],
-            q,
-            absolute
-        );  
+        std::vector<float> &values = scratch_values(0);
+        std::vector<float> &absolute_values = scratch_values(1);
+        if (raw) {
+            gather_row(data_ptr, i, sources_size, false, values);
+        }
+        if (absolute_raw) {
+            gather_row(data_ptr, i, sources_size, true, absolute_values);
+        }
+
+        aggregate_scores(
+            values, absolute_values,
+            scores_ptr, score_stride, i,
+            scores, absolute
+        );
     }
 
     return 0;
 }
 
-int __quantile(
+int _score_rows(
     float *data_ptr,
-    int sources_size,
-    int start_ind,
-    int end_ind,
+    int64_t *rows_ptr,
+    int rows_size,
+    int index_size,
     float *scores_ptr,
-    float q,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
     bool absolute
 ) {
-    for (int i = start_ind; i < end_ind; ++i) {
-        std::vector<int> targets = unary_vector(i, sources_size);
-        scores_ptr[i] = quantile(
-            data_ptr,
-            targets.data(),
-            0,
-            sources_size,
-            q,
-            absolute
-        );  
+    /* Analogue of "__score" for a dense block: statistics
+     * of the r-th row "rows_ptr[r]" with all rows are at
+     * r * index_size, the pair of the row with itself is
+     * skipped. Score "s" of the r-th row is written at
+     * s * score_stride + r */
+
+    bool raw, absolute_raw;
+    gathered_values(scores, absolute, raw, absolute_raw);
+
+    for (int r = 0; r < rows_size; ++r) {
+        std::vector<float> &values = scratch_values(0);
+        std::vector<float> &absolute_values = scratch_values(1);
+        float *row_ptr = data_ptr + (int64_t) r * index_size;
+        for (int j = 0; j < index_size; ++j) {
+            if (j == rows_ptr[r]) {
+                continue;
+            }
+
+            if (raw) {
+                values.push_back(row_ptr[j]);
+            }
+            if (absolute_raw) {
+                absolute_values.push_back(std::abs(row_ptr[j]));
+            }
+        }
+
+        aggregate_scores(
+            values, absolute_values,
+            scores_ptr, score_stride, r,
+            scores, absolute
+        );
     }
 
     return 0;
@@ -1,67 +1,95 @@
 #ifndef SCORES_H
 #define SCORES_H
 
+#include <cstdint>
+#include <string>
+#include <vector>
+
 const std::string MEAN = "mean";
 const std::string MEDIAN = "median";
+const std::string QUANTILE = "quantile";
+const std::string TRIMMED_MEAN = "trimmed_mean";
+const std::string TOP_MEAN = "top_mean";
+const std::string FRACTION = "fraction";
 
 const float QMEDIAN = 0.5;
 
+// Scores of one run are separated by SCORE_SEPARATOR,
+// a parameter follows the name after PARAMETER_SEPARATOR
+// (e.g. "mean,quantile:0.9,top_mean:10")
+const char SCORE_SEPARATOR = ',';
+const char PARAMETER_SEPARATOR = ':';
 
-float mean(
-    float *data_ptr,
-    int *index_ptr,
-    int start_ind,
-    int end_ind,
-    bool absolute=false
-);
 
-int _mean(
-    float *data_ptr,
-    int *starts_ind_ptr,
-    int *ends_ind_ptr,
-    int start_ind,
-    int end_ind,
-    float *scores_ptr,
-    bool absolute=false
+struct Score {
+    /* An aggregate of the statistics of a source: "name"
+     * is one of the score names above, "parameter" is the
+     * quantile level (QUANTILE), the share trimmed from
+     * each side (TRIMMED_MEAN), the number of the largest
+     * values (TOP_MEAN) or the threshold (FRACTION) */
+
+    std::string name;
+    float parameter;
+};
+
+std::vector<Score> parse_scores(const std::string &score);
+
+float aggregate(
+    std::vector<float> &values,
+    const Score &score
 );
 
-int __mean(
+bool absolute_score(const Score &score, bool absolute);
+
+float mean(
     float *data_ptr,
-    int sources_size,
+    int64_t *index_ptr,
     int start_ind,
     int end_ind,
-    float *scores_ptr,
     bool absolute=false
 );
 
 float quantile(
     float *data_ptr,
-    int *index_ptr,
+    int64_t *index_ptr,
     int start_ind,
     int end_ind,
     float q=QMEDIAN,
     bool absolute=false
 );
 
-int _quantile(
+int _score(
     float *data_ptr,
     int *starts_ind_ptr,
     int *ends_ind_ptr,
     int start_ind,
     int end_ind,
     float *scores_ptr,
-    float q=QMEDIAN,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
     bool absolute=false
 );
 
-int __quantile(
+int __score(
     float *data_ptr,
     int sources_size,
     int start_ind,
     int end_ind,
     float *scores_ptr,
-    float q=QMEDIAN, 
+    int64_t score_stride,
+    const std::vector<Score> &scores,
+    bool absolute=false
+);
+
+int _score_rows(
+    float *data_ptr,
+    int64_t *rows_ptr,
+    int rows_size,
+    int index_size,
+    float *scores_ptr,
+    int64_t score_stride,
+    const std::vector<Score> &scores,
     bool absolute=false
 );
 
-#endif 
+#endif
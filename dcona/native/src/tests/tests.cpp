@@ -1,4 +1,6 @@
 #include <cmath>
+#include <cstring>
+#include <limits>
 #include <string>
 #include <utility>
 #include <queue>
@@ -18,11 +20,11 @@ int ztest_unsized(
     float *first_rs_ptr, int first_size,
     float *second_rs_ptr, int second_size,
     float *stat_ptr, float *pvalue_ptr,
-    int start_ind, int end_ind,
+    int64_t start_ind, int64_t end_ind,
     const std::string correlation,
     const std::string alternative
 ) {
-    for (int ind = start_ind; ind < end_ind; ++ind) {
+    for (int64_t ind = start_ind; ind < end_ind; ++ind) {
         float first_rs = first_rs_ptr[ind];
         float second_rs = second_rs_ptr[ind];
         
@@ -87,11 +89,11 @@ int ztest_sized(
     float *first_rs_ptr, int *first_size_ptr,
     float *second_rs_ptr, int *second_size_ptr,
     float *stat_ptr, float *pvalue_ptr,
-    int start_ind, int end_ind,
+    int64_t start_ind, int64_t end_ind,
     const std::string correlation,
     const std::string alternative
 ) {
-    for (int ind = start_ind; ind < end_ind; ++ind) {
+    for (int64_t ind = start_ind; ind < end_ind; ++ind) {
           float first_rs = first_rs_ptr[ind]; 
           float second_rs = second_rs_ptr[ind]; 
         
@@ -145,3 +147,166 @@ int ztest_sized(
 
     return 0;
 }
+
+int64_t fdr_bucket(float pvalue) {
+    if (std::isnan(pvalue)) {
+        return FDR_NAN_BUCKET;
+    }
+
+    if (pvalue <= 0) {
+        return 0;
+    }
+
+    uint32_t bits;
+    std::memcpy(&bits, &pvalue, sizeof(float));
+    return std::min<int64_t>(
+        bits >> FDR_BUCKET_SHIFT,
+        FDR_NAN_BUCKET - 1
+    );
+}
+
+int fdr_histogram(
+    float *pvalue_ptr,
+    int64_t start_ind, int64_t end_ind,
+    int64_t *counts_ptr,
+    float *min_ptr, float *max_ptr
+) {
+    /* Accumulates the number of p-values and their
+     * minimum and maximum in every bucket, bounds of
+     * empty buckets are expected to be +inf and -inf */
+
+    for (int64_t ind = start_ind; ind < end_ind; ++ind) {
+        float pvalue = pvalue_ptr[ind];
+        int64_t bucket = fdr_bucket(pvalue);
+
+        min_ptr[bucket] = std::min(min_ptr[bucket], pvalue);
+        max_ptr[bucket] = std::max(max_ptr[bucket], pvalue);
+        counts_ptr[bucket] += 1;
+    }
+
+    return 0;
+}
+
+float fdr_ratio(float pvalue, int64_t rank, int64_t pvalues_size) {
+    return (double) pvalue * pvalues_size / rank;
+}
+
+float fdr_plan(
+    int64_t *counts_ptr,
+    float *min_ptr, float *max_ptr,
+    float threshold, int64_t top_k,
+    uint8_t *collect_ptr
+) {
+    /* Marks the buckets whose p-values have to be collected
+     * and sorted. The adjusted p-value of rank k is
+     * min(p_(j) * n / j, j >= k), so only the buckets up to
+     * the last selected rank are needed together with the
+     * tail buckets that may contain min(p_(j) * n / j) of
+     * the following ranks. The bound of the tail minimum
+     * (an attained value or 1) is returned. A negative
+     * "threshold" and "top_k" select all p-values */
+
+    std::vector<int64_t> ranks(FDR_NAN_BUCKET + 1, 0);
+    for (int64_t b = 0; b < FDR_NAN_BUCKET; ++b) {
+        ranks[b + 1] = ranks[b] + counts_ptr[b];
+        collect_ptr[b] = 0;
+    }
+    collect_ptr[FDR_NAN_BUCKET] = 0;
+    
+    int64_t pvalues_size = ranks[FDR_NAN_BUCKET];
+    if ((threshold < 0) && (top_k < 0)) {
+        for (int64_t b = 0; b < FDR_BUCKETS_NUMBER; ++b) {
+            collect_ptr[b] = 1;
+        }
+
+        return 1;
+    }
+
+    // The last bucket of the selected ranks
+    int64_t last_bucket = -1;
+    if (top_k >= 0) {
+        int64_t selected_size = std::min(top_k, pvalues_size);
+        for (int64_t b = 0; b < FDR_NAN_BUCKET; ++b) {
+            if (ranks[b] >= selected_size) {
+                break;
+            }
+            last_bucket = b;
+        }
+    } else {
+        // A p-value of the bucket can pass the threshold
+        // only if the bound of its ratio passes it
+        for (int64_t b = FDR_NAN_BUCKET - 1; b >= 0; --b) {
+            if ((counts_ptr[b] > 0) &&
+                    (fdr_ratio(min_ptr[b], ranks[b + 1], pvalues_size) <
+                     threshold)) {
+                last_bucket = b;
+                break;
+            }
+        }
+    }
+
+    for (int64_t b = 0; b <= last_bucket; ++b) {
+        collect_ptr[b] = 1;
+    }
+    
+    // Ratios of the following ranks are not less than
+    // the threshold, so the tail is required for top-k only
+    float tail = 1;
+    if ((top_k < 0) || (last_bucket < 0)) {
+        return tail;
+    }
+
+    for (int64_t b = last_bucket + 1; b < FDR_NAN_BUCKET; ++b) {
+        if (counts_ptr[b] == 0) {
+            continue;
+        }
+
+        tail = std::min(tail, fdr_ratio(min_ptr[b], ranks[b] + 1, pvalues_size));
+        tail = std::min(tail, fdr_ratio(max_ptr[b], ranks[b + 1], pvalues_size));
+    }
+
+    for (int64_t b = last_bucket + 1; b < FDR_NAN_BUCKET; ++b) {
+        if ((counts_ptr[b] > 0) &&
+                (fdr_ratio(min_ptr[b], ranks[b + 1], pvalues_size) < tail)) {
+            collect_ptr[b] = 1;
+        }
+    }
+
+    return tail;
+}
+
+int fdr_sort_bucket(
+    int64_t *index_ptr, float *pvalue_ptr,
+    float *adjusted_ptr,
+    int64_t bucket_size,
+    int64_t rank, int64_t pvalues_size
+) {
+    /* Sorts p-values of a bucket (ties by index) and
+     * writes their ratios p * n / rank, "rank" is the
+     * rank of the first p-value of the bucket. A negative
+     * "rank" denotes the NaN bucket */
+
+    std::vector<std::pair<float, int64_t>> items(bucket_size);
+    for (int64_t i = 0; i < bucket_size; ++i) {
+        items[i] = std::pair<float, int64_t>(
+            rank < 0 ? 0 : pvalue_ptr[i],
+            index_ptr[i]
+        );
+    }
+    std::sort(items.begin(), items.end());
+
+    for (int64_t i = 0; i < bucket_size; ++i) {
+        index_ptr[i] = items[i].second;
+        if (rank < 0) {
+            adjusted_ptr[i] = std::numeric_limits<float>::quiet_NaN();
+            continue;
+        }
+
+        pvalue_ptr[i] = items[i].first;
+        adjusted_ptr[i] = fdr_ratio(
+            items[i].first, rank + i, pvalues_size
+        );
+    }
+
+    return 0;
+}
@@ -1,6 +1,7 @@
 #ifndef TESTS_H
 #define TESTS_H
 
+#include <cstdint>
 #include <string>
 
 #include "../correlations/correlations.h"
@@ -14,12 +15,19 @@ const std::string TWO_SIDED = "two-sided";
 const std::string LESS = "less";
 const std::string GREATER = "greater";
 
+// P-values are bucketed by the high bits of their float
+// representation, it is monotone for non-negative floats.
+// The last bucket is reserved for NaN p-values
+const int FDR_BUCKET_SHIFT = 14;
+const int64_t FDR_NAN_BUCKET = (0x7F800000 >> FDR_BUCKET_SHIFT) + 1;
+const int64_t FDR_BUCKETS_NUMBER = FDR_NAN_BUCKET + 1;
+
 
 int ztest_unsized(
     float *first_rs_ptr, int first_size,
     float *second_rs_ptr, int second_size,
     float *stat_ptr, float *pvalue_ptr,
-    int start_ind, int end_ind,
+    int64_t start_ind, int64_t end_ind,
     const std::string correlation=SPEARMAN,
     const std::string alternative=TWO_SIDED
 );
@@ -28,9 +36,32 @@ int ztest_sized(
     float *first_rs_ptr, int *first_size_ptr,
     float *second_rs_ptr, int *second_size_ptr,
     float *stat_ptr, float *pvalue_ptr,
-    int start_ind, int end_ind,
+    int64_t start_ind, int64_t end_ind,
     const std::string correlation=SPEARMAN,
     const std::string alternative=TWO_SIDED
 );
 
+int64_t fdr_bucket(float pvalue);
+
+int fdr_histogram(
+    float *pvalue_ptr,
+    int64_t start_ind, int64_t end_ind,
+    int64_t *counts_ptr,
+    float *min_ptr, float *max_ptr
+);
+
+float fdr_plan(
+    int64_t *counts_ptr,
+    float *min_ptr, float *max_ptr,
+    float threshold, int64_t top_k,
+    uint8_t *collect_ptr
+);
+
+int fdr_sort_bucket(
+    int64_t *index_ptr, float *pvalue_ptr,
+    float *adjusted_ptr,
+    int64_t bucket_size,
+    int64_t rank, int64_t pvalues_size
+);
+
 #endif
@@ -1,13 +1,11 @@
 #include <cmath>
 #include <string>
 #include <utility>
-#include <thread>
 #include <algorithm>
-#include <queue>
 
 #include "utils.h"
 
-int unary_index(int first, int second, int base) {
+int64_t unary_index(int first, int second, int base) {
     /* This funcito computes an indexed of
      * a pair ("first", "second") in the alphabetically
      * ordered raw that was made by all unique pairs
@@ -23,28 +21,39 @@ int unary_index(int first, int second, int base) {
         first = tmp;
     }
 
-    int unary_index = (2 * base - first - 1) * (first) / 2;
+    int64_t unary_index = (2 * (int64_t) base - first - 1) * first / 2;
     unary_index += second - first - 1;
 
     return unary_index;
 }
 
-std::pair<int, int> paired_index(int index, int base) {
-    /* This function is inverse to "unary_index" */
+std::pair<int, int> paired_index(int64_t index, int base) {
+    /* This function is inverse to "unary_index".
+     * The square root gives an estimate of the first
+     * index that is corrected by exact integer checks */
 
-    int i = std::floor(((2 * base - 1) - std::sqrt((2 * base - 1) * 
-            (2 * base - 1) - 8 * index)) / 2);
-    int j = (index % base + ((i + 2) * (i + 1) / 2) % base) % base; 
+    double b = 2 * (double) base - 1;
+    int64_t i = std::floor((b - std::sqrt(b * b - 8 * (double) index)) / 2);
+    
+    i = std::max(std::min(i, (int64_t) base - 2), (int64_t) 0);
+    while (i > 0 && unary_index(i, i + 1, base) > index) {
+        --i;
+    }
+    while (i < base - 2 && unary_index(i + 1, i + 2, base) <= index) {
+        ++i;
+    }
+
+    int64_t j = index - unary_index(i, i + 1, base) + i + 1;
     
     return std::pair<int, int>(i, j);
 }
 
-std::vector<int> unary_vector(int index, int base) {
+std::vector<int64_t> unary_vector(int index, int base) {
     /* Computes all indexes in the alphabetically
      * ordered raw with "index" in the first position
      * of the paired index */
 
-    std::vector<int> paired_array(base);
+    std::vector<int64_t> paired_array(base);
     for (int j = 0; j < base; ++j) {
         paired_array[j] = unary_index(index, j, base);    
     }
@@ -80,6 +89,14 @@ int range(int *arr, int size) {
     return 0;
 }
 
+int range(int64_t *arr, int64_t size) {
+    for (int64_t i = 0; i < size; ++i) {
+        arr[i] = i;
+    }
+
+    return 0;
+}
+
 int _rank_data(
     float *data_ptr,
     float *rank_ptr,
@@ -87,7 +104,8 @@ int _rank_data(
     int start_ind, 
     int end_ind,
     int *sample_ind_ptr,
-    int sample_ind_size
+    int sample_ind_size,
+    int *row_ind_ptr
 ) {
     if (!sample_ind_ptr) {
         sample_ind_size = sample_size;
@@ -95,32 +113,31 @@ int _rank_data(
     
     std::vector<int> indexes(sample_ind_size);
 
-    for (int i = start_ind; i < end_ind; ++i) {
+    for (int ind = start_ind; ind < end_ind; ++ind) {
+        int i = (row_ind_ptr == nullptr) ? ind : row_ind_ptr[ind];
+        float *row_ptr = data_ptr + (int64_t) sample_size * i;
+
+        // Ties are ranked by the order of samples
         range(indexes.data(), sample_ind_size);
-        std::sort(
+        std::stable_sort(
             indexes.begin(),
             indexes.end(),
             [
-                data_ptr,
-                i,
-                sample_size,
+                row_ptr,
                 sample_ind_ptr
             ](int i1, int i2) {
-                if (!sample_ind_ptr) {
-                    i1 = sample_size * i + i1;
-                    i2 = sample_size * i + i2;
-                } else {
-                    i1 = sample_size * i + sample_ind_ptr[i1];
-                    i2 = sample_size * i + sample_ind_ptr[i2];
+                if (sample_ind_ptr) {
+                    i1 = sample_ind_ptr[i1];
+                    i2 = sample_ind_ptr[i2];
                 }
 
-                return data_ptr[i1] < data_ptr[i2];
+                return row_ptr[i1] < row_ptr[i2];
             }
         );
 
         inverse(
             indexes.data(),
-            rank_ptr + sample_size * i,
+            rank_ptr + (int64_t) sample_size * ind,
             sample_ind_ptr,
             sample_ind_size
         );
@@ -134,44 +151,234 @@ int rank_data(
     float *rank_ptr,
     int sample_size,
     int index_size,
+    ThreadPool &pool,
     int *sample_ind_ptr,
     int sample_ind_size,
-    int process_num
+    int *row_ind_ptr
 ) {
+    /* Ranks samples of every row. If "row_ind_ptr" is
+     * given "index_size" rows listed there are ranked
+     * into consecutive rows of "rank_ptr" */
+
     if (!sample_ind_ptr) {
         sample_ind_size = sample_size;
     }
 
-    std::queue<std::thread> threads;
-    int batch_size = index_size / process_num;
-    for (int i = 0; i < process_num; ++i) {
-        int left_border = i * batch_size;
-        int right_border = (i + 1) * batch_size;
-        if (i == process_num - 1) {
-            right_border = index_size;
+    pool.run(
+        "rank",
+        index_size,
+        [=](int64_t left_border, int64_t right_border) {
+            _rank_data(
+                data_ptr,
+                rank_ptr,
+                sample_size,
+                left_border,
+                right_border,
+                sample_ind_ptr,
+                sample_ind_size,
+                row_ind_ptr
+            );
         }
+    );
 
-        std::thread thr(_rank_data,
-            data_ptr,
-            rank_ptr,
-            sample_size,
-            left_border,
-            right_border,
-            sample_ind_ptr,
-            sample_ind_size
+    return 0;
+}
+
+int rank_data(
+    float *data_ptr,
+    float *rank_ptr,
+    int sample_size,
+    int index_size,
+    int *sample_ind_ptr,
+    int sample_ind_size,
+    int process_num
+) {
+    ThreadPool pool(process_num);
+    return rank_data(
+        data_ptr,
+        rank_ptr,
+        sample_size,
+        index_size,
+        pool,
+        sample_ind_ptr,
+        sample_ind_size
+    );
+}
+
+int _argsort_data(
+    float *data_ptr,
+    int *order_ptr,
+    int sample_size,
+    int start_ind,
+    int end_ind,
+    int *row_ind_ptr
+) {
+    for (int ind = start_ind; ind < end_ind; ++ind) {
+        int i = (row_ind_ptr == nullptr) ? ind : row_ind_ptr[ind];
+        int *row_order_ptr = order_ptr + (int64_t) sample_size * ind;
+        float *row_ptr = data_ptr + (int64_t) sample_size * i;
+        
+        range(row_order_ptr, sample_size);
+        std::stable_sort(
+            row_order_ptr,
+            row_order_ptr + sample_size,
+            [row_ptr](int i1, int i2) {
+                return row_ptr[i1] < row_ptr[i2];
+            }
         );
+    }
+
+    return 0;
+}
 
-        threads.push(move(thr));
+int argsort_data(
+    float *data_ptr,
+    int *order_ptr,
+    int sample_size,
+    int index_size,
+    ThreadPool &pool,
+    int *row_ind_ptr
+) {
+    /* Sorts the samples of every row once, so ranks
+     * within any subset of samples can be derived
+     * by "rank_presorted" in linear time. If "row_ind_ptr"
+     * is given "index_size" rows listed there are sorted
+     * into consecutive rows of "order_ptr" */
+
+    pool.run(
+        "argsort",
+        index_size,
+        [=](int64_t left_border, int64_t right_border) {
+            _argsort_data(
+                data_ptr,
+                order_ptr,
+                sample_size,
+                left_border,
+                right_border,
+                row_ind_ptr
+            );
+        }
+    );
+
+    return 0;
+}
+
+int label_samples(
+    int *group_ptr,
+    int sample_size,
+    int *ref_ind_ptr,
+    int ref_ind_size,
+    int *exp_ind_ptr,
+    int exp_ind_size,
+    int *position_ptr
+) {
+    /* Marks reference samples by 0, experimental
+     * samples by 1 and the rest of samples by -1.
+     * If "position_ptr" is given it gets the columns
+     * of the samples in the grouped layout (see
+     * "group_columns"): reference samples first */
+
+    for (int i = 0; i < sample_size; ++i) {
+        group_ptr[i] = -1;
+    }
+
+    for (int i = 0; i < ref_ind_size; ++i) {
+        group_ptr[ref_ind_ptr[i]] = 0;
+    }
+
+    for (int i = 0; i < exp_ind_size; ++i) {
+        group_ptr[exp_ind_ptr[i]] = 1;
+    }
+
+    if (position_ptr) {
+        for (int i = 0; i < ref_ind_size; ++i) {
+            position_ptr[ref_ind_ptr[i]] = i;
+        }
+
+        for (int i = 0; i < exp_ind_size; ++i) {
+            position_ptr[exp_ind_ptr[i]] = ref_ind_size + i;
+        }
     }
 
-    while (!threads.empty()) {
-        threads.front().join();
-        threads.pop();
+    return 0;
+}
+
+int _rank_presorted(
+    int *order_ptr,
+    float *rank_ptr,
+    int sample_size,
+    int start_ind,
+    int end_ind,
+    int *group_ptr,
+    int group_num,
+    int *row_ind_ptr,
+    int *position_ptr
+) {
+    std::vector<int> ranks(group_num);
+
+    for (int ind = start_ind; ind < end_ind; ++ind) {
+        int i = (row_ind_ptr == nullptr) ? ind : row_ind_ptr[ind];
+        int *row_order_ptr = order_ptr + (int64_t) sample_size * i;
+        float *row_rank_ptr = rank_ptr + (int64_t) sample_size * i;
+        
+        std::fill(ranks.begin(), ranks.end(), 0);
+        for (int j = 0; j < sample_size; ++j) {
+            int sample = row_order_ptr[j];
+            int group = group_ptr[sample];
+            if (group < 0) {
+                continue;
+            }
+
+            int column = (position_ptr == nullptr) ?
+                sample : position_ptr[sample];
+            row_rank_ptr[column] = (float) ranks[group];
+            ranks[group] += 1;
+        }
     }
 
     return 0;
 }
 
+int rank_presorted(
+    int *order_ptr,
+    float *rank_ptr,
+    int sample_size,
+    int index_size,
+    ThreadPool &pool,
+    int *group_ptr,
+    int group_num,
+    int *row_ind_ptr,
+    int *position_ptr
+) {
+    /* Ranks every row within each group of samples
+     * labeled by "group_ptr" (see "label_samples") by
+     * a single scan over the presorted "order_ptr".
+     * If "row_ind_ptr" is given only "index_size" rows
+     * listed there are ranked. If "position_ptr" is given
+     * the rank of a sample is written to its column
+     * "position_ptr[sample]" instead of the sample one */
+
+    pool.run(
+        "rank",
+        index_size,
+        [=](int64_t left_border, int64_t right_border) {
+            _rank_presorted(
+                order_ptr,
+                rank_ptr,
+                sample_size,
+                left_border,
+                right_border,
+                group_ptr,
+                group_num,
+                row_ind_ptr,
+                position_ptr
+            );
+        }
+    );
+
+    return 0;
+}
+
 int swap(
     int *data,
     int *indexes,
@@ -217,7 +424,8 @@ int reorder(
         indexes[i] = i;
     }
     
-    std::sort(
+    // Pairs of a source keep their order
+    std::stable_sort(
         indexes.begin(),
         indexes.end(),
         [
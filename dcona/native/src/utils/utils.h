@@ -1,20 +1,25 @@
 #ifndef UTILS_H
 #define UTILS_H
 
+#include <cstdint>
 #include <utility>
 #include <vector>
 
+#include "../pool/pool.h"
+
 const int UNDEFINED_INDEX = -1;
 
 
-int unary_index(int first, int second, int base);
+int64_t unary_index(int first, int second, int base);
 
-std::pair<int, int> paired_index(int index, int base);
+std::pair<int, int> paired_index(int64_t index, int base);
 
-std::vector<int> unary_vector(int index, int base);
+std::vector<int64_t> unary_vector(int index, int base);
 
 int range(int *arr, int size);
 
+int range(int64_t *arr, int64_t size);
+
 int rank_data(
     float *data_ptr,
     float *rank_ptr,
@@ -25,6 +30,60 @@ int rank_data(
     int process_num=1
 );
 
+int rank_data(
+    float *data_ptr,
+    float *rank_ptr,
+    int sample_size,
+    int index_size,
+    ThreadPool &pool,
+    int *sample_ind_ptr=nullptr,
+    int sample_ind_size=-1,
+    int *row_ind_ptr=nullptr
+);
+
+int argsort_data(
+    float *data_ptr,
+    int *order_ptr,
+    int sample_size,
+    int index_size,
+    ThreadPool &pool,
+    int *row_ind_ptr=nullptr
+);
+
+int label_samples(
+    int *group_ptr,
+    int sample_size,
+    int *ref_ind_ptr,
+    int ref_ind_size,
+    int *exp_ind_ptr,
+    int exp_ind_size,
+    int *position_ptr=nullptr
+);
+
+int _rank_presorted(
+    int *order_ptr,
+    float *rank_ptr,
+    int sample_size,
+    int start_ind,
+    int end_ind,
+    int *group_ptr,
+    int group_num,
+    int *row_ind_ptr,
+    int *position_ptr=nullptr
+);
+
+int rank_presorted(
+    int *order_ptr,
+    float *rank_ptr,
+    int sample_size,
+    int index_size,
+    ThreadPool &pool,
+    int *group_ptr,
+    int group_num=2,
+    int *row_ind_ptr=nullptr,
+    int *position_ptr=nullptr
+);
+
 int reorder(
     int *source_ind_ptr,
     int *target_ind_ptr,
@@ -19,7 +19,8 @@ __version__ = "0.3.0"
 
 ext_modules = [
     Extension("dcona.core.extern.utils",
-        ["dcona/native/src/utils/utils.cpp",
+        ["dcona/native/src/pool/pool.cpp",
+         "dcona/native/src/utils/utils.cpp",
          "dcona/native/src/lib/utils.cpp"],
          include_dirs=[pybind11.get_include()],
          language='c++',
@@ -27,7 +28,8 @@ ext_modules = [
     ),
 
     Extension("dcona.core.extern.correlations",
-        ["dcona/native/src/utils/utils.cpp",
+        ["dcona/native/src/pool/pool.cpp",
+         "dcona/native/src/utils/utils.cpp",
          "dcona/native/src/lib/correlations.cpp",
          "dcona/native/src/correlations/correlations.cpp"],
          include_dirs=[pybind11.get_include()],
@@ -36,7 +38,8 @@ ext_modules = [
     ),
         
     Extension("dcona.core.extern.tests",
-        ["dcona/native/src/utils/utils.cpp",
+        ["dcona/native/src/pool/pool.cpp",
+         "dcona/native/src/utils/utils.cpp",
          "dcona/native/src/correlations/correlations.cpp",
          "dcona/native/src/tests/tests.cpp",
          "dcona/native/src/lib/tests.cpp"],
@@ -46,7 +49,8 @@ ext_modules = [
     ),
         
     Extension("dcona.core.extern.scores",
-        ["dcona/native/src/utils/utils.cpp",
+        ["dcona/native/src/pool/pool.cpp",
+         "dcona/native/src/utils/utils.cpp",
          "dcona/native/src/scores/scores.cpp",
          "dcona/native/src/lib/scores.cpp"],
          include_dirs=[pybind11.get_include()],
@@ -55,7 +59,8 @@ ext_modules = [
     ),
         
     Extension("dcona.core.extern.pipelines",
-        ["dcona/native/src/utils/utils.cpp",
+        ["dcona/native/src/pool/pool.cpp",
+         "dcona/native/src/utils/utils.cpp",
          "dcona/native/src/correlations/correlations.cpp",
          "dcona/native/src/tests/tests.cpp",
          "dcona/native/src/scores/scores.cpp",
@@ -79,6 +84,7 @@ setup(
     long_description_content_type="text/markdown",
     packages=find_packages(),
     install_requires=requirements,
+    extras_require={"arrow": ["pyarrow"]},
     ext_modules=ext_modules,
     python_requires=">=3.7",
     entry_points={
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dcona
+from dcona.lib.load import read_data
+
+
+@pytest.mark.parametrize("index", [
+    list(range(100, 112)),
+    [f"g{i}" for i in range(12)]
+])
+def test_cached_names(tmp_path, index):
+    # Tables converted to the cache and read from it have
+    # the names of the csv table with their dtypes
+    rng = np.random.RandomState(0)
+    data_df = pd.DataFrame(
+        rng.randn(12, 20).astype("float32"),
+        index=pd.Index(index, name="Gene"),
+        columns=[f"s{i}" for i in range(20)]
+    )
+    path = str(tmp_path / "data.csv")
+    data_df.to_csv(path)
+
+    csv_df = read_data(path)
+    converted_df = read_data(path, cache_dir=str(tmp_path / "cache"))
+    cached_df = read_data(path, cache_dir=str(tmp_path / "cache"))
+
+    for df in [converted_df, cached_df]:
+        assert df.index.dtype == csv_df.index.dtype
+        pd.testing.assert_frame_equal(
+            df, csv_df, check_dtype=False, check_names=False
+        )
+
+def test_cached_numeric_interaction(tmp_path):
+    # Pairs of numeric names match the rows of a cached table
+    rng = np.random.RandomState(0)
+    data_df = pd.DataFrame(
+        rng.randn(5, 20).astype("float32"),
+        index=range(5)
+    )
+    path = str(tmp_path / "data.csv")
+    data_df.to_csv(path)
+    description_df = pd.DataFrame({
+        "Sample": [str(i) for i in range(20)],
+        "Group": ["A"] * 9 + ["B"] * 11
+    })
+    sources, targets = np.triu_indices(5, 1)
+    interaction_df = pd.DataFrame({"Source": sources, "Target": targets})
+    kwargs = dict(
+        correlation="pearson",
+        interaction=interaction_df,
+        repeats_number=10,
+        process_number=1
+    )
+
+    csv_df = dcona.ztest(
+        read_data(path), description_df, "A", "B", **kwargs
+    )
+    cached_df = dcona.ztest(
+        read_data(path, cache_dir=str(tmp_path / "cache")),
+        description_df, "A", "B", **kwargs
+    )
+
+    assert len(csv_df) == len(interaction_df)
+    pd.testing.assert_frame_equal(cached_df, csv_df)
@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dcona
+from dcona.core.extern.pipelines import _pipeline_statistics
+
+
+@pytest.fixture
+def expression():
+    rng = np.random.RandomState(0)
+    data_df = pd.DataFrame(
+        rng.randn(12, 20).astype("float32"),
+        index=[f"g{i}" for i in range(12)]
+    )
+    description_df = pd.DataFrame({
+        "Sample": range(20),
+        "Group": ["A"] * 9 + ["B"] * 11
+    })
+
+    return data_df, description_df
+
+@pytest.mark.parametrize("fdr_threshold", [None, 1.0])
+def test_streamed_name_filter(expression, tmp_path, fdr_threshold):
+    # A tile filter gets the names of the pairs in memory
+    # and with the output directory
+    data_df, description_df = expression
+    kwargs = dict(
+        correlation="pearson",
+        process_number=1,
+        memory_budget=1,
+        fdr_threshold=fdr_threshold,
+        tile_filter=lambda df: df[df["Source"] == "g1"]
+    )
+
+    memory_df = dcona.ztest(data_df, description_df, "A", "B", **kwargs)
+    dcona.ztest(
+        data_df, description_df, "A", "B",
+        output_dir=str(tmp_path), **kwargs
+    )
+    file_df = pd.read_csv(
+        os.path.join(tmp_path, "pearson_two-sided_ztest.csv")
+    )
+
+    assert len(memory_df) == 10
+    assert (memory_df["Source"] == "g1").all()
+    assert list(file_df.columns) == list(memory_df.columns)
+    pd.testing.assert_frame_equal(
+        file_df.sort_values("Target").reset_index(drop=True),
+        memory_df.sort_values("Target").reset_index(drop=True),
+        check_dtype=False
+    )
+
+@pytest.mark.parametrize("fdr_threshold", [None, 1.0])
+def test_streamed_empty_filter(expression, tmp_path, fdr_threshold):
+    # The header is written when no pairs pass the filter
+    data_df, description_df = expression
+    dcona.ztest(
+        data_df, description_df, "A", "B",
+        correlation="pearson",
+        process_number=1,
+        memory_budget=1,
+        fdr_threshold=fdr_threshold,
+        tile_filter=lambda df: df[df["Source"] == "missing"],
+        output_dir=str(tmp_path)
+    )
+    file_df = pd.read_csv(
+        os.path.join(tmp_path, "pearson_two-sided_ztest.csv")
+    )
+
+    assert len(file_df) == 0
+    assert list(file_df.columns[:2]) == ["Source", "Target"]
+
+@pytest.mark.parametrize("output_format", dcona.lib.dump.OUTPUT_FORMATS)
+def test_streamed_hypergeom_columns(expression, tmp_path, output_format):
+    # A streamed z-test without a selection has no AdjPvalue,
+    # hypergeom of its table names the missing column
+    data_df, description_df = expression
+    dcona.ztest(
+        data_df, description_df, "A", "B",
+        correlation="pearson",
+        process_number=1,
+        memory_budget=1,
+        output_dir=str(tmp_path),
+        output_format=output_format
+    )
+    path = dcona.lib.dump.output_path(
+        str(tmp_path), "pearson_two-sided_ztest", output_format
+    )
+
+    with pytest.raises(ValueError, match="not in the table.*AdjPvalue"):
+        dcona.hypergeom(path)
+
+@pytest.mark.parametrize("offset, scale", [
+    (0, 1), (0.5, 1), (5, 1), (10, 1), (20, 1), (50, 1),
+    (100, 0.01), (1e3, 1), (1e4, 1e3), (1e5, 10)
+])
+def test_complement_offset(offset, scale):
+    # Permutations of groups that split all the samples derive
+    # pearson correlations of centered rows from the pooled sums
+    # of the pairs, other rows are computed directly. The results
+    # equal the direct per-group computation of ztest_many
+    rng = np.random.RandomState(5)
+    values = rng.randn(30, 40) * scale
+    values[:6, 25:] += np.linspace(0, 2, 15) * rng.randn(6, 1) * scale
+    data_df = pd.DataFrame(
+        (values + offset).astype("float32"),
+        index=[f"g{i}" for i in range(30)]
+    )
+    description_df = pd.DataFrame({
+        "Sample": range(40),
+        "Group": ["A"] * 15 + ["B"] * 25
+    })
+    sources, targets = np.triu_indices(30, 1)
+    interaction_df = pd.DataFrame({
+        "Source": data_df.index[sources],
+        "Target": data_df.index[targets]
+    })
+    kwargs = dict(
+        correlation="pearson",
+        interaction=interaction_df,
+        repeats_number=400,
+        process_number=1
+    )
+
+    complement_df = dcona.ztest(
+        data_df, description_df, "A", "B", **kwargs
+    )
+    stages = [stage[0] for stage in _pipeline_statistics()]
+    direct_df = dcona.ztest_many(
+        data_df, description_df, [("A", "B")], **kwargs
+    )[("A", "B")]
+
+    assert ("pooled" in stages) == (offset < scale)
+    pd.testing.assert_frame_equal(complement_df, direct_df)